@@ -0,0 +1,179 @@
+import argparse
+import time
+from pathlib import Path
+from termcolor import colored
+
+import torch
+from torch.utils.data import DataLoader
+
+from nachosv2.data_processing.read_metadata_csv import read_metadata_csv
+from nachosv2.image_processing.image_crop import create_crop_box
+from nachosv2.image_processing.batch_preprocessing import BatchPreprocessor
+from nachosv2.image_processing.batch_preprocessing import BatchPreprocessingDataLoader
+from nachosv2.image_processing.batch_preprocessing import collate_decoded_images
+from nachosv2.training.training_processing.custom_2D_dataset import Dataset2D
+from nachosv2.training.training_processing.custom_2D_dataset import DecodedDataset2D
+from nachosv2.training.training_processing.dataloader_settings import synchronize
+
+
+def measure_throughput(dataloader,
+                       device: str,
+                       n_batches: int) -> float:
+    """
+    Measures the images per second delivered on the device by a loader.
+
+    Args:
+        dataloader: The loader, yielding (images, labels, filepaths).
+        device (str): The device where the images are used.
+        n_batches (int): Maximum number of batches measured.
+
+    Returns:
+        float: Images per second.
+    """
+
+    n_images = 0
+    start_time = time.perf_counter()
+    for i, (images, _, _) in enumerate(dataloader):
+        images = images.to(device)
+        n_images += images.shape[0]
+        if i + 1 >= n_batches:
+            break
+    synchronize(device)
+
+    return n_images / (time.perf_counter() - start_time)
+
+
+def benchmark_batch_preprocessing(csv_filepath: Path,
+                                  number_channels: int,
+                                  target_dimensions: list,
+                                  cropping_position: list = None,
+                                  batch_size: int = 64,
+                                  num_workers: int = 4,
+                                  n_batches: int = 50,
+                                  device: str = "cpu") -> dict:
+    """
+    Compares the per-sample preprocessing of Dataset2D with the batched
+    preprocessing: maximum absolute difference on the first batch, and
+    throughput of both.
+
+    Args:
+        csv_filepath (Path): Path to the metadata CSV file.
+        number_channels (int): The number of channels of the images.
+        target_dimensions (list of int): The target height and width.
+        cropping_position (list of int): x and y cropping position, None if no cropping. (Optional)
+        batch_size (int): The batch size. Default is 64.
+        num_workers (int): Number of DataLoader workers. Default is 4.
+        n_batches (int): Number of batches measured. Default is 50.
+        device (str): The device where batches are preprocessed. Default is 'cpu'.
+
+    Returns:
+        results (dict): Throughputs in images per second and maximum difference.
+    """
+
+    df_metadata = read_metadata_csv(csv_filepath)
+    dictionary_partition = {'files': df_metadata['absolute_filepath'].tolist(),
+                            'labels': df_metadata['label'].tolist()}
+
+    image_size = (target_dimensions[0], target_dimensions[1])
+    crop_box = None
+    if cropping_position is not None:
+        crop_box = create_crop_box(cropping_position[0], cropping_position[1],
+                                   image_size[0], image_size[1])
+
+    per_sample_dataloader = DataLoader(
+        Dataset2D(dictionary_partition, number_channels, image_size,
+                  do_cropping=crop_box is not None, crop_box=crop_box),
+        batch_size=batch_size, shuffle=False, num_workers=num_workers)
+
+    batched_dataloader = BatchPreprocessingDataLoader(
+        DataLoader(DecodedDataset2D(dictionary_partition),
+                   batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                   collate_fn=collate_decoded_images),
+        BatchPreprocessor(number_channels, image_size, crop_box),
+        device)
+
+    reference_images, _, _ = next(iter(per_sample_dataloader))
+    batched_images, _, _ = next(iter(batched_dataloader))
+    max_difference = (reference_images - batched_images.cpu()).abs().max().item()
+
+    results = {
+        "per_sample_images_per_second": measure_throughput(per_sample_dataloader, device, n_batches),
+        "batched_images_per_second": measure_throughput(batched_dataloader, device, n_batches),
+        "max_absolute_difference": max_difference,
+    }
+
+    print(colored(f"Per-sample preprocessing: {results['per_sample_images_per_second']:.1f} images/s", 'magenta'))
+    print(colored(f"Batched preprocessing:    {results['batched_images_per_second']:.1f} images/s", 'magenta'))
+    print(colored(f"Maximum absolute difference: {max_difference:.2e}", 'magenta'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    # Definition of all arguments
+    parser.add_argument(
+        '--csv_filepath',
+        type = str, default = None, required = True,
+        help = 'Path to the metadata CSV file.'
+    )
+
+    parser.add_argument(
+        '--number_channels',
+        type = int, default = None, required = True,
+        help = 'Number of channels of the images. Grayscale: 1, RGB: 3.'
+    )
+
+    parser.add_argument(
+        '--target_dimensions',
+        nargs = 2, type = int, default = None, required = True,
+        help = 'Height and width of the preprocessed images.'
+    )
+
+    parser.add_argument(
+        '--cropping_position',
+        nargs = 2, type = int, default = None, required = False,
+        help = 'x and y cropping position.'
+    )
+
+    parser.add_argument(
+        '--batch_size',
+        type = int, default = 64, required = False,
+        help = 'Batch size.'
+    )
+
+    parser.add_argument(
+        '--num_workers',
+        type = int, default = 4, required = False,
+        help = 'Number of DataLoader workers.'
+    )
+
+    parser.add_argument(
+        '--n_batches',
+        type = int, default = 50, required = False,
+        help = 'Number of batches measured.'
+    )
+
+    parser.add_argument(
+        '--device',
+        type = str, default = "cuda" if torch.cuda.is_available() else "cpu", required = False,
+        help = 'Device where the batches are preprocessed.'
+    )
+
+    args = parser.parse_args()
+
+    return benchmark_batch_preprocessing(
+        csv_filepath=Path(args.csv_filepath),
+        number_channels=args.number_channels,
+        target_dimensions=args.target_dimensions,
+        cropping_position=args.cropping_position,
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+        n_batches=args.n_batches,
+        device=args.device
+        )
+
+
+if __name__ == "__main__":
+    main()
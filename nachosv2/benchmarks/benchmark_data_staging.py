@@ -0,0 +1,179 @@
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+from termcolor import colored
+
+import numpy as np
+import pandas as pd
+
+from nachosv2.data_processing.data_staging import COPIED
+from nachosv2.data_processing.data_staging import DEDUPLICATED
+from nachosv2.data_processing.data_staging import DataStager
+from nachosv2.data_processing.data_staging import HIT
+
+
+def create_synthetic_dataset(source_directory: Path,
+                             n_files: int,
+                             file_bytes: int,
+                             n_folds: int,
+                             duplicate_fraction: float = 0.05,
+                             seed: int = 0) -> pd.DataFrame:
+    """
+    Writes n_files random files in one folder per fold, a fraction of them
+    with the content of another file, and returns their metadata.
+    """
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for index in range(n_files):
+        fold_name = f"k{index % n_folds + 1}"
+        filepath = source_directory / fold_name / f"image_{index:06d}.png"
+        filepath.parent.mkdir(mode=0o775, parents=True, exist_ok=True)
+        if index > 0 and rng.random() < duplicate_fraction:
+            content = (source_directory / rows[-1]["fold_name"] / Path(rows[-1]["absolute_filepath"]).name).read_bytes()
+        else:
+            content = rng.bytes(file_bytes)
+        filepath.write_bytes(content)
+        rows.append({"fold_name": fold_name, "absolute_filepath": str(filepath), "label": index % 4})
+
+    return pd.DataFrame(rows)
+
+
+def stage(cache_directory: Path,
+          df_metadata: pd.DataFrame,
+          fold_list: List[str],
+          n_workers: int,
+          verification: str = "size_mtime") -> dict:
+    """
+    Stages the folds with a new stager, as a new job on the node, and
+    returns its statistics.
+    """
+
+    data_stager = DataStager(cache_directory, df_metadata,
+                             n_workers=n_workers, verification=verification)
+    start_time = time.perf_counter()
+    df_staged, _ = data_stager.stage_folds(fold_list)
+    duration = time.perf_counter() - start_time
+
+    # The staged files have the content of the source files
+    for source_filepath, staged_filepath in zip(df_metadata["absolute_filepath"], df_staged["absolute_filepath"]):
+        if Path(source_filepath).parent.name in fold_list and \
+           Path(source_filepath).read_bytes() != Path(staged_filepath).read_bytes():
+            raise ValueError(f"The staged file {staged_filepath} differs from {source_filepath}.")
+
+    n_files = sum(data_stager.statistics[status] for status in [HIT, COPIED, DEDUPLICATED])
+    return {"seconds": duration,
+            "n_files": n_files,
+            "hit_rate": data_stager.statistics[HIT] / max(n_files, 1),
+            "copied_megabytes": data_stager.statistics["copied_bytes"] / 1e6,
+            "megabytes_per_second": data_stager.statistics["copied_bytes"] / 1e6 / max(duration, 1e-9),
+            "files_per_second": n_files / max(duration, 1e-9)}
+
+
+def benchmark_data_staging(n_files: int = 2000,
+                           file_bytes: int = 65536,
+                           n_folds: int = 4,
+                           n_workers: int = 8,
+                           output_dir: Optional[Path] = None) -> List[dict]:
+    """
+    Measures the staging of the files of the folds of a node to a local
+    cache: the first staging with one thread and with n_workers threads,
+    the staging of the same folds by a later job, all cache hits, after
+    5% of the source files changed, with hash verification, and of one
+    more fold.
+
+    Args:
+        n_files (int): Number of files of the dataset. Default is 2000.
+        file_bytes (int): Size of the files. Default is 65536.
+        n_folds (int): Number of folds. Default is 4.
+        n_workers (int): Number of threads copying the files. Default is 8.
+        output_dir (Path): Folder of the dataset and the caches. Default is a temporary folder. (Optional)
+
+    Returns:
+        results (list of dict): The results of each staging.
+    """
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        directory = Path(output_dir) if output_dir is not None else Path(temporary_dir)
+        df_metadata = create_synthetic_dataset(directory / "source", n_files, file_bytes, n_folds)
+
+        # The node trains the first folds, the last one is scheduled on another node
+        fold_list = [f"k{fold}" for fold in range(1, n_folds)]
+        cache_directory = directory / f"cache_{n_workers}_threads"
+
+        scenarios = [("cold, 1 thread", directory / "cache_1_thread", fold_list, 1, "size_mtime"),
+                     (f"cold, {n_workers} threads", cache_directory, fold_list, n_workers, "size_mtime"),
+                     ("warm", cache_directory, fold_list, n_workers, "size_mtime")]
+
+        results = []
+        for name, scenario_cache_directory, scenario_fold_list, scenario_n_workers, verification in scenarios:
+            results.append({"scenario": name, **stage(scenario_cache_directory, df_metadata,
+                                                      scenario_fold_list, scenario_n_workers, verification)})
+
+        # 5% of the source files changed since the previous job
+        for source_filepath in df_metadata["absolute_filepath"].iloc[::20]:
+            os.utime(source_filepath, ns=(time.time_ns(), time.time_ns()))
+        results.append({"scenario": "5% changed", **stage(cache_directory, df_metadata, fold_list, n_workers)})
+        results.append({"scenario": "warm, hash verification",
+                        **stage(cache_directory, df_metadata, fold_list, n_workers, "hash")})
+        results.append({"scenario": "one more fold",
+                        **stage(cache_directory, df_metadata, fold_list + [f"k{n_folds}"], n_workers)})
+
+    print()
+    for result in results:
+        print(colored(f"{result['scenario']}: {result['n_files']} files in {result['seconds']:.2f} s " + \
+                      f"({result['files_per_second']:.0f} files/s), hit rate {result['hit_rate']:.1%}, " + \
+                      f"{result['copied_megabytes']:.1f} MB copied at {result['megabytes_per_second']:.1f} MB/s", 'magenta'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    # Definition of all arguments
+    parser.add_argument(
+        '--n_files',
+        type = int, default = 2000, required = False,
+        help = 'Number of files of the dataset.'
+    )
+
+    parser.add_argument(
+        '--file_bytes',
+        type = int, default = 65536, required = False,
+        help = 'Size of the files.'
+    )
+
+    parser.add_argument(
+        '--n_folds',
+        type = int, default = 4, required = False,
+        help = 'Number of folds.'
+    )
+
+    parser.add_argument(
+        '--n_workers',
+        type = int, default = 8, required = False,
+        help = 'Number of threads copying the files.'
+    )
+
+    parser.add_argument(
+        '--output_dir',
+        type = str, default = None, required = False,
+        help = 'Folder of the dataset and the caches, e.g. on the shared storage. Default is a temporary folder.'
+    )
+
+    args = parser.parse_args()
+
+    return benchmark_data_staging(
+        n_files=args.n_files,
+        file_bytes=args.file_bytes,
+        n_folds=args.n_folds,
+        n_workers=args.n_workers,
+        output_dir=Path(args.output_dir) if args.output_dir else None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import itertools
+import time
+from typing import List
+from termcolor import colored
+
+import numpy as np
+import pandas as pd
+
+from nachosv2.data_processing.fold_index import FoldIndex
+
+
+def get_files_labels_query(partition: str,
+                           df_metadata: pd.DataFrame,
+                           test_fold: str,
+                           validation_fold: str,
+                           training_folds_list: list) -> tuple:
+    """
+    get_files_labels before the fold index, one DataFrame.query per partition.
+    """
+
+    partition_queries = {
+        'test': "fold_name == @test_fold",
+        'validation': "fold_name == @validation_fold",
+        'training': "fold_name in @training_folds_list"
+    }
+
+    filtered_data = df_metadata.query(partition_queries[partition])
+
+    return filtered_data['absolute_filepath'].tolist(), filtered_data['label'].tolist()
+
+
+def create_synthetic_metadata(n_rows: int,
+                              n_folds: int,
+                              n_classes: int = 4,
+                              seed: int = 0) -> pd.DataFrame:
+    """
+    Returns metadata with the folds of the rows interleaved, as in a
+    metadata CSV sorted by subject or by file name.
+    """
+
+    rng = np.random.default_rng(seed)
+    fold_names = np.array([f"k{fold}" for fold in range(1, n_folds + 1)], dtype=object)
+    fold_codes = rng.integers(0, n_folds, size=n_rows)
+
+    return pd.DataFrame({
+        "fold_name": fold_names[fold_codes],
+        "absolute_filepath": [f"/scratch/datasets/oct/image_{index:08d}.png" for index in range(n_rows)],
+        "label": rng.integers(0, n_classes, size=n_rows),
+    })
+
+
+def get_partitions(n_folds: int,
+                   n_tasks: int) -> List[dict]:
+    """
+    Returns the partitions of the first n_tasks (test fold, validation fold)
+    pairs of a cross-validation loop.
+    """
+
+    fold_list = [f"k{fold}" for fold in range(1, n_folds + 1)]
+    fold_pairs = [(test_fold, validation_fold)
+                  for test_fold, validation_fold in itertools.permutations(fold_list, 2)]
+
+    return [{"test_fold": test_fold,
+             "validation_fold": validation_fold,
+             "training_folds_list": [fold for fold in fold_list if fold not in (test_fold, validation_fold)]}
+            for test_fold, validation_fold in fold_pairs[:n_tasks]]
+
+
+def benchmark_fold_index(n_rows: int = 1000000,
+                         n_folds: int = 20,
+                         n_tasks: int = 40) -> List[dict]:
+    """
+    Measures the time to get the training, validation and test files and
+    labels of n_tasks trainings of a cross-validation loop, with one
+    DataFrame.query per partition and with the fold index built once.
+    Checks that both give the same files and labels, in the same order.
+
+    Args:
+        n_rows (int): Number of rows of the metadata. Default is 1000000.
+        n_folds (int): Number of folds. Default is 20.
+        n_tasks (int): Number of trainings. Default is 40.
+
+    Returns:
+        results (list of dict): The results of each method.
+    """
+
+    df_metadata = create_synthetic_metadata(n_rows, n_folds)
+    partitions = get_partitions(n_folds, n_tasks)
+
+    start_time = time.perf_counter()
+    fold_index = FoldIndex(df_metadata)
+    build_seconds = time.perf_counter() - start_time
+
+    results = []
+    for method in ["query", "fold_index"]:
+        task_seconds = []
+        for task in partitions:
+            start_time = time.perf_counter()
+            for partition in ["training", "validation", "test"]:
+                if method == "query":
+                    files, labels = get_files_labels_query(partition, df_metadata, **task)
+                else:
+                    files, labels = fold_index.get_files_labels(
+                        {"training": task["training_folds_list"],
+                         "validation": task["validation_fold"],
+                         "test": task["test_fold"]}[partition])
+            task_seconds.append(time.perf_counter() - start_time)
+
+        results.append({
+            "method": method,
+            "build_seconds": build_seconds if method == "fold_index" else 0.0,
+            "mean_task_seconds": float(np.mean(task_seconds)),
+            "total_seconds": sum(task_seconds) + (build_seconds if method == "fold_index" else 0.0),
+        })
+
+        message = f"{method}: {results[-1]['mean_task_seconds'] * 1e3:.1f} ms per training, " + \
+                  f"{results[-1]['total_seconds']:.2f} s for {n_tasks} trainings"
+        if method == "fold_index":
+            message += f", including {build_seconds:.2f} s to build the index"
+        print(colored(message, 'magenta'))
+
+    # The partitions are the same, in the same order
+    for task in partitions:
+        for partition in ["training", "validation", "test"]:
+            query_files, query_labels = get_files_labels_query(partition, df_metadata, **task)
+            index_files, index_labels = fold_index.get_files_labels(
+                {"training": task["training_folds_list"],
+                 "validation": task["validation_fold"],
+                 "test": task["test_fold"]}[partition])
+            if query_files != index_files.tolist() or query_labels != index_labels.tolist():
+                raise ValueError(f"The fold index gives different {partition} files or labels " + \
+                                 f"for test fold {task['test_fold']} and validation fold {task['validation_fold']}.")
+
+    print(colored(f"The fold index is {results[0]['mean_task_seconds'] / results[1]['mean_task_seconds']:.1f}x " + \
+                  f"faster per training, {results[0]['total_seconds'] / results[1]['total_seconds']:.1f}x " + \
+                  f"over the {n_tasks} trainings with its build, on {n_rows} rows and {n_folds} folds.", 'magenta'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    # Definition of all arguments
+    parser.add_argument(
+        '--n_rows',
+        type = int, default = 1000000, required = False,
+        help = 'Number of rows of the metadata.'
+    )
+
+    parser.add_argument(
+        '--n_folds',
+        type = int, default = 20, required = False,
+        help = 'Number of folds.'
+    )
+
+    parser.add_argument(
+        '--n_tasks',
+        type = int, default = 40, required = False,
+        help = 'Number of trainings of the cross-validation loop.'
+    )
+
+    args = parser.parse_args()
+
+    return benchmark_fold_index(
+        n_rows=args.n_rows,
+        n_folds=args.n_folds,
+        n_tasks=args.n_tasks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import argparse
+import math
+import random
+import statistics
+from typing import List, Optional
+from termcolor import colored
+
+from nachosv2.training.hpo.hpo import RandomSampler
+from nachosv2.training.hpo.hpo import TPESampler
+from nachosv2.training.hpo.hpo import extract_default_hyperparameters
+
+
+# Search space in the format of the hyperparameter configuration files
+SEARCH_SPACE = {
+    "n_combinations": 100,
+    "batch_size": {"min": 8, "max": 256},
+    "learning_rate": {"min": 0.00001, "max": 0.1},
+    "momentum": {"min": 0.5, "max": 0.99},
+    "enable_nesterov": [True, False],
+    "architecture": ["InceptionV3", "ResNet50", "ResNet18", "VGG16"],
+}
+
+ARCHITECTURE_PENALTIES = {"InceptionV3": 0.05, "ResNet50": 0.0, "ResNet18": 0.1, "VGG16": 0.2}
+
+
+def synthetic_validation_loss(dict_values: dict,
+                              noise: float = 0.0) -> float:
+    """
+    Synthetic validation loss of a configuration, lowest for a learning
+    rate of 1e-3, a batch size of 32, a momentum of 0.9 with Nesterov
+    momentum and ResNet50, with interactions between the learning rate,
+    the batch size and the momentum as in real trainings.
+    """
+
+    log_learning_rate = math.log10(dict_values["learning_rate"])
+    log_batch_size = math.log2(dict_values["batch_size"])
+    # Larger batches tolerate larger learning rates
+    effective_rate = log_learning_rate - 0.3 * (log_batch_size - 5)
+
+    loss = 0.3 + 0.25 * (effective_rate + 3) ** 2 + \
+           0.05 * (log_batch_size - 5) ** 2 + \
+           4 * (dict_values["momentum"] - 0.9) ** 2 + \
+           (0.0 if dict_values["enable_nesterov"] else 0.03) + \
+           ARCHITECTURE_PENALTIES[dict_values["architecture"]]
+
+    return loss + random.gauss(0, noise) if noise > 0 else loss
+
+
+def get_target_loss(quantile: float,
+                    n_samples: int = 20000,
+                    seed: int = 12345) -> float:
+    """
+    Returns the loss reached by the best fraction quantile of random configurations.
+    """
+
+    random.seed(seed)
+    sampler = RandomSampler(SEARCH_SPACE, extract_default_hyperparameters(), n_samples)
+    losses = sorted(synthetic_validation_loss(sampler.propose([])) for _ in range(n_samples))
+
+    return losses[int(quantile * n_samples)]
+
+
+def run_search(sampler_name: str,
+               budget: int,
+               target_loss: float,
+               seed: int,
+               noise: float,
+               n_startup: int) -> dict:
+    """
+    Proposes and evaluates configurations one at a time, as the
+    cross-validation loop of a sequential run.
+
+    Returns:
+        dict: The number of evaluations to reach the target, None if not
+            reached, and the best noise-free loss.
+    """
+
+    random.seed(seed)
+    df_default = extract_default_hyperparameters()
+    if sampler_name == "tpe":
+        sampler = TPESampler(SEARCH_SPACE, df_default, budget, n_startup=n_startup)
+    else:
+        sampler = RandomSampler(SEARCH_SPACE, df_default, budget)
+
+    l_dict = []
+    evaluations_to_target = None
+    best_loss = math.inf
+    for evaluation in range(budget):
+        dict_values = sampler.propose(l_dict)
+        l_dict.append({"hp_config_index": evaluation, **dict_values})
+        sampler.observe(dict_values, synthetic_validation_loss(dict_values, noise))
+
+        loss = synthetic_validation_loss(dict_values)
+        best_loss = min(best_loss, loss)
+        if evaluations_to_target is None and loss <= target_loss:
+            evaluations_to_target = evaluation + 1
+
+    return {"evaluations_to_target": evaluations_to_target,
+            "best_loss": best_loss}
+
+
+def benchmark_hpo_sampler(budget: int = 60,
+                          n_repetitions: int = 20,
+                          quantile: float = 0.01,
+                          noise: float = 0.02,
+                          n_startup: int = 5,
+                          seed: int = 0) -> List[dict]:
+    """
+    Compares the number of configurations random search and TPE train
+    before one reaches a target validation loss, the loss of the best 1% of
+    the configurations by default, on a synthetic objective. Each search is
+    repeated with different seeds, searches not reaching the target count
+    as budget + 1 evaluations in the median.
+
+    Args:
+        budget (int): Maximum number of configurations of a search. Default is 60.
+        n_repetitions (int): Number of searches per sampler. Default is 20.
+        quantile (float): Fraction of random configurations better than the target. Default is 0.01.
+        noise (float): Standard deviation of the noise of the observed losses. Default is 0.02.
+        n_startup (int): Random configurations before TPE uses its model. Default is 5.
+        seed (int): The seed of the first search. Default is 0.
+
+    Returns:
+        results (list of dict): The results of each sampler.
+    """
+
+    target_loss = get_target_loss(quantile)
+    print(colored(f"Target validation loss {target_loss:.4f}, reached by {quantile:.1%} " + \
+                  "of the random configurations.", 'green'))
+
+    results = []
+    for sampler_name in ["random", "tpe"]:
+        searches = [run_search(sampler_name, budget, target_loss, seed + repetition, noise, n_startup)
+                    for repetition in range(n_repetitions)]
+        evaluations = [search["evaluations_to_target"] or budget + 1 for search in searches]
+        n_reached = sum(search["evaluations_to_target"] is not None for search in searches)
+
+        results.append({
+            "sampler": sampler_name,
+            "median_evaluations_to_target": statistics.median(evaluations),
+            "mean_evaluations_to_target": statistics.mean(evaluations),
+            "fraction_reached": n_reached / n_repetitions,
+            "median_best_loss": statistics.median(search["best_loss"] for search in searches),
+        })
+
+        print(colored(f"{sampler_name}: median {results[-1]['median_evaluations_to_target']} evaluations " + \
+                      f"to target, target reached in {n_reached}/{n_repetitions} searches of {budget} " + \
+                      f"configurations, median best loss {results[-1]['median_best_loss']:.4f}", 'magenta'))
+
+    speedup = results[0]["median_evaluations_to_target"] / results[1]["median_evaluations_to_target"]
+    print(colored(f"TPE reached the target with {speedup:.2f}x fewer trainings than random search.", 'magenta'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    # Definition of all arguments
+    parser.add_argument(
+        '--budget',
+        type = int, default = 60, required = False,
+        help = 'Maximum number of configurations of a search.'
+    )
+
+    parser.add_argument(
+        '--n_repetitions',
+        type = int, default = 20, required = False,
+        help = 'Number of searches per sampler.'
+    )
+
+    parser.add_argument(
+        '--quantile',
+        type = float, default = 0.01, required = False,
+        help = 'Fraction of random configurations better than the target loss.'
+    )
+
+    parser.add_argument(
+        '--noise',
+        type = float, default = 0.02, required = False,
+        help = 'Standard deviation of the noise of the observed losses.'
+    )
+
+    parser.add_argument(
+        '--n_startup',
+        type = int, default = 5, required = False,
+        help = 'Random configurations before TPE uses its model.'
+    )
+
+    parser.add_argument(
+        '--seed',
+        type = int, default = 0, required = False,
+        help = 'Seed of the first search.'
+    )
+
+    args = parser.parse_args()
+
+    return benchmark_hpo_sampler(
+        budget=args.budget,
+        n_repetitions=args.n_repetitions,
+        quantile=args.quantile,
+        noise=args.noise,
+        n_startup=args.n_startup,
+        seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import pickle
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+from termcolor import colored
+
+import numpy as np
+import pandas as pd
+
+from nachosv2.data_processing.convert_metadata import convert_metadata
+from nachosv2.data_processing.read_metadata_csv import METADATA_COLUMNS
+from nachosv2.data_processing.read_metadata_csv import read_metadata_csv
+
+
+def create_synthetic_metadata_csv(csv_filepath: Path,
+                                  n_rows: int,
+                                  n_folds: int,
+                                  n_classes: int = 4,
+                                  seed: int = 0):
+    """
+    Writes a metadata CSV with the columns used by the training and other
+    columns of the metadata CSVs of the datasets, not used by the training.
+    """
+
+    rng = np.random.default_rng(seed)
+    fold_codes = rng.integers(0, n_folds, size=n_rows)
+    labels = rng.integers(0, n_classes, size=n_rows)
+    class_names = np.array([f"class_{label}" for label in range(n_classes)], dtype=object)
+
+    pd.DataFrame({
+        "fold_name": [f"k{fold_code + 1}" for fold_code in fold_codes],
+        "absolute_filepath": [f"/scratch/datasets/oct/k{fold_code + 1}/image_{index:08d}.png"
+                              for index, fold_code in enumerate(fold_codes)],
+        "label": labels,
+        "class_name": class_names[labels],
+        "subject_id": rng.integers(0, n_rows // 50 + 1, size=n_rows),
+        "image_height": np.full(n_rows, 301),
+        "image_width": np.full(n_rows, 235),
+    }).to_csv(csv_filepath, index=False)
+
+
+def measure_loading(filepath: Path,
+                    n_repetitions: int) -> dict:
+    """
+    Returns the best time to read the columns used by the training, and
+    the memory and pickled size of the DataFrame, the size broadcast to
+    the MPI workers.
+    """
+
+    durations = []
+    for _ in range(n_repetitions):
+        start_time = time.perf_counter()
+        df_metadata = read_metadata_csv(filepath, columns=METADATA_COLUMNS)
+        durations.append(time.perf_counter() - start_time)
+
+    return {"df_metadata": df_metadata,
+            "file_bytes": filepath.stat().st_size,
+            "load_seconds": min(durations),
+            "memory_bytes": int(df_metadata.memory_usage(deep=True).sum()),
+            "pickled_bytes": len(pickle.dumps(df_metadata, protocol=pickle.HIGHEST_PROTOCOL))}
+
+
+def benchmark_metadata_loading(n_rows: int = 1000000,
+                               n_folds: int = 20,
+                               n_repetitions: int = 3,
+                               output_dir: Optional[Path] = None) -> List[dict]:
+    """
+    Measures the time to read the metadata columns used by the training,
+    and their memory and pickled size, from a CSV file and from the
+    Parquet and Feather files of NACHOSv2_convert_metadata. Checks that
+    all the formats give the same metadata.
+
+    Args:
+        n_rows (int): Number of rows of the metadata. Default is 1000000.
+        n_folds (int): Number of folds. Default is 20.
+        n_repetitions (int): Number of reads of each file, the best is kept. Default is 3.
+        output_dir (Path): Folder of the files. Default is a temporary folder. (Optional)
+
+    Returns:
+        results (list of dict): The results of each format.
+    """
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        directory = Path(output_dir) if output_dir is not None else Path(temporary_dir)
+        directory.mkdir(mode=0o775, parents=True, exist_ok=True)
+
+        csv_filepath = directory / "metadata.csv"
+        create_synthetic_metadata_csv(csv_filepath, n_rows, n_folds)
+        filepaths = {"csv": csv_filepath,
+                     "parquet": convert_metadata(csv_filepath, file_format="parquet"),
+                     "feather": convert_metadata(csv_filepath, file_format="feather")}
+
+        results = []
+        df_reference = None
+        for file_format, filepath in filepaths.items():
+            measurement = measure_loading(filepath, n_repetitions)
+            df_metadata = measurement.pop("df_metadata")
+
+            # Same folds, files and labels in the same order
+            df_compared = df_metadata.astype({"fold_name": str, "absolute_filepath": str, "label": np.int64})
+            if df_reference is None:
+                df_reference = df_compared
+            elif not df_reference.equals(df_compared):
+                raise ValueError(f"The {file_format} metadata differs from the CSV metadata.")
+
+            results.append({"format": file_format, **measurement})
+            print(colored(f"{file_format}: file {measurement['file_bytes'] / 1e6:.1f} MB, " + \
+                          f"read in {measurement['load_seconds']:.3f} s, " + \
+                          f"{measurement['memory_bytes'] / 1e6:.1f} MB in memory, " + \
+                          f"{measurement['pickled_bytes'] / 1e6:.1f} MB pickled", 'magenta'))
+
+    for result in results[1:]:
+        print(colored(f"{result['format']} is read {results[0]['load_seconds'] / result['load_seconds']:.1f}x " + \
+                      f"faster than CSV and takes {results[0]['memory_bytes'] / result['memory_bytes']:.1f}x " + \
+                      f"less memory, for {n_rows} rows.", 'magenta'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    # Definition of all arguments
+    parser.add_argument(
+        '--n_rows',
+        type = int, default = 1000000, required = False,
+        help = 'Number of rows of the metadata.'
+    )
+
+    parser.add_argument(
+        '--n_folds',
+        type = int, default = 20, required = False,
+        help = 'Number of folds.'
+    )
+
+    parser.add_argument(
+        '--n_repetitions',
+        type = int, default = 3, required = False,
+        help = 'Number of reads of each file, the best is kept.'
+    )
+
+    parser.add_argument(
+        '--output_dir',
+        type = str, default = None, required = False,
+        help = 'Folder of the metadata files. Default is a temporary folder.'
+    )
+
+    args = parser.parse_args()
+
+    return benchmark_metadata_loading(
+        n_rows=args.n_rows,
+        n_folds=args.n_folds,
+        n_repetitions=args.n_repetitions,
+        output_dir=Path(args.output_dir) if args.output_dir else None)
+
+
+if __name__ == "__main__":
+    main()
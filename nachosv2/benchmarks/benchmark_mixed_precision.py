@@ -0,0 +1,201 @@
+import argparse
+import time
+from typing import List, Optional
+from termcolor import colored
+
+import torch
+
+from nachosv2.model_processing.create_model import get_model
+from nachosv2.model_processing.create_model import model_names
+from nachosv2.model_processing.mixed_precision import get_autocast_context
+from nachosv2.model_processing.mixed_precision import get_autocast_dtype
+from nachosv2.training.training_processing.dataloader_settings import synchronize
+
+
+def measure_inference(model: torch.nn.Module,
+                      inputs: torch.Tensor,
+                      device: str,
+                      use_mixed_precision: bool,
+                      autocast_dtype: Optional[torch.dtype],
+                      n_batches: int) -> tuple:
+    """
+    Measures the inference time of a batch, after one warm-up batch.
+
+    Args:
+        model (torch.nn.Module): The model, in evaluation mode.
+        inputs (torch.Tensor): The batch.
+        device (str): The execution device.
+        use_mixed_precision (bool): Whether to use autocast.
+        autocast_dtype (torch.dtype): The autocast data type.
+        n_batches (int): Number of timed batches.
+
+    Returns:
+        tuple: The mean time per batch in seconds, and the float32 outputs.
+    """
+
+    def run_batch():
+        with torch.no_grad(), \
+             get_autocast_context(device, use_mixed_precision, autocast_dtype):
+            outputs = model(inputs)
+        return outputs.float()
+
+    outputs = run_batch()
+    synchronize(device)
+
+    start_time = time.perf_counter()
+    for _ in range(n_batches):
+        run_batch()
+    synchronize(device)
+
+    return (time.perf_counter() - start_time) / n_batches, outputs
+
+
+def benchmark_mixed_precision(architectures: List[str],
+                              number_classes: int = 2,
+                              number_channels: int = 3,
+                              target_dimensions: list = [224, 224],
+                              batch_size: int = 16,
+                              n_batches: int = 5,
+                              device: str = "cpu",
+                              dtype_name: str = "auto",
+                              seed: int = 0) -> List[dict]:
+    """
+    Compares float32 and mixed precision inference for each architecture:
+    speedup, agreement of the predicted classes and maximum difference of
+    the probabilities and logits. Models have random weights and inputs are synthetic.
+
+    Args:
+        architectures (list of str): The architectures, from create_model.model_names.
+        number_classes (int): The number of classes. Default is 2.
+        number_channels (int): The number of channels of the images. Default is 3.
+        target_dimensions (list of int): The height and width of the images. Default is [224, 224].
+        batch_size (int): The batch size. Default is 16.
+        n_batches (int): Number of timed batches. Default is 5.
+        device (str): The execution device. Default is 'cpu'.
+        dtype_name (str): 'float16', 'bfloat16' or 'auto'. Default is 'auto'.
+        seed (int): The random seed of the weights and inputs. Default is 0.
+
+    Returns:
+        results (list of dict): The results of each architecture.
+    """
+
+    autocast_dtype = get_autocast_dtype(device, dtype_name)
+    if autocast_dtype is None:
+        raise ValueError(f"Mixed precision is not supported on '{device}'.")
+
+    results = []
+    for architecture in architectures:
+        torch.manual_seed(seed)
+        model, new_dimensions = get_model(architecture,
+                                          number_classes=number_classes,
+                                          number_channels=number_channels,
+                                          target_dimensions=target_dimensions)
+        model = model.to(device).eval()
+
+        height, width = new_dimensions if new_dimensions else target_dimensions
+        inputs = torch.randn(batch_size, number_channels, height, width, device=device)
+
+        fp32_time, fp32_outputs = measure_inference(
+            model, inputs, device, False, None, n_batches)
+        mixed_time, mixed_outputs = measure_inference(
+            model, inputs, device, True, autocast_dtype, n_batches)
+        fp32_probabilities = torch.softmax(fp32_outputs, dim=1)
+        mixed_probabilities = torch.softmax(mixed_outputs, dim=1)
+
+        agreement = (fp32_probabilities.argmax(dim=1) ==
+                     mixed_probabilities.argmax(dim=1)).float().mean().item()
+        max_difference = (fp32_probabilities - mixed_probabilities).abs().max().item()
+        max_logit_difference = (fp32_outputs - mixed_outputs).abs().max().item()
+
+        results.append({
+            "architecture": architecture,
+            "dtype": str(autocast_dtype).replace("torch.", ""),
+            "fp32_seconds_per_batch": fp32_time,
+            "mixed_seconds_per_batch": mixed_time,
+            "speedup": fp32_time / mixed_time,
+            "prediction_agreement": agreement,
+            "max_probability_difference": max_difference,
+            "max_logit_difference": max_logit_difference,
+        })
+
+        print(colored(f"{architecture}: speedup {fp32_time / mixed_time:.2f}x " + \
+                      f"({fp32_time * 1000:.1f} ms -> {mixed_time * 1000:.1f} ms per batch), " + \
+                      f"agreement {agreement:.1%}, " + \
+                      f"maximum probability difference {max_difference:.2e}, " + \
+                      f"maximum logit difference {max_logit_difference:.2e}", 'magenta'))
+
+        del model, inputs
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    # Definition of all arguments
+    parser.add_argument(
+        '--architectures',
+        nargs = '+', type = str, default = model_names, required = False,
+        choices = model_names,
+        help = 'Architectures to benchmark. By default, all the architectures of get_model.'
+    )
+
+    parser.add_argument(
+        '--number_classes',
+        type = int, default = 2, required = False,
+        help = 'Number of classes.'
+    )
+
+    parser.add_argument(
+        '--number_channels',
+        type = int, default = 3, required = False,
+        help = 'Number of channels of the images. Grayscale: 1, RGB: 3.'
+    )
+
+    parser.add_argument(
+        '--target_dimensions',
+        nargs = 2, type = int, default = [224, 224], required = False,
+        help = 'Height and width of the images.'
+    )
+
+    parser.add_argument(
+        '--batch_size',
+        type = int, default = 16, required = False,
+        help = 'Batch size.'
+    )
+
+    parser.add_argument(
+        '--n_batches',
+        type = int, default = 5, required = False,
+        help = 'Number of timed batches.'
+    )
+
+    parser.add_argument(
+        '--device',
+        type = str, default = "cuda" if torch.cuda.is_available() else "cpu", required = False,
+        help = 'Execution device.'
+    )
+
+    parser.add_argument(
+        '--dtype',
+        type = str, default = "auto", required = False,
+        choices = ["auto", "float16", "bfloat16"],
+        help = 'Autocast data type. By default, float16 on GPU and bfloat16 on CPU.'
+    )
+
+    args = parser.parse_args()
+
+    return benchmark_mixed_precision(
+        architectures=args.architectures,
+        number_classes=args.number_classes,
+        number_channels=args.number_channels,
+        target_dimensions=args.target_dimensions,
+        batch_size=args.batch_size,
+        n_batches=args.n_batches,
+        device=args.device,
+        dtype_name=args.dtype
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import gc
+import multiprocessing
+import random
+import sys
+import time
+from typing import List
+from termcolor import colored
+
+from nachosv2.data_processing.compact_file_list import create_compact_partition
+
+
+def get_process_memory() -> dict:
+    """
+    Returns the resident memory of the process and its private dirty
+    memory, the pages copied from the parent process or allocated, in bytes.
+    Linux only.
+    """
+
+    memory = {}
+    with open("/proc/self/smaps_rollup", 'r', encoding="utf-8") as file_pointer:
+        for line in file_pointer:
+            fields = line.split()
+            if fields[0] == "Rss:":
+                memory["rss"] = int(fields[1]) * 1024
+            elif fields[0] == "Private_Dirty:":
+                memory["private_dirty"] = int(fields[1]) * 1024
+
+    return memory
+
+
+def read_partition(dictionary_partition: dict,
+                   seed: int,
+                   results_queue):
+    """
+    Reads the file path and label of every sample in random order, as a
+    DataLoader worker does with Dataset2D, and reports its memory growth.
+    """
+
+    start_memory = get_process_memory()
+
+    rng = random.Random(seed)
+    indices = list(range(len(dictionary_partition['files'])))
+    rng.shuffle(indices)
+    checksum = 0
+    for index in indices:
+        filepath = dictionary_partition['files'][index]
+        label = int(dictionary_partition['labels'][index])
+        checksum += len(filepath) + label
+    del indices
+
+    end_memory = get_process_memory()
+    results_queue.put({"rss_growth": end_memory["rss"] - start_memory["rss"],
+                       "private_dirty_growth": end_memory["private_dirty"] - start_memory["private_dirty"],
+                       "checksum": checksum})
+
+
+def measure_workers(dictionary_partition: dict,
+                    n_workers: int) -> List[dict]:
+    """
+    Forks n_workers processes reading the partition and returns their memory growth.
+    """
+
+    context = multiprocessing.get_context("fork")
+    results_queue = context.Queue()
+    processes = [context.Process(target=read_partition,
+                                 args=(dictionary_partition, seed, results_queue))
+                 for seed in range(n_workers)]
+    for process in processes:
+        process.start()
+    results = [results_queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    return results
+
+
+def create_synthetic_partition(n_samples: int,
+                               n_classes: int,
+                               seed: int = 0) -> tuple:
+    rng = random.Random(seed)
+    files = [f"/scratch/datasets/oct/fold_{index % 20}/class_{index % n_classes}/" + \
+             f"subject_{rng.randrange(10**6):06d}_image_{index:08d}.png"
+             for index in range(n_samples)]
+    labels = [index % n_classes for index in range(n_samples)]
+
+    return files, labels
+
+
+def benchmark_partition_memory(n_samples: int = 1000000,
+                               n_classes: int = 4,
+                               n_workers: int = 4) -> List[dict]:
+    """
+    Measures the memory each forked DataLoader worker copies from the
+    training process when it reads all the file paths and labels of a
+    partition, stored as lists or in the compact encoding of
+    get_dataset_info. Checks that both encodings give the same samples.
+
+    Args:
+        n_samples (int): Number of samples of the partition. Default is 1000000.
+        n_classes (int): Number of classes. Default is 4.
+        n_workers (int): Number of forked workers. Default is 4.
+
+    Returns:
+        results (list of dict): The results of each encoding.
+    """
+
+    files, labels = create_synthetic_partition(n_samples, n_classes)
+    compact_files, compact_labels = create_compact_partition(files, labels)
+
+    if compact_files.tolist() != files or compact_labels.tolist() != labels:
+        raise ValueError("The compact partition does not give the same files and labels.")
+
+    results = []
+    for encoding, dictionary_partition in [("list", {'files': files, 'labels': labels}),
+                                           ("compact", {'files': compact_files, 'labels': compact_labels})]:
+        gc.collect()
+        # Objects frozen by gc.freeze are not touched by the garbage collector of the workers
+        gc.freeze()
+        start_time = time.perf_counter()
+        worker_results = measure_workers(dictionary_partition, n_workers)
+        duration = time.perf_counter() - start_time
+        gc.unfreeze()
+
+        if len({worker_result["checksum"] for worker_result in worker_results}) != 1:
+            raise ValueError("The workers read different samples.")
+
+        if encoding == "list":
+            partition_bytes = sys.getsizeof(files) + sum(sys.getsizeof(filepath) for filepath in files) + \
+                              sys.getsizeof(labels)
+        else:
+            partition_bytes = compact_files.nbytes + compact_labels.nbytes
+
+        results.append({
+            "encoding": encoding,
+            "partition_bytes": partition_bytes,
+            "mean_worker_rss_growth": sum(r["rss_growth"] for r in worker_results) / n_workers,
+            "mean_worker_private_dirty_growth": sum(r["private_dirty_growth"] for r in worker_results) / n_workers,
+            "seconds": duration,
+        })
+
+        print(colored(f"{encoding}: partition {partition_bytes / 1e6:.1f} MB, per worker " + \
+                      f"RSS +{results[-1]['mean_worker_rss_growth'] / 1e6:.1f} MB, " + \
+                      f"copied pages +{results[-1]['mean_worker_private_dirty_growth'] / 1e6:.1f} MB, " + \
+                      f"{n_workers} workers reading {n_samples} samples in {duration:.2f} s", 'magenta'))
+
+    saved_bytes = (results[0]["mean_worker_private_dirty_growth"] -
+                   results[1]["mean_worker_private_dirty_growth"]) * n_workers
+    print(colored(f"The compact encoding saves {saved_bytes / 1e6:.1f} MB of copied pages " + \
+                  f"for {n_workers} workers of one loader.", 'magenta'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    # Definition of all arguments
+    parser.add_argument(
+        '--n_samples',
+        type = int, default = 1000000, required = False,
+        help = 'Number of samples of the partition.'
+    )
+
+    parser.add_argument(
+        '--n_classes',
+        type = int, default = 4, required = False,
+        help = 'Number of classes.'
+    )
+
+    parser.add_argument(
+        '--n_workers',
+        type = int, default = 4, required = False,
+        help = 'Number of forked workers, as DataLoader workers.'
+    )
+
+    args = parser.parse_args()
+
+    return benchmark_partition_memory(
+        n_samples=args.n_samples,
+        n_classes=args.n_classes,
+        n_workers=args.n_workers)
+
+
+if __name__ == "__main__":
+    main()
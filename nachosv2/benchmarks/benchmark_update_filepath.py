@@ -0,0 +1,129 @@
+import argparse
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+from typing import List
+from termcolor import colored
+
+import numpy as np
+import pandas as pd
+
+from nachosv2.data_processing.update_csv_absolute_filepath import check_files_exist
+from nachosv2.data_processing.update_csv_absolute_filepath import update_filepath_column
+from nachosv2.data_processing.update_csv_absolute_filepath import update_path_starting_from_folder
+
+
+def create_synthetic_filepaths(n_rows: int,
+                               unmatched_fraction: float = 0.001,
+                               seed: int = 0) -> pd.Series:
+    """
+    Returns file paths under the folder 'oct_dataset', except a fraction of
+    them under another folder, as rows copied from another dataset.
+    """
+
+    rng = np.random.default_rng(seed)
+    is_unmatched = rng.random(n_rows) < unmatched_fraction
+
+    return pd.Series([f"/old_cluster/home/user/{'other_dataset' if is_unmatched[index] else 'oct_dataset'}/" + \
+                      f"k{index % 20 + 1}/class_{index % 4}/image_{index:08d}.png"
+                      for index in range(n_rows)])
+
+
+def benchmark_update_filepath(n_rows: int = 2000000,
+                              n_stat_files: int = 20000,
+                              n_stat_workers: int = 32) -> List[dict]:
+    """
+    Measures the time to update the file paths of a metadata column row
+    by row with update_path_starting_from_folder, as update_metadata_csv
+    did, and with update_filepath_column. Checks that both give the same
+    paths and the same unmatched rows. Then measures the existence check
+    of n_stat_files files, half of them missing, with one thread and with
+    n_stat_workers threads.
+
+    Args:
+        n_rows (int): Number of file paths. Default is 2000000.
+        n_stat_files (int): Number of files checked. Default is 20000.
+        n_stat_workers (int): Number of threads checking the files. Default is 32.
+
+    Returns:
+        results (list of dict): The results of each method.
+    """
+
+    filepaths = create_synthetic_filepaths(n_rows)
+    updated_parent_dir = Path("/scratch/project")
+
+    results = []
+
+    start_time = time.perf_counter()
+    rowwise_filepaths = filepaths.apply(partial(update_path_starting_from_folder,
+                                                retain_subpath_from="oct_dataset",
+                                                updated_parent_dir=updated_parent_dir))
+    results.append({"method": "rowwise", "seconds": time.perf_counter() - start_time})
+
+    start_time = time.perf_counter()
+    vectorized_filepaths = update_filepath_column(filepaths, "oct_dataset", updated_parent_dir)
+    results.append({"method": "vectorized", "seconds": time.perf_counter() - start_time})
+
+    is_unmatched = vectorized_filepaths.isna().to_numpy()
+    if not np.array_equal(rowwise_filepaths.isna().to_numpy(), is_unmatched) or \
+       rowwise_filepaths[~is_unmatched].tolist() != vectorized_filepaths[~is_unmatched].tolist():
+        raise ValueError("The vectorized update gives different file paths.")
+
+    for result in results:
+        print(colored(f"{result['method']}: {n_rows} file paths updated in {result['seconds']:.2f} s " + \
+                      f"({n_rows / result['seconds']:.0f} paths/s), {is_unmatched.sum()} unmatched rows", 'magenta'))
+    print(colored(f"The vectorized update is {results[0]['seconds'] / results[1]['seconds']:.1f}x faster.", 'magenta'))
+
+    # Existence check, half of the files created
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        stat_filepaths = [str(Path(temporary_dir) / f"image_{index:08d}.png") for index in range(n_stat_files)]
+        for filepath in stat_filepaths[::2]:
+            Path(filepath).touch()
+
+        for n_workers in [1, n_stat_workers]:
+            start_time = time.perf_counter()
+            is_existing = check_files_exist(stat_filepaths, n_workers)
+            duration = time.perf_counter() - start_time
+            if is_existing.sum() != len(stat_filepaths[::2]) or not is_existing[::2].all():
+                raise ValueError("The existence check gives wrong results.")
+
+            results.append({"method": f"stat_{n_workers}_threads", "seconds": duration})
+            print(colored(f"Existence check with {n_workers} threads: {n_stat_files} files in {duration:.2f} s " + \
+                          f"({n_stat_files / duration:.0f} files/s), {(~is_existing).sum()} missing", 'magenta'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    # Definition of all arguments
+    parser.add_argument(
+        '--n_rows',
+        type = int, default = 2000000, required = False,
+        help = 'Number of file paths.'
+    )
+
+    parser.add_argument(
+        '--n_stat_files',
+        type = int, default = 20000, required = False,
+        help = 'Number of files checked, half of them missing.'
+    )
+
+    parser.add_argument(
+        '--n_stat_workers',
+        type = int, default = 32, required = False,
+        help = 'Number of threads checking the files.'
+    )
+
+    args = parser.parse_args()
+
+    return benchmark_update_filepath(
+        n_rows=args.n_rows,
+        n_stat_files=args.n_stat_files,
+        n_stat_workers=args.n_stat_workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import argparse
+import copy
+import time
+from pathlib import Path
+from typing import List
+from termcolor import colored
+
+import pandas as pd
+import torch
+
+from nachosv2.data_processing.read_metadata_csv import read_metadata_csv
+from nachosv2.modules.optimizer.optimizer_creator import create_optimizer
+from nachosv2.setup.get_config import get_config
+from nachosv2.training.hpo.hpo import get_hp_configuration
+from nachosv2.training.training_processing.dataloader_settings import synchronize
+from nachosv2.training.training_processing.partitions import generate_dict_folds_for_partitions
+from nachosv2.training.training_processing.training_fold import TrainingFold
+from nachosv2.training.training_processing.vectorized_training import VectorizedTrainingFolds
+
+
+def create_training_folds(config_dict: dict,
+                          df_metadata: pd.DataFrame,
+                          test_fold: str,
+                          validation_folds: List[str],
+                          hp_configuration: dict,
+                          output_path: Path,
+                          device: str) -> List[TrainingFold]:
+    """
+    Creates the cross-validation folds of a test fold and a hyperparameter
+    configuration, without shuffling or mixed precision so that runs are
+    deterministic.
+    """
+
+    training_folds = []
+    for index, validation_fold in enumerate(validation_folds):
+        fold_config = copy.deepcopy(config_dict)
+        fold_config['output_path'] = str(output_path)
+        fold_config['do_shuffle_the_images'] = False
+        fold_config['use_mixed_precision'] = False
+
+        partitions_dict = generate_dict_folds_for_partitions(
+            validation_fold_name=validation_fold,
+            is_cv_loop=True,
+            fold_list=fold_config['fold_list'],
+            test_fold_name=test_fold
+            )
+
+        training_folds.append(TrainingFold(
+            execution_device=device,
+            training_index=index,
+            configuration=fold_config,
+            indices_loop_dict={"test": test_fold,
+                               "hp_configuration": copy.deepcopy(hp_configuration),
+                               "validation": validation_fold},
+            training_folds_list=partitions_dict['training'],
+            df_metadata=df_metadata,
+            do_normalize_2d=fold_config["do_normalize_2d"],
+            use_mixed_precision=False,
+            is_cv_loop=True))
+
+    return training_folds
+
+
+def check_step_parity(sequential_folds: List[TrainingFold],
+                      vectorized_folds: List[TrainingFold]) -> float:
+    """
+    Runs one training step on the first batch of each fold, sequentially
+    and vectorized, in float64 so that the order of the sums does not
+    matter, and returns the maximum difference of the updated weights.
+    The folds must be prepared from the same initial weights.
+    """
+
+    for training_fold in sequential_folds + vectorized_folds:
+        training_fold.model.double().train()
+        training_fold.optimizer = create_optimizer(training_fold.model,
+                                                   training_fold.hyperparameters)
+
+    batches = []
+    for training_fold in sequential_folds:
+        inputs, labels, _ = next(iter(training_fold.get_dataloader('training')))
+        batches.append((inputs.double(), labels))
+
+    for training_fold, (inputs, labels) in zip(sequential_folds, batches):
+        training_fold.process_batch('training', inputs, labels)
+
+    VectorizedTrainingFolds(vectorized_folds).process_batches(
+        vectorized_folds,
+        [inputs for inputs, _ in batches],
+        [labels for _, labels in batches])
+
+    max_difference = 0.0
+    for sequential_fold, vectorized_fold in zip(sequential_folds, vectorized_folds):
+        for (sequential_parameters, vectorized_parameters) in \
+                [(sequential_fold.model.parameters(), vectorized_fold.model.parameters()),
+                 (sequential_fold.model.buffers(), vectorized_fold.model.buffers())]:
+            for a, b in zip(sequential_parameters, vectorized_parameters):
+                max_difference = max(max_difference, (a.double() - b.double()).abs().max().item())
+
+    return max_difference
+
+
+def compare_histories(sequential_folds: List[TrainingFold],
+                      vectorized_folds: List[TrainingFold]) -> tuple:
+    """
+    Returns the maximum differences of the losses and of the accuracies
+    of each epoch between the sequential and the vectorized trainings.
+    """
+
+    max_loss_difference = 0.0
+    max_accuracy_difference = 0.0
+    for sequential_fold, vectorized_fold in zip(sequential_folds, vectorized_folds):
+        for key in ["training_loss", "validation_loss", "training_accuracy", "validation_accuracy"]:
+            sequential_values = sequential_fold.history[key]
+            vectorized_values = vectorized_fold.history[key]
+            if len(sequential_values) != len(vectorized_values):
+                print(colored(f"Warning: {sequential_fold.prefix_name} trained {len(sequential_values)} " + \
+                              f"epochs sequentially and {len(vectorized_values)} vectorized.", 'yellow'))
+            differences = [abs(a - b) for a, b in zip(sequential_values, vectorized_values)]
+            if "loss" in key:
+                max_loss_difference = max([max_loss_difference] + differences)
+            else:
+                max_accuracy_difference = max([max_accuracy_difference] + differences)
+
+    return max_loss_difference, max_accuracy_difference
+
+
+def benchmark_vectorized_training(config_dict: dict,
+                                  test_fold: str,
+                                  validation_folds: List[str],
+                                  hp_config_index: int = 0,
+                                  n_epochs: int = None,
+                                  device: str = "cpu",
+                                  seed: int = 0,
+                                  tolerance: float = 1e-9) -> dict:
+    """
+    Checks that VectorizedTrainingFolds trains the cross-validation folds
+    of a test fold as TrainingFold does, and measures its speedup.
+
+    The parity is checked on one training step in float64: the weights
+    and batch normalization statistics of each fold must match the ones
+    of the sequential step. Then the folds are trained in float32 for the
+    number of epochs, one after the other and vectorized, from the same
+    initial weights. Batched convolutions do not sum in the same order,
+    so the float32 losses drift apart, mostly with random weights, and
+    their differences are only reported.
+
+    Args:
+        config_dict (dict): The training configuration.
+        test_fold (str): The test fold.
+        validation_folds (list of str): The validation folds, trained together.
+        hp_config_index (int): Index of the hyperparameter configuration. Default is 0.
+        n_epochs (int): Number of epochs, to shorten the benchmark. (Optional)
+        device (str): The execution device. Default is 'cpu'.
+        seed (int): The random seed of the initial weights. Default is 0.
+        tolerance (float): Maximum difference of the float64 weights. Default is 1e-9.
+
+    Returns:
+        dict: The times, the speedup and the maximum differences.
+
+    Raises:
+        ValueError: If the float64 step differs by more than the tolerance.
+    """
+
+    df_metadata = read_metadata_csv(config_dict["path_metadata_csv"])
+    hp_configuration = get_hp_configuration(config_dict)[hp_config_index]
+    if n_epochs is not None:
+        hp_configuration["n_epochs"] = n_epochs
+
+    output_path = Path(config_dict["output_path"]) / "benchmark_vectorized_training"
+
+    def create_prepared_folds(folder_name: str) -> List[TrainingFold]:
+        training_folds = create_training_folds(config_dict, df_metadata, test_fold, validation_folds,
+                                               hp_configuration, output_path / folder_name, device)
+        for training_fold in training_folds:
+            # Same initial weights for the sequential and vectorized folds
+            torch.manual_seed(seed)
+            if not training_fold.prepare():
+                raise ValueError(f"The datasets of {training_fold.prefix_name} could not be created.")
+        return training_folds
+
+    # Parity of one step, in float64
+    max_step_difference = check_step_parity(create_prepared_folds("parity_sequential"),
+                                            create_prepared_folds("parity_vectorized"))
+    is_matching = max_step_difference <= tolerance
+    if not is_matching:
+        raise ValueError("One float64 step differs from the sequential training: " + \
+                         f"maximum weight difference {max_step_difference:.2e} > {tolerance:.0e}.")
+
+    # Sequential training
+    sequential_folds = create_prepared_folds("sequential")
+    start_time = time.perf_counter()
+    for training_fold in sequential_folds:
+        training_fold.train()
+    synchronize(device)
+    sequential_time = time.perf_counter() - start_time
+    for training_fold in sequential_folds:
+        training_fold.finish()
+
+    # Vectorized training
+    vectorized_folds = create_prepared_folds("vectorized")
+    start_time = time.perf_counter()
+    VectorizedTrainingFolds(vectorized_folds).train()
+    synchronize(device)
+    vectorized_time = time.perf_counter() - start_time
+    for training_fold in vectorized_folds:
+        training_fold.finish()
+
+    max_loss_difference, max_accuracy_difference = compare_histories(sequential_folds,
+                                                                      vectorized_folds)
+
+    results = {
+        "n_folds": len(validation_folds),
+        "architecture": hp_configuration["architecture"],
+        "max_step_difference": max_step_difference,
+        "is_matching": is_matching,
+        "sequential_seconds": sequential_time,
+        "vectorized_seconds": vectorized_time,
+        "speedup": sequential_time / vectorized_time,
+        "max_loss_difference": max_loss_difference,
+        "max_accuracy_difference": max_accuracy_difference,
+    }
+
+    print(colored("One float64 step matches the sequential training: " + \
+                  f"maximum weight difference {max_step_difference:.2e}.", 'magenta'))
+
+    print(colored(f"{len(validation_folds)} folds of {hp_configuration['architecture']}, " + \
+                  f"{hp_configuration['n_epochs']} epochs: speedup {results['speedup']:.2f}x " + \
+                  f"({sequential_time:.1f} s sequential -> {vectorized_time:.1f} s vectorized), " + \
+                  f"maximum float32 loss difference {max_loss_difference:.2e}, " + \
+                  f"maximum accuracy difference {max_accuracy_difference:.2e}.", 'magenta'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    # Definition of all arguments
+    parser.add_argument(
+        '--file', '--config_file',
+        type = str, default = None, required = True,
+        help = 'Training configuration file.'
+    )
+
+    parser.add_argument(
+        '--test_fold',
+        type = str, default = None, required = True,
+        help = 'Test fold.'
+    )
+
+    parser.add_argument(
+        '--validation_folds',
+        nargs = '+', type = str, default = None, required = False,
+        help = 'Validation folds trained together. By default, validation_fold_list without the test fold.'
+    )
+
+    parser.add_argument(
+        '--hp_config_index',
+        type = int, default = 0, required = False,
+        help = 'Index of the hyperparameter configuration.'
+    )
+
+    parser.add_argument(
+        '--n_epochs',
+        type = int, default = None, required = False,
+        help = 'Number of epochs. By default, the one of the hyperparameter configuration.'
+    )
+
+    parser.add_argument(
+        '--device',
+        type = str, default = "cpu", required = False,
+        help = 'Execution device.'
+    )
+
+    parser.add_argument(
+        '--tolerance',
+        type = float, default = 1e-9, required = False,
+        help = 'Maximum difference of the weights after one float64 step.'
+    )
+
+    args = parser.parse_args()
+
+    config_dict = get_config(args.file)
+    validation_folds = args.validation_folds
+    if validation_folds is None:
+        validation_folds = [fold for fold in config_dict["validation_fold_list"]
+                            if fold != args.test_fold]
+
+    return benchmark_vectorized_training(
+        config_dict,
+        test_fold=args.test_fold,
+        validation_folds=validation_folds,
+        hp_config_index=args.hp_config_index,
+        n_epochs=args.n_epochs,
+        device=args.device,
+        tolerance=args.tolerance
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import hashlib
+import io
+import os
+import queue
+import shutil
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+from termcolor import colored
+
+import torch
+
+
+def snapshot_to_host(value):
+    """
+    Copies the tensors of a checkpoint to host memory, and the containers
+    holding them, so the training can modify its state while it is written.
+
+    Args:
+        value: A tensor, or a dict, list or tuple containing tensors.
+
+    Returns:
+        The copy.
+    """
+
+    if isinstance(value, torch.Tensor):
+        return value.detach().to('cpu', copy=True)
+    if isinstance(value, dict):
+        return type(value)((key, snapshot_to_host(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [snapshot_to_host(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(snapshot_to_host(item) for item in value)
+
+    return value
+
+
+def save_atomically(checkpoint_data: dict,
+                    file_path: Path) -> str:
+    """
+    Saves a checkpoint to a temporary file and renames it,
+    so a checkpoint file is never partially written.
+
+    Args:
+        checkpoint_data (dict): The checkpoint.
+        file_path (Path): The checkpoint file.
+
+    Returns:
+        str: The SHA-256 of the file, computed from the bytes written.
+    """
+
+    buffer = io.BytesIO()
+    torch.save(checkpoint_data, buffer)
+    data = buffer.getbuffer()
+
+    temporary_path = file_path.with_name(file_path.name + ".tmp")
+    with open(temporary_path, 'wb') as file_pointer:
+        file_pointer.write(data)
+    os.replace(temporary_path, file_path)
+
+    return hashlib.sha256(data).hexdigest()
+
+
+def link_atomically(source_path: Path,
+                    file_path: Path):
+    """
+    Creates file_path as a hard link of source_path, or as a copy if the
+    file system does not support hard links.
+
+    Args:
+        source_path (Path): The written checkpoint.
+        file_path (Path): The other checkpoint file.
+    """
+
+    temporary_path = file_path.with_name(file_path.name + ".tmp")
+    if temporary_path.exists():
+        temporary_path.unlink()
+
+    try:
+        os.link(source_path, temporary_path)
+    except OSError:
+        shutil.copyfile(source_path, temporary_path)
+    os.replace(temporary_path, file_path)
+
+
+# Checkpoints waiting to be written, each a copy of the state in host memory
+MAX_PENDING_CHECKPOINTS = 2
+
+
+class AsyncCheckpointWriter():
+    def __init__(self,
+                 enabled: bool = True,
+                 store=None,
+                 max_pending: int = MAX_PENDING_CHECKPOINTS):
+        """
+        Writes checkpoints in a background thread, in submission order.
+
+        The state is copied to host memory when a checkpoint is submitted,
+        then the thread writes it once and hard-links the other checkpoint
+        kinds of the same epoch. If disabled, the writes are done
+        immediately in the calling thread.
+
+        At most max_pending checkpoints wait in the queue, besides the one
+        being written. When the file system is slower than the epochs,
+        submit blocks until one is written, so the host memory taken by the
+        copies stays bounded instead of growing with each epoch.
+
+        Args:
+            enabled (bool): Whether to write in a background thread. Default is True.
+            store (CompactCheckpointStore): Writes the checkpoints as blobs and
+                metadata instead of .pth files. (Optional)
+            max_pending (int): Maximum number of checkpoints waiting to be
+                written. Default is 2.
+        """
+
+        self.enabled = enabled
+        self.store = store
+        self.tasks_queue = queue.Queue(maxsize=max_pending)
+        self.thread = None
+        self.error = None
+
+
+    def submit(self,
+               checkpoint_data: dict,
+               file_path_list: List[Path],
+               rotation_list: Optional[List[Tuple[Path, Path, Optional[Path]]]] = None,
+               message: Optional[str] = None,
+               on_written: Optional[Callable[[str], None]] = None):
+        """
+        Submits a checkpoint written to one or several files. Blocks while
+        the queue of pending checkpoints is full.
+
+        Args:
+            checkpoint_data (dict): The checkpoint. Tensors are copied to host memory.
+            file_path_list (list of Path): The files of the checkpoint.
+            rotation_list (list of tuple): (previous_path, backup_path, path_to_remove)
+                applied after writing: path_to_remove is deleted and previous_path
+                is renamed to backup_path. (Optional)
+            message (str): Printed once the checkpoint is written. (Optional)
+            on_written (callable): Called with the SHA-256 of the written file once
+                the rotation is applied, e.g. to update the manifest. (Optional)
+        """
+
+        self.raise_error()
+
+        task = (snapshot_to_host(checkpoint_data),
+                list(file_path_list),
+                list(rotation_list or []),
+                message,
+                on_written)
+
+        if not self.enabled:
+            self._write(*task)
+            return
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+        self.tasks_queue.put(task)
+
+
+    def flush(self):
+        """
+        Waits until all the submitted checkpoints are written.
+
+        Raises:
+            RuntimeError: If a checkpoint could not be written.
+        """
+
+        if self.thread is not None:
+            self.tasks_queue.join()
+
+        self.raise_error()
+
+
+    def close(self):
+        """
+        Writes the pending checkpoints and stops the background thread.
+        """
+
+        if self.thread is not None:
+            self.tasks_queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+        self.raise_error()
+
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError(f"Checkpoint writing failed: {error}") from error
+
+
+    def _run(self):
+        while True:
+            task = self.tasks_queue.get()
+            try:
+                if task is None:
+                    return
+                self._write(*task)
+            except Exception as e:
+                # Kept until the next submit or flush in the training thread
+                print(colored(f"Error writing checkpoint: {e}", 'red'))
+                self.error = e
+            finally:
+                self.tasks_queue.task_done()
+
+
+    def _write(self,
+               checkpoint_data: dict,
+               file_path_list: List[Path],
+               rotation_list: List[Tuple[Path, Path, Optional[Path]]],
+               message: Optional[str],
+               on_written: Optional[Callable[[str], None]]):
+
+        if self.store is not None:
+            file_hash = self.store.write(checkpoint_data, file_path_list)
+        else:
+            first_path = file_path_list[0]
+            file_hash = save_atomically(checkpoint_data, first_path)
+
+            for file_path in file_path_list[1:]:
+                link_atomically(first_path, file_path)
+
+        if message:
+            print(colored(message, 'cyan'))
+
+        # Keeps the previous checkpoint as backup and removes the older one
+        for previous_path, backup_path, path_to_remove in rotation_list:
+            if not previous_path.exists():
+                continue
+            if path_to_remove and path_to_remove.exists():
+                os.remove(path_to_remove)
+                if self.store is not None:
+                    self.store.release(path_to_remove)
+            previous_path.replace(backup_path)
+            if self.store is not None:
+                self.store.rename(previous_path, backup_path)
+
+        if on_written is not None:
+            on_written(file_hash)
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from termcolor import colored
+
+
+# Created with the checkpoint folder: every task of the folder has a manifest,
+# so a task without one has no checkpoint and the folder is never scanned
+MANIFESTS_MARKER_FILENAME = ".checkpoint_manifests"
+
+# Checkpoints to resume from, in order of preference
+RESUME_ROLES = ["final", "latest", "latest_backup"]
+
+# Checks of a checkpoint file when resuming: its size and modification time,
+# or also its hash, which reads the whole file
+VERIFICATIONS = ["size_mtime", "hash"]
+
+
+def get_manifest_filepath(checkpoint_folder_path: Path,
+                          prefix_name: str) -> Path:
+    """
+    Returns the manifest file of a task, e.g. 'job_test_k1_hp_0_val_k2_manifest.json'.
+    """
+    return checkpoint_folder_path / f"{prefix_name}_manifest.json"
+
+
+def compute_file_hash(file_path: Path,
+                      chunk_size: int = 1 << 20) -> str:
+    """
+    Returns the SHA-256 of a file, read by chunks.
+    """
+
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as file_pointer:
+        for chunk in iter(lambda: file_pointer.read(chunk_size), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def create_checkpoint_folder(checkpoint_folder_path: Path):
+    """
+    Creates the checkpoint folder, with the marker telling that all its
+    tasks have manifests. The folder is created with its marker under a
+    temporary name and renamed, so no process sees it without the marker.
+    """
+
+    if checkpoint_folder_path.exists():
+        return
+
+    checkpoint_folder_path.parent.mkdir(mode=0o775, parents=True, exist_ok=True)
+    temporary_folder_path = checkpoint_folder_path.with_name(f".{checkpoint_folder_path.name}.{uuid.uuid4().hex}.tmp")
+    temporary_folder_path.mkdir(mode=0o775)
+    (temporary_folder_path / MANIFESTS_MARKER_FILENAME).touch()
+
+    try:
+        os.rename(temporary_folder_path, checkpoint_folder_path)
+    except OSError:
+        # Created at the same time by another process, with its marker
+        shutil.rmtree(temporary_folder_path, ignore_errors=True)
+        if not checkpoint_folder_path.is_dir():
+            raise
+
+
+def has_manifests_marker(checkpoint_folder_path: Path) -> bool:
+    return (checkpoint_folder_path / MANIFESTS_MARKER_FILENAME).exists()
+
+
+class CheckpointManifest():
+    def __init__(self,
+                 checkpoint_folder_path: Path,
+                 prefix_name: str,
+                 verification: str = "size_mtime"):
+        """
+        Per-task record of the checkpoints on disk, so that resuming a
+        task reads one small file instead of listing the checkpoint folder.
+
+        For each role ('best', 'best_backup', 'latest', 'latest_backup'
+        and 'final', the checkpoint of the last epoch or of early stopping),
+        the manifest keeps the file name, the epoch index, the SHA-256 of
+        the file, computed from the bytes written, and its size and
+        modification time. It is rewritten atomically after each checkpoint
+        is written, by the thread writing the checkpoints.
+
+        Args:
+            checkpoint_folder_path (Path): The checkpoint folder.
+            prefix_name (str): The prefix of the checkpoint files of the task.
+            verification (str): 'size_mtime' or 'hash', the check of the
+                checkpoint files when resuming. Default is 'size_mtime'.
+        """
+
+        if verification not in VERIFICATIONS:
+            raise ValueError(f"Invalid checkpoint verification: {verification}. Must be one of {VERIFICATIONS}.")
+
+        self.checkpoint_folder_path = checkpoint_folder_path
+        self.verification = verification
+        self.prefix_name = prefix_name
+        self.manifest_filepath = get_manifest_filepath(checkpoint_folder_path, prefix_name)
+        self.manifest = None
+
+
+    def read(self) -> Optional[dict]:
+        """
+        Reads the manifest.
+
+        Returns:
+            dict: The manifest, or None if the task has no manifest.
+        """
+
+        if not self.manifest_filepath.exists():
+            return None
+
+        try:
+            with open(self.manifest_filepath, 'r', encoding="utf-8") as file_pointer:
+                self.manifest = json.load(file_pointer)
+        except (OSError, json.JSONDecodeError) as e:
+            print(colored(f"Warning: unable to read '{self.manifest_filepath}': {e}", 'yellow'))
+            return None
+
+        return self.manifest
+
+
+    def write(self):
+        temporary_path = self.manifest_filepath.with_name(self.manifest_filepath.name + ".tmp")
+        with open(temporary_path, 'w', encoding="utf-8") as file_pointer:
+            json.dump(self.manifest, file_pointer, indent=2)
+            file_pointer.flush()
+            os.fsync(file_pointer.fileno())
+        os.replace(temporary_path, self.manifest_filepath)
+
+
+    def get_path(self,
+                 role: str) -> Optional[Path]:
+        """
+        Returns the checkpoint file of a role, or None if there is none.
+        """
+
+        entry = (self.manifest or {}).get("checkpoints", {}).get(role)
+        if entry is None:
+            return None
+
+        return self.checkpoint_folder_path / entry["filename"]
+
+
+    def get_epoch_index(self,
+                        role: str) -> Optional[int]:
+        entry = (self.manifest or {}).get("checkpoints", {}).get(role)
+        return None if entry is None else entry["epoch_index"]
+
+
+    def verify(self,
+               role: str) -> bool:
+        """
+        Returns True if the checkpoint file of a role exists and has the
+        recorded size and modification time, and with 'hash' verification,
+        the recorded hash. Entries without size, written before it was
+        recorded, are checked by their hash.
+        """
+
+        file_path = self.get_path(role)
+        if file_path is None or not file_path.exists():
+            return False
+
+        entry = self.manifest["checkpoints"][role]
+        if "size" in entry:
+            file_stat = file_path.stat()
+            if file_stat.st_size != entry["size"] or file_stat.st_mtime_ns != entry["mtime_ns"]:
+                return False
+            if self.verification != "hash":
+                return True
+
+        return compute_file_hash(file_path) == entry["sha256"]
+
+
+    def record(self,
+               epoch_index: int,
+               role_paths: Dict[str, Path],
+               rotation_list: List[Tuple[str, Path, Path]],
+               file_hash: Optional[str] = None):
+        """
+        Records the checkpoint of an epoch, once it is written and the
+        previous checkpoints are rotated to their backups.
+
+        Args:
+            epoch_index (int): The epoch index of the checkpoint.
+            role_paths (dict): The file of the checkpoint for each of its roles.
+            rotation_list (list of tuple): (role, previous_path, backup_path) of the
+                checkpoints renamed to backups.
+            file_hash (str): The SHA-256 of the file, computed while writing it.
+                The file is read to compute it if not given. (Optional)
+        """
+
+        if self.manifest is None:
+            self.manifest = {"prefix_name": self.prefix_name,
+                             "checkpoints": {}}
+        checkpoints = self.manifest["checkpoints"]
+
+        for role, previous_path, backup_path in rotation_list:
+            entry = checkpoints.get(role)
+            if entry is not None and entry["filename"] == previous_path.name and backup_path.exists():
+                checkpoints[f"{role}_backup"] = dict(entry, filename=backup_path.name)
+
+        # The roles of an epoch are links to, or copies of, the same file
+        for role, file_path in role_paths.items():
+            if file_hash is None:
+                file_hash = compute_file_hash(file_path)
+            file_stat = file_path.stat()
+            checkpoints[role] = {"filename": file_path.name,
+                                 "epoch_index": epoch_index,
+                                 "sha256": file_hash,
+                                 "size": file_stat.st_size,
+                                 "mtime_ns": file_stat.st_mtime_ns}
+
+        self.write()
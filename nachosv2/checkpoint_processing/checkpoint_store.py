@@ -0,0 +1,342 @@
+import hashlib
+import io
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+from termcolor import colored
+
+import torch
+
+from nachosv2.checkpoint_processing.async_checkpoint_writer import link_atomically
+
+
+COMPACT_CHECKPOINT_SUFFIX = ".json"
+
+BLOBS_FOLDER_NAME = "blobs"
+
+WEIGHTS_DTYPE_NAMES = {
+    'float32': None,
+    'float16': torch.float16,
+    'bfloat16': torch.bfloat16,
+}
+
+# Entries of a checkpoint stored as blobs, the others are kept in the metadata
+BLOB_KEYS = ["model_state_dict", "optimizer_state_dict"]
+
+
+def cast_state_dict(state_dict: dict,
+                    dtype: Optional[torch.dtype]) -> dict:
+    """
+    Casts the floating point tensors of a state dict, e.g. to float16.
+    """
+
+    if dtype is None:
+        return state_dict
+
+    return type(state_dict)((key, value.to(dtype) if torch.is_floating_point(value) else value)
+                            for key, value in state_dict.items())
+
+
+def write_file_atomically(file_path: Path,
+                          data: bytes) -> str:
+    """
+    Writes data to a temporary file and renames it, and returns the SHA-256 of the data.
+    """
+
+    temporary_path = file_path.with_name(file_path.name + ".tmp")
+    with open(temporary_path, 'wb') as file_pointer:
+        file_pointer.write(data)
+    os.replace(temporary_path, file_path)
+
+    return hashlib.sha256(data).hexdigest()
+
+
+def load_checkpoint_file(file_path: Path,
+                         map_location: Optional[str] = None) -> dict:
+    """
+    Loads a checkpoint, written as one .pth file or as the metadata of
+    a compact checkpoint and its blobs.
+
+    Args:
+        file_path (Path): The checkpoint file.
+        map_location (str): The device of the tensors. (Optional)
+
+    Returns:
+        dict: The checkpoint, with the same entries in both cases.
+    """
+
+    file_path = Path(file_path)
+    if file_path.suffix != COMPACT_CHECKPOINT_SUFFIX:
+        return torch.load(f=file_path,
+                          weights_only=True,
+                          map_location=map_location)
+
+    with open(file_path, 'r', encoding="utf-8") as file_pointer:
+        metadata = json.load(file_pointer)
+
+    checkpoint = dict(metadata["state"])
+    for key, blob_name in metadata["blobs"].items():
+        checkpoint[key] = torch.load(f=file_path.parent / blob_name,
+                                     weights_only=True,
+                                     map_location=map_location)
+
+    # load_state_dict casts float16 weights back to the dtype of the model
+    return checkpoint
+
+
+def load_model_state_dict(file_path: Path,
+                          map_location: Optional[str] = None) -> dict:
+    """
+    Loads only the weights of a checkpoint.
+
+    The blob of the weights of a compact checkpoint is loaded on
+    map_location. A .pth file is memory-mapped on the CPU, so the
+    optimizer state is not read, and the weights are copied to the
+    device by load_state_dict.
+
+    Args:
+        file_path (Path): The checkpoint file.
+        map_location (str): The device of the weights of a compact checkpoint. (Optional)
+
+    Returns:
+        dict: The state dict of the model.
+    """
+
+    file_path = Path(file_path)
+    if file_path.suffix != COMPACT_CHECKPOINT_SUFFIX:
+        return torch.load(f=file_path,
+                          weights_only=True,
+                          mmap=True,
+                          map_location='cpu')["model_state_dict"]
+
+    with open(file_path, 'r', encoding="utf-8") as file_pointer:
+        metadata = json.load(file_pointer)
+
+    return torch.load(f=file_path.parent / metadata["blobs"]["model_state_dict"],
+                      weights_only=True,
+                      map_location=map_location)
+
+
+class CompactCheckpointStore():
+    def __init__(self,
+                 checkpoint_folder_path: Path,
+                 prefix_name: str,
+                 weights_dtype_name: str = 'float32'):
+        """
+        Writes checkpoints as content-addressed blobs of the weights and
+        of the optimizer state, named by their SHA-256, and a small JSON
+        file with the epoch, histories and references to the blobs.
+
+        A blob is written once, however many checkpoint files refer to
+        it, and removed when the last checkpoint file of the task referring
+        to it is removed. The blobs of a task are in their own folder,
+        blobs/<prefix>, so removing them never affects another task.
+
+        Args:
+            checkpoint_folder_path (Path): The checkpoint folder.
+            prefix_name (str): The prefix of the checkpoint files of the task.
+            weights_dtype_name (str): 'float32', 'float16' or 'bfloat16', the
+                data type of the stored weights. Default is 'float32'.
+        """
+
+        if weights_dtype_name not in WEIGHTS_DTYPE_NAMES:
+            raise ValueError(f"checkpoint_weights_dtype must be one of {list(WEIGHTS_DTYPE_NAMES)}, " + \
+                             f"got {weights_dtype_name}.")
+
+        self.checkpoint_folder_path = checkpoint_folder_path
+        self.blobs_folder_path = checkpoint_folder_path / BLOBS_FOLDER_NAME / prefix_name
+        self.weights_dtype_name = weights_dtype_name
+        self.weights_dtype = WEIGHTS_DTYPE_NAMES[weights_dtype_name]
+        # Blobs referred to by each checkpoint file name of the task
+        self.references: Dict[str, List[str]] = {}
+
+
+    def track(self,
+              file_path_list: List[Path]):
+        """
+        Reads the references of checkpoint files written by an earlier run,
+        so that their blobs are removed with them.
+        """
+
+        for file_path in file_path_list:
+            if file_path is None or file_path.suffix != COMPACT_CHECKPOINT_SUFFIX or \
+               not file_path.exists():
+                continue
+            with open(file_path, 'r', encoding="utf-8") as file_pointer:
+                self.references[file_path.name] = list(json.load(file_pointer)["blobs"].values())
+
+
+    def write_blob(self,
+                   value) -> str:
+        """
+        Writes a blob if it does not exist yet.
+
+        Returns:
+            str: The path of the blob, relative to the checkpoint folder.
+        """
+
+        buffer = io.BytesIO()
+        torch.save(value, buffer)
+        data = buffer.getvalue()
+
+        blob_path = self.blobs_folder_path / f"{hashlib.sha256(data).hexdigest()}.pt"
+        if not blob_path.exists():
+            self.blobs_folder_path.mkdir(mode=0o775, parents=True, exist_ok=True)
+            write_file_atomically(blob_path, data)
+
+        return str(blob_path.relative_to(self.checkpoint_folder_path))
+
+
+    def write(self,
+              checkpoint_data: dict,
+              file_path_list: List[Path]) -> str:
+        """
+        Writes a checkpoint to one or several files, the first one
+        written and the others hard-linked to it.
+
+        Args:
+            checkpoint_data (dict): The checkpoint, on host memory.
+            file_path_list (list of Path): The checkpoint files.
+
+        Returns:
+            str: The SHA-256 of the checkpoint file, the metadata referring to the blobs.
+        """
+
+        blobs = {}
+        for key in BLOB_KEYS:
+            value = checkpoint_data[key]
+            if key == "model_state_dict":
+                value = cast_state_dict(value, self.weights_dtype)
+            blobs[key] = self.write_blob(value)
+
+        metadata = {
+            "weights_dtype": self.weights_dtype_name,
+            "blobs": blobs,
+            "state": {key: value for key, value in checkpoint_data.items() if key not in BLOB_KEYS},
+        }
+
+        first_path = file_path_list[0]
+        file_hash = write_file_atomically(first_path, json.dumps(metadata).encode("utf-8"))
+        for file_path in file_path_list[1:]:
+            link_atomically(first_path, file_path)
+
+        # Files rewritten, e.g. when an epoch is trained again after resuming,
+        # may refer to the blobs just written
+        previous_blob_names = []
+        for file_path in file_path_list:
+            previous_blob_names += self.references.pop(file_path.name, [])
+            self.references[file_path.name] = list(blobs.values())
+        self.remove_unreferenced(previous_blob_names)
+
+        return file_hash
+
+
+    def rename(self,
+               previous_path: Path,
+               new_path: Path):
+        """
+        Moves the references of a checkpoint file renamed on disk.
+        """
+
+        self.release(new_path)
+        if previous_path.name in self.references:
+            self.references[new_path.name] = self.references.pop(previous_path.name)
+
+
+    def release(self,
+                file_path: Path):
+        """
+        Drops the references of a checkpoint file removed or replaced on disk,
+        and removes the blobs no other checkpoint file refers to.
+        """
+
+        self.remove_unreferenced(self.references.pop(file_path.name, []))
+
+
+    def remove_unreferenced(self,
+                            blob_names: List[str]):
+        """
+        Removes the blobs among blob_names that no checkpoint file refers to.
+        """
+
+        referenced_blobs = {blob_name for names in self.references.values() for blob_name in names}
+
+        for blob_name in set(blob_names) - referenced_blobs:
+            blob_path = self.checkpoint_folder_path / blob_name
+            if blob_path.exists():
+                os.remove(blob_path)
+
+
+def get_checkpoint_footprint(checkpoint_folder_path: Path) -> dict:
+    """
+    Measures the storage of the checkpoints of a sweep.
+
+    Returns:
+        dict: The bytes on disk ('stored_bytes', hard links counted once),
+            the bytes the checkpoint files would take written in full
+            ('logical_bytes'), and the number of checkpoint files and blobs.
+    """
+
+    stored_bytes = 0
+    logical_bytes = 0
+    n_checkpoint_files = 0
+    n_blobs = 0
+    seen_inodes = set()
+    blob_sizes = defaultdict(int)
+    compact_files = []
+
+    if not checkpoint_folder_path.exists():
+        return {"stored_bytes": 0, "logical_bytes": 0, "n_checkpoint_files": 0, "n_blobs": 0}
+
+    for root, _, filenames in os.walk(checkpoint_folder_path):
+        for filename in filenames:
+            file_path = Path(root) / filename
+            if filename.endswith(".tmp"):
+                continue
+            file_stat = file_path.stat()
+
+            if (file_stat.st_dev, file_stat.st_ino) not in seen_inodes:
+                seen_inodes.add((file_stat.st_dev, file_stat.st_ino))
+                stored_bytes += file_stat.st_size
+
+            if Path(root).parent.name == BLOBS_FOLDER_NAME:
+                n_blobs += 1
+                blob_sizes[str(file_path.relative_to(checkpoint_folder_path))] = file_stat.st_size
+            elif filename.endswith(".pth"):
+                n_checkpoint_files += 1
+                logical_bytes += file_stat.st_size
+            elif filename.endswith(COMPACT_CHECKPOINT_SUFFIX) and not filename.endswith("_manifest.json"):
+                n_checkpoint_files += 1
+                logical_bytes += file_stat.st_size
+                compact_files.append(file_path)
+
+    # A compact checkpoint file stands for its blobs
+    for file_path in compact_files:
+        with open(file_path, 'r', encoding="utf-8") as file_pointer:
+            blob_names = json.load(file_pointer)["blobs"].values()
+        logical_bytes += sum(blob_sizes.get(blob_name, 0) for blob_name in blob_names)
+
+    return {"stored_bytes": stored_bytes,
+            "logical_bytes": logical_bytes,
+            "n_checkpoint_files": n_checkpoint_files,
+            "n_blobs": n_blobs}
+
+
+def report_checkpoint_footprint(checkpoint_folder_path: Path):
+    """
+    Prints the storage of the checkpoints of a sweep.
+    """
+
+    footprint = get_checkpoint_footprint(checkpoint_folder_path)
+    if footprint["n_checkpoint_files"] == 0:
+        return
+
+    message = f"Checkpoints: {footprint['stored_bytes'] / 1e9:.3f} GB on disk for " + \
+              f"{footprint['n_checkpoint_files']} checkpoint files"
+    if footprint["n_blobs"] > 0:
+        message += f" and {footprint['n_blobs']} blobs"
+    message += f", {footprint['logical_bytes'] / 1e9:.3f} GB if each file was written in full."
+
+    print(colored(message, 'magenta'))
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+from termcolor import colored
+
+import fasteners
+
+from nachosv2.training.training.task_scheduler import get_task_key
+
+
+# Status of a task in the ledger
+DISPATCHED = "dispatched"
+FINISHED = "finished"
+
+
+def get_ledger_filepath(config_dict: dict,
+                        is_cv_loop: bool) -> Path:
+    """
+    Returns the ledger file of the sweep. It can be set with
+    'sweep_ledger_path', otherwise it is in the folder of the loop.
+    """
+
+    if config_dict.get('sweep_ledger_path'):
+        return Path(config_dict['sweep_ledger_path'])
+
+    loop_folder = "CV" if is_cv_loop else "CT"
+    return Path(config_dict["output_path"]) / loop_folder / "sweep_ledger.jsonl"
+
+
+def get_hp_hash(hp_configuration: dict) -> str:
+    """
+    Returns a hash of the hyperparameter values, so that a task is only
+    skipped if it was trained with the same hyperparameters.
+    """
+
+    hp_json = json.dumps(hp_configuration, sort_keys=True, default=str)
+    return hashlib.sha1(hp_json.encode("utf-8")).hexdigest()[:16]
+
+
+class SweepLedger():
+    def __init__(self,
+                 config_dict: dict,
+                 is_cv_loop: bool):
+        """
+        Append-only journal of the status of the tasks of a sweep.
+
+        Each line is a JSON entry with the task, the hash of its
+        hyperparameters and its status: 'dispatched' when it is given to
+        a worker, 'finished' once its predictions are saved. Entries are
+        appended under an inter-process lock and synced to disk, so that
+        several processes can share the ledger and a job killed while
+        writing loses at most its last line. The last entry of a task gives
+        its status.
+
+        Args:
+            config_dict (dict): The training configuration.
+            is_cv_loop (bool): If this is the cross-validation loop.
+        """
+
+        self.ledger_filepath = get_ledger_filepath(config_dict, is_cv_loop)
+        self.lock_filepath = self.ledger_filepath.with_name(self.ledger_filepath.name + ".lock")
+
+
+    def read_entries(self) -> List[dict]:
+        """
+        Reads the entries of the ledger, skipping a line left incomplete by a crash.
+        """
+
+        if not self.ledger_filepath.exists():
+            return []
+
+        entries = []
+        with open(self.ledger_filepath, 'r', encoding="utf-8") as file_pointer:
+            for line in file_pointer:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+
+        return entries
+
+
+    def get_status_dict(self) -> dict:
+        """
+        Returns the last entry of each task, by task key and hyperparameter hash.
+        """
+
+        return {(entry["task_key"], entry["hp_hash"]): entry
+                for entry in self.read_entries()}
+
+
+    def is_finished(self,
+                    indices_loop_dict: dict,
+                    status_dict: Optional[dict] = None) -> bool:
+        if status_dict is None:
+            status_dict = self.get_status_dict()
+
+        key = (get_task_key(indices_loop_dict),
+               get_hp_hash(indices_loop_dict["hp_configuration"]))
+        entry = status_dict.get(key)
+
+        return entry is not None and entry["status"] == FINISHED
+
+
+    def filter_unfinished(self,
+                          indices_loop_list: List[dict]) -> List[dict]:
+        """
+        Removes the tasks finished in an earlier run, in one read of the ledger.
+        Partially trained tasks are kept, they resume from their checkpoints.
+
+        Args:
+            indices_loop_list (list of dict): The tasks of the loop.
+
+        Returns:
+            list of dict: The tasks left to train, in the same order.
+        """
+
+        status_dict = self.get_status_dict()
+        unfinished_list = [indices_loop_dict for indices_loop_dict in indices_loop_list
+                           if not self.is_finished(indices_loop_dict, status_dict)]
+
+        n_finished = len(indices_loop_list) - len(unfinished_list)
+        if n_finished > 0:
+            print(colored(f"{n_finished} of {len(indices_loop_list)} tasks already finished " + \
+                          f"according to {self.ledger_filepath}, skipping them.", 'green'))
+
+        return unfinished_list
+
+
+    def record(self,
+               indices_loop_dict: dict,
+               status: str,
+               result: Optional[dict] = None,
+               rank: int = 0):
+        """
+        Appends the status of a task to the ledger.
+
+        Args:
+            indices_loop_dict (dict): The task.
+            status (str): 'dispatched' or 'finished'.
+            result (dict): The result of perform_single_training, for finished tasks. (Optional)
+            rank (int): The rank training the task. Default is 0.
+        """
+
+        entry = {
+            "task_key": get_task_key(indices_loop_dict),
+            "hp_hash": get_hp_hash(indices_loop_dict["hp_configuration"]),
+            "status": status,
+            "rank": rank,
+            "timestamp": time.time(),
+        }
+        if result is not None:
+            entry["epochs_completed"] = result["epochs_completed"]
+            entry["duration_seconds"] = result["duration_seconds"]
+
+        line = json.dumps(entry) + "\n"
+
+        self.ledger_filepath.parent.mkdir(mode=0o775, parents=True, exist_ok=True)
+        with fasteners.InterProcessLock(self.lock_filepath):
+            # A line left incomplete by a crash must not swallow this entry
+            if self.ledger_filepath.exists() and self.ledger_filepath.stat().st_size > 0:
+                with open(self.ledger_filepath, 'rb') as file_pointer:
+                    file_pointer.seek(-1, os.SEEK_END)
+                    if file_pointer.read(1) != b"\n":
+                        line = "\n" + line
+
+            with open(self.ledger_filepath, 'a', encoding="utf-8") as file_pointer:
+                file_pointer.write(line)
+                file_pointer.flush()
+                os.fsync(file_pointer.fileno())
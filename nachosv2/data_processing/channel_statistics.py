@@ -0,0 +1,233 @@
+import os
+import json
+import hashlib
+import uuid
+from pathlib import Path
+from typing import Optional, List, Union
+import numpy as np
+import torch
+
+
+class ChannelStatistics():
+    def __init__(self,
+                 number_channels: int,
+                 count: int = 0,
+                 mean: Optional[List[float]] = None,
+                 m2: Optional[List[float]] = None):
+        """
+        Streaming per-channel mean and variance of images.
+
+        Batches are reduced on their device around the batch mean and the
+        partial results are combined in float64 with the parallel form of
+        Welford's algorithm (Chan et al.), so the variance does not suffer
+        from the cancellation of the sum-of-squares formula. Two statistics
+        computed on disjoint sets of images can be merged exactly.
+
+        Args:
+            number_channels (int): The number of channels of the images.
+            count (int): Number of pixels per channel already accumulated. Default is 0.
+            mean (list of float): Per-channel mean already accumulated. (Optional)
+            m2 (list of float): Per-channel sum of squared deviations from the mean. (Optional)
+        """
+
+        self.number_channels = number_channels
+        self.count = count
+        self.mean = np.zeros(number_channels, dtype=np.float64) if mean is None \
+            else np.asarray(mean, dtype=np.float64)
+        self.m2 = np.zeros(number_channels, dtype=np.float64) if m2 is None \
+            else np.asarray(m2, dtype=np.float64)
+
+
+    def update(self, images: torch.Tensor):
+        """
+        Adds a batch of images of shape (N, C, H, W) to the statistics.
+
+        Args:
+            images (torch.Tensor): The batch of images.
+        """
+
+        # (C, N*H*W)
+        pixels = images.transpose(0, 1).reshape(self.number_channels, -1)
+        batch_count = pixels.shape[1]
+        if batch_count == 0:
+            return
+
+        batch_mean = pixels.mean(dim=1, keepdim=True)
+        batch_m2 = ((pixels - batch_mean) ** 2).sum(dim=1)
+
+        self._combine(batch_count,
+                      batch_mean.squeeze(1).double().cpu().numpy(),
+                      batch_m2.double().cpu().numpy())
+
+
+    def merge(self, other: "ChannelStatistics") -> "ChannelStatistics":
+        """
+        Returns the statistics of the union of the images of both statistics.
+
+        Args:
+            other (ChannelStatistics): The statistics to merge with.
+
+        Returns:
+            ChannelStatistics: The merged statistics.
+        """
+
+        if other.number_channels != self.number_channels:
+            raise ValueError("Cannot merge statistics with different number of channels: "
+                             f"{self.number_channels} and {other.number_channels}.")
+
+        merged = ChannelStatistics(self.number_channels, self.count,
+                                   self.mean.copy(), self.m2.copy())
+        merged._combine(other.count, other.mean, other.m2)
+
+        return merged
+
+
+    def get_mean_stddev(self):
+        """
+        Returns the mean and the population standard deviation.
+
+        Returns:
+            Tuple[Union[float, List[float]], Union[float, List[float]]]:
+            (mean, std), scalars for grayscale or lists of floats for RGB.
+        """
+
+        if self.count == 0:
+            raise ValueError("The statistics are empty.")
+
+        stddev = np.sqrt(self.m2 / self.count)
+
+        if self.number_channels == 1:
+            return float(self.mean[0]), float(stddev[0])
+        elif self.number_channels == 3:
+            return self.mean.tolist(), stddev.tolist()
+        else:
+            raise ValueError("Number of channels must be 1 or 3.")
+
+
+    def to_dict(self) -> dict:
+        return {"number_channels": self.number_channels,
+                "count": self.count,
+                "mean": self.mean.tolist(),
+                "m2": self.m2.tolist()}
+
+
+    @classmethod
+    def from_dict(cls, dictionary: dict) -> "ChannelStatistics":
+        return cls(number_channels=dictionary["number_channels"],
+                   count=dictionary["count"],
+                   mean=dictionary["mean"],
+                   m2=dictionary["m2"])
+
+
+    def _combine(self,
+                 other_count: int,
+                 other_mean: np.ndarray,
+                 other_m2: np.ndarray):
+        """
+        Combines partial statistics in place (Chan et al. parallel algorithm).
+        """
+
+        if other_count == 0:
+            return
+
+        total_count = self.count + other_count
+        delta = other_mean - self.mean
+
+        self.mean = self.mean + delta * (other_count / total_count)
+        self.m2 = self.m2 + other_m2 + \
+            delta ** 2 * (self.count * other_count / total_count)
+        self.count = total_count
+
+
+def compute_channel_statistics(dataloader: "torch.utils.data.DataLoader",
+                               number_channels: int,
+                               device: str) -> ChannelStatistics:
+    """
+    Computes the channel statistics of all the images of a DataLoader.
+
+    Args:
+        dataloader (DataLoader): DataLoader providing batches of images.
+        number_channels (int): The number of channels of the images.
+        device (str): The device where the batches are reduced.
+
+    Returns:
+        ChannelStatistics: The statistics.
+    """
+
+    statistics = ChannelStatistics(number_channels)
+    for images, _, _ in dataloader:
+        statistics.update(images.to(device))
+
+    return statistics
+
+
+class FoldStatisticsCache():
+    def __init__(self,
+                 cache_directory: Union[str, Path]):
+        """
+        Stores the channel statistics of each fold as JSON files,
+        so they are computed once and shared by every test fold,
+        validation fold, hyperparameter configuration and MPI rank.
+
+        Args:
+            cache_directory (str or Path): Directory of the statistics files.
+        """
+
+        self.cache_directory = Path(cache_directory)
+        self.cache_directory.mkdir(mode=0o775, parents=True, exist_ok=True)
+
+
+    @staticmethod
+    def get_key(fold_name: str,
+                source_identifier: str,
+                number_channels: int,
+                image_size: Optional[tuple],
+                crop_box: Optional[tuple]) -> str:
+        """
+        Creates the key of the statistics of a fold.
+
+        Args:
+            fold_name (str): The fold name.
+            source_identifier (str): Identifies the images of the fold,
+                e.g. the list of file paths or the packed dataset folder.
+            number_channels (int): The number of channels of the images.
+            image_size (tuple of int): The target size.
+            crop_box (tuple of int): The crop box, None if no cropping.
+
+        Returns:
+            key (str): The key, used as file name.
+        """
+
+        key_string = f"{source_identifier}|{number_channels}|" + \
+                     f"{tuple(image_size) if image_size else None}|" + \
+                     f"{tuple(crop_box) if crop_box else None}"
+        key_hash = hashlib.sha1(key_string.encode("utf-8")).hexdigest()[:16]
+
+        return f"fold_{fold_name}_{key_hash}"
+
+
+    def load(self, key: str) -> Optional[ChannelStatistics]:
+        """
+        Loads the statistics of a key.
+
+        Returns:
+            ChannelStatistics: The statistics, None if they are not cached.
+        """
+
+        try:
+            with open(self.cache_directory / f"{key}.json", 'r', encoding='utf-8') as f:
+                return ChannelStatistics.from_dict(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+
+
+    def save(self, key: str, statistics: ChannelStatistics):
+        """
+        Saves the statistics of a key atomically.
+        """
+
+        filepath = self.cache_directory / f"{key}.json"
+        temporary_filepath = filepath.with_name(f"{key}.{uuid.uuid4().hex}.tmp")
+        with open(temporary_filepath, 'w', encoding='utf-8') as f:
+            json.dump(statistics.to_dict(), f)
+        os.replace(temporary_filepath, filepath)
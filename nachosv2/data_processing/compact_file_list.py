@@ -0,0 +1,84 @@
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+
+class CompactStringArray():
+    def __init__(self,
+                 strings: Iterable[str]):
+        """
+        Read-only sequence of strings stored as one byte buffer of their
+        UTF-8 encodings and an array of offsets.
+
+        A list of str is one Python object per string, and reading an item
+        updates its reference count, which writes to the page of the object.
+        In DataLoader workers forked from the training process, reading all
+        the file paths of a partition then copies all their pages, in every
+        worker. The buffer and the offsets are two NumPy arrays, whose pages
+        are only read and stay shared with the parent process.
+
+        Args:
+            strings (iterable of str): The strings, e.g. the file paths of a partition.
+        """
+
+        encoded_strings = [string.encode("utf-8") for string in strings]
+
+        self.offsets = np.zeros(len(encoded_strings) + 1, dtype=np.int64)
+        np.cumsum([len(encoded_string) for encoded_string in encoded_strings],
+                  out=self.offsets[1:])
+        self.buffer = np.frombuffer(b"".join(encoded_strings), dtype=np.uint8)
+
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+    def __getitem__(self, index) -> str:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Index {index} out of range for {len(self)} strings.")
+
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self[index]
+
+
+    def tolist(self) -> List[str]:
+        return list(self)
+
+
+    @property
+    def nbytes(self) -> int:
+        return self.buffer.nbytes + self.offsets.nbytes
+
+
+def get_label_array(labels: Iterable[int]) -> np.ndarray:
+    """
+    Returns the labels as an array of the smallest integer type holding
+    them, int8 up to 127 classes, then int16 or int32.
+    """
+
+    labels = np.asarray(labels, dtype=np.int64)
+
+    for dtype in (np.int8, np.int16, np.int32):
+        if labels.size == 0 or (labels.min() >= np.iinfo(dtype).min and labels.max() <= np.iinfo(dtype).max):
+            return labels.astype(dtype)
+
+    return labels
+
+
+def create_compact_partition(files: Iterable[str],
+                             labels: Iterable[int]) -> Tuple[CompactStringArray, np.ndarray]:
+    """
+    Returns the files and labels of a partition in their compact encoding.
+    """
+
+    return CompactStringArray(files), get_label_array(labels)
@@ -0,0 +1,105 @@
+import argparse
+from pathlib import Path
+from typing import Optional
+from termcolor import colored
+
+import pandas as pd
+
+from nachosv2.data_processing.compact_file_list import get_label_array
+from nachosv2.data_processing.read_metadata_csv import read_metadata_csv
+
+
+def get_typed_metadata(df_metadata: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the metadata with fold_name as a categorical column, one code
+    per row instead of one string, and the labels as the smallest integer
+    type holding them. The other columns are kept as they are.
+    """
+
+    df_typed = df_metadata.copy()
+    df_typed["fold_name"] = df_typed["fold_name"].astype("category")
+    df_typed["label"] = get_label_array(df_typed["label"])
+
+    return df_typed
+
+
+def convert_metadata(csv_filepath: Path,
+                     output_filepath: Optional[Path] = None,
+                     file_format: str = "parquet") -> Path:
+    """
+    Converts the metadata CSV into a Parquet or Feather file, with
+    categorical fold_name and small integer labels, to be given as
+    path_metadata_csv.
+
+    Args:
+        csv_filepath (Path): Path to the metadata CSV file.
+        output_filepath (Path): Path of the converted file. Default is the
+            CSV path with the suffix of the format. (Optional)
+        file_format (str): 'parquet' or 'feather'. Default is 'parquet'.
+
+    Returns:
+        Path: The path of the converted file.
+    """
+
+    if file_format not in ["parquet", "feather"]:
+        raise ValueError(f"Invalid format: {file_format}. Must be 'parquet' or 'feather'.")
+
+    if output_filepath is None:
+        output_filepath = csv_filepath.with_suffix(f".{file_format}")
+
+    df_metadata = read_metadata_csv(csv_filepath)
+
+    l_columns = ["fold_name", "absolute_filepath", "label"]
+    if not all(val_col in df_metadata.columns for val_col in l_columns):
+        raise ValueError(f"The columns {l_columns} must be in csv_metadata file.")
+
+    df_typed = get_typed_metadata(df_metadata)
+
+    output_filepath.parent.mkdir(mode=0o775, parents=True, exist_ok=True)
+    if file_format == "parquet":
+        df_typed.to_parquet(output_filepath, index=False)
+    else:
+        df_typed.to_feather(output_filepath)
+
+    memory_before = df_metadata.memory_usage(deep=True).sum()
+    memory_after = df_typed.memory_usage(deep=True).sum()
+    print(colored(f"Converted {len(df_typed)} rows from {csv_filepath} ({csv_filepath.stat().st_size / 1e6:.1f} MB) " + \
+                  f"to {output_filepath} ({output_filepath.stat().st_size / 1e6:.1f} MB). " + \
+                  f"In memory: {memory_before / 1e6:.1f} MB as CSV, {memory_after / 1e6:.1f} MB converted.", 'green'))
+
+    return output_filepath
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    # Definition of all arguments
+    parser.add_argument(
+        '--csv_filepath',
+        type = str, default = None, required = True,
+        help = 'Path to the metadata CSV file.'
+    )
+
+    parser.add_argument(
+        '--output_filepath',
+        type = str, default = None, required = False,
+        help = 'Path of the converted file. Default is the CSV path with the suffix of the format.'
+    )
+
+    parser.add_argument(
+        '--format',
+        type = str, default = "parquet", required = False,
+        choices = ["parquet", "feather"],
+        help = 'Format of the converted file.'
+    )
+
+    args = parser.parse_args()
+
+    return convert_metadata(
+        csv_filepath=Path(args.csv_filepath),
+        output_filepath=Path(args.output_filepath) if args.output_filepath else None,
+        file_format=args.format)
+
+
+if __name__ == "__main__":
+    main()
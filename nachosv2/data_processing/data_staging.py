@@ -0,0 +1,349 @@
+import copy
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from termcolor import colored
+
+import fasteners
+import pandas as pd
+
+from nachosv2.data_processing.fold_index import FoldIndex
+
+
+# Size of the blocks read to copy and hash a file
+COPY_BLOCK_BYTES = 1 << 20
+
+# Checks of the staged files: the size and modification time of the source,
+# or also the hash of the staged file
+VERIFICATIONS = ["size_mtime", "hash"]
+
+# Status of a staged file
+HIT = "hit"
+COPIED = "copied"
+DEDUPLICATED = "deduplicated"
+
+
+def hash_file(filepath: Path) -> str:
+    """
+    Returns the SHA-256 hash of the content of a file.
+    """
+
+    file_hash = hashlib.sha256()
+    with open(filepath, 'rb') as file_pointer:
+        for block in iter(lambda: file_pointer.read(COPY_BLOCK_BYTES), b""):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+class DataStager():
+    def __init__(self,
+                 cache_directory: Path,
+                 df_metadata: pd.DataFrame,
+                 fold_index: Optional[FoldIndex] = None,
+                 n_workers: int = 8,
+                 verification: str = "size_mtime"):
+        """
+        Copies the images of the folds of each training to a node-local
+        cache, and gives the metadata with the file paths of the copies.
+
+        The cache is content-addressed: each file is stored once, under the
+        SHA-256 hash of its content, in objects/, and manifest.json maps
+        each source path to its hash, size and modification time. A file is
+        copied again only if its size or modification time changed, or with
+        'hash' verification, if its copy does not have the hash in its name.
+        Files with the same content are stored once. The trainings read
+        each file from files/<source path>, a hard link to its object, so
+        the file names in the results are the names of the source files.
+
+        The folds are staged when a training needs them, so a node only
+        copies the folds of the trainings it runs. The ranks of a node
+        sharing the cache take a lock, so a file is copied once, and the
+        files are copied by n_workers threads. The metadata given to the
+        trainings is a new DataFrame each time folds are staged, the
+        metadata of running trainings is not modified.
+
+        Args:
+            cache_directory (Path): The node-local cache folder.
+            df_metadata (pd.DataFrame): The metadata, with the source file paths.
+            fold_index (FoldIndex): The fold index of df_metadata. Built if not given. (Optional)
+            n_workers (int): Number of threads copying the files. Default is 8.
+            verification (str): 'size_mtime' or 'hash'. Default is 'size_mtime'.
+        """
+
+        if verification not in VERIFICATIONS:
+            raise ValueError(f"Invalid staging verification: {verification}. Must be one of {VERIFICATIONS}.")
+
+        self.cache_directory = Path(cache_directory)
+        self.objects_directory = self.cache_directory / "objects"
+        self.files_directory = self.cache_directory / "files"
+        self.temporary_directory = self.cache_directory / "tmp"
+        self.manifest_filepath = self.cache_directory / "manifest.json"
+        self.lock_filepath = self.cache_directory / "staging.lock"
+        for directory in [self.objects_directory, self.temporary_directory]:
+            directory.mkdir(mode=0o775, parents=True, exist_ok=True)
+        self.remove_temporary_files()
+
+        self.n_workers = n_workers
+        self.verification = verification
+
+        self.df_metadata = df_metadata
+        self.fold_index = fold_index if fold_index is not None else FoldIndex(df_metadata)
+        self.source_files = self.fold_index.files
+        self.staged_folds = set()
+
+        # Source path: {"size", "mtime_ns", "sha256", "object"}
+        self.manifest: Dict[str, dict] = {}
+
+        self.thread_lock = threading.Lock()
+        self.statistics = {HIT: 0, COPIED: 0, DEDUPLICATED: 0, "copied_bytes": 0, "seconds": 0.0}
+
+
+    def remove_temporary_files(self):
+        """
+        Removes the temporary files left by runs that stopped while
+        copying a file. The files are copied under the lock, so no rank
+        is writing them.
+        """
+
+        with fasteners.InterProcessLock(self.lock_filepath):
+            for temporary_filepath in self.temporary_directory.iterdir():
+                try:
+                    temporary_filepath.unlink()
+                except OSError:
+                    pass
+
+
+    def load_manifest(self):
+        """
+        Reads the manifest, with the files staged by the other ranks of the
+        node. Called under the lock. It is always read again, the
+        modification time of the file can be the same after an update on
+        file systems with a coarse time resolution.
+        """
+
+        if not self.manifest_filepath.exists():
+            return
+
+        with open(self.manifest_filepath, 'r', encoding="utf-8") as file_pointer:
+            self.manifest = json.load(file_pointer)
+
+
+    def save_manifest(self):
+        temporary_filepath = self.temporary_directory / f"manifest_{uuid.uuid4().hex}.json"
+        with open(temporary_filepath, 'w', encoding="utf-8") as file_pointer:
+            json.dump(self.manifest, file_pointer)
+        os.replace(temporary_filepath, self.manifest_filepath)
+
+
+    def get_object_filepath(self,
+                            object_name: str) -> Path:
+        return self.objects_directory / object_name[:2] / object_name
+
+
+    def get_view_filepath(self,
+                          source_filepath: str) -> Path:
+        return self.files_directory / source_filepath.lstrip(os.sep)
+
+
+    def link_view(self,
+                  object_filepath: Path,
+                  view_filepath: Path):
+        """
+        Makes the file read by the trainings a hard link to the object, or
+        a copy of it if the file system has no hard links.
+        """
+
+        if view_filepath.is_file() and os.path.samefile(view_filepath, object_filepath):
+            return
+
+        view_filepath.parent.mkdir(mode=0o775, parents=True, exist_ok=True)
+        temporary_filepath = self.temporary_directory / uuid.uuid4().hex
+        try:
+            try:
+                os.link(object_filepath, temporary_filepath)
+            except OSError:
+                shutil.copyfile(object_filepath, temporary_filepath)
+            os.replace(temporary_filepath, view_filepath)
+        except OSError:
+            temporary_filepath.unlink(missing_ok=True)
+            raise
+
+
+    def is_cached(self,
+                  entry: Optional[dict],
+                  source_stat: os.stat_result) -> bool:
+        """
+        Returns if the cached copy of a file is up to date.
+        """
+
+        if entry is None or entry["size"] != source_stat.st_size or entry["mtime_ns"] != source_stat.st_mtime_ns:
+            return False
+
+        object_filepath = self.get_object_filepath(entry["object"])
+        if not object_filepath.is_file() or object_filepath.stat().st_size != entry["size"]:
+            return False
+
+        if self.verification == "hash":
+            return hash_file(object_filepath) == entry["sha256"]
+
+        return True
+
+
+    def stage_file(self,
+                   source_filepath: str) -> Tuple[str, dict, str, int]:
+        """
+        Copies a file to the cache if its cached copy is not up to date.
+
+        Returns:
+            tuple: The source path, its manifest entry, its status, and the
+                number of bytes copied.
+        """
+
+        source_stat = os.stat(source_filepath)
+        entry = self.manifest.get(source_filepath)
+        if self.is_cached(entry, source_stat):
+            self.link_view(self.get_object_filepath(entry["object"]), self.get_view_filepath(source_filepath))
+            return source_filepath, entry, HIT, 0
+
+        # Copies and hashes the file in one read, then moves it to its object
+        temporary_filepath = self.temporary_directory / uuid.uuid4().hex
+        file_hash = hashlib.sha256()
+        try:
+            with open(source_filepath, 'rb') as source_pointer, open(temporary_filepath, 'wb') as copy_pointer:
+                for block in iter(lambda: source_pointer.read(COPY_BLOCK_BYTES), b""):
+                    file_hash.update(block)
+                    copy_pointer.write(block)
+
+            # The suffix is kept, the images are read according to it
+            object_name = file_hash.hexdigest() + Path(source_filepath).suffix
+            object_filepath = self.get_object_filepath(object_name)
+            if object_filepath.is_file() and object_filepath.stat().st_size == source_stat.st_size:
+                os.remove(temporary_filepath)
+                status = DEDUPLICATED
+            else:
+                object_filepath.parent.mkdir(mode=0o775, parents=True, exist_ok=True)
+                os.replace(temporary_filepath, object_filepath)
+                status = COPIED
+        except OSError:
+            # Source removed or local storage full, the partial copy is not kept
+            temporary_filepath.unlink(missing_ok=True)
+            raise
+
+        self.link_view(object_filepath, self.get_view_filepath(source_filepath))
+
+        entry = {"size": source_stat.st_size,
+                 "mtime_ns": source_stat.st_mtime_ns,
+                 "sha256": file_hash.hexdigest(),
+                 "object": object_name}
+
+        return source_filepath, entry, status, source_stat.st_size
+
+
+    def stage_folds(self,
+                    fold_list: List[str]) -> Tuple[pd.DataFrame, FoldIndex]:
+        """
+        Stages the files of the folds not staged yet by this stager, and
+        returns the metadata with the cached file paths of all the staged
+        folds, and its fold index.
+
+        Args:
+            fold_list (list of str): The folds of a training.
+
+        Returns:
+            tuple: The metadata and its fold index.
+        """
+
+        with self.thread_lock:
+            new_folds = [fold for fold in dict.fromkeys(fold_list)
+                         if fold is not None and fold not in self.staged_folds]
+            if not new_folds:
+                return self.df_metadata, self.fold_index
+
+            rows = self.fold_index.get_rows(new_folds)
+            source_filepaths = list(dict.fromkeys(str(filepath) for filepath in self.source_files[rows]))
+
+            start_time = time.perf_counter()
+            counts = {HIT: 0, COPIED: 0, DEDUPLICATED: 0}
+            copied_bytes = 0
+            with fasteners.InterProcessLock(self.lock_filepath):
+                self.load_manifest()
+                with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+                    for source_filepath, entry, status, n_bytes in executor.map(self.stage_file, source_filepaths):
+                        self.manifest[source_filepath] = entry
+                        counts[status] += 1
+                        copied_bytes += n_bytes
+                if counts[COPIED] or counts[DEDUPLICATED]:
+                    self.save_manifest()
+            duration = time.perf_counter() - start_time
+
+            # New metadata and fold index with the cached file paths
+            files = self.fold_index.files.copy()
+            files[rows] = [str(self.get_view_filepath(str(filepath))) for filepath in self.source_files[rows]]
+            fold_index = copy.copy(self.fold_index)
+            fold_index.files = files
+            self.fold_index = fold_index
+            self.df_metadata = self.df_metadata.assign(absolute_filepath=files)
+            self.staged_folds.update(new_folds)
+
+            for key, value in counts.items():
+                self.statistics[key] += value
+            self.statistics["copied_bytes"] += copied_bytes
+            self.statistics["seconds"] += duration
+
+            n_files = len(source_filepaths)
+            print(colored(f"Staged {n_files} files of folds {new_folds} to {self.cache_directory} " + \
+                          f"in {duration:.2f} s: {counts[HIT]} cache hits ({counts[HIT] / max(n_files, 1):.1%}), " + \
+                          f"{counts[COPIED]} copied, {counts[DEDUPLICATED]} deduplicated, " + \
+                          f"{copied_bytes / 1e6:.1f} MB at {copied_bytes / 1e6 / max(duration, 1e-9):.1f} MB/s " + \
+                          f"({n_files / max(duration, 1e-9):.0f} files/s).", 'magenta'))
+
+            return self.df_metadata, self.fold_index
+
+
+    def report(self):
+        """
+        Prints the cache hit rate and the copy throughput of all the folds staged.
+        """
+
+        n_files = self.statistics[HIT] + self.statistics[COPIED] + self.statistics[DEDUPLICATED]
+        if n_files == 0:
+            return
+
+        print(colored(f"Data staging of {len(self.staged_folds)} folds: {n_files} files, " + \
+                      f"cache hit rate {self.statistics[HIT] / n_files:.1%}, " + \
+                      f"{self.statistics['copied_bytes'] / 1e6:.1f} MB copied at " + \
+                      f"{self.statistics['copied_bytes'] / 1e6 / max(self.statistics['seconds'], 1e-9):.1f} MB/s " + \
+                      f"in {self.statistics['seconds']:.2f} s.", 'magenta'))
+
+
+def create_data_stager(config_dict: dict,
+                       df_metadata: pd.DataFrame,
+                       fold_index: Optional[FoldIndex] = None) -> Optional[DataStager]:
+    """
+    Returns the data stager of the node if 'staging_cache_path' is set,
+    otherwise None. Environment variables in the path, e.g. $LSCRATCH,
+    are expanded.
+    """
+
+    staging_cache_path = config_dict.get('staging_cache_path', None)
+    if not staging_cache_path:
+        return None
+
+    if config_dict.get('packed_dataset_path', None):
+        print(colored("Warning: staging_cache_path is not used with packed_dataset_path, " + \
+                      "the images are read from the packed dataset.", 'yellow'))
+        return None
+
+    return DataStager(cache_directory=Path(os.path.expandvars(staging_cache_path)),
+                      df_metadata=df_metadata,
+                      fold_index=fold_index,
+                      n_workers=config_dict.get('staging_n_workers', 8),
+                      verification=config_dict.get('staging_verification', 'size_mtime'))
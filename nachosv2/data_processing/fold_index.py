@@ -0,0 +1,82 @@
+from typing import List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+
+class FoldIndex():
+    def __init__(self,
+                 df_metadata: pd.DataFrame):
+        """
+        Index of the rows of the metadata by fold, built once per sweep and
+        shared by all its trainings.
+
+        fold_name is encoded as categorical codes, and the row positions
+        are sorted by fold, so the rows of a fold are one contiguous range.
+        The rows of several folds are selected from the codes with a lookup
+        table, in the order of the metadata, without comparing the fold_name
+        strings again.
+
+        Args:
+            df_metadata (pd.DataFrame): The metadata, with the columns
+                fold_name, absolute_filepath and label.
+        """
+
+        fold_codes, fold_names = pd.factorize(df_metadata["fold_name"])
+        self.fold_codes = fold_codes
+        self.fold_positions = {fold_name: position for position, fold_name in enumerate(fold_names)}
+
+        # Row positions sorted by fold, in the order of the metadata within a fold
+        self.row_order = np.argsort(fold_codes, kind="stable")
+        self.fold_starts = np.zeros(len(fold_names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(fold_codes[fold_codes >= 0], minlength=len(fold_names)),
+                  out=self.fold_starts[1:])
+        # Rows without fold_name are sorted first
+        self.fold_starts += np.count_nonzero(fold_codes < 0)
+
+        self.files = df_metadata["absolute_filepath"].to_numpy()
+        self.labels = df_metadata["label"].to_numpy()
+
+
+    def get_fold_rows(self,
+                      fold: str) -> np.ndarray:
+        """
+        Returns the row positions of a fold, empty if it is not in the metadata.
+        """
+
+        position = self.fold_positions.get(fold)
+        if position is None:
+            return np.zeros(0, dtype=np.int64)
+
+        return self.row_order[self.fold_starts[position]:self.fold_starts[position + 1]]
+
+
+    def get_rows(self,
+                 fold_or_list_fold: Union[str, List[str]]) -> np.ndarray:
+        """
+        Returns the row positions of a fold or of a list of folds, in the order of the metadata.
+        """
+
+        if isinstance(fold_or_list_fold, list):
+            positions = [self.fold_positions[fold] for fold in fold_or_list_fold if fold in self.fold_positions]
+            if len(set(positions)) == 1:
+                return self.row_order[self.fold_starts[positions[0]]:self.fold_starts[positions[0] + 1]]
+
+            # Rows whose fold is in the list, from a lookup table of the
+            # fold codes, the last entry for the rows without fold_name
+            is_selected_fold = np.zeros(len(self.fold_positions) + 1, dtype=bool)
+            is_selected_fold[positions] = True
+            return np.flatnonzero(is_selected_fold[self.fold_codes])
+
+        return self.get_fold_rows(fold_or_list_fold)
+
+
+    def get_files_labels(self,
+                         fold_or_list_fold: Union[str, List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the file paths and labels of a fold or of a list of folds.
+        """
+
+        rows = self.get_rows(fold_or_list_fold)
+
+        return self.files[rows], self.labels[rows]
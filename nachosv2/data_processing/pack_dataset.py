@@ -0,0 +1,254 @@
+import argparse
+from pathlib import Path
+from typing import Optional, List
+import numpy as np
+import pandas as pd
+import yaml
+from termcolor import colored
+from torch.utils.data import DataLoader
+
+from nachosv2.data_processing.read_metadata_csv import read_metadata_csv
+from nachosv2.image_processing.image_crop import create_crop_box
+from nachosv2.training.training_processing.custom_2D_dataset import Dataset2D
+
+
+PACKED_INFO_FILENAME = "packed_info.yml"
+PACKED_INDEX_FILENAME = "index.csv"
+
+
+def get_packed_fold_filename(fold_name: str) -> str:
+    """
+    Returns the name of the file containing the images of a fold.
+
+    Args:
+        fold_name (str): The fold name.
+
+    Returns:
+        str: The file name.
+    """
+    return f"fold_{fold_name}.npy"
+
+
+def pack_fold(df_fold: pd.DataFrame,
+              fold_filepath: Path,
+              number_channels: int,
+              image_size: tuple,
+              crop_box: Optional[tuple],
+              batch_size: int,
+              num_workers: int):
+    """
+    Decodes and preprocesses the images of one fold and writes them
+    contiguously in a .npy file of shape (N, C, H, W).
+
+    Args:
+        df_fold (pd.DataFrame): Metadata rows of the fold.
+        fold_filepath (Path): The .npy file to write.
+        number_channels (int): The number of channels of the images.
+        image_size (tuple of int): The target height and width.
+        crop_box (tuple of int): The crop box, None if no cropping.
+        batch_size (int): Number of images decoded per batch.
+        num_workers (int): Number of processes decoding images.
+    """
+
+    fold_partition = {'files': df_fold['absolute_filepath'].tolist(),
+                      'labels': df_fold['label'].tolist()}
+
+    dataset = Dataset2D(
+        dictionary_partition=fold_partition,
+        number_channels=number_channels,
+        image_size=image_size,
+        do_cropping=crop_box is not None,
+        crop_box=crop_box,
+        transform=None
+    )
+
+    dataloader = DataLoader(
+        dataset=dataset,
+        batch_size=batch_size,
+        shuffle=False,
+        drop_last=False,
+        num_workers=num_workers
+    )
+
+    # Writes to a temporary file first, so an interrupted run
+    # never leaves a valid-looking fold file
+    temporary_filepath = fold_filepath.with_suffix(".tmp.npy")
+    packed_array = np.lib.format.open_memmap(
+        temporary_filepath,
+        mode='w+',
+        dtype=np.float32,
+        shape=(len(dataset), number_channels, image_size[0], image_size[1]))
+
+    offset = 0
+    for images, _, _ in dataloader:
+        n_images = images.shape[0]
+        packed_array[offset:offset + n_images] = images.numpy()
+        offset += n_images
+
+    packed_array.flush()
+    del packed_array
+    temporary_filepath.replace(fold_filepath)
+
+
+def pack_dataset(csv_filepath: Path,
+                 output_dir: Path,
+                 number_channels: int,
+                 target_dimensions: List[int],
+                 cropping_position: Optional[List[int]] = None,
+                 fold_list: Optional[List[str]] = None,
+                 batch_size: int = 64,
+                 num_workers: int = 4) -> Path:
+    """
+    Turns the metadata CSV into one contiguous .npy file per fold plus
+    an index of offsets, labels and fold names.
+
+    Args:
+        csv_filepath (Path): Path to the metadata CSV file.
+        output_dir (Path): Folder where the packed dataset is written.
+        number_channels (int): The number of channels of the images.
+        target_dimensions (list of int): The target height and width.
+        cropping_position (list of int): x and y cropping position, None if no cropping. (Optional)
+        fold_list (list of str): Folds to pack. If None, all the folds are packed. (Optional)
+        batch_size (int): Number of images decoded per batch. Default is 64.
+        num_workers (int): Number of processes decoding images. Default is 4.
+
+    Returns:
+        Path: The output folder.
+    """
+
+    df_metadata = read_metadata_csv(csv_filepath)
+
+    l_columns = ["fold_name", "absolute_filepath", "label"]
+    if not all(val_col in df_metadata.columns for val_col in l_columns):
+        raise ValueError(f"The columns {l_columns} must be in csv_metadata file.")
+
+    image_size = (int(target_dimensions[0]), int(target_dimensions[1]))
+
+    if cropping_position is not None:
+        crop_box = create_crop_box(cropping_position[0],
+                                   cropping_position[1],
+                                   image_size[0],
+                                   image_size[1])
+    else:
+        crop_box = None
+
+    if fold_list is None:
+        fold_list = df_metadata['fold_name'].unique().tolist()
+
+    output_dir.mkdir(mode=0o775, parents=True, exist_ok=True)
+
+    index_list = []
+    folds_info = {}
+    for fold_name in fold_list:
+        df_fold = df_metadata[df_metadata['fold_name'] == fold_name]
+        if df_fold.empty:
+            raise ValueError(f"Fold {fold_name} has no rows in {csv_filepath}.")
+
+        fold_filename = get_packed_fold_filename(fold_name)
+        print(colored(f"Packing fold {fold_name} ({len(df_fold)} images) "
+                      f"into {output_dir / fold_filename}", 'green'))
+
+        pack_fold(df_fold,
+                  output_dir / fold_filename,
+                  number_channels,
+                  image_size,
+                  crop_box,
+                  batch_size,
+                  num_workers)
+
+        index_list.append(pd.DataFrame({
+            "fold_name": fold_name,
+            "offset": np.arange(len(df_fold)),
+            "label": df_fold['label'].to_numpy(),
+            "absolute_filepath": df_fold['absolute_filepath'].to_numpy(),
+        }))
+        folds_info[str(fold_name)] = {"filename": fold_filename,
+                                      "n_images": len(df_fold)}
+
+    pd.concat(index_list, ignore_index=True).to_csv(
+        output_dir / PACKED_INDEX_FILENAME, index=False)
+
+    packed_info = {
+        "source_csv": str(csv_filepath),
+        "number_channels": number_channels,
+        "image_size": list(image_size),
+        "crop_box": list(crop_box) if crop_box else None,
+        "dtype": "float32",
+        "folds": folds_info,
+    }
+    with open(output_dir / PACKED_INFO_FILENAME, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(packed_info, f, sort_keys=False)
+
+    print(colored(f"Packed dataset saved at: {output_dir}", 'green'))
+
+    return output_dir
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    # Definition of all arguments
+    parser.add_argument(
+        '--csv_filepath',
+        type = str, default = None, required = True,
+        help = 'Path to the metadata CSV file.'
+    )
+
+    parser.add_argument(
+        '--output_dir',
+        type = str, default = None, required = True,
+        help = 'Folder where the packed dataset is written.'
+    )
+
+    parser.add_argument(
+        '--number_channels',
+        type = int, default = None, required = True,
+        help = 'Number of channels of the images. Grayscale: 1, RGB: 3.'
+    )
+
+    parser.add_argument(
+        '--target_dimensions',
+        nargs = 2, type = int, default = None, required = True,
+        help = 'Height and width of the packed images, same as target_dimensions in the training configuration.'
+    )
+
+    parser.add_argument(
+        '--cropping_position',
+        nargs = 2, type = int, default = None, required = False,
+        help = 'x and y cropping position, if the training uses do_cropping.'
+    )
+
+    parser.add_argument(
+        '--fold_list',
+        nargs = "+", type = str, default = None, required = False,
+        help = 'Folds to pack. All the folds by default.'
+    )
+
+    parser.add_argument(
+        '--batch_size',
+        type = int, default = 64, required = False,
+        help = 'Number of images decoded per batch.'
+    )
+
+    parser.add_argument(
+        '--num_workers',
+        type = int, default = 4, required = False,
+        help = 'Number of processes decoding images.'
+    )
+
+    args = parser.parse_args()
+
+    return pack_dataset(
+        csv_filepath=Path(args.csv_filepath),
+        output_dir=Path(args.output_dir),
+        number_channels=args.number_channels,
+        target_dimensions=args.target_dimensions,
+        cropping_position=args.cropping_position,
+        fold_list=args.fold_list,
+        batch_size=args.batch_size,
+        num_workers=args.num_workers
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+import os
+import hashlib
+import json
+import shutil
+import time
+import uuid
+from multiprocessing import util
+from pathlib import Path
+from typing import Optional, Tuple, Callable
+import numpy as np
+from termcolor import colored
+
+
+# Job id variables of the schedulers, the same in all the ranks of a job
+JOB_ID_VARIABLES = ["SLURM_JOB_ID", "PBS_JOBID", "LSB_JOBID"]
+
+# Lookups between two writes of the counters of a DataLoader worker
+STATISTICS_SAVE_INTERVAL = 100
+
+
+def get_run_id() -> str:
+    """
+    Returns the job id of the scheduler, or a new id if the training is
+    not run by a scheduler. Set once by the launcher and given to the
+    ranks with the configuration.
+    """
+
+    for variable in JOB_ID_VARIABLES:
+        if os.environ.get(variable):
+            return os.environ[variable]
+
+    return f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+class PreprocessedCache():
+    def __init__(self,
+                 cache_directory: str,
+                 max_size_gb: float = 10.0,
+                 low_watermark: float = 0.9,
+                 run_id: Optional[str] = None):
+        """
+        Initializes an on-disk cache of decoded and preprocessed images.
+
+        Each entry is stored as a .npy file whose name is a hash of the
+        source file path, its modification time and size, and the
+        preprocessing parameters (channels, crop box and target size).
+        Entries are read back memory-mapped, so every process (DataLoader
+        workers, folds, MPI ranks) shares the same pages.
+
+        The hits and misses are counted by the process doing the lookups.
+        The DataLoader workers, whatever their start method, save their
+        counts in statistics/<run_id>/, and collect_statistics adds them
+        to the counts of the training and deletes the files.
+
+        Args:
+            cache_directory (str): Directory where the cached arrays are stored.
+            max_size_gb (float): Maximum size of the cache in gigabytes. When it is
+                exceeded, the least recently used entries are evicted. Default is 10.
+            low_watermark (float): Fraction of max_size_gb the cache is reduced to
+                when the eviction runs. Default is 0.9. (Optional)
+            run_id (str): The id of the run, from get_run_id. Default is a new id. (Optional)
+        """
+
+        self.cache_directory = Path(cache_directory)
+        self.cache_directory.mkdir(mode=0o775, parents=True, exist_ok=True)
+        self.max_size_bytes = int(max_size_gb * 1e9)
+        self.low_watermark = low_watermark
+
+        # Scans the directory only after writing 5% of the limit
+        self.eviction_check_bytes = max(1, self.max_size_bytes // 20)
+        self._bytes_since_check = 0
+
+        # Counters of the training process, the workers get their own
+        self.run_directory = self.cache_directory / "statistics" / (run_id or get_run_id())
+        self.statistics_directory = self.run_directory / uuid.uuid4().hex
+        self._training_pid = os.getpid()
+        self._pid = self._training_pid
+        self._hits = 0
+        self._misses = 0
+        self._statistics_filepath = None
+
+
+    def _start_worker_statistics(self):
+        """
+        Starts the counters of a DataLoader worker, saved to their own file
+        every STATISTICS_SAVE_INTERVAL lookups and when the worker exits.
+        """
+
+        self._pid = os.getpid()
+        self._hits = 0
+        self._misses = 0
+        self._statistics_filepath = self.statistics_directory / f"{uuid.uuid4().hex}.json"
+        util.Finalize(self, self.save_statistics, exitpriority=10)
+
+
+    def _count(self,
+               is_hit: bool):
+        # Forked or spawned in a DataLoader worker with the counts of the parent
+        if os.getpid() != self._pid:
+            self._start_worker_statistics()
+
+        if is_hit:
+            self._hits += 1
+        else:
+            self._misses += 1
+
+        if self._pid != self._training_pid and (self._hits + self._misses) % STATISTICS_SAVE_INTERVAL == 0:
+            self.save_statistics()
+
+
+    def save_statistics(self):
+        """
+        Writes the counters of the current DataLoader worker.
+        """
+
+        if self._statistics_filepath is None or self._hits + self._misses == 0:
+            return
+
+        try:
+            self.statistics_directory.mkdir(mode=0o775, parents=True, exist_ok=True)
+            temporary_filepath = self._statistics_filepath.with_suffix(".tmp")
+            with open(temporary_filepath, 'w', encoding="utf-8") as file_pointer:
+                json.dump({"hits": self._hits, "misses": self._misses}, file_pointer)
+            os.replace(temporary_filepath, self._statistics_filepath)
+        except OSError as e:
+            print(colored(f"Warning: unable to write cache statistics {self._statistics_filepath}: {e}", 'yellow'))
+
+
+    def get_key(self,
+                filepath: str,
+                number_channels: int,
+                crop_box: Optional[tuple],
+                image_size: Optional[tuple]) -> str:
+        """
+        Creates the cache key of an image.
+
+        Args:
+            filepath (str): The path of the source image.
+            number_channels (int): The number of channels of the preprocessed image.
+            crop_box (tuple of int): The crop box, None if no cropping.
+            image_size (tuple of int): The target size, None if no resizing.
+
+        Returns:
+            key (str): The hexadecimal key.
+        """
+
+        file_stat = os.stat(filepath)
+        key_string = f"{os.path.abspath(filepath)}|{file_stat.st_mtime_ns}|" + \
+                     f"{file_stat.st_size}|{number_channels}|" + \
+                     f"{tuple(crop_box) if crop_box else None}|" + \
+                     f"{tuple(image_size) if image_size else None}"
+
+        return hashlib.sha1(key_string.encode("utf-8")).hexdigest()
+
+
+    def get_or_compute(self,
+                       filepath: str,
+                       number_channels: int,
+                       crop_box: Optional[tuple],
+                       image_size: Optional[tuple],
+                       compute_function: Callable[[str], np.ndarray]) -> np.ndarray:
+        """
+        Returns the preprocessed image from the cache, or computes and stores it.
+
+        Args:
+            filepath (str): The path of the source image.
+            number_channels (int): The number of channels of the preprocessed image.
+            crop_box (tuple of int): The crop box, None if no cropping.
+            image_size (tuple of int): The target size, None if no resizing.
+            compute_function (Callable): Function that decodes and preprocesses the image.
+
+        Returns:
+            image (numpy.ndarray): The preprocessed image.
+        """
+
+        key = self.get_key(filepath, number_channels, crop_box, image_size)
+        entry_path = self.cache_directory / f"{key}.npy"
+
+        try:
+            # Copy-on-write mapping: pages are shared until written
+            image = np.load(entry_path, mmap_mode='c')
+            self._count(is_hit=True)
+            self._touch(entry_path)
+            return image
+        except (FileNotFoundError, ValueError, OSError):
+            # Missing, being evicted, or partially written by another process
+            pass
+
+        self._count(is_hit=False)
+        image = compute_function(filepath)
+        self._store(entry_path, image)
+
+        return image
+
+
+    def collect_statistics(self) -> dict:
+        """
+        Adds the counts saved by the DataLoader workers to the counts of
+        the training, and deletes their files. Called by the training once
+        its workers exited, which save their counts when they exit.
+
+        Returns:
+            statistics (dict): hits, misses and hit_rate of the training.
+        """
+
+        if self.statistics_directory.exists():
+            for statistics_filepath in self.statistics_directory.glob("*.json"):
+                try:
+                    with open(statistics_filepath, 'r', encoding="utf-8") as file_pointer:
+                        counts = json.load(file_pointer)
+                except (OSError, json.JSONDecodeError):
+                    continue
+                self._hits += counts["hits"]
+                self._misses += counts["misses"]
+            shutil.rmtree(self.statistics_directory, ignore_errors=True)
+
+        # Removed once the last training of the run on this cache collected its counts
+        try:
+            self.run_directory.rmdir()
+        except OSError:
+            pass
+
+        return get_hit_rate(self._hits, self._misses)
+
+
+    def print_statistics(self):
+        """
+        Collects and prints the hit rate of the cache for the training.
+
+        Returns:
+            statistics (dict): hits, misses and hit_rate of the training.
+        """
+
+        statistics = self.collect_statistics()
+        print(colored(f"Preprocessed cache: {statistics['hits']} hits, "
+                      f"{statistics['misses']} misses "
+                      f"(hit rate {statistics['hit_rate']*100:.1f}%).", 'cyan'))
+
+        return statistics
+
+
+    def get_size(self) -> Tuple[int, int]:
+        """
+        Returns the number of entries and the total size of the cache.
+
+        Returns:
+            n_entries (int): The number of cached arrays.
+            size_bytes (int): The total size in bytes.
+        """
+
+        n_entries = 0
+        size_bytes = 0
+        with os.scandir(self.cache_directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".npy"):
+                    n_entries += 1
+                    size_bytes += entry.stat().st_size
+
+        return n_entries, size_bytes
+
+
+    def _store(self,
+               entry_path: Path,
+               image: np.ndarray):
+        """
+        Writes an entry atomically, so readers never see a partial file.
+        """
+
+        temporary_path = entry_path.with_name(f"{entry_path.stem}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(temporary_path, 'wb') as file_pointer:
+                np.save(file_pointer, np.ascontiguousarray(image))
+            os.replace(temporary_path, entry_path)
+        except OSError as e:
+            # The cache is an optimization, training continues without it
+            print(colored(f"Warning: unable to write cache entry {entry_path}: {e}", 'yellow'))
+            if temporary_path.exists():
+                temporary_path.unlink()
+            return
+
+        self._bytes_since_check += image.nbytes
+        if self._bytes_since_check >= self.eviction_check_bytes:
+            self._bytes_since_check = 0
+            self._evict()
+
+
+    def _evict(self):
+        """
+        Removes the least recently used entries when the cache exceeds its limit.
+        """
+
+        entries_list = []
+        total_size = 0
+        with os.scandir(self.cache_directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".npy"):
+                    continue
+                try:
+                    entry_stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries_list.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+                total_size += entry_stat.st_size
+
+        if total_size <= self.max_size_bytes:
+            return
+
+        target_size = self.max_size_bytes * self.low_watermark
+        # Oldest first
+        for _, size, path in sorted(entries_list):
+            if total_size <= target_size:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except FileNotFoundError:
+                # Already evicted by another process
+                total_size -= size
+
+
+    @staticmethod
+    def _touch(entry_path: Path):
+        """
+        Updates the modification time used as recency for the eviction.
+        """
+
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+
+
+
+def get_hit_rate(hits: int,
+                 misses: int) -> dict:
+    total = hits + misses
+
+    return {"hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0}
+
+
+class PreprocessedCacheStatistics():
+    def __init__(self):
+        """
+        Adds up the preprocessed cache counts of the trainings of a run,
+        from their results, which reach rank 0 from every rank.
+        """
+
+        self.hits = 0
+        self.misses = 0
+
+
+    def record(self,
+               result: dict):
+        """
+        Records the counts of a training, from perform_single_training.
+        """
+
+        self.hits += result.get("preprocessed_cache_hits", 0)
+        self.misses += result.get("preprocessed_cache_misses", 0)
+
+
+    def report(self):
+        """
+        Prints the hit rate of the cache for the whole run.
+        """
+
+        if self.hits + self.misses == 0:
+            return
+
+        statistics = get_hit_rate(self.hits, self.misses)
+        print(colored(f"Preprocessed cache of the run: {statistics['hits']} hits, "
+                      f"{statistics['misses']} misses "
+                      f"(hit rate {statistics['hit_rate']*100:.1f}%).", 'magenta'))
+
+
+def create_preprocessed_cache(configuration: dict) -> Optional[PreprocessedCache]:
+    """
+    Creates the preprocessed cache if it is enabled in the configuration.
+
+    Args:
+        configuration (dict): The training configuration.
+
+    Returns:
+        cache (PreprocessedCache): The cache, None if 'preprocessed_cache_path' is not set.
+    """
+
+    cache_path = configuration.get('preprocessed_cache_path', None)
+    if not cache_path:
+        return None
+
+    return PreprocessedCache(
+        cache_directory=cache_path,
+        max_size_gb=configuration.get('preprocessed_cache_max_size_gb', 10.0),
+        run_id=configuration.get('run_id', None))
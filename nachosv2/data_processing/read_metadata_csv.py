@@ -1,39 +1,73 @@
 import os
 import sys
+import time
+from typing import List, Optional
 import pandas as pd
 from termcolor import colored
 from pathlib import Path
 
-def read_metadata_csv(path_label_csv):
+
+# Columns of the metadata used by the training
+METADATA_COLUMNS = ["fold_name", "absolute_filepath", "label"]
+
+# Suffixes of the columnar metadata files, read with pyarrow
+PARQUET_SUFFIXES = (".parquet", ".pq")
+FEATHER_SUFFIXES = (".feather", ".arrow")
+
+
+def read_metadata_csv(path_label_csv,
+                      columns: Optional[List[str]] = None) -> pd.DataFrame:
     """
-    Reads all CSV files in the given directory and returns a dictionary of the datas.
-    
+    Reads the metadata file, a CSV file, or a Parquet or Feather file
+    created by NACHOSv2_convert_metadata, with fold_name as a categorical
+    column and the labels as small integers.
+
+    Only the given columns are read. The columnar formats store each column
+    separately, so the other columns are not read from the file at all.
+
     Args:
-        directory_path (str): The directory where are the CSV files.
-        configuration_file (JSON): The configuration file.
-    
+        path_label_csv (str or Path): The path of the metadata file.
+        columns (list of str): The columns to read. If None, all the columns are read. (Optional)
+
     Returns:
-        data_dict (dict): A dictionary of of the datas from the CSV files.
-                        data_dict = {'subject1': {'image_path': [image_path1, image_path2, ...],
-                                                  'indexes': [0, 1, 2, ...],
-                                                  'label1_number': [...],
-                                                  'label2_number': [...],
-                                                  ...,
-                                                  },
-                                    'subject2': {...},
-                                    ...
-                                    }
+        df (pd.DataFrame): The metadata.
     """
-    
+
     # Initializations
     p = Path(path_label_csv)
-    
+
     if not p.is_file():
         raise FileNotFoundError(f"Error: The file '{p.name}' does not exist in the directory '{p.parent}'.")
-    
-    df = pd.read_csv(p)
-    
-    # Checks if the given path is valid
+
+    suffix = p.suffix.lower()
+    if suffix in PARQUET_SUFFIXES:
+        df = pd.read_parquet(p, columns=columns)
+    elif suffix in FEATHER_SUFFIXES:
+        df = pd.read_feather(p, columns=columns)
+    else:
+        df = pd.read_csv(p, usecols=columns)
+
+    return df
+
+
+def read_training_metadata(path_label_csv) -> pd.DataFrame:
+    """
+    Reads the columns of the metadata used by the training, and prints
+    the time to read them and their memory.
+
+    Args:
+        path_label_csv (str or Path): The path of the metadata file.
+
+    Returns:
+        df (pd.DataFrame): The fold_name, absolute_filepath and label columns.
+    """
+
+    start_time = time.perf_counter()
+    df = read_metadata_csv(path_label_csv, columns=METADATA_COLUMNS)
+    duration = time.perf_counter() - start_time
+
+    print(colored(f"Read {len(df)} rows of metadata from '{Path(path_label_csv).name}' " + \
+                  f"in {duration:.3f} s, {df.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory.", 'cyan'))
 
     return df
 
@@ -1,7 +1,17 @@
 import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List
+from termcolor import colored
+import numpy as np
 import pandas as pd
-from functools import partial
+
+from nachosv2.data_processing.read_metadata_csv import FEATHER_SUFFIXES
+from nachosv2.data_processing.read_metadata_csv import PARQUET_SUFFIXES
+from nachosv2.data_processing.read_metadata_csv import read_metadata_csv
 
 
 def update_path_starting_from_folder(
@@ -28,34 +38,159 @@ def update_path_starting_from_folder(
             return str(new_path)
 
 
+def update_filepath_column(filepaths: pd.Series,
+                           retain_subpath_from: str,
+                           updated_parent_dir: Path) -> pd.Series:
+    """
+    Vectorized update_path_starting_from_folder over a column of file paths.
+
+    The position of the first folder named `retain_subpath_from` is found in
+    all the paths at once, and the paths are cut at each distinct position
+    with one slice of the whole group, since the paths of a dataset share
+    few prefix lengths. No Path is built per row. Repeated separators and
+    "." folders of the retained part are removed, as Path does, only in the
+    paths that have them.
+
+    Args:
+        filepaths (pd.Series): The absolute file paths.
+        retain_subpath_from (str): Folder name from which the remaining path should be preserved.
+        updated_parent_dir (Path): New parent path to prepend before `retain_subpath_from`.
+
+    Returns:
+        pd.Series: The updated file paths, missing for the paths without
+            the folder `retain_subpath_from`.
+    """
+
+    if not retain_subpath_from or "/" in retain_subpath_from:
+        raise ValueError(f"Invalid folder name: '{retain_subpath_from}'. Must be one folder of the paths.")
+
+    filepaths = filepaths.astype(str)
+
+    # Position of the first folder, the separators around the paths match
+    # it at the start and at the end of the paths
+    positions = ("/" + filepaths + "/").str.find(f"/{retain_subpath_from}/").to_numpy()
+
+    retained_parts = pd.Series(None, index=filepaths.index, dtype=filepaths.dtype)
+    for position in np.unique(positions[positions >= 0]):
+        is_at_position = positions == position
+        retained_parts[is_at_position] = filepaths[is_at_position].str.slice(start=int(position))
+
+    needs_cleaning = retained_parts.str.contains(r"//|/\./|/\.$|/$", regex=True).fillna(False).to_numpy(dtype=bool)
+    if needs_cleaning.any():
+        cleaned_parts = retained_parts[needs_cleaning].str.replace(r"/+", "/", regex=True)
+        cleaned_parts = cleaned_parts.str.replace(r"(?:/\.)+(?=/|$)", "", regex=True)
+        retained_parts[needs_cleaning] = cleaned_parts.str.rstrip("/")
+
+    parent_dir = str(updated_parent_dir)
+    prefix = "" if parent_dir == "." else parent_dir.rstrip("/") + "/"
+
+    return prefix + retained_parts
+
+
+def check_files_exist(filepaths: List[str],
+                      n_workers: int = 32,
+                      chunk_size: int = 1024) -> np.ndarray:
+    """
+    Checks that the files exist with a pool of threads, each calling stat
+    on a chunk of the paths. On shared file systems, the latency of each
+    stat is hidden by the other threads.
+
+    Args:
+        filepaths (list of str): The file paths.
+        n_workers (int): Number of threads. Default is 32.
+        chunk_size (int): Number of paths checked by a thread at a time. Default is 1024.
+
+    Returns:
+        np.ndarray: If each file exists.
+    """
+
+    def check_chunk(chunk: List[str]) -> List[bool]:
+        return [os.path.isfile(filepath) for filepath in chunk]
+
+    chunks = [filepaths[start:start + chunk_size] for start in range(0, len(filepaths), chunk_size)]
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        results = list(executor.map(check_chunk, chunks))
+
+    return np.fromiter(itertools.chain.from_iterable(results), dtype=bool, count=len(filepaths))
+
+
+def write_metadata(df: pd.DataFrame,
+                   filepath: Path):
+    """
+    Writes the metadata in the format of the suffix of filepath, CSV,
+    Parquet or Feather.
+    """
+
+    suffix = filepath.suffix.lower()
+    if suffix in PARQUET_SUFFIXES:
+        df.to_parquet(filepath, index=False)
+    elif suffix in FEATHER_SUFFIXES:
+        df.reset_index(drop=True).to_feather(filepath)
+    else:
+        df.to_csv(filepath, index=False)
+
+
 def update_metadata_csv(csv_filepath: Path,
                         retain_subpath_from: str,
-                        updated_parent_dir: Path):
+                        updated_parent_dir: Path,
+                        check_existence: bool = False,
+                        n_stat_workers: int = 32):
     """
     Update the absolute filepaths in a metadata CSV by modifying the parent directories.
 
+    The paths without the folder `retain_subpath_from` are kept as they are,
+    and written to `<name>_unmatched_rows.csv` next to the updated file.
+    With `check_existence`, the rows whose updated file does not exist are
+    written to `<name>_missing_files.csv`.
+
     Args:
-        csv_file_path (Path): Path to the CSV metadata file.
+        csv_file_path (Path): Path to the CSV metadata file. Parquet and Feather files are also accepted.
         retain_subpath_from (str): Folder name from which the remaining path should be preserved.
         updated_parent_dir (Path): New parent path to prepend before `retain_subpath_from`.
+        check_existence (bool): If the existence of the updated files is checked. Default is False.
+        n_stat_workers (int): Number of threads checking the files. Default is 32.
 
     Returns:
         str: Path to the updated metadata CSV file.
     """
-    # Load the CSV
     # Load metadata CSV into a DataFrame
-    df = pd.read_csv(csv_filepath)
+    df = read_metadata_csv(csv_filepath)
 
-    # Partially apply the path update function
-    update_fn  = partial(update_path_starting_from_folder,
-                        retain_subpath_from=retain_subpath_from,
-                        updated_parent_dir=updated_parent_dir)
-    df['absolute_filepath'] = df['absolute_filepath'].apply(update_fn ) 
+    start_time = time.perf_counter()
+    updated_filepaths = update_filepath_column(df['absolute_filepath'],
+                                               retain_subpath_from,
+                                               updated_parent_dir)
+    is_unmatched = updated_filepaths.isna().to_numpy()
+    df['absolute_filepath'] = updated_filepaths.where(~is_unmatched, df['absolute_filepath'])
+    print(colored(f"Updated {len(df) - is_unmatched.sum()} of {len(df)} file paths " + \
+                  f"in {time.perf_counter() - start_time:.2f} s.", 'green'))
 
      # Save updated DataFrame to a new CSV file in the new parent directory path
     cvs_new_path = updated_parent_dir / csv_filepath.name
-    df.to_csv(cvs_new_path, index=False)
+    write_metadata(df, cvs_new_path)
     print(f"New metadata CSV saved at: {cvs_new_path}")
+
+    if is_unmatched.any():
+        unmatched_path = updated_parent_dir / f"{csv_filepath.stem}_unmatched_rows.csv"
+        df[is_unmatched].to_csv(unmatched_path, index_label="row")
+        print(colored(f"Warning: {is_unmatched.sum()} file paths do not contain the folder " + \
+                      f"'{retain_subpath_from}' and were not updated. Rows saved at: {unmatched_path}", 'yellow'))
+
+    if check_existence:
+        start_time = time.perf_counter()
+        is_existing = check_files_exist(df['absolute_filepath'].astype(str).tolist(), n_stat_workers)
+        duration = time.perf_counter() - start_time
+        print(colored(f"Checked {len(df)} files in {duration:.2f} s " + \
+                      f"({len(df) / max(duration, 1e-9):.0f} files/s with {n_stat_workers} threads).", 'green'))
+
+        if not is_existing.all():
+            missing_path = updated_parent_dir / f"{csv_filepath.stem}_missing_files.csv"
+            df[~is_existing].to_csv(missing_path, index_label="row")
+            print(colored(f"Warning: {(~is_existing).sum()} of {len(df)} files do not exist. " + \
+                          f"Rows saved at: {missing_path}", 'yellow'))
+        else:
+            print(colored(f"All the {len(df)} files exist.", 'green'))
+
     return str(cvs_new_path)
 
 
@@ -81,12 +216,26 @@ def main():
         help = 'New parent directory to prepend before the retained subpath.'
     )
 
+    parser.add_argument(
+        '--check_existence',
+        action = 'store_true', required = False,
+        help = 'Checks that the updated files exist, and saves the rows of the missing ones.'
+    )
+
+    parser.add_argument(
+        '--n_stat_workers',
+        type = int, default = 32, required = False,
+        help = 'Number of threads checking the files.'
+    )
+
     args = parser.parse_args()
 
     return update_metadata_csv(
         csv_filepath=Path(args.csv_filepath),
         retain_subpath_from=args.retain_subpath_from,
-        updated_parent_dir=Path(args.updated_parent_dir)
+        updated_parent_dir=Path(args.updated_parent_dir),
+        check_existence=args.check_existence,
+        n_stat_workers=args.n_stat_workers
         )
 
 
@@ -0,0 +1,343 @@
+import math
+from typing import Optional, Callable, List, Union, Tuple
+import numpy as np
+
+import torch
+
+
+# Same coefficients as skimage.color.rgb2gray
+RGB_TO_GRAY_COEFFICIENTS = (0.2125, 0.7154, 0.0721)
+
+
+def mirror_index(index: int, length: int) -> int:
+    """
+    Maps an index outside [0, length) as scipy.ndimage 'mirror' mode,
+    i.e. d c b | a b c d | c b a.
+
+    Args:
+        index (int): The index.
+        length (int): The length of the axis.
+
+    Returns:
+        int: The index inside the axis.
+    """
+
+    if length == 1:
+        return 0
+
+    period = 2 * (length - 1)
+    index = abs(index) % period
+
+    return period - index if index >= length else index
+
+
+def get_gaussian_matrix(length: int,
+                        sigma: float,
+                        truncate: float = 4.0) -> np.ndarray:
+    """
+    Creates the matrix of a 1D Gaussian filter with 'mirror' boundaries,
+    as scipy.ndimage.gaussian_filter.
+
+    Args:
+        length (int): The length of the axis.
+        sigma (float): The standard deviation of the Gaussian.
+        truncate (float): The kernel radius in standard deviations. Default is 4.0.
+
+    Returns:
+        numpy.ndarray: The (length, length) filter matrix.
+    """
+
+    if sigma <= 0:
+        return np.eye(length)
+
+    radius = int(truncate * sigma + 0.5)
+    offsets = np.arange(-radius, radius + 1)
+    weights = np.exp(-0.5 / sigma**2 * offsets**2)
+    weights /= weights.sum()
+
+    matrix = np.zeros((length, length))
+    for i in range(length):
+        for offset, weight in zip(offsets, weights):
+            matrix[i, mirror_index(i + offset, length)] += weight
+
+    return matrix
+
+
+def get_linear_interpolation_matrix(input_length: int,
+                                    output_length: int) -> np.ndarray:
+    """
+    Creates the matrix of a linear interpolation with 'mirror' boundaries
+    and grid_mode coordinates, as scipy.ndimage.zoom(order=1, grid_mode=True).
+
+    Args:
+        input_length (int): The length of the input axis.
+        output_length (int): The length of the output axis.
+
+    Returns:
+        numpy.ndarray: The (output_length, input_length) interpolation matrix.
+    """
+
+    scale = input_length / output_length
+    matrix = np.zeros((output_length, input_length))
+
+    for o in range(output_length):
+        coordinate = (o + 0.5) * scale - 0.5
+        lower = math.floor(coordinate)
+        weight = coordinate - lower
+        matrix[o, mirror_index(lower, input_length)] += 1.0 - weight
+        matrix[o, mirror_index(lower + 1, input_length)] += weight
+
+    return matrix
+
+
+def get_resize_matrices(input_shape: Tuple[int, int],
+                        output_shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Creates the row and column matrices of skimage.transform.resize with
+    its default parameters (order=1, mode='reflect', anti_aliasing when
+    downsampling, which skimage decides for all the axes at once).
+
+    Args:
+        input_shape (tuple of int): Input height and width.
+        output_shape (tuple of int): Output height and width.
+
+    Returns:
+        tuple of numpy.ndarray: (output_height, input_height) and
+            (output_width, input_width) matrices.
+    """
+
+    factors = np.divide(input_shape, output_shape)
+    do_anti_aliasing = any(o < i for o, i in zip(output_shape, input_shape))
+
+    matrices = []
+    for input_length, output_length, factor in zip(input_shape, output_shape, factors):
+        matrix = get_linear_interpolation_matrix(input_length, output_length)
+        if do_anti_aliasing:
+            matrix = matrix @ get_gaussian_matrix(input_length, max(0.0, (factor - 1) / 2))
+        matrices.append(matrix)
+
+    return matrices[0], matrices[1]
+
+
+def to_float(images: torch.Tensor) -> torch.Tensor:
+    """
+    Converts images to float32 in [0, 1] ([-1, 1] for signed integers),
+    as skimage.util.img_as_float32.
+    """
+
+    if images.is_floating_point():
+        return images.float()
+
+    is_signed = images.dtype.is_signed
+    images = images.float() / torch.iinfo(images.dtype).max
+    if is_signed:
+        images = images.clamp_min(-1.0)
+
+    return images
+
+
+def collate_decoded_images(batch: list):
+    """
+    Collates decoded images. Images are stacked when they share shape
+    and dtype, otherwise the batch keeps a list of tensors.
+
+    Args:
+        batch (list): (image, label, filepath) samples.
+
+    Returns:
+        images (torch.Tensor or list of torch.Tensor): The images.
+        labels (torch.Tensor): The labels.
+        filepaths (list of str): The file paths.
+    """
+
+    images, labels, filepaths = zip(*batch)
+
+    if all(image.shape == images[0].shape and image.dtype == images[0].dtype
+           for image in images):
+        images = torch.stack(images)
+    else:
+        images = list(images)
+
+    return images, torch.tensor(labels, dtype=torch.int64), list(filepaths)
+
+
+class BatchPreprocessor():
+    def __init__(self,
+                 number_channels: int,
+                 image_size: Optional[tuple] = None,
+                 crop_box: Optional[tuple] = None,
+                 transform: Optional[Callable] = None,
+                 horizontal_flip_probability: float = 0.0,
+                 vertical_flip_probability: float = 0.0):
+        """
+        Preprocesses batches of decoded images with tensor operations:
+        conversion to float, grayscale conversion, cropping, resizing,
+        a transform (e.g. normalization) and optional random flips.
+
+        Without flips, the result matches Dataset2D, which processes each
+        image with skimage. The resizing is written as two matrix products
+        reproducing skimage.transform.resize (anti-aliasing Gaussian filter
+        and linear interpolation), and the matrices are cached by shape.
+
+        Args:
+            number_channels (int): The number of channels of the output images.
+            image_size (tuple of int): The target height and width. (Optional)
+            crop_box (tuple of int): The crop box, None if no cropping. (Optional)
+            transform (Callable): Transform applied to the batch tensor. (Optional)
+            horizontal_flip_probability (float): Probability of flipping an image horizontally. Default is 0.
+            vertical_flip_probability (float): Probability of flipping an image vertically. Default is 0.
+        """
+
+        self.number_channels = number_channels
+        self.image_size = tuple(image_size) if image_size else None
+        self.crop_box = crop_box
+        self.transform = transform
+        self.horizontal_flip_probability = horizontal_flip_probability
+        self.vertical_flip_probability = vertical_flip_probability
+
+        self.resize_matrices = {}
+
+
+    def __call__(self,
+                 images: Union[torch.Tensor, List[torch.Tensor]]) -> torch.Tensor:
+        """
+        Preprocesses a batch.
+
+        Args:
+            images (torch.Tensor or list of torch.Tensor): Images of shape
+                (N, H, W) or (N, H, W, C), or a list of (H, W) or (H, W, C) images.
+
+        Returns:
+            torch.Tensor: The (N, C, H, W) float32 batch.
+        """
+
+        if isinstance(images, torch.Tensor):
+            images = self.preprocess_same_shape(images)
+        else:
+            # Images of different shapes are processed by groups of equal shape
+            groups = {}
+            for position, image in enumerate(images):
+                groups.setdefault((tuple(image.shape), image.dtype), []).append(position)
+
+            outputs = [None] * len(images)
+            for positions in groups.values():
+                group_output = self.preprocess_same_shape(
+                    torch.stack([images[p] for p in positions]))
+                for p, output in zip(positions, group_output):
+                    outputs[p] = output
+            images = torch.stack(outputs)
+
+        if self.transform:
+            images = self.transform(images)
+
+        return self.flip(images)
+
+
+    def preprocess_same_shape(self,
+                              images: torch.Tensor) -> torch.Tensor:
+        """
+        Converts, crops and resizes a batch of images of the same shape.
+        """
+
+        images = to_float(images)
+
+        # (N, H, W) -> (N, 1, H, W), (N, H, W, C) -> (N, C, H, W)
+        if images.dim() == 3:
+            images = images.unsqueeze(1)
+        else:
+            images = images.permute(0, 3, 1, 2)
+
+        if self.number_channels == 1 and images.shape[1] == 3:
+            coefficients = torch.tensor(RGB_TO_GRAY_COEFFICIENTS,
+                                        dtype=images.dtype,
+                                        device=images.device)
+            images = torch.einsum('nchw,c->nhw', images, coefficients).unsqueeze(1)
+
+        if self.crop_box:
+            x1, y1, x2, y2 = self.crop_box
+            images = images[:, :, y1:y2, x1:x2]
+
+        if self.image_size and tuple(images.shape[-2:]) != self.image_size:
+            images = self.resize(images)
+
+        return images.contiguous()
+
+
+    def resize(self,
+               images: torch.Tensor) -> torch.Tensor:
+        """
+        Resizes a (N, C, H, W) batch as skimage.transform.resize,
+        including the clipping to the value range of each input image.
+        """
+
+        input_shape = tuple(images.shape[-2:])
+        key = (input_shape, images.device, images.dtype)
+
+        if key not in self.resize_matrices:
+            row_matrix, column_matrix = get_resize_matrices(input_shape, self.image_size)
+            self.resize_matrices[key] = (
+                torch.from_numpy(row_matrix).to(device=images.device, dtype=images.dtype),
+                torch.from_numpy(column_matrix.T).to(device=images.device, dtype=images.dtype))
+
+        row_matrix, column_matrix_transposed = self.resize_matrices[key]
+
+        flat_images = images.flatten(1)
+        minimum = flat_images.amin(dim=1).view(-1, 1, 1, 1)
+        maximum = flat_images.amax(dim=1).view(-1, 1, 1, 1)
+
+        resized_images = row_matrix @ images @ column_matrix_transposed
+
+        return torch.clamp(resized_images, minimum, maximum)
+
+
+    def flip(self,
+             images: torch.Tensor) -> torch.Tensor:
+        """
+        Randomly flips each image of the batch.
+        """
+
+        for probability, dimension in [(self.horizontal_flip_probability, 3),
+                                       (self.vertical_flip_probability, 2)]:
+            if probability <= 0:
+                continue
+            do_flip = torch.rand(images.shape[0], device=images.device) < probability
+            images = torch.where(do_flip.view(-1, 1, 1, 1),
+                                 images.flip(dimension),
+                                 images)
+
+        return images
+
+
+class BatchPreprocessingDataLoader():
+    def __init__(self,
+                 dataloader: "torch.utils.data.DataLoader",
+                 preprocessor: BatchPreprocessor,
+                 device: str):
+        """
+        Wraps a DataLoader of decoded images: each collated batch is
+        sent to the device and preprocessed there as a whole.
+
+        Args:
+            dataloader (DataLoader): DataLoader using collate_decoded_images.
+            preprocessor (BatchPreprocessor): The batch preprocessor.
+            device (str): The device where batches are preprocessed.
+        """
+
+        self.dataloader = dataloader
+        self.dataset = dataloader.dataset
+        self.preprocessor = preprocessor
+        self.device = device
+
+
+    def __len__(self):
+        return len(self.dataloader)
+
+
+    def __iter__(self):
+        for images, labels, filepaths in self.dataloader:
+            if isinstance(images, torch.Tensor):
+                images = images.to(self.device, non_blocking=True)
+            else:
+                images = [image.to(self.device, non_blocking=True) for image in images]
+
+            yield self.preprocessor(images), labels, filepaths
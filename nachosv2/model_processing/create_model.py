@@ -4,6 +4,18 @@ import torch.nn as nn
 import math
 
 
+vit_patch_sizes = {
+    "vit_b_16": 16, # https://docs.pytorch.org/vision/main/models/generated/torchvision.models.vit_b_16.html#torchvision.models.vit_b_16
+    "vit_l_16": 16, # https://docs.pytorch.org/vision/main/models/generated/torchvision.models.vit_l_16.html#vit-l-16
+    "vit_h_14": 14,
+    "vit_b_32": 32,
+    "vit_l_32": 32,
+}
+
+# Architectures supported by get_model
+model_names = ["InceptionV3", "ResNet50"] + list(vit_patch_sizes)
+
+
 def get_new_dimensions(target_dimensions: list,
                        patch_size: int) -> tuple:
             """
@@ -31,14 +43,6 @@ def get_model(model_name: str,
               number_channels: int,
               target_dimensions: tuple):
     
-    vit_patch_sizes = {
-        "vit_b_16": 16, # https://docs.pytorch.org/vision/main/models/generated/torchvision.models.vit_b_16.html#torchvision.models.vit_b_16
-        "vit_l_16": 16, # https://docs.pytorch.org/vision/main/models/generated/torchvision.models.vit_l_16.html#vit-l-16
-        "vit_h_14": 14,
-        "vit_b_32": 32,
-        "vit_l_32": 32,
-    }
-    
     new_dimensions = None
     # https://github.com/pytorch/vision/blob/main/torchvision/models/inception.py
     # https://pytorch.org/vision/0.12/generated/torchvision.models.inception_v3.html
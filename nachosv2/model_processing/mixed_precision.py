@@ -0,0 +1,93 @@
+import contextlib
+from typing import Optional
+from termcolor import colored
+
+import torch
+
+
+# Data types of autocast by default, per device type.
+# CPUs only support bfloat16, which has the range of float32.
+DEFAULT_AUTOCAST_DTYPES = {
+    'cuda': torch.float16,
+    'cpu': torch.bfloat16,
+    'mps': torch.float16,
+}
+
+AUTOCAST_DTYPE_NAMES = {
+    'float16': torch.float16,
+    'bfloat16': torch.bfloat16,
+}
+
+
+def get_device_type(execution_device: str) -> str:
+    """
+    Returns the device type of a device name, e.g. 'cuda' for 'cuda:1'.
+    """
+    return torch.device(execution_device).type
+
+
+def get_autocast_dtype(execution_device: str,
+                       dtype_name: Optional[str] = None) -> Optional[torch.dtype]:
+    """
+    Returns the autocast data type for an execution device.
+
+    Args:
+        execution_device (str): The execution device.
+        dtype_name (str): 'float16' or 'bfloat16'. By default, float16 on
+            GPUs and bfloat16 on CPUs. (Optional)
+
+    Returns:
+        torch.dtype: The data type, or None if the device does not support autocast.
+
+    Raises:
+        ValueError: If dtype_name is not supported.
+    """
+
+    device_type = get_device_type(execution_device)
+
+    if dtype_name is None or dtype_name == 'auto':
+        return DEFAULT_AUTOCAST_DTYPES.get(device_type, None)
+
+    if dtype_name not in AUTOCAST_DTYPE_NAMES:
+        raise ValueError(f"mixed_precision_dtype must be one of {list(AUTOCAST_DTYPE_NAMES)} " + \
+                         f"or 'auto', got {dtype_name}.")
+
+    if device_type == 'cpu' and dtype_name == 'float16':
+        print(colored("Warning: float16 autocast is not supported on CPU, using bfloat16.", 'yellow'))
+        return torch.bfloat16
+
+    return AUTOCAST_DTYPE_NAMES[dtype_name]
+
+
+def get_autocast_context(execution_device: str,
+                         enabled: bool,
+                         dtype: Optional[torch.dtype]):
+    """
+    Returns the autocast context of the execution device,
+    or a context doing nothing if mixed precision is not used.
+
+    Args:
+        execution_device (str): The execution device.
+        enabled (bool): Whether to use mixed precision.
+        dtype (torch.dtype): The autocast data type, from get_autocast_dtype.
+
+    Returns:
+        The context manager.
+    """
+
+    if not enabled or dtype is None:
+        return contextlib.nullcontext()
+
+    return torch.autocast(device_type=get_device_type(execution_device),
+                          dtype=dtype,
+                          cache_enabled=True)
+
+
+def needs_gradient_scaling(execution_device: str,
+                           dtype: Optional[torch.dtype]) -> bool:
+    """
+    Returns True if the loss must be scaled to avoid gradient underflow,
+    which is only needed with float16 on GPU. bfloat16 has the
+    exponent range of float32.
+    """
+    return dtype == torch.float16 and get_device_type(execution_device) == 'cuda'
@@ -1,52 +1,79 @@
+import numpy as np
 import torch
 from torch import nn
 from torch.utils.data import DataLoader
+from typing import Optional
 
-# TODO: should it work with mixed precision?
+from nachosv2.model_processing.mixed_precision import get_autocast_context
 
-def predict_model(execution_device: str, 
+
+def predict_model(execution_device: str,
                   model: nn.Module,
-                  dataloader: DataLoader):
+                  dataloader: DataLoader,
+                  use_mixed_precision: bool = False,
+                  autocast_dtype: Optional[torch.dtype] = None):
     """
     Makes the model do predictions on the test dataset.
 
+    The results are stored in tensors preallocated on the execution device
+    and copied to host memory once at the end. With mixed precision, the
+    forward pass runs under autocast and the probabilities are computed in float32.
+
     Args:
         execution_device (str): The execution device.
         model (TrainingModel): The training model.
         test_dataloader (test_dataloader): The test_dataloader containing the test or validation data.
+        use_mixed_precision (bool): Whether to use autocast. Default is False.
+        autocast_dtype (torch.dtype): The autocast data type, from get_autocast_dtype. (Optional)
 
     Returns:
-        predictions_list (list): The list of the label prediction for each image in the test data.
-        true_labels_list (list): The list of the real label for each image in the test data.
+        predictions (numpy.ndarray): The label prediction for each image in the test data.
+        prediction_probabilities (numpy.ndarray): The (N, number of classes) probabilities.
+        true_labels (numpy.ndarray): The real label for each image in the test data.
         file_names_list (list): The list of the file names for each image in the test data.
     """
-    
+
     # Initializations
+    n_samples = len(dataloader.dataset)
     file_name_list = []
-    prediction_list = []
-    prediction_probabilities_list = []
-    true_label_list = []
+    predictions = torch.empty(n_samples, dtype=torch.int64, device=execution_device)
+    true_labels = torch.empty(n_samples, dtype=torch.int64, device=execution_device)
+    prediction_probabilities = None
+    offset = 0
 
     with torch.set_grad_enabled(False):
-        
+
         for inputs, labels, filepaths in dataloader:
-            
-            # Sends inputs and labels to the execution device  
+
+            # Sends inputs and labels to the execution device
             inputs = inputs.to(execution_device)
             labels = labels.to(execution_device)
-            
+
             # Does the test
-            outputs = model(inputs)
+            with get_autocast_context(execution_device, use_mixed_precision, autocast_dtype):
+                outputs = model(inputs)
+            outputs = outputs.float()
             probabilities = torch.softmax(outputs, dim=1)
             # Gets the predicted class indices
             _, class_predictions = torch.max(outputs, 1)
 
-            # Formats the predictions and real labels into lists
-            # file_names_list.append(file_names)
-            prediction_list.extend(class_predictions.tolist())
-            prediction_probabilities_list.extend(probabilities.tolist())
-            true_label_list.extend(labels.tolist())
+            if prediction_probabilities is None:
+                prediction_probabilities = torch.empty((n_samples, probabilities.shape[1]),
+                                                       dtype=probabilities.dtype,
+                                                       device=execution_device)
+
+            # Fills the preallocated tensors, without synchronizing with the device
+            batch_size = inputs.shape[0]
+            predictions[offset:offset + batch_size] = class_predictions
+            prediction_probabilities[offset:offset + batch_size] = probabilities
+            true_labels[offset:offset + batch_size] = labels
             file_name_list.extend(list(filepaths))
+            offset += batch_size
+
+    if prediction_probabilities is None:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32), \
+               np.empty(0, dtype=np.int64), file_name_list
 
-    return prediction_list, prediction_probabilities_list, \
-           true_label_list, file_name_list
+    return predictions[:offset].cpu().numpy(), \
+           prediction_probabilities[:offset].cpu().numpy(), \
+           true_labels[:offset].cpu().numpy(), file_name_list
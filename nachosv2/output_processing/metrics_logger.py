@@ -0,0 +1,131 @@
+import csv
+import io
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+import pandas as pd
+
+
+class MetricsLogger():
+    def __init__(self,
+                 filepath: Path,
+                 columns: List[str],
+                 max_buffered_rows: int = 1000,
+                 flush_interval_seconds: float = 30.0):
+        """
+        Append-only CSV logger of training metrics (history, learning rate).
+
+        Rows are buffered in memory and appended to the file when the buffer
+        is full, when flush_interval_seconds have passed since the last write,
+        or when flush() is called (e.g. at each checkpoint). The file has the
+        layout written by pandas.DataFrame.to_csv, with the row number as
+        first column, so it is read with read_metrics_csv or
+        pd.read_csv(index_col=0).
+
+        Args:
+            filepath (Path): The CSV file.
+            columns (list of str): The columns of the rows.
+            max_buffered_rows (int): Number of rows kept in memory before writing. Default is 1000.
+            flush_interval_seconds (float): Maximum time between writes. Default is 30.
+        """
+
+        self.filepath = Path(filepath)
+        self.columns = list(columns)
+        self.max_buffered_rows = max_buffered_rows
+        self.flush_interval_seconds = flush_interval_seconds
+
+        self.buffered_rows = []
+        self.n_rows = 0
+        self.last_flush_time = time.monotonic()
+
+
+    def reset(self,
+              dictionary: Optional[dict] = None):
+        """
+        Rewrites the file with the rows of a dictionary of columns,
+        e.g. the history restored from a checkpoint, dropping the rows
+        written after it. Following rows are appended.
+
+        Args:
+            dictionary (dict of list): The rows to keep. If None, the file only has the header. (Optional)
+        """
+
+        self.buffered_rows = []
+        df = pd.DataFrame(dictionary if dictionary else {column: [] for column in self.columns},
+                          columns=self.columns)
+
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        temporary_filepath = self.filepath.with_name(self.filepath.name + ".tmp")
+        df.to_csv(temporary_filepath)
+        os.replace(temporary_filepath, self.filepath)
+
+        self.n_rows = len(df)
+        self.last_flush_time = time.monotonic()
+
+
+    def append(self,
+               row: dict):
+        """
+        Adds a row, written at the next flush.
+
+        Args:
+            row (dict): The values of the row, by column.
+        """
+
+        self.buffered_rows.append([row.get(column, None) for column in self.columns])
+
+        if len(self.buffered_rows) >= self.max_buffered_rows or \
+           time.monotonic() - self.last_flush_time >= self.flush_interval_seconds:
+            self.flush()
+
+
+    def flush(self):
+        """
+        Appends the buffered rows to the file and syncs it to disk.
+        """
+
+        self.last_flush_time = time.monotonic()
+        if not self.buffered_rows:
+            return
+
+        if not self.filepath.exists():
+            self.reset()
+
+        with open(self.filepath, 'a', newline='', encoding='utf-8') as file_pointer:
+            writer = csv.writer(file_pointer)
+            for row in self.buffered_rows:
+                writer.writerow([self.n_rows] + ['' if value is None else value for value in row])
+                self.n_rows += 1
+            file_pointer.flush()
+            os.fsync(file_pointer.fileno())
+
+        self.buffered_rows = []
+
+
+def read_metrics_csv(filepath: Path) -> pd.DataFrame:
+    """
+    Reads a CSV written by MetricsLogger or save_dict_to_csv.
+    A last row cut by an interruption of the training, without its
+    newline or with fewer fields than the header, is dropped. Complete
+    rows are kept, even with NaN values, e.g. a diverged last epoch.
+
+    Args:
+        filepath (Path): The CSV file.
+
+    Returns:
+        pd.DataFrame: The rows, indexed by row number.
+    """
+
+    with open(filepath, 'r', newline='', encoding='utf-8') as file_pointer:
+        text = file_pointer.read()
+
+    header_end = text.find("\n") + 1
+    if 0 < header_end < len(text):
+        last_row_start = text.rfind("\n", 0, len(text) - 1) + 1
+        n_fields = len(next(csv.reader([text[:header_end]])))
+        if not text.endswith("\n") or \
+           len(next(csv.reader([text[last_row_start:]]))) != n_fields:
+            text = text[:last_row_start]
+
+    return pd.read_csv(io.StringIO(text), index_col=0, float_precision="round_trip")
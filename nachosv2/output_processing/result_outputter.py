@@ -2,8 +2,10 @@ from typing import Optional, Callable, Union, Tuple, List
 from pathlib import Path
 import os
 import fasteners
+import numpy as np
 from termcolor import colored
 
+import torch
 from torch import nn
 import pandas as pd
 from nachosv2.model_processing.predict_model import predict_model
@@ -64,7 +66,11 @@ def save_prediction_results(partition_type: str,
                             trained_model: nn.Module,
                             partitions_info_dict: dict,
                             output_path: Path,
-                            file_prefix: str):
+                            file_prefix: str,
+                            save_npz: bool = False,
+                            use_mixed_precision: bool = False,
+                            autocast_dtype: Optional[torch.dtype] = None,
+                            overwrite: bool = False):
     """
     Saves the results of the inner loop to the metrics dictionary.
 
@@ -74,6 +80,11 @@ def save_prediction_results(partition_type: str,
         datasets (dict): Dictionary containing 'testing' and 'validation' datasets.
         metrics (dict): Dictionary to store the metrics and results.
         file_prefix (str): Prefix for the file names used in saving the results.
+        save_npz (bool): Whether to also save the predictions in a .npz file. Default is False.
+        use_mixed_precision (bool): Whether to predict with autocast. Default is False.
+        autocast_dtype (torch.dtype): The autocast data type. (Optional)
+        overwrite (bool): Whether to replace existing predictions, e.g. when the
+            training was resumed to a larger epoch budget. Default is False.
     """
     
     if partition_type not in ["validation", "test"]:
@@ -88,36 +99,67 @@ def save_prediction_results(partition_type: str,
     
     filepath = output_path / filename
     
-    if filepath.exists():
+    if filepath.exists() and not overwrite:
         return
     
     preds, pred_probs, true_labels, filepaths = predict_model(
                                                 execution_device,
                                                 trained_model,
-                                                partitions_info_dict[partition_type]['dataloader'])
-   
-    prediction_rows = []
-    num_classes = len(pred_probs[0])
-    
-    for index in range(len(preds)):
-        dict_temp = {}
-        dict_temp["index"] = index
-        dict_temp["filename"] = Path(filepaths[index]).name
-        dict_temp["filepath"] = filepaths[index]
-        dict_temp["true_label"] = true_labels[index]
-        dict_temp["predicted_class"] = preds[index]
-        for i in range(num_classes):
-            dict_temp[f"class_{i}_prob"] = pred_probs[index][i]
-        prediction_rows.append(dict_temp)
+                                                partitions_info_dict[partition_type]['dataloader'],
+                                                use_mixed_precision,
+                                                autocast_dtype)
+
+    # Columns are built from the arrays, without a dictionary per image
+    prediction_columns = {
+        "index": np.arange(len(preds)),
+        "filename": [os.path.basename(filepath) for filepath in filepaths],
+        "filepath": filepaths,
+        "true_label": true_labels,
+        "predicted_class": preds,
+    }
+    for i in range(pred_probs.shape[1]):
+        prediction_columns[f"class_{i}_prob"] = pred_probs[:, i]
+
+    # The .npz of earlier predictions is removed first, so it is never
+    # read next to a newer CSV, even if the run stops before the new one
+    filepath.with_suffix(".npz").unlink(missing_ok=True)
 
     save_dict_or_listdict_to_csv(
-        values=prediction_rows,
+        values=prediction_columns,
         path=output_path,
         filename=filename,
         overwrite=True,
         verbose=True,
         )
 
+    if save_npz:
+        save_prediction_npz(filepath.with_suffix(".npz"),
+                            preds, pred_probs, true_labels, filepaths)
+
+
+def save_prediction_npz(filepath: Path,
+                        predictions: np.ndarray,
+                        prediction_probabilities: np.ndarray,
+                        true_labels: np.ndarray,
+                        filepaths: List[str]):
+    """
+    Saves the predictions in a binary .npz file, next to the prediction CSV.
+    The metrics tools read it instead of the CSV when it exists.
+
+    Args:
+        filepath (Path): The .npz file.
+        predictions (numpy.ndarray): The predicted classes.
+        prediction_probabilities (numpy.ndarray): The (N, number of classes) probabilities.
+        true_labels (numpy.ndarray): The true labels.
+        filepaths (list of str): The file paths of the images.
+    """
+
+    np.savez(filepath,
+             true_label=true_labels,
+             predicted_class=predictions,
+             probabilities=prediction_probabilities,
+             filepath=np.asarray(filepaths, dtype=str))
+
 
 def save_dict_to_csv(dictionary: dict,
                      output_path: Path,
@@ -154,7 +196,11 @@ def predict_and_save_results(execution_device: str,
                              partitions_info_dict: dict,
                              class_names: List[str],
                              is_cv_loop: bool,
-                             enable_prediction_on_test: bool=None):
+                             enable_prediction_on_test: bool=None,
+                             save_prediction_npz: bool=False,
+                             use_mixed_precision: bool=False,
+                             autocast_dtype: Optional[torch.dtype]=None,
+                             overwrite_predictions: bool=False):
     """
     Outputs results from the trained model.
         
@@ -179,6 +225,10 @@ def predict_and_save_results(execution_device: str,
         
         is_outer_loop (bool): If this is of the outer loop.
         rank (int): The process rank. May be None.
+        save_prediction_npz (bool): Whether to also save the predictions in .npz files. Default is False.
+        use_mixed_precision (bool): Whether to predict with autocast. Default is False.
+        autocast_dtype (torch.dtype): The autocast data type. (Optional)
+        overwrite_predictions (bool): Whether to replace existing predictions. Default is False.
     """
 
     
@@ -218,7 +268,11 @@ def predict_and_save_results(execution_device: str,
                                 model,
                                 partitions_info_dict,
                                 path_folder_output,
-                                prefix)
+                                prefix,
+                                save_prediction_npz,
+                                use_mixed_precision,
+                                autocast_dtype,
+                                overwrite_predictions)
         
         end_message = f"Finished writing results to file " + \
                       f"test fold '{test_fold}' and validation subject " + \
@@ -230,7 +284,11 @@ def predict_and_save_results(execution_device: str,
                                     model,
                                     partitions_info_dict,
                                     path_folder_output,
-                                    prefix)
+                                    prefix,
+                                    save_prediction_npz,
+                                    use_mixed_precision,
+                                    autocast_dtype,
+                                    overwrite_predictions)
         
             end_message = f"Finished writing results to file " + \
                         f"test fold '{test_fold}' and validation subject " + \
@@ -242,7 +300,11 @@ def predict_and_save_results(execution_device: str,
                                 model,
                                 partitions_info_dict,
                                 path_folder_output,
-                                prefix)
+                                prefix,
+                                save_prediction_npz,
+                                use_mixed_precision,
+                                autocast_dtype,
+                                overwrite_predictions)
         end_message = f"Finished writing results to file " + \
                       f"test fold '{test_fold}'.\n"
     
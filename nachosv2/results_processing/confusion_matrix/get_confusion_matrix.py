@@ -8,6 +8,7 @@ from nachosv2.setup.get_config import get_config
 from nachosv2.setup.utils import get_other_result
 from nachosv2.setup.utils import get_filepath_list
 from nachosv2.setup.utils import get_new_filepath_from_suffix
+from nachosv2.setup.utils_processing import read_prediction_labels
 from nachosv2.setup.files_check import ensure_path_exists
 
 
@@ -33,9 +34,7 @@ def generate_individual_confusion_matrix(path: Path) -> pd.DataFrame:
     Raises:
         FileNotFoundError: If the CSV file at the provided path or the associated class names file is not found.
     """
-    df_results = pd.read_csv(path)
-    actual = df_results['true_label']
-    predicted = df_results['predicted_class']
+    actual, predicted = read_prediction_labels(path)
 
     confusion_matrix = metrics.confusion_matrix(actual, predicted) 
 
@@ -9,6 +9,7 @@ from pytorch_grad_cam.utils.model_targets import ClassifierOutputTarget
 from nachosv2.setup.command_line_parser import parse_command_line_args
 from pytorch_grad_cam.utils.image import show_cam_on_image
 from nachosv2.data_processing.read_metadata_csv import read_metadata_csv
+from nachosv2.data_processing.read_metadata_csv import METADATA_COLUMNS
 from nachosv2.setup.files_check import ensure_path_exists
 from nachosv2.setup.get_config import get_config
 from nachosv2.setup.utils_training import get_files_labels_for_fold
@@ -139,7 +140,8 @@ def main():
     validate_exclusive_options(config_dict,
                                ["fold", "image_path", "image_folder"])
 
-    df_metadata = read_metadata_csv(config_dict["metadata_path"])
+    df_metadata = read_metadata_csv(config_dict["metadata_path"],
+                                    columns=METADATA_COLUMNS)
 
     if config_dict.get("do_normalize", None) and config_dict.get("fold"):
         transform = transforms.Normalize(
@@ -166,7 +168,7 @@ def main():
         fold_info_dict = {'files': [], 'labels': [], 'dataloader': None}
         fold_info_dict['files'], fold_info_dict['labels'] = get_files_labels_for_fold(
             df_metadata=df_metadata,
-            fold_or_list_fold="k1")
+            fold_or_list_fold=config_dict["fold"])
 
         dataset = Dataset2D(
             dictionary_partition=fold_info_dict,
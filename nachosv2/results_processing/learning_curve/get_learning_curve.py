@@ -13,6 +13,7 @@ from nachosv2.setup.utils_processing import save_dict_to_yaml
 from nachosv2.setup.utils_processing import parse_filename
 from nachosv2.setup.utils_processing import is_metric_allowed
 from nachosv2.setup.utils import get_new_filepath_from_suffix
+from nachosv2.output_processing.metrics_logger import read_metrics_csv
 import matplotlib.pyplot as plt
 
 
@@ -20,8 +21,7 @@ def generate_individual_learning_curve(history_path: Path,
                                        is_cv_loop: bool,
                                        output_filepath: Path,
                                        title: Optional[str] = None):
-    df_history = pd.read_csv(history_path,
-                             index_col=0)
+    df_history = read_metrics_csv(history_path)
     
     fig, ax = plt.subplots()
     fig.set_size_inches(10,5)
@@ -12,6 +12,7 @@ from nachosv2.setup.get_config import get_config
 from nachosv2.setup.utils_processing import save_dict_to_yaml
 from nachosv2.setup.utils_processing import parse_filename
 from nachosv2.setup.utils_processing import is_metric_allowed
+from nachosv2.output_processing.metrics_logger import read_metrics_csv
 from nachosv2.results_processing.metrics.get_metrics import (
     generate_metrics_file
 )
@@ -35,7 +36,7 @@ def fill_dataframe(filepath: Path,
         pd.DataFrame: The updated DataFrame with the extracted results.
     """
     # Read CSV file into DataFrame
-    history_df = pd.read_csv(filepath, index_col=0)
+    history_df = read_metrics_csv(filepath)
     metrics_df = pd.read_csv(metrics_filepath, index_col=0)
 
     # if CV loop, 3 first columns are test, hp_config, and val
@@ -1,6 +1,7 @@
 from pathlib import Path
 from typing import List, Dict
 from sklearn import metrics
+import numpy as np
 import yaml
 from termcolor import colored
 import pandas as pd
@@ -109,14 +110,36 @@ def generate_individual_metric(metrics_list: List[str],
             path_list_sorted = sorted(path_list, reverse=True)
             for path in path_list_sorted:
                 partition = get_partition_from_prediction_file(path)
-                df_results = pd.read_csv(path)
-                actual = df_results['true_label']
-                predicted = df_results['predicted_class']
+                actual, predicted = read_prediction_labels(path)
                 metrics_dict[f"{partition}_{metric}"] = [metric_functions[metric](actual, predicted)]
 
     return metrics_dict
 
 
+def read_prediction_labels(path: Path) -> tuple:
+    """
+    Reads the true labels and predicted classes of a prediction file.
+    The .npz file saved next to the CSV is used when it exists and is
+    not older than the CSV, otherwise only the two columns are read from
+    the CSV.
+
+    Args:
+        path (Path): The prediction CSV filepath.
+
+    Returns:
+        tuple: The true labels and the predicted classes, as numpy arrays.
+    """
+
+    npz_path = Path(path).with_suffix(".npz")
+    if npz_path.exists() and npz_path.stat().st_mtime_ns >= Path(path).stat().st_mtime_ns:
+        with np.load(npz_path) as predictions:
+            return predictions['true_label'], predictions['predicted_class']
+
+    df_results = pd.read_csv(path, usecols=['true_label', 'predicted_class'])
+
+    return df_results['true_label'].to_numpy(), df_results['predicted_class'].to_numpy()
+
+
 def parse_filename(filepath: Path,
                    is_cv_loop: bool) -> dict:
     """
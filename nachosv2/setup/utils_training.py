@@ -1,7 +1,10 @@
-from typing import Union, List, Tuple
+from typing import Union, List, Optional, Tuple
 from termcolor import colored
 import torch
 
+from nachosv2.data_processing.channel_statistics import compute_channel_statistics
+from nachosv2.data_processing.fold_index import FoldIndex
+
 
 FloatOrListFloats = Union[float, List[float]]
 def get_mean_stddev(
@@ -11,6 +14,7 @@ def get_mean_stddev(
     )->Tuple[FloatOrListFloats, FloatOrListFloats]:
     """
     Calculate the mean and standard deviation for grayscale (1 channel) or RGB (3 channels) datasets.
+    The statistics are accumulated with a numerically stable streaming algorithm.
 
     Args:
         dataloader (DataLoader): DataLoader providing batches of images.
@@ -21,79 +25,70 @@ def get_mean_stddev(
         or lists of floats for RGB.
     """
 
-    total_sum = torch.zeros(number_channels, device=device)
-    total_sum_squared = torch.zeros(number_channels, device=device)
-    num_pixels = 0
-    
-    # Iterate through the dataset
-    for images, _, _ in dataloader:
-        images = images.to(device)
-        batch_size, channels, height, width = images.shape
+    statistics = compute_channel_statistics(dataloader,
+                                            number_channels,
+                                            device)
 
-        images = images.view(batch_size, channels, -1)
-        
-        # Accumulate sum and squared sum
-        total_sum += images.sum(dim=(0, 2))  # Sum over batch and spatial dimensions
-        total_sum_squared += (images ** 2).sum(dim=(0, 2))  # Sum of squares
-        num_pixels += batch_size * height * width  # Total number of pixels per channel
-
-    # Calculate mean and standard deviation
-    mean = total_sum / num_pixels
-    stddev = (total_sum_squared / num_pixels - mean ** 2).sqrt()
-        
-    # Convert to scalars for grayscale or lists for RGB
-    if number_channels == 1:
-        return mean.item(), stddev.item()
-    elif number_channels == 3:
-        return mean.tolist(), stddev.tolist()
-    else:
-        raise ValueError("Number of channels must be 1 or 3.")
+    return statistics.get_mean_stddev()
 
 
 def get_files_labels(partition: str,
                      df_metadata: 'pandas.DataFrame',
                      test_fold: str,
                      validation_fold: str,
-                     training_folds_list: list) -> tuple:   
-    # Dictionary mapping partitions to their respective fold names or conditions
-    partition_queries = {
-        'test': f"fold_name == @test_fold",
-        'validation': f"fold_name == @validation_fold",
-        'training': f"fold_name in @training_folds_list"
+                     training_folds_list: list,
+                     fold_index: Optional[FoldIndex] = None) -> tuple:
+    """
+    Returns the file paths and labels of a partition, as arrays.
+
+    Args:
+        partition (str): 'test', 'validation' or 'training'.
+        df_metadata (pandas.DataFrame): The metadata.
+        test_fold (str): The test fold.
+        validation_fold (str): The validation fold.
+        training_folds_list (list of str): The training folds.
+        fold_index (FoldIndex): The fold index of df_metadata, built once
+            per sweep. Built from df_metadata if not given. (Optional)
+    """
+
+    # Folds of each partition
+    partition_folds = {
+        'test': test_fold,
+        'validation': validation_fold,
+        'training': list(training_folds_list)
     }
 
     # Validate the partition argument
-    if partition not in partition_queries:
+    if partition not in partition_folds:
         raise ValueError(f"Invalid partition specified: {partition}."
                             " Must be 'test', 'validation', or 'training'.")
 
-    # Query the DataFrame once per function call
-    partition_query = partition_queries[partition]
-    filtered_data = df_metadata.query(partition_query)
-
-    # Extract files and labels lists
-    files = filtered_data['absolute_filepath'].tolist()
-    labels = filtered_data['label'].tolist()
+    if fold_index is None:
+        fold_index = FoldIndex(df_metadata)
 
-    return files, labels
+    return fold_index.get_files_labels(partition_folds[partition])
 
 def get_files_labels_for_fold(df_metadata,
-                              fold_or_list_fold: Union[str, List[str]]) -> tuple:   
-    # Query the DataFrame once per function call
-    if isinstance(fold_or_list_fold, str):
-        query = "fold_name == @fold_or_list_fold"
-    elif isinstance(fold_or_list_fold, list):
-        query = "fold_name in @fold_or_list_fold"    
-    else:
+                              fold_or_list_fold: Union[str, List[str]],
+                              fold_index: Optional[FoldIndex] = None) -> tuple:
+    """
+    Returns the file paths and labels of a fold or of a list of folds, as arrays.
+
+    Args:
+        df_metadata (pandas.DataFrame): The metadata.
+        fold_or_list_fold (str or list of str): The fold or the folds.
+        fold_index (FoldIndex): The fold index of df_metadata, built once
+            per sweep. Built from df_metadata if not given. (Optional)
+    """
+
+    if not isinstance(fold_or_list_fold, (str, list)):
         raise ValueError(f"Invalid type for {fold_or_list_fold}."
                           " Must be string or list of strings.")
-    filtered_data = df_metadata.query(query)
 
-    # Extract files and labels lists
-    files = filtered_data['absolute_filepath'].tolist()
-    labels = filtered_data['label'].tolist()
+    if fold_index is None:
+        fold_index = FoldIndex(df_metadata)
 
-    return files, labels
+    return fold_index.get_files_labels(fold_or_list_fold)
 
 
 def create_empty_learning_rate_freq_step_history():
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+import skimage.io
+import torch
+from torch import nn
+
+from nachosv2.training.training_processing import training_fold
+
+
+class SmallConvNet(nn.Module):
+    def __init__(self,
+                 number_channels: int = 1,
+                 number_classes: int = 3):
+        """
+        A convolution, batch normalization and linear classifier, small
+        enough to train the folds of the tests on CPU in seconds.
+        """
+
+        super().__init__()
+        self.convolution = nn.Conv2d(number_channels, 4, kernel_size=3, padding=1)
+        self.batch_normalization = nn.BatchNorm2d(4)
+        self.pooling = nn.AdaptiveAvgPool2d(2)
+        self.classifier = nn.Linear(16, number_classes)
+
+
+    def forward(self, inputs):
+        # Inputs have the type of the weights, e.g. float64 in the parity tests
+        inputs = inputs.to(self.convolution.weight.dtype)
+        outputs = torch.relu(self.batch_normalization(self.convolution(inputs)))
+        return self.classifier(torch.flatten(self.pooling(outputs), 1))
+
+
+@pytest.fixture
+def synthetic_metadata(tmp_path) -> pd.DataFrame:
+    """
+    Writes 12 random 16x16 grayscale PNG images of 3 classes in each of
+    the folds k1 to k4, and returns their metadata.
+    """
+
+    rng = np.random.default_rng(0)
+    rows = []
+    for fold_name in ["k1", "k2", "k3", "k4"]:
+        fold_directory = tmp_path / "images" / fold_name
+        fold_directory.mkdir(parents=True)
+        for index in range(12):
+            filepath = fold_directory / f"image_{index:02d}.png"
+            skimage.io.imsave(filepath, rng.integers(0, 256, size=(16, 16), dtype=np.uint8),
+                              check_contrast=False)
+            rows.append({"fold_name": fold_name, "absolute_filepath": str(filepath), "label": index % 3})
+
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def small_model(monkeypatch):
+    """
+    Makes TrainingFold create a SmallConvNet instead of the architecture
+    of the hyperparameters.
+    """
+
+    monkeypatch.setattr(training_fold, "create_model",
+                        lambda configuration, hyperparameters: (SmallConvNet(), None))
+
+
+@pytest.fixture
+def training_config(tmp_path, monkeypatch) -> dict:
+    """
+    Returns a configuration of the synthetic folds. The TensorBoard runs
+    folder is created in the temporary folder.
+    """
+
+    monkeypatch.chdir(tmp_path)
+
+    return {'job_name': 'test', 'metrics_list': [], 'do_shuffle_the_images': False,
+            'target_dimensions': [16, 16], 'number_channels': 1,
+            'output_path': str(tmp_path / "results"), 'checkpoint_epoch_frequency': 100,
+            'class_names': ['a', 'b', 'c'], 'fold_list': ['k1', 'k2', 'k3', 'k4'],
+            'do_normalize_2d': True, 'use_mixed_precision': False,
+            'dataloader_num_workers': 0, 'enable_prediction_on_test': False}
+
+
+@pytest.fixture
+def hp_configuration() -> dict:
+    return {'hp_config_index': 0, 'n_epochs': 6, 'batch_size': 4, 'do_cropping': False,
+            'patience': 1, 'learning_rate': 0.05, 'learning_rate_scheduler': 'constant',
+            'learning_rate_scheduler_parameters': None, 'momentum': 0.9,
+            'enable_nesterov': False, 'architecture': 'ResNet50'}
@@ -0,0 +1,33 @@
+import threading
+
+from nachosv2.checkpoint_processing.checkpoint_manifest import create_checkpoint_folder
+from nachosv2.checkpoint_processing.checkpoint_manifest import has_manifests_marker
+
+
+def test_concurrent_creators_always_see_the_marker(tmp_path):
+    for trial in range(20):
+        checkpoint_folder_path = tmp_path / str(trial) / "CV" / "checkpoints"
+        has_marker = []
+
+        def create():
+            create_checkpoint_folder(checkpoint_folder_path)
+            has_marker.append(has_manifests_marker(checkpoint_folder_path))
+
+        threads = [threading.Thread(target=create) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert has_marker == [True] * 8
+        # The temporary folders of the processes that lost the race are removed
+        assert [path.name for path in checkpoint_folder_path.parent.iterdir()] == ["checkpoints"]
+
+
+def test_existing_folder_without_marker_is_left_as_is(tmp_path):
+    checkpoint_folder_path = tmp_path / "checkpoints"
+    checkpoint_folder_path.mkdir()
+
+    create_checkpoint_folder(checkpoint_folder_path)
+
+    assert not has_manifests_marker(checkpoint_folder_path)
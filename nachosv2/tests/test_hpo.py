@@ -0,0 +1,111 @@
+import itertools
+import random
+from unittest import mock
+
+import pandas as pd
+import pytest
+
+from nachosv2.training.hpo import hpo
+from nachosv2.training.hpo.hpo import HyperparameterSampler
+from nachosv2.training.hpo.hpo import TPESampler
+from nachosv2.training.hpo.hpo import extract_default_hyperparameters
+from nachosv2.training.hpo.hpo import get_hp_key
+from nachosv2.training.hpo.hpo import read_hpo_observations
+
+
+ARCHITECTURES = ["ResNet50", "VGG16", "DenseNet121", "InceptionV3"]
+
+
+def create_tpe_sampler(batch_size_max, architectures):
+    hyperparameter_dict = {"n_combinations": 20,
+                           "batch_size": {"min": 4, "max": batch_size_max},
+                           "architecture": architectures}
+
+    return TPESampler(hyperparameter_dict, extract_default_hyperparameters(),
+                      max_number_repetitions=100, n_startup=2)
+
+
+def create_configurations(sampler, batch_sizes, architectures):
+    """
+    Returns the configurations of the given values, the other
+    hyperparameters with their default values.
+    """
+
+    df_default = sampler.df_default
+    l_dict = []
+    for batch_size, architecture in itertools.product(batch_sizes, architectures):
+        dict_values = {hyperparameter: df_default.loc[hyperparameter, "value_converted"]
+                       for hyperparameter in df_default.index}
+        dict_values.update({"batch_size": batch_size, "architecture": architecture})
+        l_dict.append(dict_values)
+
+    return l_dict
+
+
+def write_summary(filepath):
+    pd.DataFrame({"test_fold": ["k1", "k1", "k2", "k2", "k1", "k3"],
+                  "hp_config": [0, 0, 0, 0, 1, 1],
+                  "val_fold": ["k2", "k3", "k1", "k3", "k2", "k1"],
+                  "validation_loss": [1.0, 3.0, 5.0, 5.0, 0.5, 9.0]}).to_csv(filepath)
+
+
+def test_observations_are_scored_on_the_test_folds_of_the_loop(tmp_path):
+    summary_filepath = tmp_path / "results_all.csv"
+    write_summary(summary_filepath)
+    config = {"hpo_summary_filepath": summary_filepath}
+
+    # Configuration 1 has no result for test fold k2
+    assert read_hpo_observations(config, ["k1", "k2"]) == {0: 3.5}
+    # The results of test fold k3 are not mixed in
+    assert read_hpo_observations(config, ["k1"]) == {0: 2.0, 1: 0.5}
+
+
+def test_sampler_without_propose_cannot_be_created():
+    with pytest.raises(TypeError):
+        HyperparameterSampler({}, pd.DataFrame(), 1)
+
+
+def test_tpe_proposal_is_never_a_configuration_already_given():
+    random.seed(0)
+    sampler = create_tpe_sampler(8, ARCHITECTURES[:2])
+    # 3 of the 4 configurations of the search space are given and trained
+    l_dict = create_configurations(sampler, [4, 8], ARCHITECTURES[:2])
+    remaining_dict = l_dict.pop()
+    for loss, dict_values in enumerate(l_dict):
+        sampler.observe(dict_values, float(loss))
+
+    for _ in range(20):
+        assert get_hp_key(sampler.propose(l_dict)) == get_hp_key(remaining_dict)
+
+
+def test_tpe_falls_back_to_random_when_all_candidates_are_given(monkeypatch):
+    random.seed(0)
+    sampler = create_tpe_sampler(8, ARCHITECTURES[:2])
+    l_dict = create_configurations(sampler, [4, 8], ARCHITECTURES[:2])
+    remaining_dict = l_dict.pop()
+    for loss, dict_values in enumerate(l_dict):
+        sampler.observe(dict_values, float(loss))
+
+    # Every candidate is the first value of each hyperparameter, already given
+    monkeypatch.setattr(hpo.random, "choices", lambda population, weights: [population[0]])
+    with mock.patch.object(sampler, "propose_random", wraps=sampler.propose_random) as propose_random:
+        dict_values = sampler.propose(l_dict)
+
+    propose_random.assert_called_once()
+    assert get_hp_key(dict_values) == get_hp_key(remaining_dict)
+
+
+def test_tpe_proposals_favor_the_values_with_low_losses():
+    random.seed(0)
+    sampler = create_tpe_sampler(64, ARCHITECTURES)
+    # The loss is lowest with the smallest batch sizes and the first architecture
+    for dict_values in create_configurations(sampler, [4, 8, 16, 32, 64], ARCHITECTURES):
+        loss = sampler.search_space["batch_size"]["values"].index(dict_values["batch_size"]) + \
+            2 * ARCHITECTURES.index(dict_values["architecture"])
+        sampler.observe(dict_values, float(loss))
+
+    proposals = [sampler.propose([]) for _ in range(100)]
+
+    # Random search gives each architecture 25% of the time, 40% for batch sizes 4 and 8
+    assert sum(dict_values["architecture"] == ARCHITECTURES[0] for dict_values in proposals) > 50
+    assert sum(dict_values["batch_size"] <= 8 for dict_values in proposals) > 60
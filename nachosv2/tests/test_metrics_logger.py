@@ -0,0 +1,57 @@
+import math
+
+from nachosv2.output_processing.metrics_logger import MetricsLogger
+from nachosv2.output_processing.metrics_logger import read_metrics_csv
+
+
+COLUMNS = ["training_loss", "validation_loss"]
+
+
+def write_rows(filepath, rows):
+    metrics_logger = MetricsLogger(filepath, COLUMNS)
+    metrics_logger.reset()
+    for row in rows:
+        metrics_logger.append(row)
+    metrics_logger.flush()
+
+
+def test_diverged_last_epoch_is_kept(tmp_path):
+    filepath = tmp_path / "history.csv"
+    write_rows(filepath, [{"training_loss": 1.5, "validation_loss": 1.25},
+                          {"training_loss": math.nan, "validation_loss": math.nan}])
+
+    df = read_metrics_csv(filepath)
+
+    assert len(df) == 2
+    assert df.iloc[0].tolist() == [1.5, 1.25]
+    assert df.iloc[-1].isna().all()
+
+
+def test_cut_last_row_is_dropped(tmp_path):
+    filepath = tmp_path / "history.csv"
+    write_rows(filepath, [{"training_loss": 1.5, "validation_loss": 1.25},
+                          {"training_loss": 0.75, "validation_loss": 0.5}])
+    complete_size = filepath.stat().st_size
+
+    # Interrupted while writing the third row
+    with open(filepath, 'a', encoding='utf-8') as file_pointer:
+        file_pointer.write("2,0.62")
+    assert len(read_metrics_csv(filepath)) == 2
+
+    # A last row with fewer fields than the header
+    with open(filepath, 'r+', encoding='utf-8') as file_pointer:
+        file_pointer.truncate(complete_size)
+    with open(filepath, 'a', encoding='utf-8') as file_pointer:
+        file_pointer.write("2,0.62\n")
+    df = read_metrics_csv(filepath)
+    assert df["validation_loss"].tolist() == [1.25, 0.5]
+
+
+def test_header_only(tmp_path):
+    filepath = tmp_path / "history.csv"
+    write_rows(filepath, [])
+
+    df = read_metrics_csv(filepath)
+
+    assert len(df) == 0
+    assert df.columns.tolist() == COLUMNS
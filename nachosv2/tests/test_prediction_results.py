@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from nachosv2.checkpoint_processing.checkpoint_store import load_model_state_dict
+from nachosv2.model_processing.predict_model import predict_model
+from nachosv2.output_processing.result_outputter import save_prediction_npz
+from nachosv2.output_processing.result_outputter import save_prediction_results
+from nachosv2.setup.utils_processing import read_prediction_labels
+from nachosv2.tests.conftest import SmallConvNet
+from nachosv2.training.training_processing.training_fold import TrainingFold
+
+
+def run_fold(config, metadata, hp_configuration, epoch_budget):
+    training_fold = TrainingFold(execution_device="cpu",
+                                 training_index=0,
+                                 configuration=config,
+                                 indices_loop_dict={"test": "k1",
+                                                    "validation": "k2",
+                                                    "hp_configuration": dict(hp_configuration)},
+                                 training_folds_list=["k3", "k4"],
+                                 df_metadata=metadata,
+                                 do_normalize_2d=True,
+                                 use_mixed_precision=False,
+                                 is_cv_loop=True,
+                                 epoch_budget=epoch_budget)
+    training_fold.run_all_steps()
+
+    return training_fold
+
+
+def test_promoted_run_rewrites_predictions(synthetic_metadata, small_model, training_config,
+                                           hp_configuration, tmp_path):
+    hp_configuration = {**hp_configuration, 'n_epochs': 4, 'patience': 20}
+
+    # First rung of successive halving, then the promoted trial resumes to the top rung
+    torch.manual_seed(0)
+    run_fold(training_config, synthetic_metadata, hp_configuration, epoch_budget=1)
+    prediction_filepaths = list((tmp_path / "results").rglob("*_prediction_val.csv"))
+    assert len(prediction_filepaths) == 1
+    first_rung_mtime_ns = prediction_filepaths[0].stat().st_mtime_ns
+
+    training_fold = run_fold(training_config, synthetic_metadata, hp_configuration, epoch_budget=4)
+    assert training_fold.start_epoch == 1
+    assert training_fold.epochs_completed == 4
+    assert prediction_filepaths[0].stat().st_mtime_ns != first_rung_mtime_ns
+    predictions = pd.read_csv(prediction_filepaths[0])
+
+    # The predictions are the ones of the best checkpoint of the top rung
+    model = SmallConvNet()
+    model.load_state_dict(load_model_state_dict(training_fold.best_checkpoint_file_path,
+                                                map_location="cpu"))
+    model.eval()
+    # The DataLoaders are released when the training finishes
+    training_fold.create_dataset()
+    _, probabilities, true_labels, filepaths = predict_model(
+        "cpu", model, training_fold.partitions_info_dict['validation']['dataloader'])
+
+    probability_columns = [f"class_{index}_prob" for index in range(probabilities.shape[1])]
+    assert predictions["filepath"].tolist() == list(filepaths)
+    np.testing.assert_array_equal(predictions["true_label"].to_numpy(), true_labels)
+    np.testing.assert_allclose(predictions[probability_columns].to_numpy(), probabilities,
+                               rtol=1e-5, atol=1e-6)
+
+
+class FilepathDataset(TensorDataset):
+    def __getitem__(self, index):
+        image, label = super().__getitem__(index)
+        return image, label, f"image_{index}.png"
+
+
+def test_rewritten_predictions_remove_the_earlier_npz(tmp_path):
+    torch.manual_seed(0)
+    dataset = FilepathDataset(torch.randn(8, 1, 16, 16), torch.arange(8) % 3)
+    partitions_info_dict = {"validation": {"dataloader": DataLoader(dataset, batch_size=4)}}
+    csv_filepath = tmp_path / "test_k1_prediction_val.csv"
+
+    save_prediction_results("validation", "cpu", SmallConvNet().eval(), partitions_info_dict,
+                            tmp_path, "test_k1", save_npz=True)
+    assert csv_filepath.with_suffix(".npz").exists()
+
+    # Rewritten without save_npz, e.g. by a promoted trial
+    save_prediction_results("validation", "cpu", SmallConvNet().eval(), partitions_info_dict,
+                            tmp_path, "test_k1", save_npz=False, overwrite=True)
+    assert not csv_filepath.with_suffix(".npz").exists()
+
+    df_predictions = pd.read_csv(csv_filepath)
+    true_labels, predicted_classes = read_prediction_labels(csv_filepath)
+    np.testing.assert_array_equal(true_labels, df_predictions["true_label"].to_numpy())
+    np.testing.assert_array_equal(predicted_classes, df_predictions["predicted_class"].to_numpy())
+
+
+def test_npz_older_than_the_csv_is_not_read(tmp_path):
+    csv_filepath = tmp_path / "test_k1_prediction_val.csv"
+    pd.DataFrame({"true_label": [0, 1], "predicted_class": [1, 1]}).to_csv(csv_filepath)
+    save_prediction_npz(csv_filepath.with_suffix(".npz"), np.array([0, 0]), np.ones((2, 2)),
+                        np.array([0, 1]), ["a.png", "b.png"])
+    csv_mtime_ns = csv_filepath.stat().st_mtime_ns
+    os.utime(csv_filepath.with_suffix(".npz"), ns=(csv_mtime_ns - 10**9, csv_mtime_ns - 10**9))
+
+    _, predicted_classes = read_prediction_labels(csv_filepath)
+
+    np.testing.assert_array_equal(predicted_classes, [1, 1])
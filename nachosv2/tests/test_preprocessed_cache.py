@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from nachosv2.data_processing.preprocessed_cache import PreprocessedCache
+from nachosv2.data_processing.preprocessed_cache import PreprocessedCacheStatistics
+
+
+def compute_image(filepath):
+    return np.full((2, 2), len(filepath), dtype=np.float32)
+
+
+class CachedDataset(Dataset):
+    def __init__(self, cache, filepaths):
+        self.cache = cache
+        self.filepaths = filepaths
+
+    def __len__(self):
+        return len(self.filepaths)
+
+    def __getitem__(self, index):
+        return torch.from_numpy(np.array(self.cache.get_or_compute(self.filepaths[index], 1, None, None, compute_image)))
+
+
+@pytest.mark.parametrize("multiprocessing_context", ["fork", "spawn"])
+def test_worker_counts_are_collected_and_added_up_for_the_run(tmp_path, multiprocessing_context):
+    filepaths = [str(tmp_path / f"image_{index}.png") for index in range(6)]
+    for filepath in filepaths:
+        open(filepath, 'wb').close()
+
+    # Two trainings of the same run, the second one reads the cached images
+    cache_statistics = PreprocessedCacheStatistics()
+    fold_statistics = []
+    for _ in range(2):
+        cache = PreprocessedCache(tmp_path / "cache", run_id="1234")
+        data_loader = DataLoader(CachedDataset(cache, filepaths), batch_size=2, num_workers=1,
+                                 multiprocessing_context=multiprocessing_context)
+        for _ in range(2):
+            for _ in data_loader:
+                pass
+        statistics = cache.collect_statistics()
+        fold_statistics.append(statistics)
+        cache_statistics.record({"preprocessed_cache_hits": statistics["hits"],
+                                 "preprocessed_cache_misses": statistics["misses"]})
+
+    # 6 misses in the first epoch of the first training, then only hits
+    assert fold_statistics == [{"hits": 6, "misses": 6, "hit_rate": 0.5},
+                               {"hits": 12, "misses": 0, "hit_rate": 1.0}]
+    assert (cache_statistics.hits, cache_statistics.misses) == (18, 6)
+    # The files of the workers are deleted once collected
+    assert not (tmp_path / "cache" / "statistics" / "1234").exists()
+
+
+def test_max_size_is_in_gigabytes_of_1e9_bytes(tmp_path):
+    assert PreprocessedCache(tmp_path, max_size_gb=2.5).max_size_bytes == 2500000000
@@ -0,0 +1,88 @@
+import torch
+
+from nachosv2.benchmarks.benchmark_vectorized_training import check_step_parity
+from nachosv2.benchmarks.benchmark_vectorized_training import create_training_folds
+from nachosv2.training.training_processing.vectorized_training import VectorizedTrainingFolds
+
+
+TEST_FOLD = "k1"
+VALIDATION_FOLDS = ["k2", "k3", "k4"]
+
+
+def create_prepared_folds(config, metadata, hp_configuration, output_path, is_float64=True):
+    """
+    Creates and prepares the cross-validation folds of k1, each from the
+    same initial weights, in float64 so that the order of the sums of the
+    batched convolutions does not matter.
+    """
+
+    training_folds = create_training_folds(config, metadata, TEST_FOLD, VALIDATION_FOLDS,
+                                           hp_configuration, output_path, "cpu")
+    for training_fold in training_folds:
+        torch.manual_seed(0)
+        assert training_fold.prepare()
+        if is_float64:
+            # The parameters are converted in place, the optimizer keeps them
+            training_fold.model.double()
+
+    return training_folds
+
+
+def assert_tensors_close(sequential_tensors, vectorized_tensors):
+    sequential_tensors = list(sequential_tensors)
+    vectorized_tensors = list(vectorized_tensors)
+    assert len(sequential_tensors) == len(vectorized_tensors)
+    for sequential_tensor, vectorized_tensor in zip(sequential_tensors, vectorized_tensors):
+        torch.testing.assert_close(vectorized_tensor, sequential_tensor, rtol=1e-9, atol=1e-9)
+
+
+def test_one_step_matches_sequential(synthetic_metadata, small_model, training_config,
+                                     hp_configuration, tmp_path):
+    sequential_folds = create_prepared_folds(training_config, synthetic_metadata, hp_configuration,
+                                             tmp_path / "sequential", is_float64=False)
+    vectorized_folds = create_prepared_folds(training_config, synthetic_metadata, hp_configuration,
+                                             tmp_path / "vectorized", is_float64=False)
+
+    assert check_step_parity(sequential_folds, vectorized_folds) <= 1e-9
+
+
+def test_epochs_match_sequential(synthetic_metadata, small_model, training_config,
+                                 hp_configuration, tmp_path):
+    sequential_folds = create_prepared_folds(training_config, synthetic_metadata, hp_configuration,
+                                             tmp_path / "sequential")
+    for training_fold in sequential_folds:
+        training_fold.train()
+
+    vectorized_folds = create_prepared_folds(training_config, synthetic_metadata, hp_configuration,
+                                             tmp_path / "vectorized")
+    VectorizedTrainingFolds(vectorized_folds).train()
+
+    # With a patience of 1, some folds stop before the last epoch
+    assert any(training_fold.epochs_completed < hp_configuration['n_epochs']
+               for training_fold in sequential_folds)
+
+    for sequential_fold, vectorized_fold in zip(sequential_folds, vectorized_folds):
+        # Same early stopping epoch
+        assert vectorized_fold.epochs_completed == sequential_fold.epochs_completed
+        assert vectorized_fold.do_early_stop == sequential_fold.do_early_stop
+        assert vectorized_fold.counter_early_stopping == sequential_fold.counter_early_stopping
+
+        for key in ["training_loss", "validation_loss", "training_accuracy", "validation_accuracy"]:
+            assert len(vectorized_fold.history[key]) == len(sequential_fold.history[key])
+            torch.testing.assert_close(torch.tensor(vectorized_fold.history[key], dtype=torch.float64),
+                                       torch.tensor(sequential_fold.history[key], dtype=torch.float64),
+                                       rtol=1e-9, atol=1e-9)
+
+        # Weights and batch normalization running statistics
+        assert_tensors_close(sequential_fold.model.parameters(), vectorized_fold.model.parameters())
+        assert_tensors_close(sequential_fold.model.buffers(), vectorized_fold.model.buffers())
+
+        # Momentum buffers of the optimizer
+        sequential_state = sequential_fold.optimizer.state_dict()['state']
+        vectorized_state = vectorized_fold.optimizer.state_dict()['state']
+        assert sequential_state.keys() == vectorized_state.keys()
+        for parameter_index, parameter_state in sequential_state.items():
+            assert parameter_state.keys() == vectorized_state[parameter_index].keys()
+            assert_tensors_close([value for value in parameter_state.values() if torch.is_tensor(value)],
+                                 [value for value in vectorized_state[parameter_index].values()
+                                  if torch.is_tensor(value)])
@@ -0,0 +1,300 @@
+import math
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from termcolor import colored
+
+import pandas as pd
+
+from nachosv2.setup.utils import get_folder_path
+
+
+# Decision taken for a configuration at a rung
+PROMOTED = "promoted"
+STOPPED = "stopped"
+COMPLETED = "completed"
+
+
+def get_rung_epochs(n_epochs: int,
+                    min_epochs: int,
+                    reduction_factor: int) -> List[int]:
+    """
+    Returns the epoch budgets of the rungs, min_epochs multiplied by the
+    reduction factor at each rung, up to n_epochs.
+    E.g. [1, 3, 9, 20] for 20 epochs, a minimum of 1 and a factor of 3.
+    """
+
+    rung_epochs = []
+    epoch_budget = max(1, min_epochs)
+    while epoch_budget < n_epochs:
+        rung_epochs.append(epoch_budget)
+        epoch_budget *= reduction_factor
+    rung_epochs.append(n_epochs)
+
+    return rung_epochs
+
+
+class AshaScheduler():
+    def __init__(self,
+                 config_dict: dict,
+                 indices_loop_list: List[dict]):
+        """
+        Asynchronous successive halving (ASHA) of the hyperparameter
+        configurations of a cross-validation loop.
+
+        A trial is a hyperparameter configuration of a test fold, trained
+        on all its validation folds. Trials start with a budget of
+        'asha_min_epochs' epochs. Once all the folds of a trial reach the
+        budget of a rung, the trial gets the mean of their best validation
+        losses, and it is promoted to the next rung, with a budget
+        'asha_reduction_factor' times larger, if it is in the best
+        1 / asha_reduction_factor of the trials of the test fold that
+        completed the rung. Promoted folds resume from their checkpoints.
+        The other trials wait and are promoted if later trials do worse,
+        otherwise they are stopped at the end of the loop.
+
+        Promotions are dispatched before new trials, and the new trials in
+        order of their configuration index, so the configurations drawn with
+        'seed_hpo' and the rung budgets are the same from run to run. Ties
+        are broken by configuration index.
+
+        Args:
+            config_dict (dict): The training configuration.
+            indices_loop_list (list of dict): The tasks of the loop.
+        """
+
+        self.reduction_factor = config_dict.get('asha_reduction_factor', 3)
+        self.min_epochs = config_dict.get('asha_min_epochs', 1)
+        if self.reduction_factor < 2:
+            raise ValueError(f"asha_reduction_factor must be at least 2, got {self.reduction_factor}.")
+
+        self.indices_loop_list = indices_loop_list
+        self.report_filepath = get_folder_path(Path(config_dict["output_path"]),
+                                               "hp_random_search",
+                                               True) / f"{config_dict['job_name']}_asha_rungs.csv"
+
+        # Task indices and rung budgets of each trial, by (test fold, configuration index)
+        self.trial_indices: Dict[Tuple[str, int], List[int]] = {}
+        self.trial_rung_epochs: Dict[Tuple[str, int], List[int]] = {}
+        for index, indices_loop_dict in enumerate(indices_loop_list):
+            trial_key = self.get_trial_key(indices_loop_dict)
+            self.trial_indices.setdefault(trial_key, []).append(index)
+            self.trial_rung_epochs[trial_key] = get_rung_epochs(
+                indices_loop_dict["hp_configuration"]["n_epochs"],
+                self.min_epochs,
+                self.reduction_factor)
+
+        # Best validation loss of each fold and mean of the trial, by rung
+        self.fold_losses: Dict[Tuple[Tuple[str, int], int], Dict[int, float]] = {}
+        self.rung_scores: Dict[Tuple[str, int], Dict[Tuple[str, int], float]] = {}
+        self.promoted_trials = set()
+
+        # New trials by configuration index, each with its folds one after the other
+        self.new_tasks = deque((index, 0)
+                               for trial_key in sorted(self.trial_indices, key=lambda key: (key[1], key[0]))
+                               for index in self.trial_indices[trial_key])
+        self.promoted_tasks = deque()
+
+
+    @staticmethod
+    def get_trial_key(indices_loop_dict: dict) -> Tuple[str, int]:
+        return (indices_loop_dict["test"],
+                indices_loop_dict["hp_configuration"]["hp_config_index"])
+
+
+    def get_number_of_tasks(self) -> int:
+        return len(self.indices_loop_list)
+
+
+    def get_next_task(self,
+                      is_idle: bool = False) -> Optional[dict]:
+        """
+        Returns the next task to dispatch, promotions first, as a task
+        message with the index of the task, its rung and its epoch budget,
+        or None if no task can be dispatched until more results arrive.
+
+        Args:
+            is_idle (bool): If no task is running. Then, if there are no
+                tasks left, the best trial of the highest rung of each test
+                fold without a completed trial is promoted, so that at least
+                one configuration is trained for all its epochs. Default is False.
+        """
+
+        if is_idle and not self.promoted_tasks and not self.new_tasks:
+            self.promote_best_remaining()
+
+        queue = self.promoted_tasks if self.promoted_tasks else self.new_tasks
+        if not queue:
+            return None
+
+        index, rung = queue.popleft()
+        trial_key = self.get_trial_key(self.indices_loop_list[index])
+
+        return {"index": index,
+                "rung": rung,
+                "epoch_budget": self.trial_rung_epochs[trial_key][rung]}
+
+
+    def is_top_rung(self,
+                    trial_key: Tuple[str, int],
+                    rung: int) -> bool:
+        return rung == len(self.trial_rung_epochs[trial_key]) - 1
+
+
+    def is_task_finished(self,
+                         task: dict) -> bool:
+        """
+        Returns True if the task was trained for all the epochs of its configuration.
+        """
+
+        trial_key = self.get_trial_key(self.indices_loop_list[task["index"]])
+        return self.is_top_rung(trial_key, task["rung"])
+
+
+    def get_stopped_indices(self) -> List[int]:
+        """
+        Returns the indices of the tasks of the trials stopped before their last rung.
+        """
+
+        stopped_indices = []
+        for (_, rung), rung_scores in self.rung_scores.items():
+            for trial_key in rung_scores:
+                if self.get_decision(trial_key, rung) == STOPPED:
+                    stopped_indices += self.trial_indices[trial_key]
+
+        return stopped_indices
+
+
+    def record(self,
+               task: dict,
+               result: dict):
+        """
+        Records the result of a task, and promotes the trials that are
+        in the best fraction of their rung.
+
+        Args:
+            task (dict): The task message, from get_next_task.
+            result (dict): The result of perform_single_training.
+        """
+
+        index, rung = task["index"], task["rung"]
+        trial_key = self.get_trial_key(self.indices_loop_list[index])
+
+        loss = result.get("best_validation_loss")
+        if loss is None or math.isnan(loss):
+            loss = math.inf
+        self.fold_losses.setdefault((trial_key, rung), {})[index] = loss
+
+        fold_losses = self.fold_losses[(trial_key, rung)]
+        if len(fold_losses) < len(self.trial_indices[trial_key]):
+            return
+
+        rung_scores = self.rung_scores.setdefault((trial_key[0], rung), {})
+        rung_scores[trial_key] = sum(fold_losses.values()) / len(fold_losses)
+        print(colored(f"ASHA: test fold '{trial_key[0]}', configuration {trial_key[1]}, " + \
+                      f"rung {rung} ({self.trial_rung_epochs[trial_key][rung]} epochs): " + \
+                      f"mean validation loss {rung_scores[trial_key]:.4f}.", 'cyan'))
+
+        self.promote(trial_key[0])
+
+
+    def promote(self,
+                test_fold: str):
+        """
+        Promotes the trials of a test fold in the best 1 / reduction_factor
+        of the trials that completed their rung, starting from the highest rung.
+        """
+
+        rungs = sorted({rung for (test, rung) in self.rung_scores if test == test_fold},
+                       reverse=True)
+        for rung in rungs:
+            rung_scores = self.rung_scores[(test_fold, rung)]
+            n_promotable = len(rung_scores) // self.reduction_factor
+            ranking = sorted(rung_scores, key=lambda trial_key: (rung_scores[trial_key], trial_key[1]))
+
+            for trial_key in ranking[:n_promotable]:
+                if (trial_key, rung) in self.promoted_trials or self.is_top_rung(trial_key, rung):
+                    continue
+                self.promoted_trials.add((trial_key, rung))
+                for index in self.trial_indices[trial_key]:
+                    self.promoted_tasks.append((index, rung + 1))
+
+
+    def promote_best_remaining(self):
+        """
+        Promotes the best trial of the highest rung of each test fold
+        where no trial completed its last rung.
+        """
+
+        for test_fold in sorted({test for (test, _) in self.rung_scores}):
+            rungs = sorted(rung for (test, rung) in self.rung_scores if test == test_fold)
+            if any(self.is_top_rung(trial_key, rung)
+                   for rung in rungs for trial_key in self.rung_scores[(test_fold, rung)]):
+                continue
+
+            rung = rungs[-1]
+            rung_scores = self.rung_scores[(test_fold, rung)]
+            trial_key = min(rung_scores, key=lambda trial_key: (rung_scores[trial_key], trial_key[1]))
+            if (trial_key, rung) in self.promoted_trials:
+                continue
+
+            self.promoted_trials.add((trial_key, rung))
+            for index in self.trial_indices[trial_key]:
+                self.promoted_tasks.append((index, rung + 1))
+
+
+    def get_decision(self,
+                     trial_key: Tuple[str, int],
+                     rung: int) -> str:
+        if self.is_top_rung(trial_key, rung):
+            return COMPLETED
+        if (trial_key, rung) in self.promoted_trials:
+            return PROMOTED
+        return STOPPED
+
+
+    def report(self) -> pd.DataFrame:
+        """
+        Saves the scores and decisions of each trial at each rung it
+        reached, and prints a summary per rung.
+
+        Returns:
+            pd.DataFrame: The report.
+        """
+
+        rows = []
+        for (test_fold, rung), rung_scores in sorted(self.rung_scores.items()):
+            ranking = sorted(rung_scores, key=lambda trial_key: (rung_scores[trial_key], trial_key[1]))
+            for position, trial_key in enumerate(ranking):
+                rows.append({"test_fold": test_fold,
+                             "hp_config_index": trial_key[1],
+                             "rung": rung,
+                             "epoch_budget": self.trial_rung_epochs[trial_key][rung],
+                             "n_folds": len(self.fold_losses[(trial_key, rung)]),
+                             "mean_validation_loss": rung_scores[trial_key],
+                             "rank": position + 1,
+                             "n_trials_in_rung": len(rung_scores),
+                             "decision": self.get_decision(trial_key, rung)})
+
+        df_report = pd.DataFrame(rows)
+        df_report.to_csv(self.report_filepath)
+        if not rows:
+            return df_report
+
+        for (test_fold, rung), df_rung in df_report.groupby(["test_fold", "rung"]):
+            n_stopped = (df_rung["decision"] == STOPPED).sum()
+            best_row = df_rung.iloc[0]
+            print(colored(f"ASHA test fold '{test_fold}', rung {rung}: {len(df_rung)} configurations, " + \
+                          f"{n_stopped} stopped, best configuration {best_row['hp_config_index']} " + \
+                          f"with mean validation loss {best_row['mean_validation_loss']:.4f}.", 'magenta'))
+
+        n_epochs_trained = sum(self.trial_rung_epochs[trial_key][rung] * len(self.fold_losses[(trial_key, rung)])
+                               for (_, rung), rung_scores in self.rung_scores.items()
+                               for trial_key in rung_scores
+                               if self.get_decision(trial_key, rung) != PROMOTED)
+        n_epochs_full = sum(self.trial_rung_epochs[trial_key][-1] * len(indices)
+                            for trial_key, indices in self.trial_indices.items())
+        print(colored(f"ASHA trained {n_epochs_trained} fold epochs instead of {n_epochs_full}. " + \
+                      f"Report saved to {self.report_filepath}", 'magenta'))
+
+        return df_report
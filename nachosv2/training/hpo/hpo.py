@@ -1,7 +1,10 @@
 import random
 import math
-from typing import List, Dict
+import json
+from abc import ABC, abstractmethod
+from typing import List, Dict, Optional
 from pathlib import Path
+from termcolor import colored
 import pandas as pd
 from nachosv2.setup.get_config import get_config
 from nachosv2.setup.utils import get_folder_path
@@ -189,33 +192,27 @@ def get_value_from_hyperparameter_dict(index: str,
     return value
     
 
-def is_repeated(dict_values, l_dict):
+def get_hp_key(dict_values: dict) -> str:
     """
-    Check if a given dictionary of hyperparameter values is already present in a list of dictionaries.
+    Returns a hashable key of the hyperparameter values, without
+    hp_config_index, to detect repeated configurations.
 
     Args:
-        dict_values (dict): Dictionary containing hyperparameter values to check.
-        l_dict (List[dict]): List of dictionaries containing previously generated hyperparameter values.
+        dict_values (dict): Dictionary containing hyperparameter values.
 
     Returns:
-        bool: True if the dictionary of hyperparameter values is already present in the list, False otherwise.
+        str: The values as sorted JSON.
     """
-    for existing_dict in l_dict:
-        dict_hp = existing_dict.copy()
-        # delete hp_config_index to compare just the hyperparameter values
-        del dict_hp["hp_config_index"]
+    dict_hp = {key: value for key, value in dict_values.items() if key != "hp_config_index"}
 
-        # comparing dictionaries of hyperparameters    
-        if dict_hp == dict_values:
-            return True
-    
-    return False
+    return json.dumps(dict_hp, sort_keys=True, default=str)
 
 
 def get_one_random_combination(df_default: pd.DataFrame,
                                hyperparameter_dict: Dict[str,any],
                                l_dict: List[Dict[str,any]],
-                               max_number_repetitions: int) -> Dict[str,any]:
+                               max_number_repetitions: int,
+                               seen_keys: Optional[set] = None) -> Dict[str,any]:
     """
     Generate one unique random combination of hyperparameters.
 
@@ -224,6 +221,7 @@ def get_one_random_combination(df_default: pd.DataFrame,
         hyperparameter_dict (dict): Dictionary containing hyperparameters and their ranges or values.
         l_dict (List[dict]): List of dictionaries containing previously generated hyperparameter values.
         max_number_repetitions (int): Maximum number of combinations to try before raising an error.
+        seen_keys (set): The keys of l_dict from get_hp_key, if already computed. (Optional)
 
     Returns:
         dict: A dictionary containing a unique combination of hyperparameter values.
@@ -232,6 +230,9 @@ def get_one_random_combination(df_default: pd.DataFrame,
         ValueError: If too many repeated configurations are generated.
     """
 
+    if seen_keys is None:
+        seen_keys = {get_hp_key(existing_dict) for existing_dict in l_dict}
+
     n_repetitions = 0
 
     while n_repetitions <= max_number_repetitions:
@@ -249,10 +250,10 @@ def get_one_random_combination(df_default: pd.DataFrame,
                     df_default)
             else:
                 # Use default value if not in hyperparameter dictionary
-                dict_values[hyperparameter] = df_default.loc[index, "value_converted"]
+                dict_values[hyperparameter] = df_default.loc[hyperparameter, "value_converted"]
 
         # Check if the generated combination is unique
-        if not is_repeated(dict_values, l_dict):
+        if get_hp_key(dict_values) not in seen_keys:
             return dict_values
         
         n_repetitions += 1
@@ -286,6 +287,484 @@ def add_hp_to_df(dict_values: dict,
     return df_hp_rs
 
 
+def get_search_space(hyperparameter_dict: Dict[str,any],
+                     df_default: pd.DataFrame) -> Dict[str, dict]:
+    """
+    Returns the hyperparameters that take several values, with the values
+    random search draws them from.
+
+    Ranges of powers (batch_size, learning_rate) and of multiples
+    (n_epochs) and integer ranges (n_patience) are 'ordinal', the list of
+    their values in increasing order. Lists are 'categorical'. Momentum
+    ranges are 'uniform', with their 'min' and 'max'.
+
+    Args:
+        hyperparameter_dict (dict): Dictionary containing hyperparameters and their ranges or values.
+        df_default (pd.DataFrame): DataFrame containing default values for hyperparameters.
+
+    Returns:
+        dict: The kind and the values of each hyperparameter of the search space.
+
+    Raises:
+        ValueError: If the hyperparameter range is invalid.
+    """
+
+    def power_values(min_value, max_value, base):
+        min_exponent = math.floor(math.log(min_value, base))
+        max_exponent = math.ceil(math.log(max_value, base))
+        return [base ** exponent for exponent in range(min_exponent, max_exponent + 1)]
+
+    # Same values as the random function of each hyperparameter
+    ordinal_values_function = {
+        "batch_size": lambda min_val, max_val: power_values(min_val, max_val, base=2),
+        "n_epochs": lambda min_val, max_val: [10 * factor for factor in range(min_val // 10, max_val // 10 + 1)],
+        "n_patience": lambda min_val, max_val: list(range(min_val, max_val + 1)),
+        "learning_rate": lambda min_val, max_val: power_values(min_val, max_val, base=10),
+    }
+
+    search_space = {}
+    for hyperparameter in df_default.index:
+        if hyperparameter not in hyperparameter_dict or \
+           hyperparameter == "learning_rate_scheduler_parameters":
+            continue
+
+        value = hyperparameter_dict[hyperparameter]
+        if isinstance(value, list) and len(value) > 1:
+            search_space[hyperparameter] = {"kind": "categorical", "values": value}
+        elif isinstance(value, dict):
+            if "min" not in value or "max" not in value:
+                raise ValueError(f"Hyperparameter {hyperparameter} must have 'min' and 'max' keys.")
+            if hyperparameter == "momentum":
+                search_space[hyperparameter] = {"kind": "uniform", "min": value["min"], "max": value["max"]}
+            else:
+                search_space[hyperparameter] = {"kind": "ordinal",
+                                                "values": ordinal_values_function[hyperparameter](value["min"],
+                                                                                                  value["max"])}
+
+    return search_space
+
+
+class HyperparameterSampler(ABC):
+    def __init__(self,
+                 hyperparameter_dict: Dict[str,any],
+                 df_default: pd.DataFrame,
+                 max_number_repetitions: int):
+        """
+        Proposes hyperparameter configurations, given the configurations
+        already proposed and the validation losses of those trained.
+
+        Args:
+            hyperparameter_dict (dict): Dictionary containing hyperparameters and their ranges or values.
+            df_default (pd.DataFrame): DataFrame containing default values for hyperparameters.
+            max_number_repetitions (int): Maximum number of repeated configurations drawn in a row.
+        """
+
+        self.hyperparameter_dict = hyperparameter_dict
+        self.df_default = df_default
+        self.max_number_repetitions = max_number_repetitions
+        # Hyperparameter values and loss of the trained configurations, by key
+        self.observations: Dict[str, tuple] = {}
+
+
+    def observe(self,
+                dict_values: Dict[str,any],
+                loss: float):
+        """
+        Records the validation loss of a configuration, lower is better.
+        """
+
+        if loss is None or math.isnan(loss):
+            loss = math.inf
+        self.observations[get_hp_key(dict_values)] = (dict_values, loss)
+
+
+    def propose_random(self,
+                       l_dict: List[Dict[str,any]],
+                       seen_keys: set) -> Dict[str,any]:
+        return get_one_random_combination(self.df_default,
+                                          self.hyperparameter_dict,
+                                          l_dict,
+                                          self.max_number_repetitions,
+                                          seen_keys)
+
+
+    @abstractmethod
+    def propose(self,
+                l_dict: List[Dict[str,any]]) -> Dict[str,any]:
+        """
+        Returns a configuration that is not in l_dict, without hp_config_index.
+        """
+
+
+class RandomSampler(HyperparameterSampler):
+    """
+    Draws each hyperparameter uniformly from its values, as random search.
+    """
+
+    def propose(self,
+                l_dict: List[Dict[str,any]]) -> Dict[str,any]:
+
+        return self.propose_random(l_dict,
+                                   {get_hp_key(existing_dict) for existing_dict in l_dict})
+
+
+class TPESampler(HyperparameterSampler):
+    def __init__(self,
+                 hyperparameter_dict: Dict[str,any],
+                 df_default: pd.DataFrame,
+                 max_number_repetitions: int,
+                 n_startup: int = 5,
+                 gamma: float = 0.25,
+                 n_candidates: int = 24):
+        """
+        Tree-structured Parzen Estimator. The trained configurations are
+        split into the best fraction gamma and the others, and each
+        hyperparameter gets a density l(x) estimated from the best ones and
+        a density g(x) from the others, both mixed with the uniform
+        distribution of random search. n_candidates configurations are
+        drawn from l(x), and the one that maximizes l(x) / g(x), the
+        expected improvement, is proposed. Until n_startup configurations
+        are trained, configurations are drawn at random.
+
+        Args:
+            hyperparameter_dict (dict): Dictionary containing hyperparameters and their ranges or values.
+            df_default (pd.DataFrame): DataFrame containing default values for hyperparameters.
+            max_number_repetitions (int): Maximum number of repeated configurations drawn in a row.
+            n_startup (int): Number of trained configurations before using the model. Default is 5.
+            gamma (float): Fraction of the trained configurations used for l(x). Default is 0.25.
+            n_candidates (int): Number of candidates drawn from l(x). Default is 24.
+        """
+
+        super().__init__(hyperparameter_dict, df_default, max_number_repetitions)
+
+        if not 0 < gamma < 1:
+            raise ValueError(f"tpe_gamma must be between 0 and 1, got {gamma}.")
+
+        self.n_startup = n_startup
+        self.gamma = gamma
+        self.n_candidates = n_candidates
+        self.search_space = get_search_space(hyperparameter_dict, df_default)
+
+
+    def get_position(self,
+                     hyperparameter: str,
+                     value):
+        """
+        Returns the index of a value among the values of an ordinal or
+        categorical hyperparameter, or the value itself if uniform.
+        None if the value is not in the search space.
+        """
+
+        space = self.search_space[hyperparameter]
+        if space["kind"] == "uniform":
+            return float(value)
+        if space["kind"] == "ordinal":
+            return min(range(len(space["values"])),
+                       key=lambda position: abs(space["values"][position] - value))
+        if value in space["values"]:
+            return space["values"].index(value)
+
+        return None
+
+
+    def get_bandwidth(self,
+                      hyperparameter: str,
+                      n_points: int) -> float:
+        space = self.search_space[hyperparameter]
+        if space["kind"] == "uniform":
+            width = space["max"] - space["min"]
+            return max(width / 50, width / 4 * n_points ** -0.2)
+
+        return max(0.5, (len(space["values"]) - 1) / 4 * n_points ** -0.2)
+
+
+    def get_density(self,
+                    hyperparameter: str,
+                    points: list) -> Optional[List[float]]:
+        """
+        Returns the probabilities of the values of an ordinal or categorical
+        hyperparameter: a uniform prior, with the weight of one point, and
+        one kernel by point, gaussian over the positions if ordinal.
+        """
+
+        space = self.search_space[hyperparameter]
+        n_values = len(space["values"])
+        weights = [1 / n_values] * n_values
+
+        bandwidth = self.get_bandwidth(hyperparameter, len(points))
+        for point in points:
+            if space["kind"] == "categorical":
+                weights[point] += 1
+                continue
+            kernel = [math.exp(-0.5 * ((position - point) / bandwidth) ** 2) for position in range(n_values)]
+            kernel_sum = sum(kernel)
+            for position in range(n_values):
+                weights[position] += kernel[position] / kernel_sum
+
+        return [weight / (1 + len(points)) for weight in weights]
+
+
+    def get_uniform_density(self,
+                            hyperparameter: str,
+                            points: List[float],
+                            value: float) -> float:
+        space = self.search_space[hyperparameter]
+        bandwidth = self.get_bandwidth(hyperparameter, len(points))
+
+        density = 1 / (space["max"] - space["min"])
+        for point in points:
+            density += math.exp(-0.5 * ((value - point) / bandwidth) ** 2) / (bandwidth * math.sqrt(2 * math.pi))
+
+        return density / (1 + len(points))
+
+
+    def sample_uniform(self,
+                       hyperparameter: str,
+                       points: List[float]) -> float:
+        space = self.search_space[hyperparameter]
+        # The prior has the weight of one point
+        position = random.randint(0, len(points))
+        if position == len(points):
+            return random.uniform(space["min"], space["max"])
+
+        value = random.gauss(points[position], self.get_bandwidth(hyperparameter, len(points)))
+        return min(max(value, space["min"]), space["max"])
+
+
+    def propose(self,
+                l_dict: List[Dict[str,any]]) -> Dict[str,any]:
+
+        seen_keys = {get_hp_key(existing_dict) for existing_dict in l_dict}
+        if len(self.observations) < self.n_startup or not self.search_space:
+            return self.propose_random(l_dict, seen_keys)
+
+        ranking = sorted(self.observations.values(), key=lambda observation: observation[1])
+        n_good = max(1, math.ceil(self.gamma * len(ranking)))
+
+        # Positions of the values of the best and of the other configurations
+        good_points, bad_points = {}, {}
+        for hyperparameter in self.search_space:
+            good_points[hyperparameter], bad_points[hyperparameter] = [], []
+            for rank, (dict_values, _) in enumerate(ranking):
+                position = self.get_position(hyperparameter, dict_values.get(hyperparameter))
+                if position is None:
+                    continue
+                points = good_points if rank < n_good else bad_points
+                points[hyperparameter].append(position)
+
+        good_densities = {hyperparameter: self.get_density(hyperparameter, points)
+                          for hyperparameter, points in good_points.items()
+                          if self.search_space[hyperparameter]["kind"] != "uniform"}
+        bad_densities = {hyperparameter: self.get_density(hyperparameter, points)
+                         for hyperparameter, points in bad_points.items()
+                         if self.search_space[hyperparameter]["kind"] != "uniform"}
+
+        best_values, best_score = None, -math.inf
+        for _ in range(self.n_candidates):
+            dict_values = {}
+            score = 0.0
+            for hyperparameter in self.df_default.index:
+                space = self.search_space.get(hyperparameter)
+                if space is None:
+                    dict_values[hyperparameter] = get_value_from_hyperparameter_dict(hyperparameter,
+                                                                                     self.hyperparameter_dict,
+                                                                                     self.df_default) \
+                        if hyperparameter in self.hyperparameter_dict \
+                        else self.df_default.loc[hyperparameter, "value_converted"]
+                elif space["kind"] == "uniform":
+                    value = self.sample_uniform(hyperparameter, good_points[hyperparameter])
+                    dict_values[hyperparameter] = value
+                    score += math.log(self.get_uniform_density(hyperparameter, good_points[hyperparameter], value)) - \
+                             math.log(self.get_uniform_density(hyperparameter, bad_points[hyperparameter], value))
+                else:
+                    position = random.choices(range(len(space["values"])),
+                                              weights=good_densities[hyperparameter])[0]
+                    dict_values[hyperparameter] = space["values"][position]
+                    score += math.log(good_densities[hyperparameter][position]) - \
+                             math.log(bad_densities[hyperparameter][position])
+
+            if score > best_score and get_hp_key(dict_values) not in seen_keys:
+                best_values, best_score = dict_values, score
+
+        if best_values is None:
+            return self.propose_random(l_dict, seen_keys)
+
+        return best_values
+
+
+def create_sampler(hyperparameter_dict: Dict[str,any],
+                   df_default: pd.DataFrame,
+                   config: Dict[str,any]) -> HyperparameterSampler:
+    """
+    Creates the sampler set with 'hpo_sampler': 'random' (default) or 'tpe'.
+    """
+
+    sampler_name = config.get('hpo_sampler', 'random')
+    max_number_repetitions = hyperparameter_dict["n_combinations"]
+
+    if sampler_name == 'random':
+        return RandomSampler(hyperparameter_dict,
+                             df_default,
+                             max_number_repetitions)
+    if sampler_name == 'tpe':
+        return TPESampler(hyperparameter_dict,
+                          df_default,
+                          max_number_repetitions,
+                          n_startup=config.get('hpo_n_startup', 5),
+                          gamma=config.get('tpe_gamma', 0.25),
+                          n_candidates=config.get('tpe_n_candidates', 24))
+
+    raise ValueError(f"hpo_sampler must be 'random' or 'tpe', got {sampler_name}.")
+
+
+def save_hp_configurations(l_dict: List[Dict[str,any]],
+                           config: Dict[str,any]):
+    """
+    Saves the configurations to hp_configurations.csv, and to
+    hp_configurations.json, read back by model-based search.
+    """
+
+    hp_folder_path = get_folder_path(Path(config["output_path"]),
+                                     "hp_random_search",
+                                     True)
+
+    df_hp_rs = pd.DataFrame()
+    for dict_values in l_dict:
+        df_hp_rs = add_hp_to_df(dict_values,
+                                df_hp_rs)
+    df_hp_rs.to_csv(hp_folder_path / "hp_configurations.csv")
+
+    temporary_path = hp_folder_path / "hp_configurations.json.tmp"
+    with open(temporary_path, 'w', encoding="utf-8") as file_pointer:
+        json.dump(l_dict, file_pointer, indent=1, default=str)
+    temporary_path.replace(hp_folder_path / "hp_configurations.json")
+
+
+def read_hp_configurations(config: Dict[str,any]) -> List[Dict[str,any]]:
+    """
+    Returns the configurations of earlier runs of model-based search, if any.
+    """
+
+    hp_filepath = Path(config["output_path"]) / "CV" / "hp_random_search" / "hp_configurations.json"
+    if not hp_filepath.exists():
+        return []
+
+    with open(hp_filepath, 'r', encoding="utf-8") as file_pointer:
+        return json.load(file_pointer)
+
+
+def get_test_fold_list(config: Dict[str,any]) -> List[str]:
+    """
+    Returns the test folds of the cross-validation loop, all the folds of
+    'fold_list' if 'test_fold_list' is not set.
+    """
+
+    test_fold_list = config.get('test_fold_list') or config.get('fold_list') or []
+    if isinstance(test_fold_list, str):
+        return [test_fold_list]
+
+    return list(test_fold_list)
+
+
+def read_hpo_observations(config: Dict[str,any],
+                          test_fold_list: List[str]) -> Dict[int, float]:
+    """
+    Reads the validation loss of each configuration from the summary of
+    the trainings, results_all.csv of NACHOSv2_get_summary, scored as the
+    loop scores it: the mean over the validation folds of each test fold,
+    then over the test folds of the loop. The configurations without
+    results for all these test folds are not comparable and left out.
+    The path of the summary can be set with 'hpo_summary_filepath',
+    otherwise it is in the summary folder of the cross-validation loop.
+
+    Args:
+        config (dict): The training configuration.
+        test_fold_list (list of str): The test folds of the loop.
+
+    Returns:
+        dict: The mean validation loss by hp_config_index, empty if there is no summary.
+    """
+
+    summary_filepath = config.get('hpo_summary_filepath') or \
+        Path(config["output_path"]) / "CV" / "summary_analysis" / "results_all.csv"
+    if not Path(summary_filepath).exists():
+        return {}
+
+    df_summary = pd.read_csv(summary_filepath, usecols=["test_fold", "hp_config", "validation_loss"],
+                             dtype={"test_fold": str})
+    df_summary = df_summary[df_summary["test_fold"].isin(test_fold_list)]
+
+    df_per_test_fold = df_summary.groupby(["test_fold", "hp_config"])["validation_loss"].mean().reset_index()
+    df_per_configuration = df_per_test_fold.groupby("hp_config")["validation_loss"].agg(["mean", "count"])
+    df_complete = df_per_configuration[df_per_configuration["count"] == len(set(test_fold_list))]
+
+    return df_complete["mean"].to_dict()
+
+
+def load_hpo_sampler(config: Dict[str,any],
+                     test_fold_list: Optional[List[str]] = None) -> tuple:
+    """
+    Creates the sampler of model-based search, with the configurations of
+    earlier runs and the validation losses of those in the summary.
+
+    Args:
+        config (dict): The training configuration.
+        test_fold_list (list of str): The test folds of the loop. Default is
+            the test folds of the configuration. (Optional)
+
+    Returns:
+        tuple: The sampler, and the list of configurations.
+    """
+
+    hyperparameter_dict = get_config(config["configuration_filepath"])
+    df_default = extract_default_hyperparameters()
+    sampler = create_sampler(hyperparameter_dict,
+                             df_default,
+                             config)
+
+    l_dict = read_hp_configurations(config)
+    observations = read_hpo_observations(config,
+                                         test_fold_list if test_fold_list is not None else get_test_fold_list(config))
+    for dict_values in l_dict:
+        if dict_values["hp_config_index"] in observations:
+            sampler.observe(dict_values, observations[dict_values["hp_config_index"]])
+
+    return sampler, l_dict
+
+
+def create_model_based_configurations(hyperparameter_dict: Dict[str,any],
+                                      config: Dict[str,any]) -> List[Dict[str,any]]:
+    """
+    Generates the first configurations of a model-based search: the
+    configurations of earlier runs, completed with new ones up to
+    'hpo_n_startup'. The others, up to n_combinations, are proposed during
+    the cross-validation loop as the results arrive.
+
+    Args:
+        hyperparameter_dict (dict): Dictionary containing hyperparameter information, including the number of combinations.
+        config (dict): Configuration dictionary containing output path information.
+
+    Returns:
+        List[dict]: A list of dictionaries, each representing a hyperparameter configuration.
+    """
+
+    sampler, l_dict = load_hpo_sampler(config)
+    n_earlier = len(l_dict)
+    n_initial = min(hyperparameter_dict["n_combinations"],
+                    max(n_earlier, config.get('hpo_n_startup', 5)))
+
+    while len(l_dict) < n_initial:
+        hp_config_index = max((dict_values["hp_config_index"] for dict_values in l_dict), default=-1) + 1
+        l_dict.append({"hp_config_index": hp_config_index, **sampler.propose(l_dict)})
+
+    save_hp_configurations(l_dict, config)
+    print(colored(f"HPO sampler '{config['hpo_sampler']}': {n_earlier} configurations from earlier runs, " + \
+                  f"{len(sampler.observations)} with results in the summary, " + \
+                  f"{len(l_dict) - n_earlier} new.", 'green'))
+
+    return l_dict
+
+
 def create_random_configurations(hyperparameter_dict: Dict[str,any],
                                  df_default: pd.DataFrame,
                                  config: Dict[str,any]) -> List[Dict[str,any]]:
@@ -361,6 +840,10 @@ def get_hp_configuration(config: Dict[str,any]) -> List[Dict[str,any]]:
         verify_single_values(hyperparameter_dict)
         return [extract_values_single(df_default,
                                       hyperparameter_dict)]
+    elif config.get('hpo_sampler', 'random') != 'random' and hyperparameter_dict["n_combinations"] > 1:
+        # Model-based search, the other configurations are proposed during the loop
+        return create_model_based_configurations(hyperparameter_dict,
+                                                 config)
     else:
         # If HPO is used, generate random configurations
         return create_random_configurations(
@@ -0,0 +1,194 @@
+import math
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from termcolor import colored
+
+import pandas as pd
+
+from nachosv2.setup.utils import get_folder_path
+from nachosv2.training.hpo.hpo import load_hpo_sampler
+from nachosv2.training.hpo.hpo import save_hp_configurations
+
+
+class SamplerScheduler():
+    def __init__(self,
+                 config_dict: dict,
+                 indices_loop_list: List[dict],
+                 fold_pair_list: List[Tuple[str, str]]):
+        """
+        Model-based search of the hyperparameter configurations of a
+        cross-validation loop, with the sampler set by 'hpo_sampler'.
+
+        The tasks of the first configurations, from create_loop_indices, are
+        given first. Then, each time a task is asked for and none is left,
+        the sampler proposes a new configuration from the mean validation
+        losses of the configurations trained so far, until there are
+        n_combinations configurations. The tasks of a new configuration,
+        one per pair of test and validation folds, are added to
+        indices_loop_list and their task messages carry them, since the
+        workers only received the first tasks.
+
+        Args:
+            config_dict (dict): The training configuration.
+            indices_loop_list (list of dict): The tasks of the loop, extended in place.
+            fold_pair_list (list of tuple): The (test fold, validation fold) pairs of a configuration.
+        """
+
+        self.indices_loop_list = indices_loop_list
+        self.n_initial_tasks = len(indices_loop_list)
+        self.fold_pair_list = fold_pair_list
+        self.config_dict = config_dict
+        self.sampler_name = config_dict.get('hpo_sampler', 'random')
+
+        # The configurations of earlier runs and of this one, as saved by get_hp_configuration
+        self.sampler, self.l_dict = load_hpo_sampler(config_dict,
+                                                     list(dict.fromkeys(test_fold for test_fold, _ in fold_pair_list)))
+        self.n_combinations = self.sampler.hyperparameter_dict["n_combinations"]
+        self.proposed_indices = set()
+
+        self.report_filepath = get_folder_path(Path(config_dict["output_path"]),
+                                               "hp_random_search",
+                                               True) / f"{config_dict['job_name']}_hpo_trials.csv"
+
+        # Task indices, best validation loss of each fold and mean of each configuration
+        self.trial_indices: Dict[int, List[int]] = {}
+        for index, indices_loop_dict in enumerate(indices_loop_list):
+            self.trial_indices.setdefault(self.get_trial_key(indices_loop_dict), []).append(index)
+        self.fold_losses: Dict[int, Dict[int, float]] = {}
+        self.trial_scores: Dict[int, float] = {}
+
+        self.tasks = deque(range(len(indices_loop_list)))
+
+
+    @staticmethod
+    def get_trial_key(indices_loop_dict: dict) -> int:
+        return indices_loop_dict["hp_configuration"]["hp_config_index"]
+
+
+    def get_number_of_tasks(self) -> int:
+        """
+        Returns the number of tasks of the loop once all the configurations are proposed.
+        """
+
+        n_configurations_left = max(0, self.n_combinations - len(self.l_dict))
+        return len(self.indices_loop_list) + n_configurations_left * len(self.fold_pair_list)
+
+
+    def add_configuration(self):
+        hp_config_index = max((dict_values["hp_config_index"] for dict_values in self.l_dict), default=-1) + 1
+        hp_configuration = {"hp_config_index": hp_config_index, **self.sampler.propose(self.l_dict)}
+        self.l_dict.append(hp_configuration)
+        self.proposed_indices.add(hp_config_index)
+        save_hp_configurations(self.l_dict, self.config_dict)
+
+        for test_fold, validation_fold in self.fold_pair_list:
+            index = len(self.indices_loop_list)
+            self.indices_loop_list.append({"test": test_fold,
+                                           "hp_configuration": hp_configuration,
+                                           "validation": validation_fold})
+            self.trial_indices.setdefault(hp_config_index, []).append(index)
+            self.tasks.append(index)
+
+        print(colored(f"HPO sampler '{self.sampler_name}' proposed configuration {hp_config_index} " + \
+                      f"from {len(self.sampler.observations)} trained configurations.", 'cyan'))
+
+
+    def get_next_task(self,
+                      is_idle: bool = False) -> Optional[dict]:
+        """
+        Returns the next task to dispatch, as a task message with the index
+        of the task, and the task itself if it was added during the loop,
+        or None if all the configurations are given.
+
+        Args:
+            is_idle (bool): If no task is running. Unused, a new
+                configuration is proposed whenever a task is asked for.
+        """
+
+        if not self.tasks and len(self.l_dict) < self.n_combinations:
+            self.add_configuration()
+
+        if not self.tasks:
+            return None
+
+        index = self.tasks.popleft()
+        task = {"index": index}
+        if index >= self.n_initial_tasks:
+            task["indices_loop_dict"] = self.indices_loop_list[index]
+
+        return task
+
+
+    def is_task_finished(self,
+                         task: dict) -> bool:
+        return True
+
+
+    def get_stopped_indices(self) -> List[int]:
+        return []
+
+
+    def record(self,
+               task: dict,
+               result: dict):
+        """
+        Records the result of a task. Once all the folds of its
+        configuration are trained, the sampler observes their mean best
+        validation loss.
+
+        Args:
+            task (dict): The task message, from get_next_task.
+            result (dict): The result of perform_single_training.
+        """
+
+        index = task["index"]
+        indices_loop_dict = self.indices_loop_list[index]
+        trial_key = self.get_trial_key(indices_loop_dict)
+
+        loss = result.get("best_validation_loss")
+        if loss is None or math.isnan(loss):
+            loss = math.inf
+        fold_losses = self.fold_losses.setdefault(trial_key, {})
+        fold_losses[index] = loss
+        if len(fold_losses) < len(self.trial_indices[trial_key]):
+            return
+
+        self.trial_scores[trial_key] = sum(fold_losses.values()) / len(fold_losses)
+        self.sampler.observe(indices_loop_dict["hp_configuration"], self.trial_scores[trial_key])
+        print(colored(f"HPO: configuration {trial_key}: mean validation loss " + \
+                      f"{self.trial_scores[trial_key]:.4f}.", 'cyan'))
+
+
+    def report(self) -> pd.DataFrame:
+        """
+        Saves the mean validation loss of each configuration trained in
+        the loop, in the order they completed, and prints the best one.
+
+        Returns:
+            pd.DataFrame: The report.
+        """
+
+        rows = []
+        best_loss = math.inf
+        for position, (trial_key, score) in enumerate(self.trial_scores.items()):
+            best_loss = min(best_loss, score)
+            rows.append({"hp_config_index": trial_key,
+                         "proposed_by": self.sampler_name if trial_key in self.proposed_indices else "initial",
+                         "n_folds": len(self.fold_losses[trial_key]),
+                         "mean_validation_loss": score,
+                         "best_mean_validation_loss_so_far": best_loss,
+                         "completion_order": position + 1})
+
+        df_report = pd.DataFrame(rows)
+        df_report.to_csv(self.report_filepath)
+        if not rows:
+            return df_report
+
+        best_row = df_report.loc[df_report["mean_validation_loss"].idxmin()]
+        print(colored(f"HPO sampler '{self.sampler_name}': {len(df_report)} configurations trained, " + \
+                      f"best configuration {best_row['hp_config_index']} with mean validation loss " + \
+                      f"{best_row['mean_validation_loss']:.4f}, reached after {best_row['completion_order']} " + \
+                      f"configurations. Report saved to {self.report_filepath}", 'magenta'))
+
+        return df_report
@@ -0,0 +1,302 @@
+import os
+import contextlib
+import copy
+import multiprocessing
+import threading
+import time
+from typing import Optional, List
+from termcolor import colored
+
+import torch
+import torch.nn as nn
+
+from nachosv2.model_processing.create_model import get_model
+from nachosv2.training.training.task_scheduler import ARCHITECTURE_COST_FACTORS
+from nachosv2.training.training_processing.dataloader_settings import synchronize
+
+
+DEFAULT_MAX_TRAININGS_PER_DEVICE = 8
+
+
+def get_process_memory_bytes() -> int:
+    """
+    Returns the resident memory of the process, or 0 if it cannot be read.
+    """
+
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as file_pointer:
+            resident_pages = int(file_pointer.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def get_available_memory_bytes(execution_device: str) -> Optional[int]:
+    """
+    Returns the free memory of the device, or None if it is unknown.
+    """
+
+    device = torch.device(execution_device)
+    if device.type == 'cuda':
+        free_bytes, _ = torch.cuda.mem_get_info(device)
+        return free_bytes
+
+    if device.type == 'cpu':
+        try:
+            return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (ValueError, OSError):
+            return None
+
+    return None
+
+
+def measure_training_footprint(model: nn.Module,
+                               loss_function: nn.Module,
+                               sample_image: torch.Tensor,
+                               batch_size: int,
+                               execution_device: str) -> int:
+    """
+    Measures the memory a training needs on a device: the model, its
+    gradients, the momentum of the optimizer and the activations of a
+    forward and backward pass on a synthetic batch.
+
+    Args:
+        model (nn.Module): The model to train, on host memory.
+        loss_function (nn.Module): The loss function.
+        sample_image (torch.Tensor): An image as the model receives it.
+        batch_size (int): The batch size.
+        execution_device (str): The execution device.
+
+    Returns:
+        int: The footprint in bytes.
+    """
+
+    device = torch.device(execution_device)
+    is_cuda = device.type == 'cuda'
+
+    if is_cuda:
+        synchronize(execution_device)
+        torch.cuda.reset_peak_memory_stats(device)
+        memory_before = torch.cuda.memory_allocated(device)
+    else:
+        memory_before = get_process_memory_bytes()
+
+    probe_model = copy.deepcopy(model).to(device)
+    probe_model.train()
+    inputs = sample_image.unsqueeze(0).repeat(batch_size, *([1] * sample_image.dim())).to(device)
+    labels = torch.zeros(batch_size, dtype=torch.int64, device=device)
+
+    loss = loss_function(probe_model(inputs), labels)
+    loss.backward()
+    synchronize(execution_device)
+
+    if is_cuda:
+        footprint = torch.cuda.max_memory_allocated(device) - memory_before
+    else:
+        footprint = get_process_memory_bytes() - memory_before
+
+    # The optimizer keeps a momentum buffer per parameter
+    parameter_bytes = sum(parameter.numel() * parameter.element_size()
+                          for parameter in probe_model.parameters())
+    footprint = max(footprint, 2 * parameter_bytes) + parameter_bytes
+
+    del probe_model, inputs, labels, loss
+    if is_cuda:
+        torch.cuda.empty_cache()
+
+    return footprint
+
+
+def get_largest_task(indices_loop_list: List[dict]) -> dict:
+    """
+    Returns the task expected to need the most memory: the largest
+    batch of the most expensive architecture.
+    """
+
+    def get_memory_cost(indices_loop_dict: dict) -> float:
+        hyperparameters = indices_loop_dict["hp_configuration"]
+        return ARCHITECTURE_COST_FACTORS.get(hyperparameters["architecture"], 1.0) * \
+            hyperparameters.get("batch_size", 1)
+
+    return max(indices_loop_list, key=get_memory_cost)
+
+
+def get_number_concurrent_trainings(config_dict: dict,
+                                    indices_loop_list: List[dict],
+                                    execution_device: str,
+                                    memory_fraction: float = 0.8) -> int:
+    """
+    Returns the number of trainings to run at the same time on a device.
+
+    'trainings_per_device' gives it, 1 by default. With 'auto', it is
+    the number of footprints of the largest task that fit in the free
+    memory of the device, capped by 'max_trainings_per_device' and on
+    CPU by the number of cores.
+
+    Args:
+        config_dict (dict): The training configuration.
+        indices_loop_list (list of dict): The tasks to train.
+        execution_device (str): The execution device.
+        memory_fraction (float): Fraction of the free memory used. Default is 0.8.
+
+    Returns:
+        int: The number of concurrent trainings, at least 1.
+    """
+
+    n_trainings = config_dict.get('trainings_per_device', 1)
+    max_trainings = config_dict.get('max_trainings_per_device', DEFAULT_MAX_TRAININGS_PER_DEVICE)
+
+    if n_trainings != 'auto':
+        if not (isinstance(n_trainings, int) and n_trainings >= 1):
+            raise ValueError(f"trainings_per_device must be a positive integer or 'auto', got {n_trainings}.")
+        return n_trainings
+
+    if not indices_loop_list:
+        return 1
+
+    if torch.device(execution_device).type == 'cpu':
+        max_trainings = min(max_trainings, os.cpu_count() or 1)
+
+    available_bytes = get_available_memory_bytes(execution_device)
+    if available_bytes is None:
+        print(colored(f"Warning: free memory of '{execution_device}' is unknown, " + \
+                      "running one training at a time.", 'yellow'))
+        return 1
+
+    hyperparameters = get_largest_task(indices_loop_list)["hp_configuration"]
+    model, new_dimensions = get_model(hyperparameters["architecture"],
+                                      number_classes=len(config_dict["class_names"]),
+                                      number_channels=config_dict["number_channels"],
+                                      target_dimensions=config_dict["target_dimensions"])
+    height, width = new_dimensions if new_dimensions else config_dict["target_dimensions"][:2]
+    sample_image = torch.zeros(config_dict["number_channels"], height, width)
+
+    footprint = measure_training_footprint(model, nn.CrossEntropyLoss(), sample_image,
+                                           hyperparameters.get("batch_size", 1),
+                                           execution_device)
+
+    n_trainings = int(min(max_trainings, max(1, memory_fraction * available_bytes // max(footprint, 1))))
+
+    print(colored(f"Training footprint of {hyperparameters['architecture']} with batch size " + \
+                  f"{hyperparameters.get('batch_size', 1)}: {footprint / 1e9:.2f} GB, " + \
+                  f"{available_bytes / 1e9:.2f} GB free on '{execution_device}'. " + \
+                  f"Running {n_trainings} trainings at the same time.", 'cyan'))
+
+    return n_trainings
+
+
+def set_threads_per_training(execution_device: str,
+                             n_trainings: int):
+    """
+    Shares the CPU threads of torch between the concurrent trainings on CPU.
+    """
+
+    if torch.device(execution_device).type == 'cpu' and n_trainings > 1:
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // n_trainings))
+
+
+def get_worker_start_method() -> str:
+    """
+    Returns the start method of the DataLoader workers of concurrent
+    trainings. Forking a process running several training threads, with
+    CUDA initialized, can copy locks held by another thread and deadlock
+    the workers, so they are started from a forkserver, or spawned where
+    there is none.
+    """
+
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return 'forkserver'
+
+    return 'spawn'
+
+
+def get_device_stream_context(execution_device: str):
+    """
+    Returns the context running the calling thread on its own CUDA stream,
+    so concurrent trainings overlap on the GPU. Does nothing on other devices.
+    """
+
+    device = torch.device(execution_device)
+    if device.type == 'cuda':
+        return torch.cuda.stream(torch.cuda.Stream(device))
+
+    return contextlib.nullcontext()
+
+
+class DeviceUtilizationMonitor():
+    def __init__(self,
+                 execution_device: str,
+                 interval_seconds: float = 1.0):
+        """
+        Samples the utilization of a device in a background thread.
+
+        On GPU, the utilization reported by the driver is used when
+        available (it needs pynvml), with the allocated memory. On CPU,
+        the utilization is the CPU time of the process over the time of
+        all the cores.
+
+        Args:
+            execution_device (str): The execution device.
+            interval_seconds (float): Time between samples. Default is 1.
+        """
+
+        self.execution_device = execution_device
+        self.device = torch.device(execution_device)
+        self.interval_seconds = interval_seconds
+        self.utilization_samples = []
+        self.memory_samples = []
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.start_time = None
+        self.start_cpu_time = None
+
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.start_cpu_time = self._get_cpu_time()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+
+    def stop(self) -> dict:
+        """
+        Stops the sampling.
+
+        Returns:
+            dict: The mean utilization in percent (None if unknown) and,
+                on GPU, the peak allocated memory in bytes.
+        """
+
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+        utilization = None
+        if self.device.type == 'cpu':
+            elapsed_time = time.perf_counter() - self.start_time
+            if elapsed_time > 0:
+                utilization = 100 * (self._get_cpu_time() - self.start_cpu_time) / \
+                    (elapsed_time * (os.cpu_count() or 1))
+        elif self.utilization_samples:
+            utilization = sum(self.utilization_samples) / len(self.utilization_samples)
+
+        return {"mean_utilization_percent": utilization,
+                "peak_memory_bytes": max(self.memory_samples) if self.memory_samples else None}
+
+
+    @staticmethod
+    def _get_cpu_time() -> float:
+        times = os.times()
+        return times.user + times.system
+
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval_seconds):
+            if self.device.type != 'cuda':
+                continue
+            self.memory_samples.append(torch.cuda.memory_allocated(self.device))
+            try:
+                self.utilization_samples.append(torch.cuda.utilization(self.device))
+            except Exception:
+                # The driver utilization needs pynvml
+                pass
@@ -0,0 +1,343 @@
+import heapq
+import math
+import os
+from pathlib import Path
+from typing import List, Optional
+from termcolor import colored
+import fasteners
+import pandas as pd
+
+from nachosv2.training.training_processing.partitions import generate_dict_folds_for_partitions
+
+
+# Relative cost of a forward pass at 224x224, from the GFLOPs of the
+# torchvision models (ResNet50 = 1). Unknown architectures count as 1.
+ARCHITECTURE_COST_FACTORS = {
+    "ResNet50": 1.0,
+    "InceptionV3": 1.4,
+    "vit_b_32": 1.1,
+    "vit_b_16": 4.3,
+    "vit_l_32": 3.8,
+    "vit_l_16": 15.0,
+    "vit_h_14": 41.0,
+}
+
+# Fixed cost of an optimizer step, in samples of ResNet50 at 224x224
+STEP_OVERHEAD_UNITS = 8.0
+
+DURATIONS_COLUMNS = ["task_key", "architecture", "n_epochs", "batch_size",
+                     "n_training_samples", "cost_units", "predicted_seconds",
+                     "start_epoch", "epochs_completed", "duration_seconds", "rank"]
+
+
+def get_task_key(indices_loop_dict: dict) -> str:
+    """
+    Returns the name of a task, e.g. 'test_k1_hp_0_val_k2'.
+    """
+    return f"test_{indices_loop_dict['test']}" + \
+           f"_hp_{indices_loop_dict['hp_configuration']['hp_config_index']}" + \
+           f"_val_{indices_loop_dict['validation']}"
+
+
+def get_durations_filepath(config_dict: dict,
+                           is_cv_loop: bool) -> Path:
+    """
+    Returns the CSV file of the task durations. It can be shared between
+    sweeps with 'task_durations_path', otherwise it is in the timings folder.
+    """
+
+    if config_dict.get('task_durations_path'):
+        return Path(config_dict['task_durations_path'])
+
+    loop_folder = "CV" if is_cv_loop else "CT"
+    return Path(config_dict["output_path"]) / loop_folder / "training_timings" / "task_durations.csv"
+
+
+def simulate_makespan(costs: List[float],
+                      n_workers: int) -> float:
+    """
+    Simulates the dispatch of tasks, in order, to the first free worker.
+
+    Args:
+        costs (list of float): The cost of each task, in dispatch order.
+        n_workers (int): The number of workers.
+
+    Returns:
+        float: The time the last task finishes.
+    """
+
+    if not costs:
+        return 0.0
+
+    worker_free_times = [0.0] * max(1, n_workers)
+    for cost in costs:
+        free_time = heapq.heappop(worker_free_times)
+        heapq.heappush(worker_free_times, free_time + cost)
+
+    return max(worker_free_times)
+
+
+class TaskCostModel():
+    def __init__(self,
+                 config_dict: dict,
+                 df_metadata: pd.DataFrame,
+                 is_cv_loop: bool):
+        """
+        Estimates the duration of the training tasks from their
+        hyperparameters, calibrated with the durations of earlier tasks.
+
+        The cost of a task in units is the number of epochs times the
+        number of training samples, weighted by the relative cost of the
+        architecture and the number of pixels, plus a fixed cost per step.
+        The durations recorded in the durations file give the seconds per
+        unit and the fraction of the epochs run before early stopping,
+        per architecture when available. A task already run with the same
+        hyperparameters takes its recorded duration.
+
+        Args:
+            config_dict (dict): The training configuration.
+            df_metadata (pd.DataFrame): The metadata, used to count the training samples.
+            is_cv_loop (bool): If this is the cross-validation loop.
+        """
+
+        self.config_dict = config_dict
+        self.is_cv_loop = is_cv_loop
+        self.durations_filepath = get_durations_filepath(config_dict, is_cv_loop)
+        self.lock_filepath = self.durations_filepath.with_name(self.durations_filepath.name + ".lock")
+        self.fold_sizes = df_metadata['fold_name'].value_counts().to_dict()
+
+        target_dimensions = config_dict.get('target_dimensions', [224, 224])
+        self.pixel_factor = math.prod(target_dimensions[:2]) / (224 * 224)
+
+        self.df_durations = self.read_durations()
+
+
+    def read_durations(self) -> pd.DataFrame:
+        """
+        Reads the recorded durations of the tasks that trained at least one epoch.
+        """
+
+        if not self.durations_filepath.exists():
+            return pd.DataFrame(columns=DURATIONS_COLUMNS)
+
+        # Files written before rows were appended without an index have an unnamed first column
+        df_durations = pd.read_csv(self.durations_filepath, on_bad_lines='skip')
+        df_durations = df_durations.drop(columns=[column for column in df_durations.columns
+                                                  if column.startswith("Unnamed")])
+        df_durations = df_durations[(df_durations['epochs_completed'] > df_durations['start_epoch']) &
+                                    (df_durations['duration_seconds'] > 0)]
+
+        return df_durations
+
+
+    def is_calibrated(self) -> bool:
+        """
+        Returns True if durations were recorded, so the estimates are in seconds.
+        """
+        return len(self.df_durations) > 0
+
+
+    def get_n_training_samples(self,
+                               indices_loop_dict: dict) -> int:
+
+        partitions_dict = generate_dict_folds_for_partitions(
+            validation_fold_name=indices_loop_dict["validation"],
+            is_cv_loop=self.is_cv_loop,
+            fold_list=self.config_dict['fold_list'],
+            test_fold_name=indices_loop_dict["test"]
+            )
+
+        return int(sum(self.fold_sizes.get(fold, 0) for fold in partitions_dict['training']))
+
+
+    def get_cost_units(self,
+                       indices_loop_dict: dict) -> float:
+        """
+        Returns the cost of a task in units, without calibration.
+        """
+
+        hyperparameters = indices_loop_dict["hp_configuration"]
+        n_epochs = hyperparameters["n_epochs"]
+        batch_size = max(1, hyperparameters.get("batch_size", 1))
+        n_samples = self.get_n_training_samples(indices_loop_dict)
+
+        architecture_factor = ARCHITECTURE_COST_FACTORS.get(hyperparameters["architecture"], 1.0)
+        sample_cost = architecture_factor * self.pixel_factor
+        n_steps = math.ceil(n_samples / batch_size)
+
+        return n_epochs * (n_samples * sample_cost + n_steps * STEP_OVERHEAD_UNITS)
+
+
+    def get_predicted_seconds(self,
+                              indices_loop_dict: dict) -> Optional[float]:
+        """
+        Returns the expected duration of a task, or None if no duration was recorded.
+        """
+
+        if not self.is_calibrated():
+            return None
+
+        hyperparameters = indices_loop_dict["hp_configuration"]
+        df = self.df_durations
+
+        # Same task, with the same hyperparameters, fully trained before
+        df_same_task = df[(df['task_key'] == get_task_key(indices_loop_dict)) &
+                          (df['architecture'] == hyperparameters['architecture']) &
+                          (df['n_epochs'] == hyperparameters['n_epochs']) &
+                          (df['batch_size'] == hyperparameters.get('batch_size')) &
+                          (df['start_epoch'] == 0)]
+        if len(df_same_task) > 0:
+            return float(df_same_task['duration_seconds'].median())
+
+        df_architecture = df[df['architecture'] == hyperparameters['architecture']]
+        df_reference = df_architecture if len(df_architecture) > 0 else df
+
+        # Seconds per unit of the epochs that were trained
+        trained_fraction = (df_reference['epochs_completed'] - df_reference['start_epoch']) / \
+                           df_reference['n_epochs']
+        seconds_per_unit = (df_reference['duration_seconds'] /
+                            (df_reference['cost_units'] * trained_fraction)).median()
+
+        # Fraction of the epochs run before early stopping
+        completed_fraction = (df_reference['epochs_completed'] / df_reference['n_epochs']).mean()
+
+        return float(self.get_cost_units(indices_loop_dict) * seconds_per_unit * completed_fraction)
+
+
+    def get_cost(self,
+                 indices_loop_dict: dict) -> float:
+        """
+        Returns the cost used to order the tasks: the expected duration
+        in seconds when calibrated, the cost in units otherwise.
+        """
+
+        predicted_seconds = self.get_predicted_seconds(indices_loop_dict)
+        if predicted_seconds is not None:
+            return predicted_seconds
+
+        return self.get_cost_units(indices_loop_dict)
+
+
+    def record(self,
+               indices_loop_dict: dict,
+               result: dict,
+               rank: int = 0):
+        """
+        Appends the duration of a finished task to the durations file,
+        without reading it, under an inter-process lock, as the ranks of a
+        sweep and other sweeps may share the file.
+
+        Args:
+            indices_loop_dict (dict): The task.
+            result (dict): The result of perform_single_training.
+            rank (int): The rank that trained the task. Default is 0.
+        """
+
+        hyperparameters = indices_loop_dict["hp_configuration"]
+        row = {
+            "task_key": get_task_key(indices_loop_dict),
+            "architecture": hyperparameters["architecture"],
+            "n_epochs": hyperparameters["n_epochs"],
+            "batch_size": hyperparameters.get("batch_size"),
+            "n_training_samples": self.get_n_training_samples(indices_loop_dict),
+            "cost_units": self.get_cost_units(indices_loop_dict),
+            "predicted_seconds": self.get_predicted_seconds(indices_loop_dict),
+            "start_epoch": result["start_epoch"],
+            "epochs_completed": result["epochs_completed"],
+            "duration_seconds": result["duration_seconds"],
+            "rank": rank,
+        }
+
+        line = pd.DataFrame([row], columns=DURATIONS_COLUMNS).to_csv(index=False, header=False)
+
+        self.durations_filepath.parent.mkdir(mode=0o775, parents=True, exist_ok=True)
+        with fasteners.InterProcessLock(self.lock_filepath):
+            if not self.durations_filepath.exists() or self.durations_filepath.stat().st_size == 0:
+                line = ",".join(DURATIONS_COLUMNS) + "\n" + line
+            else:
+                with open(self.durations_filepath, 'rb') as file_pointer:
+                    # Files written with an index column get an empty index
+                    if file_pointer.read(1) == b",":
+                        line = "," + line
+                    # A line left incomplete by a crash must not swallow this row
+                    file_pointer.seek(-1, os.SEEK_END)
+                    if file_pointer.read(1) != b"\n":
+                        line = "\n" + line
+
+            with open(self.durations_filepath, 'a', encoding="utf-8") as file_pointer:
+                file_pointer.write(line)
+                file_pointer.flush()
+                os.fsync(file_pointer.fileno())
+
+
+def order_tasks_by_cost(indices_loop_list: List[dict],
+                        cost_model: TaskCostModel) -> List[int]:
+    """
+    Returns the indices of the tasks, longest expected first.
+    """
+
+    costs = [cost_model.get_cost(indices_loop_dict) for indices_loop_dict in indices_loop_list]
+
+    return sorted(range(len(indices_loop_list)), key=lambda index: costs[index], reverse=True)
+
+
+def report_schedule(schedule_rows: List[dict],
+                    cost_model: TaskCostModel,
+                    indices_loop_list: List[dict],
+                    dispatch_order: List[int],
+                    n_workers: int,
+                    actual_makespan: float,
+                    output_filepath: Path):
+    """
+    Prints the predicted and actual makespans and saves the schedule of the tasks.
+
+    Args:
+        schedule_rows (list of dict): Per task: index, task_key, rank, predicted_seconds,
+            start_seconds, end_seconds.
+        cost_model (TaskCostModel): The cost model used to order the tasks.
+        indices_loop_list (list of dict): The tasks, in list order.
+        dispatch_order (list of int): The indices of the tasks, in dispatch order.
+        n_workers (int): The number of training workers.
+        actual_makespan (float): Time from the first dispatch to the end of the last task.
+        output_filepath (Path): The CSV file of the schedule.
+    """
+
+    output_filepath.parent.mkdir(mode=0o775, parents=True, exist_ok=True)
+    pd.DataFrame(schedule_rows).to_csv(output_filepath)
+
+    if cost_model.is_calibrated():
+        costs = [cost_model.get_cost(indices_loop_dict) for indices_loop_dict in indices_loop_list]
+        predicted_makespan = simulate_makespan([costs[index] for index in dispatch_order], n_workers)
+        list_order_makespan = simulate_makespan(costs, n_workers)
+        print(colored(f"Predicted makespan: {predicted_makespan:.1f} s " + \
+                      f"(in list order: {list_order_makespan:.1f} s), " + \
+                      f"actual makespan: {actual_makespan:.1f} s.", 'magenta'))
+    else:
+        print(colored(f"Actual makespan: {actual_makespan:.1f} s. No durations were recorded " + \
+                      "before this run, so no makespan was predicted.", 'magenta'))
+
+    print(colored(f"Task durations recorded in {cost_model.durations_filepath}", 'green'))
+
+
+def report_dispatch(schedule_rows: List[dict],
+                    broadcast_bytes: int):
+    """
+    Prints the size of the broadcast data and of the task messages,
+    and the time the workers waited for their tasks.
+
+    Args:
+        schedule_rows (list of dict): Per task: message_bytes and dispatch_latency_seconds.
+        broadcast_bytes (int): Size of the data broadcast once to the workers.
+    """
+
+    df_schedule = pd.DataFrame(schedule_rows)
+    if len(df_schedule) == 0:
+        return
+
+    print(colored(f"Broadcast once: {broadcast_bytes / 1e6:.2f} MB. " + \
+                  f"Task messages: {df_schedule['message_bytes'].mean():.0f} bytes on average.", 'magenta'))
+
+    if 'dispatch_latency_seconds' in df_schedule:
+        latencies = df_schedule['dispatch_latency_seconds'].dropna()
+        print(colored(f"Dispatch latency: {latencies.mean() * 1000:.2f} ms on average, " + \
+                      f"{latencies.max() * 1000:.2f} ms at most.", 'magenta'))
@@ -6,36 +6,65 @@ Yellow: warnings
 Red: errors, fatal or not
 """
 from pathlib import Path
+import copy
 import itertools
-from typing import List, Dict, Union
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from typing import List, Dict, Optional, Union
 import random
 from termcolor import colored
 import pandas as pd
 import torch
 from mpi4py import MPI
-from nachosv2.data_processing.read_metadata_csv import read_metadata_csv
+from nachosv2.data_processing.read_metadata_csv import read_training_metadata
 from nachosv2.data_processing.check_unique_subjects import check_unique_subjects
+from nachosv2.data_processing.data_staging import DataStager
+from nachosv2.data_processing.data_staging import create_data_stager
+from nachosv2.data_processing.fold_index import FoldIndex
+from nachosv2.data_processing.preprocessed_cache import PreprocessedCacheStatistics
+from nachosv2.data_processing.preprocessed_cache import get_run_id
 from nachosv2.setup.utils_training import is_image_3D
 from nachosv2.training.training_processing.partitions import generate_dict_folds_for_partitions
 from nachosv2.training.training_processing.training_fold import TrainingFold
+from nachosv2.training.training_processing.vectorized_training import VectorizedTrainingFolds
 from nachosv2.modules.timer.precision_timer import PrecisionTimer
 from nachosv2.modules.timer.write_timing_file import write_timing_file
 from nachosv2.output_processing.memory_leak_check import initiate_memory_leak_check, end_memory_leak_check
 from nachosv2.setup.command_line_parser import parse_command_line_args
 from nachosv2.setup.get_config import get_config
 from nachosv2.checkpoint_processing.load_save_metadata_checkpoint import write_log
+from nachosv2.checkpoint_processing.checkpoint_store import report_checkpoint_footprint
+from nachosv2.checkpoint_processing.sweep_ledger import DISPATCHED, FINISHED
+from nachosv2.checkpoint_processing.sweep_ledger import SweepLedger
+from nachosv2.training.hpo.asha import AshaScheduler
 from nachosv2.training.hpo.hpo import get_hp_configuration
+from nachosv2.training.hpo.sampler_scheduler import SamplerScheduler
 from nachosv2.setup.utils import determine_if_cv_loop
+from nachosv2.training.training.concurrent_training import DeviceUtilizationMonitor
+from nachosv2.training.training.concurrent_training import get_device_stream_context
+from nachosv2.training.training.concurrent_training import get_number_concurrent_trainings
+from nachosv2.training.training.concurrent_training import get_worker_start_method
+from nachosv2.training.training.concurrent_training import set_threads_per_training
+from nachosv2.training.training.task_scheduler import TaskCostModel
+from nachosv2.training.training.task_scheduler import get_task_key
+from nachosv2.training.training.task_scheduler import order_tasks_by_cost
+from nachosv2.training.training.task_scheduler import report_dispatch
+from nachosv2.training.training.task_scheduler import report_schedule
 
 def create_loop_indices(config_dict: dict,
-                        is_cv_loop: bool) -> List[dict]:
+                        is_cv_loop: bool,
+                        skip_finished: bool = True) -> List[dict]:
     """
     Create a list of dictionaries containing loop indices for training, that is training, validation(if cross-validation loop), and testing.
+    Unless 'skip_finished_tasks' is false, the tasks finished in an earlier
+    run according to the sweep ledger are left out.
 
     Args:
         test_fold_list (list): List of test folds.
         hpo_list (list of dict]): List of hyperparameter optimization configurations.
         validation_fold_list (list): List of validation folds.
+        skip_finished (bool): Whether to leave out the finished tasks. Default is True.
 
     Returns:
         List[dict]: List of dictionaries with keys 'test', 'hpo', and 'validation' 
@@ -62,6 +91,9 @@ def create_loop_indices(config_dict: dict,
             list_loop_indices.append({"test": t,
                                       "hp_configuration": h,
                                       "validation": v})
+
+    if skip_finished and config_dict.get('skip_finished_tasks', True):
+        list_loop_indices = SweepLedger(config_dict, is_cv_loop).filter_unfinished(list_loop_indices)
     
     return list_loop_indices
 
@@ -73,7 +105,10 @@ def perform_single_training(index: int,
                             df_metadata: pd.DataFrame,
                             execution_device: str,
                             config_dict: dict,
-                            is_verbose_on: bool = False):
+                            is_verbose_on: bool = False,
+                            epoch_budget: Optional[int] = None,
+                            fold_index: Optional[FoldIndex] = None,
+                            data_stager: Optional[DataStager] = None):
     """
     Executes a single training run for a given fold and hyperparameter configuration,
     handling cross-validation or cross-testing loop scenarios. This function sets up the 
@@ -103,13 +138,27 @@ def perform_single_training(index: int,
         - other training settings.
     is_verbose_on : bool, optional
         Enables verbose output during training if True (default is False).
+    epoch_budget : int, optional
+        Number of epochs to train to, used by successive halving (default is n_epochs).
+    fold_index : FoldIndex, optional
+        The fold index of df_metadata, built once per sweep (default builds it).
+    data_stager : DataStager, optional
+        Copies the images of the folds to the node-local cache, and gives the
+        metadata with their cached paths (default reads the images in place).
 
     Returns:
     -------
-    None
-        This function performs training and logging but does not return a value.
+    dict
+        The duration of the training in seconds ("duration_seconds"), and the
+        epoch it started from and the number of epochs completed
+        ("start_epoch", "epochs_completed"), used to schedule later tasks,
+        the best validation loss ("best_validation_loss"), and the hits and
+        misses of the preprocessed cache ("preprocessed_cache_hits",
+        "preprocessed_cache_misses").
     """
 
+    start_time = time.perf_counter()
+
     test_fold = indices_loop_dict["test"]
     validation_fold = indices_loop_dict["validation"]
     
@@ -145,6 +194,10 @@ def perform_single_training(index: int,
 
     training_folds_list = partitions_dict['training']
 
+    # Copies the images of the folds of the training to the node-local cache
+    if data_stager is not None:
+        df_metadata, fold_index = data_stager.stage_folds([test_fold, validation_fold] + training_folds_list)
+
     # Creates and runs the training fold for this subject pair
     training_fold = TrainingFold(
         execution_device=execution_device,  # The name of the device that will be use
@@ -157,11 +210,169 @@ def perform_single_training(index: int,
         use_mixed_precision=use_mixed_precision,
         is_cv_loop=is_cv_loop,  # If this is of the outer loop. Default is false. (Optional)
         is_3d=is_3d,  # 
-        is_verbose_on=is_verbose_on  # If the verbose mode is activated. Default is false. (Optional)
+        is_verbose_on=is_verbose_on,  # If the verbose mode is activated. Default is false. (Optional)
+        epoch_budget=epoch_budget,
+        fold_index=fold_index  # The rows of each fold, shared by the trainings
     )
     
     training_fold.run_all_steps()
 
+    duration_seconds = time.perf_counter() - start_time
+    n_trained_samples = len(training_fold.partitions_info_dict['training']['files']) * \
+        (training_fold.epochs_completed - training_fold.start_epoch)
+
+    return {"duration_seconds": duration_seconds,
+            "start_epoch": training_fold.start_epoch,
+            "epochs_completed": training_fold.epochs_completed,
+            "training_samples_per_second": n_trained_samples / duration_seconds,
+            "best_validation_loss": getattr(training_fold, "best_valid_loss", None),
+            "preprocessed_cache_hits": training_fold.preprocessed_cache_statistics["hits"],
+            "preprocessed_cache_misses": training_fold.preprocessed_cache_statistics["misses"]}
+
+
+def perform_vectorized_training(index_list: List[int],
+                                n_combinations: int,
+                                indices_loop_list: List[dict],
+                                is_cv_loop: bool,
+                                df_metadata: pd.DataFrame,
+                                execution_device: str,
+                                config_dict: dict,
+                                is_verbose_on: bool = False,
+                                fold_index: Optional[FoldIndex] = None,
+                                data_stager: Optional[DataStager] = None) -> List[dict]:
+    """
+    Trains the cross-validation folds of a test fold and a hyperparameter
+    configuration together with VectorizedTrainingFolds. Each fold gets its
+    own copy of the configuration, as TrainingFold modifies it.
+
+    Returns:
+        list of dict: The result of each fold, as perform_single_training returns it.
+    """
+
+    start_time = time.perf_counter()
+
+    print(colored(f'--- Trainings: {", ".join(str(index + 1) for index in index_list)}' + \
+                  f'/{n_combinations}, vectorized ---', 'magenta'))
+
+    training_folds = []
+    for index, indices_loop_dict in zip(index_list, indices_loop_list):
+        print("Test fold:", indices_loop_dict["test"])
+        print("Hyperparameter configuration index:",
+              indices_loop_dict["hp_configuration"]["hp_config_index"])
+        print("Validation fold:", indices_loop_dict["validation"])
+
+        partitions_dict = generate_dict_folds_for_partitions(
+            validation_fold_name=indices_loop_dict["validation"],
+            is_cv_loop=is_cv_loop,
+            fold_list=config_dict['fold_list'],
+            test_fold_name=indices_loop_dict["test"]
+            )
+
+        if data_stager is not None:
+            df_metadata, fold_index = data_stager.stage_folds(
+                [indices_loop_dict["test"], indices_loop_dict["validation"]] + partitions_dict['training'])
+
+        training_folds.append(TrainingFold(
+            execution_device=execution_device,
+            training_index=index,
+            configuration=copy.deepcopy(config_dict),
+            indices_loop_dict=indices_loop_dict,
+            training_folds_list=partitions_dict['training'],
+            df_metadata=df_metadata,
+            do_normalize_2d=config_dict["do_normalize_2d"],
+            use_mixed_precision=config_dict["use_mixed_precision"],
+            is_cv_loop=is_cv_loop,
+            is_3d=is_image_3D(config_dict),
+            is_verbose_on=is_verbose_on,
+            fold_index=fold_index))
+
+    VectorizedTrainingFolds(training_folds).run_all_steps()
+
+    # The folds share the time of the vectorized training
+    duration_seconds = (time.perf_counter() - start_time) / len(training_folds)
+    results = []
+    for training_fold in training_folds:
+        n_trained_samples = len(training_fold.partitions_info_dict['training']['files']) * \
+            (training_fold.epochs_completed - training_fold.start_epoch)
+        results.append({"duration_seconds": duration_seconds,
+                        "start_epoch": training_fold.start_epoch,
+                        "epochs_completed": training_fold.epochs_completed,
+                        "training_samples_per_second": n_trained_samples / duration_seconds,
+                        "preprocessed_cache_hits": training_fold.preprocessed_cache_statistics["hits"],
+                        "preprocessed_cache_misses": training_fold.preprocessed_cache_statistics["misses"]})
+
+    return results
+
+
+def group_vectorized_tasks(indices_loop_list: List[dict]) -> List[List[int]]:
+    """
+    Groups the indices of the cross-validation tasks with the same test
+    fold and hyperparameter configuration, in order of first appearance.
+    """
+
+    groups = {}
+    for index, indices_loop_dict in enumerate(indices_loop_list):
+        key = (indices_loop_dict["test"],
+               indices_loop_dict["hp_configuration"]["hp_config_index"])
+        groups.setdefault(key, []).append(index)
+
+    return list(groups.values())
+
+
+def perform_concurrent_training(config_dict: dict,
+                                execution_device: str,
+                                **kwargs) -> dict:
+    """
+    Runs perform_single_training in a thread next to other trainings on
+    the same device, on its own CUDA stream when the device is a GPU.
+    The training gets its own copy of the configuration, as TrainingFold
+    modifies it. Its DataLoader workers are not forked from this
+    multithreaded process, unless dataloader_multiprocessing_context says so.
+
+    Returns:
+        dict: The result of perform_single_training.
+    """
+
+    config_dict = copy.deepcopy(config_dict)
+    if not config_dict.get('dataloader_multiprocessing_context'):
+        config_dict['dataloader_multiprocessing_context'] = get_worker_start_method()
+
+    with get_device_stream_context(execution_device):
+        result = perform_single_training(config_dict=config_dict,
+                                         execution_device=execution_device,
+                                         **kwargs)
+
+    print(colored(f"Training {kwargs['index'] + 1}: " + \
+                  f"{result['training_samples_per_second']:.1f} training samples/s " + \
+                  f"in {result['duration_seconds']:.1f} s.", 'magenta'))
+
+    return result
+
+
+def report_concurrent_trainings(results: List[dict],
+                                utilization: dict,
+                                n_concurrent: int,
+                                elapsed_time: float,
+                                execution_device: str):
+    """
+    Prints the throughput of the trainings run at the same time on a device,
+    and the utilization of the device.
+    """
+
+    if not results:
+        return
+
+    n_trained_samples = sum(result['training_samples_per_second'] * result['duration_seconds']
+                            for result in results)
+    message = f"{len(results)} trainings on '{execution_device}', {n_concurrent} at the same time: " + \
+              f"{n_trained_samples / elapsed_time:.1f} training samples/s in total"
+    if utilization["mean_utilization_percent"] is not None:
+        message += f", device utilization {utilization['mean_utilization_percent']:.0f}%"
+    if utilization["peak_memory_bytes"] is not None:
+        message += f", peak memory {utilization['peak_memory_bytes'] / 1e9:.2f} GB"
+
+    print(colored(message + ".", 'magenta'))
+
 
 def get_fold_list(partition: str,
                   is_cv_loop: bool,
@@ -282,6 +493,59 @@ def get_index_device(num_device_to_use: int,
     return index_gpu
 
 
+def get_number_training_workers(n_proc: int,
+                                num_device_to_use: int,
+                                enable_dummy_node: bool) -> int:
+    """
+    Returns the number of ranks that train, i.e. the ranks other than 0
+    that get_index_device does not make dummy processes.
+    """
+
+    if not enable_dummy_node:
+        return n_proc - 1
+
+    return sum(1 for rank in range(1, n_proc)
+               if (rank - 1) % (num_device_to_use + 1) != num_device_to_use)
+
+
+def get_hpo_scheduler(config_dict: dict,
+                      indices_loop_list: List[dict],
+                      is_cv_loop: bool):
+    """
+    Returns the scheduler that gives the tasks of the loop from the results
+    of the previous ones: successive halving if 'use_asha', model-based
+    search if 'hpo_sampler' is not 'random', otherwise None.
+
+    Raises:
+        ValueError: If both are set.
+    """
+
+    use_asha = config_dict.get('use_asha', False)
+    use_sampler = config_dict.get('use_hpo', False) and config_dict.get('hpo_sampler', 'random') != 'random'
+
+    if not is_cv_loop:
+        if use_asha:
+            print(colored("Warning: use_asha is only used in the cross-validation loop.", 'yellow'))
+        if use_sampler:
+            print(colored("Warning: hpo_sampler only proposes configurations in the cross-validation loop.", 'yellow'))
+        return None
+
+    if use_asha and use_sampler:
+        raise ValueError("use_asha and a model-based hpo_sampler cannot be used together.")
+
+    if use_asha:
+        return AshaScheduler(config_dict, indices_loop_list)
+
+    if use_sampler:
+        test_fold_list = get_fold_list("test", is_cv_loop, config_dict)
+        validation_fold_list = get_fold_list("validation", is_cv_loop, config_dict)
+        fold_pair_list = [(t, v) for t, v in itertools.product(test_fold_list, validation_fold_list)
+                          if t != v]
+        return SamplerScheduler(config_dict, indices_loop_list, fold_pair_list)
+
+    return None
+
+
 def train_sequential(config_dict: dict,
                      execution_device_list: list,
                      is_verbose_on: bool,
@@ -330,9 +594,16 @@ def train_sequential(config_dict: dict,
     # Determine whether we are in a cross-validation or cross-testing loop
     is_cv_loop = determine_if_cv_loop(loop)
 
-    # Load metadata from the CSV file
+    # Groups the files of the run in the shared caches
+    config_dict.setdefault('run_id', get_run_id())
+
+    # Load the metadata, from a CSV, Parquet or Feather file
     path_csv_metadata = config_dict["path_metadata_csv"]
-    df_metadata = read_metadata_csv(path_csv_metadata)
+    df_metadata = read_training_metadata(path_csv_metadata)
+    # The rows of each fold, shared by all the trainings of the loop
+    fold_index = FoldIndex(df_metadata)
+    # Copies the images of the folds to the node-local cache, if set
+    data_stager = create_data_stager(config_dict, df_metadata, fold_index)
 
     # Double-checks that the validation subjects are unique
     if is_cv_loop:  # Only if we are in the inner loop
@@ -347,26 +618,142 @@ def train_sequential(config_dict: dict,
                                             is_cv_loop)
     n_combinations = len(indices_loop_list)
 
+    # Records the durations, used to schedule parallel runs
+    cost_model = TaskCostModel(config_dict, df_metadata, is_cv_loop)
+    # Records the finished tasks, skipped when the loop is run again
+    sweep_ledger = SweepLedger(config_dict, is_cv_loop)
+    # Adds up the preprocessed cache counts of the trainings
+    cache_statistics = PreprocessedCacheStatistics()
+
+    # Number of trainings run at the same time on the device
+    execution_device = execution_device_list[0]
+    n_concurrent = get_number_concurrent_trainings(config_dict,
+                                                   indices_loop_list,
+                                                   execution_device)
+
+    # Successive halving or model-based search of the configurations
+    hpo_scheduler = get_hpo_scheduler(config_dict, indices_loop_list, is_cv_loop)
+    if hpo_scheduler is not None:
+        n_combinations = hpo_scheduler.get_number_of_tasks()
+        if config_dict.get('vectorized_folds', False):
+            print(colored("Warning: vectorized_folds is not used with use_asha or hpo_sampler, " + \
+                          "the folds are trained separately.", 'yellow'))
+
     # Start measuring elapsed training time
     training_timer = PrecisionTimer()
 
-    # Iterate through each combination of folds and train sequentially
-    for index, indices_loop_dict in enumerate(indices_loop_list):
-        perform_single_training(index=index,
-                                n_combinations=n_combinations,
-                                indices_loop_dict=indices_loop_dict,
-                                is_cv_loop=is_cv_loop,
-                                df_metadata=df_metadata,
-                                execution_device=execution_device_list[0],
-                                config_dict=config_dict,
-                                is_verbose_on=is_verbose_on)
+    if hpo_scheduler is not None:
+        # One task at a time, each given from the results of the previous ones
+        task = hpo_scheduler.get_next_task(is_idle=True)
+        while task is not None:
+            indices_loop_dict = indices_loop_list[task["index"]]
+            sweep_ledger.record(indices_loop_dict, DISPATCHED)
+            result = perform_single_training(index=task["index"],
+                                             n_combinations=n_combinations,
+                                             indices_loop_dict=indices_loop_dict,
+                                             is_cv_loop=is_cv_loop,
+                                             df_metadata=df_metadata,
+                                             execution_device=execution_device,
+                                             config_dict=config_dict,
+                                             is_verbose_on=is_verbose_on,
+                                             epoch_budget=task.get("epoch_budget"),
+                                             fold_index=fold_index,
+                                             data_stager=data_stager)
+            cost_model.record(indices_loop_dict, result)
+            cache_statistics.record(result)
+            hpo_scheduler.record(task, result)
+            if hpo_scheduler.is_task_finished(task):
+                sweep_ledger.record(indices_loop_dict, FINISHED, result)
+            task = hpo_scheduler.get_next_task(is_idle=True)
+
+        hpo_scheduler.report()
+        for index in hpo_scheduler.get_stopped_indices():
+            sweep_ledger.record(indices_loop_list[index], FINISHED)
+    elif config_dict.get('vectorized_folds', False) and is_cv_loop:
+        # Trains the validation folds of each test fold and hyperparameter
+        # configuration together, as one batched model
+        for index_list in group_vectorized_tasks(indices_loop_list):
+            group_list = [indices_loop_list[index] for index in index_list]
+            for indices_loop_dict in group_list:
+                sweep_ledger.record(indices_loop_dict, DISPATCHED)
+            results = perform_vectorized_training(index_list=index_list,
+                                                  n_combinations=n_combinations,
+                                                  indices_loop_list=group_list,
+                                                  is_cv_loop=is_cv_loop,
+                                                  df_metadata=df_metadata,
+                                                  execution_device=execution_device,
+                                                  config_dict=config_dict,
+                                                  is_verbose_on=is_verbose_on,
+                                                  fold_index=fold_index,
+                                                  data_stager=data_stager)
+            for indices_loop_dict, result in zip(group_list, results):
+                cost_model.record(indices_loop_dict, result)
+                cache_statistics.record(result)
+                sweep_ledger.record(indices_loop_dict, FINISHED, result)
+    elif n_concurrent == 1:
+        # Iterate through each combination of folds and train sequentially
+        for index, indices_loop_dict in enumerate(indices_loop_list):
+            sweep_ledger.record(indices_loop_dict, DISPATCHED)
+            result = perform_single_training(index=index,
+                                             n_combinations=n_combinations,
+                                             indices_loop_dict=indices_loop_dict,
+                                             is_cv_loop=is_cv_loop,
+                                             df_metadata=df_metadata,
+                                             execution_device=execution_device,
+                                             config_dict=config_dict,
+                                             is_verbose_on=is_verbose_on,
+                                             fold_index=fold_index,
+                                             data_stager=data_stager)
+            cost_model.record(indices_loop_dict, result)
+            cache_statistics.record(result)
+            sweep_ledger.record(indices_loop_dict, FINISHED, result)
+    else:
+        # Trains several combinations at the same time on the device
+        set_threads_per_training(execution_device, n_concurrent)
+        utilization_monitor = DeviceUtilizationMonitor(execution_device)
+        utilization_monitor.start()
+        start_time = time.perf_counter()
+
+        results = []
+        for indices_loop_dict in indices_loop_list:
+            sweep_ledger.record(indices_loop_dict, DISPATCHED)
+        with ThreadPoolExecutor(max_workers=n_concurrent) as executor:
+            futures = {executor.submit(perform_concurrent_training,
+                                       index=index,
+                                       n_combinations=n_combinations,
+                                       indices_loop_dict=indices_loop_dict,
+                                       is_cv_loop=is_cv_loop,
+                                       df_metadata=df_metadata,
+                                       execution_device=execution_device,
+                                       config_dict=config_dict,
+                                       is_verbose_on=is_verbose_on,
+                                       fold_index=fold_index,
+                                       data_stager=data_stager): indices_loop_dict
+                       for index, indices_loop_dict in enumerate(indices_loop_list)}
+            for future in as_completed(futures):
+                result = future.result()
+                cost_model.record(futures[future], result)
+                cache_statistics.record(result)
+                sweep_ledger.record(futures[future], FINISHED, result)
+                results.append(result)
+
+        report_concurrent_trainings(results,
+                                    utilization_monitor.stop(),
+                                    n_concurrent,
+                                    time.perf_counter() - start_time,
+                                    execution_device)
         
+    if data_stager is not None:
+        data_stager.report()
+    cache_statistics.report()
+
     # Report elapsed training time
     elapsed_time_seconds = training_timer.get_elapsed_time()
     print(colored(f"\nElapsed time: {elapsed_time_seconds:.2f} seconds.", 'magenta'))
 
     # Save the timing results to a file in the appropriate output directory
     loop_folder = "CT" if not is_cv_loop else "CV"
+    report_checkpoint_footprint(Path(config_dict["output_path"]) / loop_folder / "checkpoints")
     timing_directory_path = Path(config_dict["output_path"]) / loop_folder /"training_timings" # The directory's path where to put the timing file
     timing_directory_path.mkdir(mode=0o775, parents=True, exist_ok=True)
     
@@ -426,45 +813,187 @@ def train_parallel(config_dict: dict,
             check_unique_subjects(config_dict["validation_fold_list"],
                                   "validation")
 
+        if config_dict.get('vectorized_folds', False):
+            print(colored("Warning: vectorized_folds is only used in sequential training, " + \
+                          "the folds are trained separately.", 'yellow'))
+
         if is_verbose_on:
             print(colored("Double-checks of test and validation uniqueness successfully done.", 'cyan'))
 
         # Create task list for training (each entry is a fold/config combo)
         indices_loop_list = create_loop_indices(config_dict,
                                                 is_cv_loop)
-        n_tasks = len(indices_loop_list)
+
+        # Successive halving or model-based search of the configurations
+        hpo_scheduler = get_hpo_scheduler(config_dict, indices_loop_list, is_cv_loop)
+        if hpo_scheduler is not None:
+            n_tasks = hpo_scheduler.get_number_of_tasks()
+        else:
+            n_tasks = len(indices_loop_list)
 
         if n_tasks == 0:
             # If no configurations exist, inform all workers and exit
-            for subrank in range(1, n_proc):
-                comm.send(False, dest=subrank)
+            comm.bcast(None, root=0)
+            if create_loop_indices(config_dict, is_cv_loop, skip_finished=False):
+                print(colored("All the tasks are already finished.", 'green'))
+                return
             raise ValueError(colored("No configurations given.", 'yellow'))
 
-        # Load metadata from CSV
+        # Load the metadata, from a CSV, Parquet or Feather file
         path_csv_metadata = config_dict["path_metadata_csv"]
-        df_metadata = read_metadata_csv(path_csv_metadata)
+        df_metadata = read_training_metadata(path_csv_metadata)
+
+        # Groups the files of the run in the shared caches, the same id
+        # is given to all the ranks with the configuration
+        config_dict.setdefault('run_id', get_run_id())
+
+        # The metadata, configuration and tasks are sent once to all
+        # the workers, the task messages only carry the task index,
+        # and the task itself if it was added during the loop
+        shared_data = {
+            "n_combinations": n_tasks,
+            "indices_loop_list": indices_loop_list,
+            "is_cv_loop": is_cv_loop,
+            "df_metadata": df_metadata,
+            "config_dict": config_dict,
+            "is_verbose_on": is_verbose_on
+        }
+        broadcast_bytes = len(pickle.dumps(shared_data, protocol=pickle.HIGHEST_PROTOCOL))
+        broadcast_start_time = time.perf_counter()
+        comm.bcast(shared_data, root=0)
+        print(colored(f"Rank 0 broadcast the metadata and configuration ({broadcast_bytes / 1e6:.2f} MB) " + \
+                      f"in {time.perf_counter() - broadcast_start_time:.3f} s.", 'cyan'))
+
+        # Orders the tasks longest expected first, so the longest
+        # tasks do not start last and delay the end of the loop
+        cost_model = TaskCostModel(config_dict, df_metadata, is_cv_loop)
+        sweep_ledger = SweepLedger(config_dict, is_cv_loop)
+        cache_statistics = PreprocessedCacheStatistics()
+        if config_dict.get("task_scheduling", "longest_first") == "longest_first":
+            dispatch_order = order_tasks_by_cost(indices_loop_list, cost_model)
+        else:
+            dispatch_order = list(range(n_tasks))
+
+        n_workers = get_number_training_workers(n_proc,
+                                                num_device_to_use,
+                                                enable_dummy_process)
+        # Rows by dispatch, a task is dispatched once per rung with successive halving
+        schedule_rows = {}
+        running_tasks = {}
         
         # Start a training timer
         training_timer = PrecisionTimer()
-        
-        # Assign training tasks to workers as they become available
-        for index, indices_loop_dict in enumerate(indices_loop_list):
-            subrank = comm.recv(source=MPI.ANY_SOURCE)
-            dict_to_send = { 
+        start_time = time.perf_counter()
+
+        def receive_result() -> int:
+            # Receives a ready message, with the result of the previous task of the rank
+            message = comm.recv(source=MPI.ANY_SOURCE)
+            subrank, result = message["rank"], message["result"]
+            if result is not None:
+                dispatch_id = result["dispatch_id"]
+                task = running_tasks.pop(dispatch_id)
+                index = task["index"]
+                cost_model.record(indices_loop_list[index], result, subrank)
+                cache_statistics.record(result)
+                if hpo_scheduler is not None:
+                    hpo_scheduler.record(task, result)
+                if hpo_scheduler is None or hpo_scheduler.is_task_finished(task):
+                    sweep_ledger.record(indices_loop_list[index], FINISHED, result, subrank)
+                schedule_rows[dispatch_id]["end_seconds"] = time.perf_counter() - start_time
+                schedule_rows[dispatch_id]["duration_seconds"] = result["duration_seconds"]
+                schedule_rows[dispatch_id]["epochs_completed"] = result["epochs_completed"]
+                schedule_rows[dispatch_id]["dispatch_latency_seconds"] = result["dispatch_latency_seconds"]
+                schedule_rows[dispatch_id]["training_samples_per_second"] = result["training_samples_per_second"]
+            return subrank
+
+        def dispatch_task(subrank: int,
+                          task: dict):
+            index = task["index"]
+            indices_loop_dict = indices_loop_list[index]
+            dispatch_id = len(schedule_rows)
+            dict_to_send = dict(task, dispatch_id=dispatch_id)
+            schedule_rows[dispatch_id] = {
                 "index": index,
-                "n_combinations": n_tasks,
-                "indices_loop_dict": indices_loop_dict,
-                "is_cv_loop": is_cv_loop,
-                "df_metadata": df_metadata,
-                "config_dict": config_dict,
-                "is_verbose_on": is_verbose_on
+                "task_key": get_task_key(indices_loop_dict),
+                "rank": subrank,
+                "predicted_seconds": cost_model.get_predicted_seconds(indices_loop_dict),
+                "start_seconds": time.perf_counter() - start_time,
+                "message_bytes": len(pickle.dumps(dict_to_send)),
             }
+            if "epoch_budget" in task:
+                schedule_rows[dispatch_id]["epoch_budget"] = task["epoch_budget"]
+            running_tasks[dispatch_id] = dict(task, rank=subrank)
+            sweep_ledger.record(indices_loop_dict, DISPATCHED, rank=subrank)
             comm.send(dict_to_send, dest=subrank)
 
+        terminated_subranks = set()
+        if hpo_scheduler is None:
+            # Assign training tasks to workers as they become available
+            for index in dispatch_order:
+                dispatch_task(receive_result(), {"index": index})
+
+            # Waits for the running tasks, to record their durations
+            while running_tasks:
+                subrank = receive_result()
+                print(colored(f"Rank 0 is terminating rank {subrank}, no tasks to give.", 'red'))
+                comm.send(False, dest=subrank)
+                terminated_subranks.add(subrank)
+        else:
+            # The tasks are given from the results of the previous ones,
+            # the next rungs of successive halving as the trials complete
+            # their rungs, or the configurations proposed by the sampler. A rank with a free slot but no task to run waits:
+            # it is answered later if it has no running task, otherwise it
+            # is told to ask again once one of its trainings finishes.
+            waiting_subranks = []
+            while True:
+                subrank = receive_result()
+                task = hpo_scheduler.get_next_task(is_idle=not running_tasks)
+                if task is None:
+                    if not running_tasks:
+                        waiting_subranks.append(subrank)
+                        break
+                    if any(running_task["rank"] == subrank for running_task in running_tasks.values()):
+                        comm.send({"wait": True}, dest=subrank)
+                    else:
+                        waiting_subranks.append(subrank)
+                    continue
+
+                dispatch_task(subrank, task)
+                while waiting_subranks:
+                    task = hpo_scheduler.get_next_task()
+                    if task is None:
+                        break
+                    dispatch_task(waiting_subranks.pop(0), task)
+
+            for subrank in waiting_subranks:
+                print(colored(f"Rank 0 is terminating rank {subrank}, no tasks to give.", 'red'))
+                comm.send(False, dest=subrank)
+                terminated_subranks.add(subrank)
+
+            hpo_scheduler.report()
+            # The stopped configurations are not trained again if the loop is run again
+            for index in hpo_scheduler.get_stopped_indices():
+                sweep_ledger.record(indices_loop_list[index], FINISHED)
+
         # Notify all workers that tasks are complete
         for subrank in range(1, n_proc):
+            if subrank in terminated_subranks:
+                continue
             print(colored(f"Rank 0 is terminating rank {subrank}, no tasks to give.", 'red'))
             comm.send(False, dest=subrank)
+
+        loop_folder = "CT" if not is_cv_loop else "CV"
+        report_schedule(schedule_rows=list(schedule_rows.values()),
+                        cost_model=cost_model,
+                        indices_loop_list=indices_loop_list,
+                        dispatch_order=[row["index"] for row in schedule_rows.values()],
+                        n_workers=n_workers,
+                        actual_makespan=time.perf_counter() - start_time,
+                        output_filepath=Path(config_dict["output_path"]) / loop_folder / \
+                            "training_timings" / f"{config_dict['job_name']}_schedule.csv")
+        report_dispatch(schedule_rows=list(schedule_rows.values()),
+                        broadcast_bytes=broadcast_bytes)
+        cache_statistics.report()
         
         # Stop the timer and log elapsed time
         elapsed_time_seconds = training_timer.get_elapsed_time()
@@ -472,6 +1001,7 @@ def train_parallel(config_dict: dict,
 
         # Save timing information
         loop_folder = "CT" if not is_cv_loop else "CV"
+        report_checkpoint_footprint(Path(config_dict["output_path"]) / loop_folder / "checkpoints")
         timing_directory_path = Path(config_dict["output_path"]) / loop_folder /"training_timings" # The directory's path where to put the timing file
         timing_directory_path.mkdir(mode=0o775, parents=True, exist_ok=True)
         
@@ -492,29 +1022,99 @@ def train_parallel(config_dict: dict,
         print(f"rank: {rank}, index_gpu: {index_device}")
         print("enable_dummy_process:", enable_dummy_process)
         
-        if index_device != -1:
-            # Notify rank 0 that this process is ready to receive a task
-            comm.send(rank, dest=0)
-
-            print(colored(f'Rank {rank} is listening for process 0.', 'cyan'))
-            task = comm.recv(source=0)
-            
-            # Process training tasks as long as they are being sent
-            while task:
-                perform_single_training(
-                        index=task["index"],
-                        n_combinations=task["n_combinations"],
-                        indices_loop_dict=task["indices_loop_dict"],
-                        is_cv_loop=task["is_cv_loop"],
-                        df_metadata=task["df_metadata"],
-                        execution_device=execution_device_list[index_device],  # Use the GPU assigned to this rank
-                        config_dict=task["config_dict"],
-                        is_verbose_on=task["is_verbose_on"])
-
-                # Notify rank 0 that this process is ready for a new task
-                comm.send(rank, dest=0)
-                task = comm.recv(source=0)
+        # Receives the metadata, configuration and tasks once
+        shared_data = comm.bcast(None, root=0)
+        if shared_data is None:
+            print(colored(f'Rank {rank} terminated. No tasks were given.', 'yellow'))
+            return
 
+        if index_device != -1:
+            execution_device = execution_device_list[index_device]  # Use the GPU assigned to this rank
+
+            # Number of trainings run at the same time on the device
+            n_concurrent = get_number_concurrent_trainings(shared_data["config_dict"],
+                                                           shared_data["indices_loop_list"],
+                                                           execution_device)
+            set_threads_per_training(execution_device, n_concurrent)
+            # The rows of each fold, shared by all the trainings of the rank
+            fold_index = FoldIndex(shared_data["df_metadata"])
+            # Copies the images of the folds of the trainings of the rank
+            # to the node-local cache, if set
+            data_stager = create_data_stager(shared_data["config_dict"],
+                                             shared_data["df_metadata"],
+                                             fold_index)
+            utilization_monitor = DeviceUtilizationMonitor(execution_device)
+            utilization_monitor.start()
+            start_time = time.perf_counter()
+
+            # All the MPI communication is done by this thread. Each message
+            # sent to rank 0 is answered with a task or False. A message
+            # asks for a task when a training slot is free, and carries the
+            # result of a finished training if there is one.
+            running_futures = {}
+            finished_results = []
+            all_results = []
+            is_terminated = False
+            # Told by rank 0 to ask for a task once a training finishes
+            is_waiting = False
+
+            with ThreadPoolExecutor(max_workers=n_concurrent) as executor:
+                while True:
+                    if finished_results:
+                        result = finished_results.pop(0)
+                    elif not is_terminated and not is_waiting and len(running_futures) < n_concurrent:
+                        result = None
+                    elif running_futures:
+                        done_futures, _ = wait(running_futures, return_when=FIRST_COMPLETED)
+                        for future in done_futures:
+                            result = future.result()
+                            task, result["dispatch_latency_seconds"] = running_futures.pop(future)
+                            result["index"], result["dispatch_id"] = task["index"], task["dispatch_id"]
+                            finished_results.append(result)
+                            all_results.append(result)
+                        continue
+                    else:
+                        break
+
+                    # Notify rank 0 that this process is ready for a new task,
+                    # with the duration of the previous task for the scheduling
+                    if result is None:
+                        print(colored(f'Rank {rank} is listening for process 0.', 'cyan'))
+                    ready_time = time.perf_counter()
+                    comm.send({"rank": rank, "result": result}, dest=0)
+                    task = comm.recv(source=0)
+
+                    if not task:
+                        is_terminated = True
+                        continue
+                    is_waiting = task.get("wait", False)
+                    if is_waiting:
+                        continue
+
+                    index = task["index"]
+                    future = executor.submit(
+                        perform_concurrent_training,
+                        index=index,
+                        n_combinations=shared_data["n_combinations"],
+                        indices_loop_dict=task["indices_loop_dict"] if "indices_loop_dict" in task \
+                            else shared_data["indices_loop_list"][index],
+                        is_cv_loop=shared_data["is_cv_loop"],
+                        df_metadata=shared_data["df_metadata"],
+                        execution_device=execution_device,
+                        config_dict=shared_data["config_dict"],
+                        is_verbose_on=shared_data["is_verbose_on"],
+                        epoch_budget=task.get("epoch_budget"),
+                        fold_index=fold_index,
+                        data_stager=data_stager)
+                    running_futures[future] = (task, time.perf_counter() - ready_time)
+
+            report_concurrent_trainings(all_results,
+                                        utilization_monitor.stop(),
+                                        n_concurrent,
+                                        time.perf_counter() - start_time,
+                                        execution_device)
+            if data_stager is not None:
+                data_stager.report()
 
             print(colored(f'Rank {rank} terminated. All jobs finished for this process.', 'yellow'))
 
@@ -12,6 +12,7 @@ import pandas as pd
 from torchvision import transforms
 
 from nachosv2.image_processing.image_crop import crop_image
+from nachosv2.data_processing.preprocessed_cache import PreprocessedCache
 # from nachosv2.image_processing.image_transformations import image_transformation_2D
 
 
@@ -39,7 +40,8 @@ class Dataset2D(Dataset):
                  image_size: tuple = None,
                  do_cropping: bool = False,
                  crop_box: tuple = None,
-                 transform: Optional[Callable] = None):
+                 transform: Optional[Callable] = None,
+                 cache: Optional[PreprocessedCache] = None):
         """
         Initializes a custom dataset object.
         
@@ -53,6 +55,7 @@ class Dataset2D(Dataset):
             crop_box (tuple of int): The dimensions after cropping.
             
             normalizer (transforms.Compose): The image normalizer.
+            cache (PreprocessedCache): Cache of decoded, cropped and resized images. (Optional)
         """
         
         self.dictionary_partition = dictionary_partition
@@ -61,6 +64,7 @@ class Dataset2D(Dataset):
         self.do_cropping = do_cropping
         self.crop_box = crop_box
         self.transform = transform
+        self.cache = cache
 
     def __len__(self):
         """
@@ -70,24 +74,19 @@ class Dataset2D(Dataset):
         return len(self.dictionary_partition['files'])
 
 
-    def __getitem__(self, index):
+    def load_image(self, filepath: str) -> np.ndarray:
         """
-        Retrieves a single sample from the dataset given an index.
-        
+        Decodes an image and applies the grayscale conversion, cropping and resizing.
+
         Args:
-            index (int): The index of a sample in the dataset.
-        
+            filepath (str): The path of the image.
+
         Returns:
-            image_tensor (PyTorch tensor): The sample from the dataset.
-            label_index (int): The label of the sample.
-            image_index (int): The index of the sample in all the dataset.
-            file_path (str): The file path.
+            image (numpy.ndarray): The preprocessed image.
         """
-        
+
         # Opens the image
-        filepath = self.dictionary_partition['files'][index]
         image = skimage.io.imread(filepath)
-        label = self.dictionary_partition['labels'][index]
         
         image = img_as_float32(image)
         # Transformes the image
@@ -102,6 +101,36 @@ class Dataset2D(Dataset):
         if self.image_size:
             image = skimage.transform.resize(image, self.image_size)        
 
+        return image
+
+
+    def __getitem__(self, index):
+        """
+        Retrieves a single sample from the dataset given an index.
+        
+        Args:
+            index (int): The index of a sample in the dataset.
+        
+        Returns:
+            image_tensor (PyTorch tensor): The sample from the dataset.
+            label_index (int): The label of the sample.
+            image_index (int): The index of the sample in all the dataset.
+            file_path (str): The file path.
+        """
+        
+        filepath = self.dictionary_partition['files'][index]
+        label = int(self.dictionary_partition['labels'][index])
+
+        if self.cache is None:
+            image = self.load_image(filepath)
+        else:
+            image = self.cache.get_or_compute(
+                filepath,
+                self.number_channels,
+                self.crop_box if self.do_cropping else None,
+                self.image_size,
+                self.load_image)
+
         # Converts the image into a tensor
         image = transforms.ToTensor()(image)
         if self.transform:
@@ -114,6 +143,54 @@ class Dataset2D(Dataset):
         return image, label, filepath
 
 
+class DecodedDataset2D(Dataset):
+    def __init__(self,
+                 dictionary_partition: dict):
+        """
+        Initializes a dataset that only decodes the images. The preprocessing
+        is done afterwards on whole batches by a BatchPreprocessor.
+
+        Args:
+            dictionary_partition (dict): The files and labels of the partition, as lists
+                or as a CompactStringArray and a label array.
+        """
+
+        self.dictionary_partition = dictionary_partition
+
+
+    def __len__(self):
+        """
+        Returns the dataset len.
+        """
+
+        return len(self.dictionary_partition['files'])
+
+
+    def __getitem__(self, index):
+        """
+        Retrieves a single decoded image from the dataset given an index.
+
+        Args:
+            index (int): The index of a sample in the dataset.
+
+        Returns:
+            image (PyTorch tensor): The decoded image, (H, W) or (H, W, C).
+            label (int): The label of the sample.
+            filepath (str): The file path.
+        """
+
+        filepath = self.dictionary_partition['files'][index]
+        label = int(self.dictionary_partition['labels'][index])
+
+        image = skimage.io.imread(filepath)
+
+        # uint8 images are kept as they are, 4 times smaller than float32
+        if image.dtype not in (np.uint8, np.int8, np.int16, np.int32, np.float32, np.float64):
+            image = img_as_float32(image)
+
+        return torch.from_numpy(np.ascontiguousarray(image)), label, filepath
+
+
 class Custom2DDataset(Dataset):
     def __init__(self, prefix, data_dictionary, channels, do_cropping, crop_box, normalizer):
         """
@@ -0,0 +1,388 @@
+import os
+import copy
+import json
+import math
+import multiprocessing
+import socket
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Callable
+from termcolor import colored
+
+import fasteners
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Dataset
+
+
+DEFAULT_NUM_WORKERS = 4
+DEFAULT_PREFETCH_FACTOR = 2
+MAX_PREFETCH_FACTOR = 8
+
+# Settings resolved by the probes, in output_path, reused by the next trainings
+AUTOTUNING_CACHE_FILENAME = "dataloader_autotuning.json"
+
+# Resolved settings kept in the cache
+AUTOTUNED_KEYS = ['num_workers', 'prefetch_factor',
+                  'model_samples_per_second', 'loader_samples_per_second']
+
+
+def get_dataloader_settings(configuration: dict,
+                            execution_device: str) -> dict:
+    """
+    Reads the DataLoader settings of the configuration.
+
+    Args:
+        configuration (dict): The training configuration.
+        execution_device (str): The execution device.
+
+    Returns:
+        settings (dict): num_workers and prefetch_factor (int or 'auto'),
+            pin_memory and persistent_workers (bool), and multiprocessing_context
+            (str or None, the start method of the workers).
+    """
+
+    pin_memory = configuration.get('dataloader_pin_memory', 'auto')
+    if pin_memory == 'auto':
+        pin_memory = torch.device(execution_device).type == 'cuda'
+
+    settings = {
+        'num_workers': configuration.get('dataloader_num_workers', DEFAULT_NUM_WORKERS),
+        'pin_memory': bool(pin_memory),
+        'persistent_workers': bool(configuration.get('dataloader_persistent_workers', True)),
+        'prefetch_factor': configuration.get('dataloader_prefetch_factor', DEFAULT_PREFETCH_FACTOR),
+        'multiprocessing_context': configuration.get('dataloader_multiprocessing_context', None),
+    }
+
+    start_methods = multiprocessing.get_all_start_methods()
+    if settings['multiprocessing_context'] not in [None] + start_methods:
+        raise ValueError(f"dataloader_multiprocessing_context must be one of {start_methods}, " + \
+                         f"got {settings['multiprocessing_context']}.")
+
+    # bool is a subclass of int, 'true' in the configuration is not a count
+    for key, minimum in [('num_workers', 0), ('prefetch_factor', 1)]:
+        value = settings[key]
+        if value != 'auto' and not (isinstance(value, int) and not isinstance(value, bool) and value >= minimum):
+            raise ValueError(f"dataloader_{key} must be an integer >= {minimum} or 'auto', got {value}.")
+
+    return settings
+
+
+def needs_autotuning(settings: dict) -> bool:
+    """
+    Returns True if a setting is 'auto'.
+    """
+    return settings['num_workers'] == 'auto' or settings['prefetch_factor'] == 'auto'
+
+
+def get_dataloader_kwargs(settings: dict) -> dict:
+    """
+    Converts the settings into DataLoader arguments. persistent_workers,
+    prefetch_factor and multiprocessing_context are only valid when
+    num_workers > 0.
+
+    Args:
+        settings (dict): The resolved DataLoader settings.
+
+    Returns:
+        dict: Keyword arguments of DataLoader.
+    """
+
+    kwargs = {'num_workers': settings['num_workers'],
+              'pin_memory': settings['pin_memory']}
+
+    if settings['num_workers'] > 0:
+        kwargs['persistent_workers'] = settings['persistent_workers']
+        kwargs['prefetch_factor'] = settings['prefetch_factor']
+        if settings.get('multiprocessing_context'):
+            kwargs['multiprocessing_context'] = settings['multiprocessing_context']
+
+    return kwargs
+
+
+def measure_model_step_time(model: nn.Module,
+                            loss_function: nn.Module,
+                            sample_image: torch.Tensor,
+                            batch_size: int,
+                            device: str,
+                            n_steps: int = 3) -> float:
+    """
+    Measures the time of a forward and backward pass on a synthetic batch.
+    A copy of the model is used, so the weights and batch normalization
+    statistics of the training are not modified.
+
+    Args:
+        model (nn.Module): The model to train.
+        loss_function (nn.Module): The loss function.
+        sample_image (torch.Tensor): An image of the dataset, used for the shape.
+        batch_size (int): The batch size.
+        device (str): The execution device.
+        n_steps (int): Number of timed steps, after one warm-up step. Default is 3.
+
+    Returns:
+        float: The mean step time in seconds.
+    """
+
+    probe_model = copy.deepcopy(model).to(device)
+    probe_model.train()
+
+    inputs = sample_image.unsqueeze(0).repeat(batch_size, *([1] * sample_image.dim())).to(device)
+    labels = torch.zeros(batch_size, dtype=torch.int64, device=device)
+
+    def run_step():
+        loss = loss_function(probe_model(inputs), labels)
+        loss.backward()
+        probe_model.zero_grad(set_to_none=True)
+
+    run_step()
+    synchronize(device)
+
+    start_time = time.perf_counter()
+    for _ in range(n_steps):
+        run_step()
+    synchronize(device)
+
+    step_time = (time.perf_counter() - start_time) / n_steps
+
+    del probe_model
+
+    return step_time
+
+
+def measure_loader_throughput(dataset: Dataset,
+                              batch_size: int,
+                              num_workers: int,
+                              prefetch_factor: int,
+                              n_batches: int,
+                              collate_fn: Optional[Callable] = None,
+                              multiprocessing_context: Optional[str] = None) -> float:
+    """
+    Measures the samples per second a DataLoader delivers,
+    excluding the start-up of the workers.
+
+    Returns:
+        float: Samples per second.
+    """
+
+    kwargs = get_dataloader_kwargs({'num_workers': num_workers,
+                                    'pin_memory': False,
+                                    'persistent_workers': False,
+                                    'prefetch_factor': prefetch_factor,
+                                    'multiprocessing_context': multiprocessing_context})
+
+    dataloader = DataLoader(dataset=dataset,
+                            batch_size=batch_size,
+                            shuffle=True,
+                            drop_last=False,
+                            collate_fn=collate_fn,
+                            **kwargs)
+
+    n_samples = 0
+    start_time = None
+    for i, (_, labels, _) in enumerate(dataloader):
+        if i == 0:
+            # The first batch includes the worker start-up
+            start_time = time.perf_counter()
+            continue
+
+        n_samples += len(labels)
+        if i >= n_batches:
+            break
+
+    elapsed_time = time.perf_counter() - start_time if start_time else 0.0
+    del dataloader
+
+    if n_samples == 0 or elapsed_time == 0.0:
+        return math.inf
+
+    return n_samples / elapsed_time
+
+
+def autotune_dataloader_settings(settings: dict,
+                                 dataset: Dataset,
+                                 model: nn.Module,
+                                 loss_function: nn.Module,
+                                 batch_size: int,
+                                 device: str,
+                                 n_batches: int = 10,
+                                 headroom: float = 1.2,
+                                 sample_image: Optional[torch.Tensor] = None,
+                                 collate_fn: Optional[Callable] = None) -> dict:
+    """
+    Resolves the 'auto' DataLoader settings with a short probe on the current node.
+
+    The model step time gives the samples per second the training consumes.
+    Worker counts are tried in increasing order and the first one delivering
+    'headroom' times that throughput is chosen (the fastest one otherwise).
+    The prefetch depth is chosen so the batches in flight cover the time a
+    worker needs to produce a batch.
+
+    Args:
+        settings (dict): The DataLoader settings from get_dataloader_settings.
+        dataset (Dataset): The training dataset.
+        model (nn.Module): The model to train.
+        loss_function (nn.Module): The loss function.
+        batch_size (int): The batch size.
+        device (str): The execution device.
+        n_batches (int): Number of batches measured per worker count. Default is 10.
+        headroom (float): Required ratio of loading over training throughput. Default is 1.2.
+        sample_image (torch.Tensor): An image as the model receives it. By default,
+            the first image of the dataset. (Optional)
+        collate_fn (Callable): The collate function of the DataLoader. (Optional)
+
+    Returns:
+        settings (dict): The resolved settings, with the measured throughputs.
+    """
+
+    settings = dict(settings)
+
+    if sample_image is None:
+        sample_image, _, _ = dataset[0]
+    step_time = measure_model_step_time(model, loss_function, sample_image,
+                                        batch_size, device)
+    model_throughput = batch_size / step_time
+
+    if settings['num_workers'] == 'auto':
+        max_workers = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') \
+            else (os.cpu_count() or 1)
+        candidate_workers = [0] + [n for n in [1, 2, 4, 8, 16, 32] if n <= max_workers]
+    else:
+        candidate_workers = [settings['num_workers']]
+
+    probe_prefetch_factor = DEFAULT_PREFETCH_FACTOR if settings['prefetch_factor'] == 'auto' \
+        else settings['prefetch_factor']
+
+    best_workers, best_throughput = candidate_workers[0], 0.0
+    for num_workers in candidate_workers:
+        loader_throughput = measure_loader_throughput(dataset, batch_size, num_workers,
+                                                      probe_prefetch_factor, n_batches,
+                                                      collate_fn, settings['multiprocessing_context'])
+        print(colored(f"DataLoader probe: {num_workers} workers deliver "
+                      f"{loader_throughput:.1f} samples/s, the model consumes "
+                      f"{model_throughput:.1f} samples/s.", 'cyan'))
+
+        if loader_throughput > best_throughput:
+            best_workers, best_throughput = num_workers, loader_throughput
+
+        if loader_throughput >= headroom * model_throughput:
+            best_workers, best_throughput = num_workers, loader_throughput
+            break
+
+    settings['num_workers'] = best_workers
+
+    if settings['prefetch_factor'] == 'auto':
+        if best_workers == 0 or math.isinf(best_throughput):
+            settings['prefetch_factor'] = DEFAULT_PREFETCH_FACTOR
+        else:
+            # Time one worker needs to produce a batch, in training steps
+            worker_batch_time = best_workers * batch_size / best_throughput
+            batches_in_flight = worker_batch_time / step_time
+            settings['prefetch_factor'] = min(
+                MAX_PREFETCH_FACTOR,
+                max(DEFAULT_PREFETCH_FACTOR, math.ceil(batches_in_flight / best_workers) + 1))
+
+    settings['model_samples_per_second'] = model_throughput
+    settings['loader_samples_per_second'] = best_throughput
+
+    return settings
+
+
+def get_autotuning_cache_key(configuration: dict,
+                             hyperparameters: dict,
+                             device: str,
+                             settings: dict) -> str:
+    """
+    Returns the key of the autotuned settings of a training: the host, the
+    dataset and its preprocessing, the model, the batch size, the device
+    and the requested settings. The folds are not part of the key, the
+    trainings of all the folds reuse the settings of the first probe.
+    """
+
+    return json.dumps({
+        'host': socket.gethostname(),
+        'dataset': configuration.get('packed_dataset_path', None) or
+                   configuration.get('path_metadata_csv', None),
+        'target_dimensions': configuration.get('target_dimensions', None),
+        'number_channels': configuration.get('number_channels', None),
+        'batch_preprocessing': configuration.get('batch_preprocessing', False),
+        'architecture': hyperparameters.get('architecture', None),
+        'batch_size': hyperparameters['batch_size'],
+        'device': str(device),
+        'num_workers': settings['num_workers'],
+        'prefetch_factor': settings['prefetch_factor'],
+    }, sort_keys=True, default=str)
+
+
+def read_autotuned_settings(cache_filepath: Path,
+                            cache_key: str,
+                            settings: dict) -> Optional[dict]:
+    """
+    Returns the settings with the values resolved by an earlier probe with
+    the same key, or None if there was none.
+
+    Args:
+        cache_filepath (Path): The cache file.
+        cache_key (str): The key from get_autotuning_cache_key.
+        settings (dict): The DataLoader settings from get_dataloader_settings.
+
+    Returns:
+        settings (dict): The resolved settings, or None.
+    """
+
+    if not cache_filepath.exists():
+        return None
+
+    try:
+        with open(cache_filepath, 'r', encoding="utf-8") as file_pointer:
+            cached_settings = json.load(file_pointer).get(cache_key)
+    except (OSError, json.JSONDecodeError) as e:
+        print(colored(f"Warning: unable to read '{cache_filepath}': {e}", 'yellow'))
+        return None
+
+    if cached_settings is None:
+        return None
+
+    print(colored(f"DataLoader settings of an earlier probe read from {cache_filepath}.", 'cyan'))
+
+    return dict(settings, **cached_settings)
+
+
+def save_autotuned_settings(cache_filepath: Path,
+                            cache_key: str,
+                            settings: dict):
+    """
+    Adds the resolved settings of a probe to the cache, under an
+    inter-process lock, as several trainings may share output_path.
+    """
+
+    cache_filepath.parent.mkdir(mode=0o775, parents=True, exist_ok=True)
+    lock_filepath = cache_filepath.with_name(cache_filepath.name + ".lock")
+
+    with fasteners.InterProcessLock(lock_filepath):
+        cache = {}
+        if cache_filepath.exists():
+            try:
+                with open(cache_filepath, 'r', encoding="utf-8") as file_pointer:
+                    cache = json.load(file_pointer)
+            except (OSError, json.JSONDecodeError):
+                cache = {}
+
+        cache[cache_key] = {key: settings[key] for key in AUTOTUNED_KEYS}
+
+        temporary_filepath = cache_filepath.with_name(f"{cache_filepath.name}.{uuid.uuid4().hex}.tmp")
+        with open(temporary_filepath, 'w', encoding="utf-8") as file_pointer:
+            json.dump(cache, file_pointer, indent=2)
+        os.replace(temporary_filepath, cache_filepath)
+
+
+def synchronize(device: Optional[str]):
+    """
+    Waits for the kernels of the device, so timings are accurate.
+    """
+
+    device_type = torch.device(device).type
+    if device_type == 'cuda':
+        torch.cuda.synchronize(device)
+    elif device_type == 'mps':
+        torch.mps.synchronize()
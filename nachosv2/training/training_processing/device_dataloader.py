@@ -0,0 +1,145 @@
+import math
+from typing import Optional, Callable, List
+from termcolor import colored
+
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+
+class BatchFilepaths():
+    def __init__(self,
+                 filepaths: List[str],
+                 batch_indices: torch.Tensor):
+        """
+        File paths of a batch, resolved only when they are read,
+        so the training loop does not synchronize with the device.
+
+        Args:
+            filepaths (list of str): The file paths of the whole partition.
+            batch_indices (torch.Tensor): The indices of the batch samples.
+        """
+        self.filepaths = filepaths
+        self.batch_indices = batch_indices
+
+    def __len__(self):
+        return len(self.batch_indices)
+
+    def __iter__(self):
+        return iter([self.filepaths[i] for i in self.batch_indices.tolist()])
+
+    def __getitem__(self, index):
+        return self.filepaths[int(self.batch_indices[index])]
+
+
+class DeviceDataLoader():
+    def __init__(self,
+                 dataset: Dataset,
+                 batch_size: int,
+                 device: str,
+                 shuffle: bool = False,
+                 drop_last: bool = False,
+                 transform: Optional[Callable] = None,
+                 num_workers: int = 0,
+                 multiprocessing_context: Optional[str] = None):
+        """
+        Loads a whole partition into device tensors once and serves batches
+        by indexing them, replacing the DataLoader for small 2D datasets.
+        Shuffling uses a permutation generated on the device and the
+        normalization is applied once on the device tensor.
+
+        Args:
+            dataset (Dataset): The dataset of the partition, without normalization.
+            batch_size (int): The batch size.
+            device (str): The execution device.
+            shuffle (bool): Whether to shuffle the samples every epoch. Default is False.
+            drop_last (bool): Whether to drop the last incomplete batch. Default is False.
+            transform (Callable): Transform applied to the whole image tensor, e.g. normalization. (Optional)
+            num_workers (int): Number of workers used to read the dataset once. Default is 0.
+            multiprocessing_context (str): The start method of the workers, e.g. 'forkserver'. (Optional)
+        """
+
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.device = device
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+        images_list = []
+        labels_list = []
+        self.filepaths = []
+
+        loading_dataloader = DataLoader(
+            dataset=dataset,
+            batch_size=max(batch_size, 256),
+            shuffle=False,
+            drop_last=False,
+            num_workers=num_workers,
+            multiprocessing_context=multiprocessing_context if num_workers > 0 else None
+        )
+
+        for images, labels, filepaths in loading_dataloader:
+            images_list.append(images)
+            labels_list.append(labels)
+            self.filepaths.extend(filepaths)
+
+        self.images = torch.cat(images_list).to(device)
+        self.labels = torch.cat(labels_list).to(device=device, dtype=torch.int64)
+
+        if transform:
+            self.images = transform(self.images)
+
+        size_mb = self.images.element_size() * self.images.nelement() / 1024**2
+        print(colored(f"Loaded {len(self.labels)} images ({size_mb:.1f} MB) on {device}.", 'cyan'))
+
+
+    def __len__(self):
+        """
+        Returns the number of batches.
+        """
+        n_samples = len(self.labels)
+        if self.drop_last:
+            return n_samples // self.batch_size
+        return math.ceil(n_samples / self.batch_size)
+
+
+    def __iter__(self):
+        n_samples = len(self.labels)
+
+        if self.shuffle:
+            order = torch.randperm(n_samples, device=self.device)
+        else:
+            order = torch.arange(n_samples, device=self.device)
+
+        for batch_index in range(len(self)):
+            batch_indices = order[batch_index * self.batch_size:
+                                  (batch_index + 1) * self.batch_size]
+
+            yield self.images.index_select(0, batch_indices), \
+                  self.labels.index_select(0, batch_indices), \
+                  BatchFilepaths(self.filepaths, batch_indices)
+
+
+def fits_on_device(dataset: Dataset,
+                   device: str,
+                   memory_fraction: float = 0.5) -> bool:
+    """
+    Checks if a dataset fits in the free memory of the device.
+
+    Args:
+        dataset (Dataset): The dataset to check.
+        device (str): The execution device.
+        memory_fraction (float): Maximum fraction of the free memory the dataset can use. Default is 0.5.
+
+    Returns:
+        bool: True if the dataset fits.
+    """
+
+    if torch.device(device).type != 'cuda':
+        # On CPU, the tensors live in host memory as with the DataLoader
+        return True
+
+    image, _, _ = dataset[0]
+    dataset_bytes = image.element_size() * image.nelement() * len(dataset)
+    free_bytes, _ = torch.cuda.mem_get_info(torch.device(device))
+
+    return dataset_bytes <= free_bytes * memory_fraction
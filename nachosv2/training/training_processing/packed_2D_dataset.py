@@ -0,0 +1,131 @@
+from pathlib import Path
+from typing import Optional, Callable, List
+import numpy as np
+import pandas as pd
+import yaml
+
+import torch
+from torch.utils.data import Dataset
+
+from nachosv2.data_processing.compact_file_list import CompactStringArray
+from nachosv2.data_processing.compact_file_list import get_label_array
+from nachosv2.data_processing.pack_dataset import PACKED_INFO_FILENAME
+from nachosv2.data_processing.pack_dataset import PACKED_INDEX_FILENAME
+
+
+class PackedDataset2D(Dataset):
+    def __init__(self,
+                 packed_directory: str,
+                 fold_list: List[str],
+                 number_channels: int,
+                 image_size: tuple = None,
+                 crop_box: tuple = None,
+                 transform: Optional[Callable] = None):
+        """
+        Initializes a dataset that reads preprocessed images from a packed
+        dataset created by NACHOSv2_pack_dataset.
+
+        The fold files are opened with np.memmap, so samples are read
+        without copies and the pages are shared between processes.
+
+        Args:
+            packed_directory (str): The folder of the packed dataset.
+            fold_list (list of str): The folds of the partition.
+            number_channels (int): The number of channels in an image.
+            image_size (tuple of int): The target height and width.
+            crop_box (tuple of int): The crop box, None if no cropping.
+            transform (Callable): Transform applied to each image tensor. (Optional)
+
+        Raises:
+            ValueError: If the packed dataset was created with other preprocessing
+                        parameters or does not contain a fold.
+        """
+
+        self.packed_directory = Path(packed_directory)
+        self.transform = transform
+
+        with open(self.packed_directory / PACKED_INFO_FILENAME, 'r', encoding='utf-8') as f:
+            self.packed_info = yaml.safe_load(f)
+
+        expected_parameters = {
+            "number_channels": number_channels,
+            "image_size": list(image_size) if image_size else None,
+            "crop_box": list(crop_box) if crop_box else None,
+        }
+        for key, expected_value in expected_parameters.items():
+            if self.packed_info[key] != expected_value:
+                raise ValueError(f"The packed dataset at {self.packed_directory} was created with "
+                                 f"{key}={self.packed_info[key]}, but the training uses {expected_value}. "
+                                 "Run NACHOSv2_pack_dataset again with the training parameters.")
+
+        self.fold_list = [str(fold) for fold in fold_list]
+        for fold in self.fold_list:
+            if fold not in self.packed_info["folds"]:
+                raise ValueError(f"Fold {fold} is not in the packed dataset at {self.packed_directory}.")
+
+        df_index = pd.read_csv(self.packed_directory / PACKED_INDEX_FILENAME,
+                               dtype={"fold_name": str})
+        df_index = df_index[df_index["fold_name"].isin(self.fold_list)]
+
+        # Keeps the fold order of fold_list
+        fold_position = {fold: i for i, fold in enumerate(self.fold_list)}
+        self.fold_indices = df_index["fold_name"].map(fold_position).to_numpy(dtype=np.int16)
+        order = np.argsort(self.fold_indices, kind="stable")
+
+        self.fold_indices = self.fold_indices[order]
+        self.offsets = df_index["offset"].to_numpy(dtype=np.int64)[order]
+        self.labels = get_label_array(df_index["label"].to_numpy()[order])
+        self.filepaths = CompactStringArray(df_index["absolute_filepath"].to_numpy()[order])
+
+        # Memory maps are opened lazily in each process
+        self.fold_arrays = None
+
+
+    def __getstate__(self):
+        # DataLoader workers open their own memory maps
+        state = self.__dict__.copy()
+        state["fold_arrays"] = None
+        return state
+
+
+    def _open_fold_arrays(self):
+        """
+        Opens the fold files as copy-on-write memory maps.
+        """
+        self.fold_arrays = [
+            np.load(self.packed_directory / self.packed_info["folds"][fold]["filename"],
+                    mmap_mode='c')
+            for fold in self.fold_list]
+
+
+    def __len__(self):
+        """
+        Returns the dataset len.
+        """
+
+        return len(self.offsets)
+
+
+    def __getitem__(self, index):
+        """
+        Retrieves a single sample from the dataset given an index.
+
+        Args:
+            index (int): The index of a sample in the dataset.
+
+        Returns:
+            image (PyTorch tensor): The sample from the dataset.
+            label (int): The label of the sample.
+            filepath (str): The file path of the original image.
+        """
+
+        if self.fold_arrays is None:
+            self._open_fold_arrays()
+
+        fold_array = self.fold_arrays[self.fold_indices[index]]
+        image = torch.from_numpy(fold_array[self.offsets[index]])
+
+        if self.transform:
+            image = self.transform(image)
+
+        return image, int(self.labels[index]), self.filepaths[index]
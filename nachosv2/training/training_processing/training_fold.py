@@ -1,5 +1,6 @@
 import random
 import os
+import functools
 from collections import OrderedDict
 from typing import Optional, Callable, Union, Tuple, List
 from pathlib import Path
@@ -10,8 +11,7 @@ from datetime import datetime
 # from tqdm import tqdm
 # import torch
 import torch
-# from torch.cuda.amp import autocast, GradScaler
-from torch import autocast, GradScaler
+from torch import GradScaler
 from torch.optim import lr_scheduler
 from torch.utils.data import DataLoader, Subset
 from torch.utils.tensorboard import SummaryWriter
@@ -20,25 +20,63 @@ import torch.optim as optim
 from torchvision import transforms
 
 from nachosv2.training.training_processing.custom_2D_dataset import Dataset2D
+from nachosv2.training.training_processing.custom_2D_dataset import DecodedDataset2D
+from nachosv2.training.training_processing.packed_2D_dataset import PackedDataset2D
+from nachosv2.training.training_processing.device_dataloader import DeviceDataLoader
+from nachosv2.training.training_processing.device_dataloader import fits_on_device
+from nachosv2.training.training_processing.dataloader_settings import get_dataloader_settings
+from nachosv2.training.training_processing.dataloader_settings import get_dataloader_kwargs
+from nachosv2.training.training_processing.dataloader_settings import needs_autotuning
+from nachosv2.training.training_processing.dataloader_settings import autotune_dataloader_settings
+from nachosv2.training.training_processing.dataloader_settings import AUTOTUNING_CACHE_FILENAME
+from nachosv2.training.training_processing.dataloader_settings import get_autotuning_cache_key
+from nachosv2.training.training_processing.dataloader_settings import read_autotuned_settings
+from nachosv2.training.training_processing.dataloader_settings import save_autotuned_settings
+from nachosv2.data_processing.preprocessed_cache import create_preprocessed_cache
+from nachosv2.data_processing.channel_statistics import ChannelStatistics
+from nachosv2.data_processing.channel_statistics import FoldStatisticsCache
+from nachosv2.data_processing.channel_statistics import compute_channel_statistics
+from nachosv2.data_processing.compact_file_list import create_compact_partition
+from nachosv2.data_processing.fold_index import FoldIndex
 from nachosv2.image_processing.image_crop import create_crop_box
+from nachosv2.image_processing.batch_preprocessing import BatchPreprocessor
+from nachosv2.image_processing.batch_preprocessing import BatchPreprocessingDataLoader
+from nachosv2.image_processing.batch_preprocessing import collate_decoded_images
 # from nachosv2.image_processing.image_parser import *
 from nachosv2.checkpoint_processing.checkpointer import Checkpointer
+from nachosv2.checkpoint_processing.async_checkpoint_writer import AsyncCheckpointWriter
+from nachosv2.checkpoint_processing.async_checkpoint_writer import snapshot_to_host
+from nachosv2.checkpoint_processing.checkpoint_manifest import CheckpointManifest
+from nachosv2.checkpoint_processing.checkpoint_manifest import RESUME_ROLES
+from nachosv2.checkpoint_processing.checkpoint_manifest import create_checkpoint_folder
+from nachosv2.checkpoint_processing.checkpoint_manifest import has_manifests_marker
+from nachosv2.checkpoint_processing.checkpoint_store import COMPACT_CHECKPOINT_SUFFIX
+from nachosv2.checkpoint_processing.checkpoint_store import CompactCheckpointStore
+from nachosv2.checkpoint_processing.checkpoint_store import load_checkpoint_file
+from nachosv2.checkpoint_processing.checkpoint_store import load_model_state_dict
 from nachosv2.checkpoint_processing.delete_log import delete_log_file
 from nachosv2.checkpoint_processing.read_log import read_item_list_in_log
 from nachosv2.checkpoint_processing.load_save_metadata_checkpoint import save_metadata_checkpoint
 # from nachosv2.model_processing.save_model import save_model
 from nachosv2.modules.timer.precision_timer import PrecisionTimer
 from nachosv2.output_processing.result_outputter import predict_and_save_results
+from nachosv2.model_processing.mixed_precision import get_autocast_context
+from nachosv2.model_processing.mixed_precision import get_autocast_dtype
+from nachosv2.model_processing.mixed_precision import get_device_type
+from nachosv2.model_processing.mixed_precision import needs_gradient_scaling
 from nachosv2.model_processing.initialize_model_weights import initialize_model_weights        
 from nachosv2.model_processing.create_model import create_model
 from nachosv2.model_processing.get_metrics_dictionary import get_metrics_dictionary
 from nachosv2.modules.optimizer.optimizer_creator import create_optimizer
 from nachosv2.modules.early_stopping.earlystopping import EarlyStopping
 from nachosv2.output_processing.result_outputter import save_dict_to_csv
+from nachosv2.output_processing.result_outputter import get_prefix_and_folder_path
+from nachosv2.output_processing.metrics_logger import MetricsLogger
+from nachosv2.output_processing.metrics_logger import read_metrics_csv
 from nachosv2.setup.utils_training import create_empty_history
 from nachosv2.setup.utils_training import create_empty_learning_rate_freq_step_history
 from nachosv2.setup.utils_training import get_files_labels
-from nachosv2.setup.utils_training import get_mean_stddev
+from nachosv2.setup.utils_training import get_files_labels_for_fold
 from nachosv2.setup.learning_rate_scheduler import get_lr_scheduler
 
 
@@ -55,7 +93,9 @@ class TrainingFold():
         use_mixed_precision: bool = False,
         is_cv_loop: bool = False,
         is_3d: bool = False,
-        is_verbose_on: bool = False
+        is_verbose_on: bool = False,
+        epoch_budget: Optional[int] = None,
+        fold_index: Optional[FoldIndex] = None
     ):
         """ Initializes a training fold object.
 
@@ -71,6 +111,11 @@ class TrainingFold():
             mpi_rank (int): An optional value of some MPI rank. Default is none. (Optional)
             is_outer_loop (bool): If this is of the outer loop. Default is false. (Optional)
             is_verbose_on (bool): If the verbose mode is activated. Default is false. (Optional)
+            epoch_budget (int): Number of epochs to train to in this run, fewer than n_epochs
+                with successive halving. The training resumes from its checkpoint
+                when given a larger budget. Default is n_epochs. (Optional)
+            fold_index (FoldIndex): The fold index of df_metadata, shared by the
+                trainings of the sweep. Built from df_metadata if not given. (Optional)
         """
 
         self.training_index = training_index
@@ -92,8 +137,11 @@ class TrainingFold():
 
         self.training_folds_list = training_folds_list
         self.df_metadata = df_metadata
+        self.fold_index = fold_index if fold_index is not None else FoldIndex(df_metadata)
         # hyperparameter
         self.number_of_epochs = self.hyperparameters["n_epochs"]
+        self.stop_epoch = self.number_of_epochs if epoch_budget is None else \
+                          min(epoch_budget, self.number_of_epochs)
         self.metrics_dictionary = get_metrics_dictionary(self.configuration['metrics_list'])
         
         # https://pytorch.org/docs/stable/generated/torch.nn.CrossEntropyLoss.html
@@ -124,9 +172,27 @@ class TrainingFold():
             ]
             )
         self.use_mixed_precision = use_mixed_precision
+        self.autocast_dtype = None
+        if use_mixed_precision:
+            self.autocast_dtype = get_autocast_dtype(
+                execution_device,
+                configuration.get('mixed_precision_dtype', 'auto'))
+            if self.autocast_dtype is None:
+                print(colored(f"Warning: mixed precision is not supported on '{execution_device}', " + \
+                              "using float32.", 'yellow'))
+                self.use_mixed_precision = False
         self.is_3d = is_3d
         self.do_normalize_2d = do_normalize_2d
         self.do_shuffle_the_images = configuration["do_shuffle_the_images"]
+        # Cache of decoded, cropped and resized images shared across
+        # epochs, folds and processes. None if not enabled.
+        self.preprocessed_cache = create_preprocessed_cache(configuration)
+        # Hits and misses of the training, collected when it finishes
+        self.preprocessed_cache_statistics = {"hits": 0, "misses": 0, "hit_rate": 0.0}
+        self.dataloader_settings = get_dataloader_settings(configuration,
+                                                           execution_device)
+        self.history_logger = None
+        self.lr_history_logger = None
 
         if self.hyperparameters["do_cropping"]:
             self.crop_box = create_crop_box(
@@ -141,7 +207,23 @@ class TrainingFold():
 
         loop_folder = 'CV' if self.is_cv_loop else 'CT'
         self.checkpoint_folder_path = Path(self.configuration['output_path']) / loop_folder /'checkpoints'
+        self.checkpoint_manifest = CheckpointManifest(self.checkpoint_folder_path,
+                                                      self.prefix_name,
+                                                      configuration.get('checkpoint_verification', 'size_mtime'))
+        # Weights and optimizer state as deduplicated blobs, histories as JSON
+        self.checkpoint_store = None
+        self.checkpoint_suffix = ".pth"
+        if configuration.get('compact_checkpoints', False):
+            self.checkpoint_store = CompactCheckpointStore(
+                self.checkpoint_folder_path,
+                self.prefix_name,
+                configuration.get('checkpoint_weights_dtype', 'float32'))
+            self.checkpoint_suffix = COMPACT_CHECKPOINT_SUFFIX
+        self.checkpoint_writer = AsyncCheckpointWriter(
+            enabled=configuration.get('async_checkpointing', True),
+            store=self.checkpoint_store)
         self.start_epoch = 0
+        self.epochs_completed = 0
 
         # self.prev_checkpoint_file_path = None
         # self.prev_checkpoint_file_path_backup = None
@@ -150,6 +232,15 @@ class TrainingFold():
         self.last_checkpoint_file_path = None
         self.last_checkpoint_file_path_backup = None
 
+        # Weights used for the predictions, kept in host memory within the budget
+        # so that they are not reloaded from the checkpoint file
+        self.prediction_weights_budget_bytes = \
+            configuration.get('best_model_memory_budget_gb', 2) * 1e9
+        self.prediction_weights_path = None
+        self.prediction_weights_epoch = None
+        self.prediction_state_dict = None
+        self.model_epoch_index = None
+
         # TODO: verify it doesnt contradict with prefix
         if is_cv_loop: 
             new_job_name = f"{configuration['job_name']}_test_{self.test_fold}"+ \
@@ -173,14 +264,17 @@ class TrainingFold():
         if not all(val_col in self.df_metadata.columns.to_list() for val_col in l_columns):
             raise ValueError(f"The columns {l_columns} must be in csv_metadata file.")
 
+        # Stored as byte buffers and small integer arrays, which DataLoader
+        # workers read without copying the pages of the training process
         for partition, value_dict in self.partitions_info_dict.items():
-            value_dict['files'], value_dict['labels'] = get_files_labels(
+            value_dict['files'], value_dict['labels'] = create_compact_partition(*get_files_labels(
                 partition,
                 self.df_metadata,
                 self.test_fold,
                 self.validation_fold,
-                self.training_folds_list
-            )
+                self.training_folds_list,
+                self.fold_index
+            ))
 
 
     def create_model(self):
@@ -209,6 +303,19 @@ class TrainingFold():
         Training itself depends on the state of the training fold.
         Checks for insufficient dataset.
         """
+        # Creates the datasets and trains them (Datasets cannot be logged.)
+        if self.prepare():
+            self.train()
+            self.finish()
+
+
+    def prepare(self) -> bool:
+        """
+        Creates the model, optimizer, learning rate scheduler and datasets.
+
+        Returns:
+            bool: False if the datasets could not be created.
+        """
         self.get_dataset_info()
         self.create_model()
         self.optimizer = create_optimizer(self.model,
@@ -231,16 +338,38 @@ class TrainingFold():
         #                                                       verbose='deprecated')
         
         # self.save_state()
-        # Creates the datasets and trains them (Datasets cannot be logged.)
-        if self.create_dataset():
-            self.fold_timer = PrecisionTimer()
-            self.training_already_finished = False
-            self.train()
-            if self.training_already_finished:
-                self.time_elapsed = self.fold_timer.additional_time
-            else:
-                self.time_elapsed = self.fold_timer.get_elapsed_time() 
-            self.process_results()
+        return self.create_dataset()
+
+
+    def finish(self):
+        """
+        Writes the pending metrics and checkpoints, and the predictions,
+        then releases the DataLoaders.
+        """
+        if self.training_already_finished:
+            self.time_elapsed = self.fold_timer.additional_time
+        else:
+            self.time_elapsed = self.fold_timer.get_elapsed_time() 
+        # The best checkpoint must be on disk before the predictions
+        self.flush_metrics_loggers()
+        self.checkpoint_writer.close()
+        self.process_results()
+        self.release_dataloaders()
+
+        if self.preprocessed_cache is not None:
+            self.preprocessed_cache_statistics = self.preprocessed_cache.print_statistics()
+
+
+    def release_dataloaders(self):
+        """
+        Drops the DataLoaders of the partitions once the predictions are
+        saved. Their persistent workers exit with them, and save their
+        preprocessed cache counts, and the datasets on the device are
+        freed before the next training. create_dataset creates them again.
+        """
+
+        for partition_info in self.partitions_info_dict.values():
+            partition_info['dataloader'] = None
 
 
     def load_state(self):
@@ -303,29 +432,8 @@ class TrainingFold():
                 transform = None
 
                 if self.do_normalize_2d:
-                    dataset_before_normalization = Dataset2D(
-                        dictionary_partition=self.partitions_info_dict[partition],
-                        number_channels=self.configuration['number_channels'],
-                        image_size=(self.configuration['target_dimensions'][0],
-                                    self.configuration['target_dimensions'][1]),
-                        do_cropping=self.hyperparameters['do_cropping'],
-                        crop_box=self.crop_box,
-                        transform=None
-                    )
+                    mean, stddev = self.get_training_mean_stddev()
 
-                    dataloader = DataLoader(
-                        dataset=dataset_before_normalization,
-                        batch_size=self.hyperparameters['batch_size'],
-                        shuffle=False,
-                        drop_last=drop_residual,
-                        num_workers=0  # Default
-                    )
-
-                    mean, stddev = get_mean_stddev(
-                        number_channels=self.configuration['number_channels'],
-                        dataloader=dataloader,
-                        device=self.execution_device)
-                    
                     mean_stddev_dict = {
                         "mean": [mean],
                         "stddev": [stddev]
@@ -354,19 +462,72 @@ class TrainingFold():
                 # TODO
 
             else:
-                dataset = Dataset2D(
-                    dictionary_partition=self.partitions_info_dict[partition], # The data dictionary
-                    number_channels=self.configuration['number_channels'],      # The number of channels in an image
-                    image_size=(self.configuration['target_dimensions'][0], self.configuration['target_dimensions'][1]),
-                    do_cropping=self.hyperparameters['do_cropping'],              # Whether to crop the image
-                    crop_box=self.crop_box,                                       # The dimensions after cropping
-                    transform=transform
-                )
+                if self.use_batch_preprocessing(partition):
+                    # Workers only decode, the preprocessing is done on whole batches
+                    dataset = DecodedDataset2D(self.partitions_info_dict[partition])
+                elif self.use_dataset_on_device(partition):
+                    # Normalization is applied once on the device tensor
+                    dataset = self.create_partition_dataset(partition, None)
+                else:
+                    dataset = self.create_partition_dataset(partition, transform)
+
+            if self.use_batch_preprocessing(partition):
+                preprocessor = self.create_batch_preprocessor(partition, transform)
+                collate_fn = collate_decoded_images
+            else:
+                preprocessor = None
+                collate_fn = None
+
+            if partition == "training" and needs_autotuning(self.dataloader_settings):
+                # The probe is run once per host, dataset and batch size
+                cache_filepath = Path(self.configuration['output_path']) / AUTOTUNING_CACHE_FILENAME
+                cache_key = get_autotuning_cache_key(self.configuration,
+                                                     self.hyperparameters,
+                                                     self.execution_device,
+                                                     self.dataloader_settings)
+                cached_settings = read_autotuned_settings(cache_filepath, cache_key,
+                                                          self.dataloader_settings)
+
+                if cached_settings is not None:
+                    self.dataloader_settings = cached_settings
+                else:
+                    sample_image = None
+                    if preprocessor:
+                        sample_image = preprocessor(collate_fn([dataset[0]])[0])[0]
+
+                    self.dataloader_settings = autotune_dataloader_settings(
+                        settings=self.dataloader_settings,
+                        dataset=dataset,
+                        model=self.model,
+                        loss_function=self.loss_function,
+                        batch_size=self.hyperparameters['batch_size'],
+                        device=self.execution_device,
+                        sample_image=sample_image,
+                        collate_fn=collate_fn)
+                    save_autotuned_settings(cache_filepath, cache_key, self.dataloader_settings)
 
             # TODO verify the shuffle           
             # Shuffles the images
             do_shuffle = self.determine_shuffle_dataset(partition)
 
+            if self.use_dataset_on_device(partition):
+                if fits_on_device(dataset, self.execution_device):
+                    self.partitions_info_dict[partition]['dataloader'] = DeviceDataLoader(
+                        dataset=dataset,
+                        batch_size=self.hyperparameters['batch_size'],
+                        device=self.execution_device,
+                        shuffle=do_shuffle,
+                        drop_last=drop_residual,
+                        transform=transform,
+                        num_workers=self.dataloader_settings['num_workers'],
+                        multiprocessing_context=self.dataloader_settings['multiprocessing_context']
+                    )
+                    continue
+
+                print(colored(f"Warning: the {partition} partition does not fit in the memory "
+                              f"of {self.execution_device}. A DataLoader is used instead.", 'yellow'))
+                dataset.transform = transform
+
             # Apply normalization to the dataset
 
             # Creates dataloader
@@ -375,18 +536,251 @@ class TrainingFold():
                 batch_size=self.hyperparameters['batch_size'],
                 shuffle=do_shuffle,
                 drop_last=drop_residual,
-                num_workers=4
+                collate_fn=collate_fn,
+                **get_dataloader_kwargs(self.dataloader_settings)
             )
 
+            if preprocessor:
+                dataloader = BatchPreprocessingDataLoader(dataloader,
+                                                          preprocessor,
+                                                          self.execution_device)
+
             # Adds the dataloader to the dictionary
             self.partitions_info_dict[partition]['dataloader'] = dataloader
 
+        print(colored(f"DataLoader settings: {self.dataloader_settings}", 'cyan'))
+        save_dict_to_csv(
+            dictionary={key: [value] for key, value in self.dataloader_settings.items()},
+            output_path=Path(self.configuration['output_path']),
+            test_fold=self.test_fold,
+            hp_config_index=self.hp_config_index,
+            validation_fold=self.validation_fold,
+            is_cv_loop=self.is_cv_loop,
+            suffix='dataloader_settings',
+            verbose=False,
+        )
+
         # If the datasets are empty, cannot train
         _is_dataset_created = self._check_create_dataset()
 
         return _is_dataset_created
 
 
+    def use_dataset_on_device(self, partition: str) -> bool:
+        """
+        Determines if a partition is loaded in device memory, which is
+        enabled with 'dataset_on_device' in the configuration.
+        Only the training and validation partitions of 2D datasets are loaded.
+
+        Args:
+            partition (str): The partition ('training', 'validation' or 'test').
+
+        Returns:
+            bool: True if the partition is loaded in device memory.
+        """
+
+        return self.configuration.get('dataset_on_device', False) and \
+            not self.is_3d and \
+            partition in ['training', 'validation']
+
+
+    def use_batch_preprocessing(self, partition: str) -> bool:
+        """
+        Determines if a partition is preprocessed by batches, which is
+        enabled with 'batch_preprocessing' in the configuration.
+        The packed dataset and the device-resident partitions are already
+        preprocessed, so they do not use it.
+
+        Args:
+            partition (str): The partition ('training', 'validation' or 'test').
+
+        Returns:
+            bool: True if the images are preprocessed by batches.
+        """
+
+        return self.configuration.get('batch_preprocessing', False) and \
+            not self.is_3d and \
+            not self.configuration.get('packed_dataset_path', None) and \
+            not self.use_dataset_on_device(partition)
+
+
+    def create_batch_preprocessor(self,
+                                  partition: str,
+                                  transform: Optional[Callable] = None) -> BatchPreprocessor:
+        """
+        Creates the batch preprocessor of a partition. The augmentations of
+        'batch_augmentation' in the configuration are only applied to training.
+
+        Args:
+            partition (str): The partition ('training', 'validation' or 'test').
+            transform (Callable): Transform applied to the batch, e.g. normalization. (Optional)
+
+        Returns:
+            BatchPreprocessor: The preprocessor.
+        """
+
+        augmentation = self.configuration.get('batch_augmentation', None) or {}
+        if partition != 'training':
+            augmentation = {}
+
+        return BatchPreprocessor(
+            number_channels=self.configuration['number_channels'],
+            image_size=(self.configuration['target_dimensions'][0],
+                        self.configuration['target_dimensions'][1]),
+            crop_box=self.crop_box if self.hyperparameters['do_cropping'] else None,
+            transform=transform,
+            horizontal_flip_probability=augmentation.get('horizontal_flip', 0.0),
+            vertical_flip_probability=augmentation.get('vertical_flip', 0.0))
+
+
+    def get_training_mean_stddev(self):
+        """
+        Gets the mean and standard deviation of the training partition by
+        merging the statistics of each training fold. The statistics of a
+        fold are computed once and stored in 'normalization_statistics_path'
+        (default: output_path/normalization_statistics), so other test
+        folds, validation folds and hyperparameter configurations reuse them.
+
+        Returns:
+            mean (float or list of float): The mean of each channel.
+            stddev (float or list of float): The standard deviation of each channel.
+        """
+
+        statistics_directory = self.configuration.get(
+            'normalization_statistics_path',
+            Path(self.configuration['output_path']) / 'normalization_statistics')
+        statistics_cache = FoldStatisticsCache(statistics_directory)
+
+        image_size = (self.configuration['target_dimensions'][0],
+                      self.configuration['target_dimensions'][1])
+        crop_box = self.crop_box if self.hyperparameters['do_cropping'] else None
+        packed_dataset_path = self.configuration.get('packed_dataset_path', None)
+
+        training_statistics = ChannelStatistics(self.configuration['number_channels'])
+
+        for fold in self.training_folds_list:
+            fold_files, fold_labels = get_files_labels_for_fold(self.df_metadata, fold, self.fold_index)
+
+            if packed_dataset_path:
+                source_identifier = str(Path(packed_dataset_path).resolve())
+            else:
+                source_identifier = "\n".join(fold_files)
+
+            key = statistics_cache.get_key(fold, source_identifier,
+                                           self.configuration['number_channels'],
+                                           image_size, crop_box)
+            fold_statistics = statistics_cache.load(key)
+
+            if fold_statistics is None:
+                print(colored(f"Calculating the normalization statistics of fold {fold}.", 'cyan'))
+                dictionary_fold = {'files': fold_files, 'labels': fold_labels}
+
+                if self.use_batch_preprocessing('training'):
+                    dataloader = BatchPreprocessingDataLoader(
+                        DataLoader(
+                            dataset=DecodedDataset2D(dictionary_fold),
+                            batch_size=self.hyperparameters['batch_size'],
+                            shuffle=False,
+                            drop_last=False,
+                            collate_fn=collate_decoded_images,
+                            num_workers=0  # Default
+                        ),
+                        BatchPreprocessor(self.configuration['number_channels'],
+                                          image_size, crop_box),
+                        self.execution_device)
+                else:
+                    dataset = self.create_folds_dataset(
+                        fold_list=[fold],
+                        dictionary_partition=dictionary_fold)
+
+                    dataloader = DataLoader(
+                        dataset=dataset,
+                        batch_size=self.hyperparameters['batch_size'],
+                        shuffle=False,
+                        drop_last=False,
+                        num_workers=0  # Default
+                    )
+
+                fold_statistics = compute_channel_statistics(
+                    dataloader,
+                    self.configuration['number_channels'],
+                    self.execution_device)
+                statistics_cache.save(key, fold_statistics)
+
+            training_statistics = training_statistics.merge(fold_statistics)
+
+        return training_statistics.get_mean_stddev()
+
+
+    def create_partition_dataset(self,
+                                 partition: str,
+                                 transform: Optional[Callable] = None):
+        """
+        Creates the 2D dataset of a partition.
+
+        Args:
+            partition (str): The partition ('training', 'validation' or 'test').
+            transform (Callable): Transform applied to each image tensor. (Optional)
+
+        Returns:
+            Dataset: The dataset of the partition.
+        """
+
+        partition_folds = {
+            'training': self.training_folds_list,
+            'validation': [self.validation_fold],
+            'test': [self.test_fold],
+        }
+
+        return self.create_folds_dataset(
+            fold_list=partition_folds[partition],
+            dictionary_partition=self.partitions_info_dict[partition],
+            transform=transform)
+
+
+    def create_folds_dataset(self,
+                             fold_list: List[str],
+                             dictionary_partition: dict,
+                             transform: Optional[Callable] = None):
+        """
+        Creates the 2D dataset of a list of folds. If 'packed_dataset_path' is set
+        in the configuration, images are read from the packed dataset,
+        otherwise they are decoded from the files in the metadata.
+
+        Args:
+            fold_list (list of str): The folds of the dataset.
+            dictionary_partition (dict): The files and labels of the folds.
+            transform (Callable): Transform applied to each image tensor. (Optional)
+
+        Returns:
+            Dataset: The dataset of the folds.
+        """
+
+        image_size = (self.configuration['target_dimensions'][0],
+                      self.configuration['target_dimensions'][1])
+        packed_dataset_path = self.configuration.get('packed_dataset_path', None)
+
+        if packed_dataset_path:
+            return PackedDataset2D(
+                packed_directory=packed_dataset_path,
+                fold_list=fold_list,
+                number_channels=self.configuration['number_channels'],
+                image_size=image_size,
+                crop_box=self.crop_box if self.hyperparameters['do_cropping'] else None,
+                transform=transform
+            )
+
+        return Dataset2D(
+            dictionary_partition=dictionary_partition,                    # The data dictionary
+            number_channels=self.configuration['number_channels'],      # The number of channels in an image
+            image_size=image_size,
+            do_cropping=self.hyperparameters['do_cropping'],              # Whether to crop the image
+            crop_box=self.crop_box,                                       # The dimensions after cropping
+            transform=transform,
+            cache=self.preprocessed_cache
+        )
+
+
     def _residual_compute_and_decide(self) -> bool:
         """
         Calculates the residual and choses to use it or not.
@@ -465,12 +859,46 @@ class TrainingFold():
     def process_one_epoch(self, epoch_index, partition):
 
         # Defines the data loader
-        data_loader = self.get_dataloader(partition)
+        data_loader = self.begin_partition_epoch(epoch_index, partition)
         
         # Initializations
         running_loss = 0.0
         running_corrects = 0
 
+        # Iterates over data
+        for i, (inputs, labels, _ ) in enumerate(data_loader):
+            print(f"Epoch: {epoch_index+1} of {self.number_of_epochs}. {partition} Progress: {(i+1)/len(data_loader)*100:.1f}% Step:{i+1}/{len(data_loader)}\r",
+                  end="")
+            if i == len(data_loader) - 1:
+                print()
+            # Runs the fit loop
+            loss_update, corrects_update = self.process_batch(
+                partition, inputs, labels,
+                self.use_mixed_precision
+            )
+
+            if partition == "training":
+                self.end_training_step(epoch_index, i, len(data_loader))
+
+            # # Create file with loss and accuracy for the current batch
+            # self.history[f'{partition}_loss'].append(loss_update)
+            
+
+            running_loss += loss_update
+            running_corrects += corrects_update
+
+        self.end_partition_epoch(epoch_index, partition, data_loader,
+                                 running_loss, running_corrects)
+
+
+    def begin_partition_epoch(self, epoch_index, partition):
+        """
+        Sets the mode of the model for a partition and returns its data loader.
+        """
+
+        # Defines the data loader
+        data_loader = self.get_dataloader(partition)
+
         self.all_labels = []
         self.all_predictions = []
 
@@ -488,43 +916,29 @@ class TrainingFold():
             # statistics for batch normalization.
             self.model.eval()
 
+        return data_loader
 
 
-        # Iterates over data
-        for i, (inputs, labels, _ ) in enumerate(data_loader):
-            print(f"Epoch: {epoch_index+1} of {self.number_of_epochs}. {partition} Progress: {(i+1)/len(data_loader)*100:.1f}% Step:{i+1}/{len(data_loader)}\r",
-                  end="")
-            if i == len(data_loader) - 1:
-                print()
-            # Runs the fit loop
-            loss_update, corrects_update = self.process_batch(
-                partition, inputs, labels,
-                self.use_mixed_precision
-            )
-
-            if partition == "training" and self.scheduler_update_frequency == "step" :
-                self.lr_history['epoch'].append(epoch_index+1)
-                self.lr_history['step'].append(i + 1 + epoch_index * len(data_loader))
-                self.lr_history['learning_rate'].append(self.scheduler.get_last_lr()[0])
-                save_dict_to_csv(
-                    dictionary=self.lr_history,
-                    output_path=Path(self.configuration['output_path']),
-                    test_fold=self.test_fold,
-                    hp_config_index=self.hp_config_index,
-                    validation_fold=self.validation_fold,
-                    is_cv_loop=self.is_cv_loop,
-                    suffix='lr_history',
-                    verbose=False,
-                )
-                self.scheduler.step()
+    def end_training_step(self, epoch_index, step_index, n_steps):
+        """
+        Logs the learning rate and steps the scheduler after an optimizer step,
+        if the learning rate is updated per step.
+        """
 
-            # # Create file with loss and accuracy for the current batch
-            # self.history[f'{partition}_loss'].append(loss_update)
-            
+        if self.scheduler_update_frequency == "step" :
+            self.lr_history_logger.append({
+                'epoch': epoch_index+1,
+                'step': step_index + 1 + epoch_index * n_steps,
+                'learning_rate': self.scheduler.get_last_lr()[0]})
+            self.scheduler.step()
 
-            running_loss += loss_update
-            running_corrects += corrects_update
 
+    def end_partition_epoch(self, epoch_index, partition, data_loader,
+                            running_loss, running_corrects):
+        """
+        Saves the loss and accuracy of the partition for the epoch,
+        and the checkpoints.
+        """
 
         # Calculates the loss and accuracy for the epoch and adds them to the history
         epoch_loss, epoch_accuracy = self.calculate_metrics_for_epoch(data_loader,
@@ -537,17 +951,9 @@ class TrainingFold():
 
         # it saves history when partition is validation
         # or when not self.is_cv_loop, that is, cross-testing loop
-        if partition == 'validation' or not self.is_cv_loop:           
-            save_dict_to_csv(
-                dictionary=self.history,
-                output_path=Path(self.configuration['output_path']),
-                test_fold=self.test_fold,
-                hp_config_index=self.hp_config_index,
-                validation_fold=self.validation_fold,
-                is_cv_loop=self.is_cv_loop,
-                suffix='history',
-                verbose=True,
-                )
+        if partition == 'validation' or not self.is_cv_loop:
+            self.history_logger.append(
+                {key: values[-1] for key, values in self.history.items()})
 
         # Saves model
         if partition == 'validation':
@@ -584,8 +990,29 @@ class TrainingFold():
         """
         Fits the model.
         """
+        if not self.prepare_training():
+            return
+
+        # For each epoch
+        for epoch in range(self.start_epoch, self.stop_epoch):
+            if self.run_epoch(epoch):
+                print("Early stopping")
+                break
+
+
+    def prepare_training(self) -> bool:
+        """
+        Loads the last checkpoint if there is one and initializes the history.
+
+        Returns:
+            bool: False if the training was already finished.
+        """
+        self.fold_timer = PrecisionTimer()
+        self.training_already_finished = False
+
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        self.writer = SummaryWriter(log_dir=f'runs/nachosv2_{timestamp}')
+        # Trainings started in the same second, e.g. concurrent ones, get their own folder
+        self.writer = SummaryWriter(log_dir=f'runs/nachosv2_{timestamp}_{self.prefix_name}')
         # TODO: get history if interruped by reading file
         checkpoint = self.load_checkpoint()
         # verify is less than the expected 
@@ -619,38 +1046,104 @@ class TrainingFold():
                                                 counter=self.counter_early_stopping,
                                                 best_val_loss=self.best_valid_loss)    
 
-        self.scaler = GradScaler() if self.use_mixed_precision else None
+        self.create_metrics_loggers()
+
+        # Loss scaling is only needed with float16 on GPU, it does nothing otherwise
+        self.scaler = GradScaler(get_device_type(self.execution_device),
+                                 enabled=needs_gradient_scaling(self.execution_device,
+                                                                self.autocast_dtype)) \
+            if self.use_mixed_precision else None
+
+        self.epochs_completed = self.start_epoch
 
         if self.counter_early_stopping == self.hyperparameters['patience']:
             print("Checkpoint loades is already done due to Early stopping, exiting training")
             self.training_already_finished = True
-            return
+            return False
 
-        # For each epoch
-        for epoch in range(self.start_epoch, self.number_of_epochs):
+        return True
+
+
+    def run_epoch(self,
+                  epoch: int,
+                  is_training_done: bool = False) -> bool:
+        """
+        Runs one epoch on the partitions.
+
+        Args:
+            epoch (int): The epoch index.
+            is_training_done (bool): If the training partition of this epoch was
+                already processed, e.g. by VectorizedTrainingFolds. Default is False.
+
+        Returns:
+            bool: True if the training stops early.
+        """
+        if not is_training_done:
             # Prints the current epoch
             print('-' * 60)
             print(f'Epoch {epoch + 1}/{self.number_of_epochs}')
-            # Defines the list of partitions
-            # AHPO/CV: ["training", "validation"]
-            # Cross-testing: ["training"]
-            partitions_list = self.get_partitions()
+        # Defines the list of partitions
+        # AHPO/CV: ["training", "validation"]
+        # Cross-testing: ["training"]
+        partitions_list = self.get_partitions()
 
-            for partition in partitions_list:
+        for partition in partitions_list:
+            if not (partition == 'training' and is_training_done):
                 self.process_one_epoch(epoch, partition)
 
-                # Do a step                 
-                if self.is_cv_loop: 
-                    # In a cross-validation loop, step the scheduler only after validating                  
-                    if partition == "validation" and self.scheduler_update_frequency == "epoch":
-                        self.scheduler.step()
-                else:
-                    # In a cross-testing loop, step the scheduler after training
-                    if self.scheduler_update_frequency == "epoch" :
-                        self.scheduler.step()          
-            if self.is_cv_loop and self.do_early_stop:
-                print("Early stopping")
-                break
+            # Do a step                 
+            if self.is_cv_loop: 
+                # In a cross-validation loop, step the scheduler only after validating                  
+                if partition == "validation" and self.scheduler_update_frequency == "epoch":
+                    self.scheduler.step()
+            else:
+                # In a cross-testing loop, step the scheduler after training
+                if self.scheduler_update_frequency == "epoch" :
+                    self.scheduler.step()          
+        self.epochs_completed = epoch + 1
+
+        return self.is_cv_loop and self.do_early_stop
+
+
+    def create_metrics_loggers(self):
+        """
+        Creates the append-only loggers of the history and of the
+        learning rate per step. The files are rewritten once with the
+        rows up to the epoch the training starts from.
+        """
+
+        prefix, path_folder_output = get_prefix_and_folder_path(
+            self.test_fold,
+            self.hp_config_index,
+            self.validation_fold,
+            self.is_cv_loop,
+            Path(self.configuration['output_path']))
+
+        self.history_logger = MetricsLogger(
+            filepath=path_folder_output / f"{prefix}_history.csv",
+            columns=list(self.history.keys()))
+        self.history_logger.reset(self.history)
+
+        if self.scheduler_update_frequency == "step":
+            self.lr_history_logger = MetricsLogger(
+                filepath=path_folder_output / f"{prefix}_lr_history.csv",
+                columns=list(self.lr_history.keys()))
+
+            lr_history = None
+            if self.start_epoch > 0 and self.lr_history_logger.filepath.exists():
+                df_lr_history = read_metrics_csv(self.lr_history_logger.filepath)
+                lr_history = df_lr_history[df_lr_history['epoch'] <= self.start_epoch].to_dict('list')
+            self.lr_history_logger.reset(lr_history)
+
+
+    def flush_metrics_loggers(self):
+        """
+        Writes the buffered rows of the history and learning rate loggers.
+        """
+
+        for logger in [self.history_logger, self.lr_history_logger]:
+            if logger is not None:
+                logger.flush()
 
 
     def get_partitions(self) -> List[str]:
@@ -694,33 +1187,33 @@ class TrainingFold():
 
 
     def process_batch_mixed_precision(self, partition, inputs, labels):
-        # Uses mixed precision to use less memory
-        with autocast(enabled=True, dtype=torch.float16,
-                      cache_enabled=True, device_type='cuda'):
+        # Uses mixed precision to use less memory, with float16 on GPU
+        # and bfloat16 on CPU
+        with get_autocast_context(self.execution_device, True, self.autocast_dtype):
             # Make predictions for this batch
             outputs = self.model(inputs)
             
             # Compute the loss
             loss = self.loss_function(outputs, labels)
         
-            # Backward pass and optimize only if in training phase
-            if partition == 'training':
-                # scale the loss to avoid underflow
-                # which can occur when using mixed precision float16
-                self.scaler.scale(loss).backward()
-                
-                # Gradient clipping to avoid exploding gradients
-                # it is required to unscale to float32
-                # float16 might be too small to update the weights
-                # scaler.unscale_(self.optimizer)
-                # torch.nn.utils.clip_grad_norm_(self.model.parameters(),
-                #                             max_norm=1.0)
-                
-                # because of mixed precision, optimizer.step()
-                # is replaced by
-                self.scaler.step(self.optimizer)
-                # Updates the scale for next iteration. 
-                self.scaler.update()
+        # Backward pass and optimize only if in training phase
+        if partition == 'training':
+            # scale the loss to avoid underflow
+            # which can occur when using mixed precision float16
+            self.scaler.scale(loss).backward()
+            
+            # Gradient clipping to avoid exploding gradients
+            # it is required to unscale to float32
+            # float16 might be too small to update the weights
+            # scaler.unscale_(self.optimizer)
+            # torch.nn.utils.clip_grad_norm_(self.model.parameters(),
+            #                             max_norm=1.0)
+            
+            # because of mixed precision, optimizer.step()
+            # is replaced by
+            self.scaler.step(self.optimizer)
+            # Updates the scale for next iteration. 
+            self.scaler.update()
 
         return outputs, loss
 
@@ -770,8 +1263,8 @@ class TrainingFold():
         # Off: validation, test
         with torch.set_grad_enabled(partition == 'training'):
             # Sends the inputs and labels to the execution device
-            inputs = inputs.to(self.execution_device)
-            labels = labels.to(self.execution_device)
+            inputs = inputs.to(self.execution_device, non_blocking=True)
+            labels = labels.to(self.execution_device, non_blocking=True)
 
             # Zero your gradients for every batch!
             self.optimizer.zero_grad()
@@ -839,13 +1332,18 @@ class TrainingFold():
             epoch_accuracy (float): The accuracy of the epoch.
             best_accuracy (float): The best accuracy obtained in the training.
         """       
+        # The metrics of the checkpoint are on disk if the training is interrupted
+        self.flush_metrics_loggers()
+
         # If the directory does not exist, creates it
-        if not self.checkpoint_folder_path.exists():
-            self.checkpoint_folder_path.mkdir(mode=0o775, parents=True, exist_ok=True)
+        create_checkpoint_folder(self.checkpoint_folder_path)
 
         # If the epoch is within the frequency steps, saves it
         checkpoint_frequency = self.configuration['checkpoint_epoch_frequency']
         is_frequency_checkpoint = ( (epoch_index+1) % checkpoint_frequency == 0)
+        # The training resumes from the end of its epoch budget
+        if epoch_index + 1 == self.stop_epoch < self.number_of_epochs:
+            is_frequency_checkpoint = True
         # Determine if it is the last epoch
         is_last_epoch = ( epoch_index+1 == self.number_of_epochs)
         # save last
@@ -858,19 +1356,24 @@ class TrainingFold():
             is_last_early_stop = False
             
         # Prepare checkpoint targets
+        # Role of the checkpoint in the manifest
         checkpoint_conditions = [
         (is_best,
-         f"{self.prefix_name}_epoch_{epoch_index + 1}_best.pth",
-         "best_checkpoint_file_path"),
+         f"{self.prefix_name}_epoch_{epoch_index + 1}_best{self.checkpoint_suffix}",
+         "best_checkpoint_file_path",
+         "best"),
         (is_frequency_checkpoint,
-         f"{self.prefix_name}_epoch_{epoch_index + 1}.pth",
-         "last_checkpoint_file_path"),
+         f"{self.prefix_name}_epoch_{epoch_index + 1}{self.checkpoint_suffix}",
+         "last_checkpoint_file_path",
+         "latest"),
         (is_last_epoch,
-         f"{self.prefix_name}_epoch_{epoch_index + 1}_last.pth",
-         None),
+         f"{self.prefix_name}_epoch_{epoch_index + 1}_last{self.checkpoint_suffix}",
+         None,
+         "final"),
         (is_last_early_stop,
-         f"{self.prefix_name}_epoch_{epoch_index + 1}_last-early-stopping.pth",
-         None),
+         f"{self.prefix_name}_epoch_{epoch_index + 1}_last-early-stopping{self.checkpoint_suffix}",
+         None,
+         "final"),
         ]
 
         checkpoint_data = {
@@ -885,29 +1388,112 @@ class TrainingFold():
             "time_total": self.fold_timer.get_elapsed_time(),
             }
 
-        for condition, filename, prev_attr in checkpoint_conditions:
+        file_path_list = []
+        rotation_list = []
+        role_paths = {}
+        manifest_rotation_list = []
+        for condition, filename, prev_attr, role in checkpoint_conditions:
             if condition:
                 file_path = self.checkpoint_folder_path / filename
-                torch.save(checkpoint_data, file_path)
-                print(colored(f"Saved checkpoint at epoch {epoch_index + 1}/{self.number_of_epochs} to {file_path}.", 'cyan'))
+                file_path_list.append(file_path)
+                role_paths[role] = file_path
 
                 # Manage memory: remove previous checkpoint
                 if prev_attr:
                     prev_path = getattr(self, prev_attr, None)
-                    if prev_path and Path(prev_path).exists():
-                        
+                    if prev_path and prev_path != file_path:
                         path_to_remove = getattr(self, prev_attr + "_backup", None)
-                        if path_to_remove:
-                            os.remove(path_to_remove)
-                                                       
+
                         # name for prev_path to backup
                         backup_path = prev_path.with_name(prev_path.stem + "-backup" + prev_path.suffix)
-                        prev_path.replace(backup_path)
-                        
+                        rotation_list.append((prev_path, backup_path, path_to_remove))
+                        manifest_rotation_list.append((role, prev_path, backup_path))
+
                         setattr(self, prev_attr + "_backup", backup_path)
-                                
+
                     setattr(self, prev_attr, file_path)
 
+        self.model_epoch_index = epoch_index
+        prediction_role = "best" if self.is_cv_loop else "latest"
+        if prediction_role in role_paths:
+            self.retain_prediction_weights(epoch_index, role_paths[prediction_role])
+
+        if not file_path_list:
+            return
+
+        # The state is copied to host memory, written once in the background
+        # and hard-linked for the other checkpoint kinds
+        self.checkpoint_writer.submit(
+            checkpoint_data=checkpoint_data,
+            file_path_list=file_path_list,
+            rotation_list=rotation_list,
+            message=f"Saved checkpoint at epoch {epoch_index + 1}/{self.number_of_epochs} to "
+                    f"{', '.join(str(path) for path in file_path_list)}.",
+            on_written=functools.partial(self.checkpoint_manifest.record,
+                                         epoch_index,
+                                         role_paths,
+                                         manifest_rotation_list))
+
+
+    def retain_prediction_weights(self,
+                                  epoch_index: int,
+                                  file_path: Path):
+        """
+        Keeps a copy in host memory of the weights of the checkpoint used
+        for the predictions, the best one for cross-validation and the
+        latest one for cross-testing, if it fits in the memory budget.
+
+        No copy is made at the last epoch, the weights stay in the model.
+
+        Args:
+            epoch_index (int): The epoch index of the checkpoint.
+            file_path (Path): The checkpoint file.
+        """
+
+        self.prediction_weights_path = file_path
+        self.prediction_weights_epoch = epoch_index
+        self.prediction_state_dict = None
+
+        is_last_epoch = epoch_index + 1 == self.stop_epoch or \
+                        (self.is_cv_loop and self.do_early_stop)
+        if is_last_epoch:
+            return
+
+        state_dict = self.model.state_dict()
+        size_bytes = sum(tensor.numel() * tensor.element_size()
+                         for tensor in state_dict.values())
+        if size_bytes <= self.prediction_weights_budget_bytes:
+            self.prediction_state_dict = snapshot_to_host(state_dict)
+
+
+    def load_prediction_weights(self,
+                                checkpoint_path: Path):
+        """
+        Loads the weights of the checkpoint used for the predictions: kept
+        in the model if it was saved at the last trained epoch, otherwise
+        from the copy in memory, otherwise only the weights of the file,
+        on the execution device.
+
+        Args:
+            checkpoint_path (Path): The checkpoint file.
+        """
+
+        if checkpoint_path == self.prediction_weights_path:
+            if self.prediction_weights_epoch == self.model_epoch_index:
+                print(colored("For predictions using the weights in memory, " + \
+                              f"saved at {checkpoint_path}", 'green'))
+                return
+            if self.prediction_state_dict is not None:
+                print(colored("For predictions using the copy in memory of " + \
+                              f"{checkpoint_path}", 'green'))
+                self.model.load_state_dict(self.prediction_state_dict)
+                self.prediction_state_dict = None
+                return
+
+        print(colored(f"For predictions using checkpoint file: {checkpoint_path}", 'green'))
+        self.model.load_state_dict(load_model_state_dict(checkpoint_path,
+                                                         map_location=self.execution_device))
+
 
     def get_checkpoint_info(self,
                             list_paths: List[Path]):
@@ -963,10 +1549,77 @@ class TrainingFold():
 
     def load_checkpoint(self):
         """
+        Loads the checkpoint to resume from, using the manifest of the task.
+        Checkpoint folders written before manifests existed are listed instead.
+
+        Returns:
+            dict: The checkpoint, or None if there is none.
+        """
+
+        if self.checkpoint_manifest.read() is not None:
+            return self.load_checkpoint_from_manifest()
+
+        # A task without manifest in a folder with manifests has no checkpoints
+        if not self.checkpoint_folder_path.exists() or \
+           has_manifests_marker(self.checkpoint_folder_path):
+            return None
+
+        return self.load_checkpoint_from_folder()
+
+
+    def load_checkpoint_from_manifest(self):
+        """
+        Loads the checkpoint recorded in the manifest: the one of the last
+        epoch, otherwise the latest one or its backup. A file whose size
+        and modification time, or hash with 'hash' verification, do not
+        match the manifest is skipped.
+        """
+
+        checkpoint = None
+        manifest = self.checkpoint_manifest
+
+        for role in RESUME_ROLES:
+            checkpoint_path = manifest.get_path(role)
+            if checkpoint_path is None:
+                continue
+
+            if not manifest.verify(role):
+                print(colored(f"Warning: checkpoint {checkpoint_path} is missing or does not " + \
+                              "match the manifest.", 'yellow'))
+                continue
+
+            try:
+                checkpoint = load_checkpoint_file(
+                    file_path=checkpoint_path,
+                    map_location=self.execution_device)
+            except Exception as e:
+                print(f"Failed to load checkpoint: {e} at {checkpoint_path}")
+                continue
+
+            self.last_checkpoint_file_path = checkpoint_path
+            if role == "latest":
+                self.last_checkpoint_file_path_backup = manifest.get_path("latest_backup")
+            self.start_epoch = manifest.get_epoch_index(role) + 1
+            break
+
+        self.best_checkpoint_file_path = manifest.get_path("best")
+        self.best_checkpoint_file_path_backup = manifest.get_path("best_backup")
+
+        # The blobs of the earlier checkpoints are removed with them
+        if self.checkpoint_store is not None:
+            self.checkpoint_store.track([manifest.get_path(role)
+                                         for role in manifest.manifest["checkpoints"]])
+
+        return checkpoint
+
+
+    def load_checkpoint_from_folder(self):
+        """
+        Finds the checkpoints of the task by listing the checkpoint folder.
         """
         checkpoint = None
         # get list of checkpoints
-        checkpoint_list = list(self.checkpoint_folder_path.glob(f"*{self.prefix_name}*.pth"))
+        checkpoint_list = list(self.checkpoint_folder_path.glob(f"{self.prefix_name}_epoch_*.pth"))
         
         checkpoint_info_tuple = self.get_checkpoint_info(checkpoint_list)
 
@@ -983,9 +1636,8 @@ class TrainingFold():
 
         if last_checkpoint_path:
             try:
-                checkpoint = torch.load(
-                    f=last_checkpoint_path,
-                    weights_only=True,
+                checkpoint = load_checkpoint_file(
+                    file_path=last_checkpoint_path,
                     map_location=self.execution_device)
                 bool_load = True
                 self.last_checkpoint_file_path = last_checkpoint_path        
@@ -996,9 +1648,8 @@ class TrainingFold():
         if prev_checkpoint_path and not bool_load:
             print(colored(f"Previous checkpoint found at {prev_checkpoint_path}.", 'yellow'))
             try:
-                checkpoint = torch.load(
-                    f=prev_checkpoint_path,
-                    weights_only=True,
+                checkpoint = load_checkpoint_file(
+                    file_path=prev_checkpoint_path,
                     map_location=self.execution_device)
                 bool_load = True
                 self.last_checkpoint_file_path = prev_checkpoint_path        
@@ -1012,9 +1663,8 @@ class TrainingFold():
         if prev_checkpoint_path_backup and not bool_load:
             print(colored(f"Previous checkpoint found at {prev_checkpoint_path_backup}.", 'yellow'))
             try:
-                checkpoint = torch.load(
-                    f=prev_checkpoint_path_backup,
-                    weights_only=True,
+                checkpoint = load_checkpoint_file(
+                    file_path=prev_checkpoint_path_backup,
                     map_location=self.execution_device)
                 self.last_checkpoint_file_path = prev_checkpoint_path_backup
                 # For this case, the file may require to be rename        
@@ -1042,15 +1692,12 @@ class TrainingFold():
             self.best_checkpoint_file_path if self.is_cv_loop
             else self.last_checkpoint_file_path
         )
+        # No validation loss improved, e.g. a short epoch budget with a NaN loss
+        if checkpoint_path is None and self.last_checkpoint_file_path is not None:
+            print(colored("Warning: no best checkpoint, using the latest one for predictions.", 'yellow'))
+            checkpoint_path = self.last_checkpoint_file_path
 
-        print(colored(f"For predictions using checkpoint file: {checkpoint_path}", 'green'))
-        
-        checkpoint = torch.load(checkpoint_path,
-                                weights_only=True)
-
-
-        self.model.load_state_dict(checkpoint['model_state_dict'])
-        self.optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+        self.load_prediction_weights(checkpoint_path)
 
         # Sets the model to evaluation mode
         self.model.eval()
@@ -1075,5 +1722,11 @@ class TrainingFold():
             partitions_info_dict=self.partitions_info_dict, 
             class_names=self.configuration['class_names'],
             is_cv_loop=self.is_cv_loop,
-            enable_prediction_on_test=self.configuration.get('enable_prediction_on_test',False)
+            enable_prediction_on_test=self.configuration.get('enable_prediction_on_test',False),
+            save_prediction_npz=self.configuration.get('save_predictions_npz', False),
+            use_mixed_precision=self.use_mixed_precision,
+            autocast_dtype=self.autocast_dtype,
+            # Predictions of a previous run, e.g. an earlier rung of successive
+            # halving, are from other weights when epochs were trained since
+            overwrite_predictions=self.epochs_completed > self.start_epoch
         )
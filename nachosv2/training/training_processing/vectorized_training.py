@@ -0,0 +1,225 @@
+from collections import defaultdict
+from typing import List
+from termcolor import colored
+
+import torch
+from torch.func import functional_call, vmap
+
+from nachosv2.training.training_processing.training_fold import TrainingFold
+
+
+class VectorizedTrainingFolds():
+    def __init__(self,
+                 training_folds: List[TrainingFold]):
+        """
+        Trains several folds of the same hyperparameter configuration in
+        lockstep, as one batched model.
+
+        At each training step, the parameters and buffers of the folds are
+        stacked and a single vectorized forward pass (torch.func.vmap) runs
+        the batches of all the folds. The losses are summed, so one backward
+        pass gives each fold the gradients of its own loss. Every fold keeps
+        its own data stream, optimizer, learning rate scheduler, early
+        stopping, metrics and checkpoints: validation, checkpointing and
+        predictions run with the code of TrainingFold.
+
+        Folds whose data are exhausted or that stopped early leave the
+        batch, and folds whose last batches have different sizes run in
+        separate vectorized passes.
+
+        Args:
+            training_folds (list of TrainingFold): The folds, with the same architecture.
+        """
+
+        architectures = {training_fold.hyperparameters["architecture"]
+                         for training_fold in training_folds}
+        if len(architectures) > 1:
+            raise ValueError(f"The folds must have the same architecture, got {sorted(architectures)}.")
+
+        self.training_folds = training_folds
+        self.number_of_epochs = max(training_fold.number_of_epochs
+                                    for training_fold in training_folds)
+
+        if any(training_fold.use_mixed_precision for training_fold in training_folds):
+            print(colored("Warning: mixed precision is not used with vectorized folds, " + \
+                          "using float32.", 'yellow'))
+            for training_fold in training_folds:
+                training_fold.use_mixed_precision = False
+
+
+    def run_all_steps(self):
+        """
+        Creates the models and datasets of the folds, trains them together
+        and saves the results of each fold.
+        """
+
+        self.training_folds = [training_fold for training_fold in self.training_folds
+                               if training_fold.prepare()]
+        self.train()
+
+        for training_fold in self.training_folds:
+            training_fold.finish()
+
+
+    def train(self):
+        """
+        Fits the models of the folds in lockstep.
+        """
+
+        active_folds = [training_fold for training_fold in self.training_folds
+                        if training_fold.prepare_training()]
+        if not active_folds:
+            return
+
+        start_epoch = min(training_fold.start_epoch for training_fold in active_folds)
+
+        for epoch in range(start_epoch, self.number_of_epochs):
+            # Folds resumed from a later epoch wait for the others
+            epoch_folds = [training_fold for training_fold in active_folds
+                           if training_fold.start_epoch <= epoch < training_fold.number_of_epochs]
+            if not epoch_folds:
+                break
+
+            print('-' * 60)
+            print(f'Epoch {epoch + 1}/{self.number_of_epochs}, ' + \
+                  f'{len(epoch_folds)} folds vectorized')
+
+            self.train_one_epoch(epoch, epoch_folds)
+
+            for training_fold in epoch_folds:
+                if training_fold.run_epoch(epoch, is_training_done=True):
+                    print(f"Early stopping of {training_fold.prefix_name}")
+                    active_folds.remove(training_fold)
+
+
+    def train_one_epoch(self,
+                        epoch_index: int,
+                        training_folds: List[TrainingFold]):
+        """
+        Runs the training partition of an epoch for the folds, one
+        vectorized step per batch.
+
+        Args:
+            epoch_index (int): The epoch index.
+            training_folds (list of TrainingFold): The folds to train.
+        """
+
+        data_loaders = {}
+        iterators = {}
+        running_losses = {}
+        running_corrects = {}
+        step_indices = {}
+        for training_fold in training_folds:
+            data_loader = training_fold.begin_partition_epoch(epoch_index, 'training')
+            data_loaders[training_fold] = data_loader
+            iterators[training_fold] = iter(data_loader)
+            running_losses[training_fold] = 0.0
+            running_corrects[training_fold] = 0
+            step_indices[training_fold] = 0
+
+        n_steps = max(len(data_loader) for data_loader in data_loaders.values())
+        step_folds = list(training_folds)
+
+        while step_folds:
+            print(f"Epoch: {epoch_index + 1} of {self.number_of_epochs}. training " + \
+                  f"Step:{max(step_indices.values()) + 1}/{n_steps}\r", end="")
+
+            batches = {}
+            for training_fold in step_folds:
+                batch = next(iterators[training_fold], None)
+                if batch is not None:
+                    batches[training_fold] = batch
+
+            if not batches:
+                print()
+                break
+
+            # Folds with batches of the same shape run in the same pass
+            groups = defaultdict(list)
+            for training_fold, (inputs, labels, _) in batches.items():
+                groups[tuple(inputs.shape)].append(training_fold)
+
+            for group_folds in groups.values():
+                statistics = self.process_batches(group_folds,
+                                                  [batches[training_fold][0] for training_fold in group_folds],
+                                                  [batches[training_fold][1] for training_fold in group_folds])
+                for training_fold, (batch_loss, batch_corrects) in zip(group_folds, statistics):
+                    running_losses[training_fold] += batch_loss
+                    running_corrects[training_fold] += batch_corrects
+                    training_fold.end_training_step(epoch_index,
+                                                    step_indices[training_fold],
+                                                    len(data_loaders[training_fold]))
+                    step_indices[training_fold] += 1
+
+            step_folds = list(batches)
+
+        for training_fold in training_folds:
+            training_fold.end_partition_epoch(epoch_index, 'training',
+                                              data_loaders[training_fold],
+                                              running_losses[training_fold],
+                                              running_corrects[training_fold])
+
+
+    def process_batches(self,
+                        training_folds: List[TrainingFold],
+                        inputs_list: List[torch.Tensor],
+                        labels_list: List[torch.Tensor]) -> List[tuple]:
+        """
+        Runs a vectorized training step on one batch per fold.
+        The batches must have the same shape.
+
+        Args:
+            training_folds (list of TrainingFold): The folds.
+            inputs_list (list of Tensor): The input data of each fold.
+            labels_list (list of Tensor): The labels of each fold.
+
+        Returns:
+            list of tuple: The loss times the batch size and the number of
+                correct predictions, per fold.
+        """
+
+        template_model = training_folds[0].model
+        execution_device = training_folds[0].execution_device
+        parameter_names = [name for name, _ in template_model.named_parameters()]
+        buffer_names = [name for name, _ in template_model.named_buffers()]
+
+        with torch.set_grad_enabled(True):
+            inputs = torch.stack(inputs_list).to(execution_device, non_blocking=True)
+            labels = torch.stack(labels_list).to(execution_device, non_blocking=True)
+
+            for training_fold in training_folds:
+                training_fold.optimizer.zero_grad()
+
+            # Stacking keeps the graph, so the gradients flow to the parameters of each fold
+            fold_parameters = [dict(training_fold.model.named_parameters())
+                               for training_fold in training_folds]
+            fold_buffers = [dict(training_fold.model.named_buffers())
+                            for training_fold in training_folds]
+            parameters = {name: torch.stack([parameters_dict[name] for parameters_dict in fold_parameters])
+                          for name in parameter_names}
+            buffers = {name: torch.stack([buffers_dict[name] for buffers_dict in fold_buffers])
+                       for name in buffer_names}
+
+            def compute_outputs(parameters, buffers, inputs):
+                return functional_call(template_model, (parameters, buffers), (inputs,))
+
+            outputs = vmap(compute_outputs, randomness='different')(parameters, buffers, inputs)
+
+            losses = [training_fold.loss_function(outputs[k], labels[k])
+                      for k, training_fold in enumerate(training_folds)]
+            torch.stack(losses).sum().backward()
+
+            for training_fold in training_folds:
+                training_fold.optimizer.step()
+
+        # Batch normalization updated the stacked running statistics
+        with torch.no_grad():
+            for k, buffers_dict in enumerate(fold_buffers):
+                for name in buffer_names:
+                    buffers_dict[name].copy_(buffers[name][k])
+
+        predictions = outputs.detach().argmax(dim=2)
+        batch_corrects = (predictions == labels).sum(dim=1).tolist()
+
+        return [(loss.item() * inputs.size(1), corrects)
+                for loss, corrects in zip(losses, batch_corrects)]